@@ -3,19 +3,34 @@
 # Update the charmcraft.yaml
 
 import argparse
+import functools
 import logging
-import os
 from pathlib import Path
 import re
 import sys
 import textwrap
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, TYPE_CHECKING
 
-from ruamel.yaml import YAML
+from lib.fleet import Result, charm_name_for, expand_filenames, run_pool
+from lib.output import dumps, write_if_changed
+from lib.timing import timed
+from lib.profiling import run_profiled
+
+
+if TYPE_CHECKING:
+    from ruamel.yaml import YAML
 
 
 logger = logging.getLogger(__name__)
 
+# The results of updating a file.
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+MISSING = 'missing'
+
+# The YAML instance of this process; see get_yaml().
+_yaml: Optional['YAML'] = None
+
 
 def delete_bases(args: argparse.Namespace, charmcraft: Any) -> Any:
     """Delete any bases run-on/build-on that has args.bases.
@@ -334,9 +349,20 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
                 "search and replacements to find the relevant sections. This "
                 "is to try as hard as possible to maintain the existing "
                 "formatting in the file and keep minimal diffs."))
-    parser.add_argument(dest='filename',
+    parser.add_argument(dest='filenames',
+                        nargs='+',
                         metavar='FILE',
-                        help="Required filename to change.")
+                        help=("Required filename to change.  More than one "
+                              "file, or a quoted glob such as "
+                              "'charms/*/charmcraft.yaml', may be given; the "
+                              "files are then updated in a process pool and a "
+                              "result is printed for each file."))
+    parser.add_argument('--workers', '-j',
+                        dest='workers',
+                        type=int,
+                        default=None,
+                        help=('The number of files to update at once when '
+                              'more than one file is given.'))
     parser.add_argument('--log', dest='loglevel',
                         type=str.upper,
                         default='INFO',
@@ -401,39 +427,99 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
     return parser.parse_args(argv)
 
 
-# update the charmcraft.yaml file (passed on the line as arg1) and ensure that
-# it has the bases added.
+def get_yaml() -> 'YAML':
+    """Return the round-trip YAML instance for this process.
+
+    It is made and configured on first use and then reused for every file
+    that the process (or pool worker) updates.
+    """
+    global _yaml
+    if _yaml is None:
+        # ruamel is slow to import, so only import it when it is needed.
+        from ruamel.yaml import YAML
+        _yaml = YAML(typ="rt")
+        _yaml.preserve_quotes = True
+        _yaml.indent(mapping=2, sequence=4, offset=2)
+    return _yaml
+
+
+def update_file(filename: str, args: argparse.Namespace) -> str:
+    """Apply the sub-command to a charmcraft.yaml file.
+
+    :param filename: the charmcraft.yaml to update.
+    :param args: the parsed arguments; args.func is the sub-command.
+    :returns: CHANGED, UNCHANGED or MISSING.
+    :raises: Exception if the file couldn't be parsed or the sub-command
+        failed; the file is left unmodified.
+    """
+    with timed(args.cmd, charm=charm_name_for(Path(filename))):
+        yaml = get_yaml()
+        try:
+            with open(filename) as f:
+                charmcraft = yaml.load(f)
+        except FileNotFoundError:
+            logger.error(f"Couldn't open {filename}")
+            return MISSING
+        except Exception as e:
+            logger.error(f"Couldn't open {filename}: reason: {e}")
+            raise
+
+        # Call the function associated with the sub-command.
+        try:
+            modified_charmcraft = args.func(args, charmcraft)
+        except Exception:
+            logger.error("Error occured; leaving without modifying %s",
+                         filename)
+            raise
+
+        if write_if_changed(filename, dumps(yaml, modified_charmcraft)):
+            return CHANGED
+        logger.info("%s is unchanged.", filename)
+        return UNCHANGED
+
+
+def report(results: List[Result]) -> int:
+    """Print the result for each file and a summary.
+
+    :param results: the result for each file.
+    :returns: the number of files that failed.
+    """
+    counts = dict.fromkeys((CHANGED, UNCHANGED, MISSING, 'failed'), 0)
+    for result in results:
+        if result.ok:
+            counts[result.value] += 1
+            print(f"{result.item}: {result.value}")
+        else:
+            counts['failed'] += 1
+            print(f"{result.item}: FAILED: {result.error}")
+    print(f"{len(results)} file(s): " +
+          ", ".join(f"{count} {what}" for what, count in counts.items()))
+    return counts['failed']
+
+
+# update the charmcraft.yaml file(s) (passed on the line as arg1) and ensure
+# that it has the bases added.
 def main() -> None:
     args = parse_args(sys.argv[1:])
     logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
 
-    yaml = YAML(typ="rt")
-    yaml.preserve_quotes = True
-    yaml.indent(mapping=2, sequence=4, offset=2)
-    try:
-        with open(args.filename) as f:
-            charmcraft = yaml.load(f)
-    except FileNotFoundError:
-        logger.error(f"Couldn't open {args.filename}")
-        return
-    except Exception as e:
-        logger.error(f"Couldn't open {args.filename}: reason: {e}")
+    filenames = expand_filenames(args.filenames)
+    if not filenames:
+        logger.error("No files match %s", " ".join(args.filenames))
+        sys.exit(1)
+    if len(filenames) == 1:
+        try:
+            update_file(filenames[0], args)
+        except Exception:
+            sys.exit(1)
         return
 
-    # Call the function associated with the sub-command.
-    try:
-        modified_charmcraft = args.func(args, charmcraft)
-    except Exception:
-        logger.error("Error occured; leaving without modifying %s",
-                     args.filename)
+    results = run_pool(functools.partial(update_file, args=args), filenames,
+                       workers=args.workers, processes=True)
+    if report(results):
         sys.exit(1)
 
-    new_file_name = Path(args.filename).with_suffix('.new')
-    yaml.dump(modified_charmcraft, new_file_name)
-    # now overwrite the file
-    os.rename(new_file_name, args.filename)
-
 
 if __name__ == '__main__':
     logging.basicConfig()
-    main()
+    run_profiled(main)
@@ -1,124 +1,275 @@
 #!/usr/bin/env python3
 
 # script to help with managing the series in a metadata.yaml file
-# it provides four commands: list, add, remove and ensure
+# it provides five commands: list, add, remove, ensure and check
 # - list the series in metadata.yaml;
-# - add a series if it doesn't exist
-# - remove a series if it does exist
-# - ensure that the metadata contains the items on the args
+# - add series if they don't exist
+# - remove series if they do exist
+# - ensure that the series in the metadata are the items on the args
+# - check that the series are in the metadata (replaces check-series)
+#
+# The charm can be 'all' to run the command on every charm in the charms
+# directory; the charms are then processed in a worker pool, each
+# metadata.yaml is loaded once and only written if it changed, and a report is
+# printed at the end.
 
-import os
+import argparse
+import functools
+from pathlib import Path
 import sys
-import collections
+from typing import List, NamedTuple
 
-# from ruamel.yaml import YAML
-from ruamel.yaml import YAML
+from lib.fleet import find_charm_dirs, run_pool
+from lib.output import dumps, write_if_changed
+from lib import readonly
+from lib.profiling import run_profiled
 
 
-Command = collections.namedtuple('Command', ['charm', 'cmd', 'params'])
+COMMANDS = ("list", "add", "remove", "ensure", "check")
+# the commands that change metadata.yaml
+MODIFY_COMMANDS = ("add", "remove", "ensure")
+ALL_CHARMS = "all"
+
+
+class CharmSeries(NamedTuple):
+    """The series of a charm after the command, what was done (or not) and
+    whether metadata.yaml was written."""
+    series: List[str]
+    messages: List[str]
+    written: bool
 
 
 def usage():
-    print("usage: {} <charm> [list | add | remove | ensure] [<series, ...]"
+    print("usage: {} <charm | all> [list | add | remove | ensure | check] "
+          "[<series, ...] [--charms-dir DIR] [-j N]"
           .format(sys.argv[0]))
 
 
-def parse_args():
-    if len(sys.argv) < 3:
+def parse_args(argv):
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description="Manage the series in the metadata.yaml of charms.",
+        epilog=("With 'all' as the charm, the command is run on every charm "
+                "in the charms directory."))
+    parser.add_argument('charm',
+                        help="The charm, or 'all' for every charm.")
+    parser.add_argument('cmd',
+                        type=str.lower,
+                        help="One of: {}.".format(", ".join(COMMANDS)))
+    parser.add_argument('params',
+                        nargs='*',
+                        metavar='series',
+                        help="The series for the command.")
+    parser.add_argument('--charms-dir',
+                        dest='charms_dir',
+                        type=Path,
+                        default=Path('charms'),
+                        metavar='DIR',
+                        help=("The directory of charms; default is "
+                              "%(default)s."))
+    parser.add_argument('--workers', '-j',
+                        dest='workers',
+                        type=int,
+                        help="With 'all', how many charms to process at once.")
+    args = parser.parse_args(argv)
+    if args.cmd not in COMMANDS:
+        print("Command '{}' not recognised.".format(args.cmd))
         usage()
         sys.exit(1)
-    charm = sys.argv[1]
-    cmd = sys.argv[2].lower()
-    if cmd not in ["list", "add", "remove", "ensure"]:
-        print("Command '{}' not recognised.".format(cmd))
+    if args.cmd != "list" and not args.params:
+        print("Command '{}' requires at least 1 argument".format(args.cmd))
         usage()
         sys.exit(1)
-    if cmd in ["add", "remove"]:
-        if len(sys.argv) < 4:
-            print("Command '{}' requires at least 1 argument".format(cmd))
-            usage()
-            sys.exit(1)
-        param = [sys.argv[3]]
-    elif cmd == "ensure":
-        param = sys.argv[3:]
-    else:
-        param = []
-    return Command(charm, cmd, param)
-
-
-def run_command(cmd, yml):
-    if cmd.cmd == "list":
-        list_series(yml)
-    elif cmd.cmd == "add":
-        add_series(cmd, yml)
-    elif cmd.cmd == "remove":
-        remove_series(cmd, yml)
-    # NOTE(ajkavanagh) - this hasn't actually been written yet.
-    # elif cmd.cmd == "ensure":
-    #     ensure_series_is(cmd, yml)
-    else:
-        print("Command?? {}".format(cmd))
-        sys.exit(1)
+    args.params = [series.lower() for series in args.params]
+    return args
 
 
-def metadata_file(cmd):
+def metadata_file(charm_dir):
     """Find the metadata.yaml file"""
-    charm_dir = os.path.join("charms", cmd.charm)
-    if not os.path.isdir(charm_dir):
-        print("dir: {} doesn't exist.".format(charm_dir))
-        sys.exit(1)
-    metadata_in_root = os.path.join(charm_dir, 'metadata.yaml')
-    if (os.path.isfile(metadata_in_root) and
-            not os.path.islink(metadata_in_root)):
-        return metadata_in_root
-    metadata_in_src = os.path.join(charm_dir, 'src', 'metadata.yaml')
-    if os.path.isfile(metadata_in_src):
-        return metadata_in_src
-    print("Can't find metadata!")
-    sys.exit(1)
-
-
-def load_yaml(cmd):
-    yaml = YAML(typ='rt')
-    with open(metadata_file(cmd)) as f:
-        return yaml.load(f)
-
-
-def write_yaml(cmd, yml):
-    yaml = YAML(typ='rt')
-    with open(metadata_file(cmd), "w") as f:
-        yaml.dump(yml, f)
+    path = readonly.metadata_path(Path(charm_dir))
+    if path is None:
+        raise FileNotFoundError("Can't find metadata!")
+    return path
 
 
-def list_series(yml):
-    print("Series are: {}".format(", ".join(yml['series'])))
+@functools.lru_cache(maxsize=None)
+def get_yaml():
+    """The round-trip YAML instance, made once per process."""
+    # ruamel is slow to import, so only import it when it is used.
+    from ruamel.yaml import YAML
+    return YAML(typ='rt')
 
 
-def add_series(cmd, yml):
-    series = cmd.params[0].lower()
+def add_series_to(yml, series):
+    """Add the series to the metadata if it isn't there; True if added."""
     if series in yml['series']:
-        print("Series '{}' already present; continuing".format(series))
-        return
+        return False
     yml['series'].append(series)
-    print("Adding series '{}' to metadata".format(series))
-    write_yaml(cmd, yml)
+    return True
 
 
-def remove_series(cmd, yml):
-    series = cmd.params[0].lower()
+def remove_series_from(yml, series):
+    """Remove the series from the metadata if it is there; True if removed."""
     if series not in yml['series']:
-        print("Series '{}' not present; ignoring remove".format(series))
-        return
+        return False
     yml['series'].remove(series)
-    print("Removed series '{}' from metadata".format(series))
-    write_yaml(cmd, yml)
+    return True
+
+
+def add_series(yml, params):
+    messages = []
+    for series in params:
+        if add_series_to(yml, series):
+            messages.append("Adding series '{}' to metadata".format(series))
+        else:
+            messages.append("Series '{}' already present; continuing"
+                            .format(series))
+    return messages
+
+
+def remove_series(yml, params):
+    messages = []
+    for series in params:
+        if remove_series_from(yml, series):
+            messages.append("Removed series '{}' from metadata".format(series))
+        else:
+            messages.append("Series '{}' not present; ignoring remove"
+                            .format(series))
+    return messages
+
+
+def ensure_series_is(yml, params):
+    """Make the series those in params: the others are removed and the
+    missing ones are added (at the end, in the order given)."""
+    messages = []
+    for series in list(yml['series']):
+        if series not in params:
+            remove_series_from(yml, series)
+            messages.append("Removed series '{}' from metadata".format(series))
+    for series in params:
+        if add_series_to(yml, series):
+            messages.append("Adding series '{}' to metadata".format(series))
+    return messages
+
+
+EDITS = {
+    "add": add_series,
+    "remove": remove_series,
+    "ensure": ensure_series_is,
+}
+
+
+def check_series(series, params):
+    return ["{} {}".format(s, "OK" if s in series else "NOT FOUND")
+            for s in params]
+
+
+def run_charm(charm_dir, cmd, params):
+    """Run the command on a charm.
+
+    :param charm_dir: the charm directory.
+    :param cmd: one of COMMANDS.
+    :param params: the series for the command.
+    :returns: a CharmSeries.
+    :raises: FileNotFoundError if there isn't a metadata.yaml, ValueError if
+        a command that changes the series is used on a metadata.yaml without
+        any.
+    """
+    path = metadata_file(charm_dir)
+    if cmd not in MODIFY_COMMANDS:
+        # only read, so the fast loader will do.
+        yml = readonly.load(path)
+        series = list((yml or {}).get('series') or [])
+        messages = check_series(series, params) if cmd == "check" else []
+        return CharmSeries(series, messages, False)
+    yaml = get_yaml()
+    with open(path) as f:
+        yml = yaml.load(f)
+    if not isinstance((yml or {}).get('series'), list):
+        raise ValueError("{} has no series".format(path))
+    before = list(yml['series'])
+    messages = EDITS[cmd](yml, params)
+    # only dump if the series changed, as the round trip may not be exact.
+    written = (list(yml['series']) != before and
+               write_if_changed(path, dumps(yaml, yml)))
+    return CharmSeries(list(yml['series']), messages, written)
+
+
+def print_charm(result, cmd):
+    if cmd == "list":
+        print("Series are: {}".format(", ".join(result.series)))
+    for message in result.messages:
+        print(message)
+
+
+def report(results, cmd):
+    """Print the result for each charm and a summary.
+
+    For check, this is the check-series report: a line per series for each
+    charm.
+
+    :param results: the result (a `CharmSeries`) for each charm directory.
+    :param cmd: the command that was run.
+    :returns: the number of charms that failed (or, for check, that are
+        missing a series).
+    """
+    changed = failed = 0
+    for result in results:
+        name = result.item.name
+        if not result.ok:
+            failed += 1
+            print("{}: FAILED: {}".format(name, result.error))
+        elif cmd == "list":
+            print("{}: {}".format(name, ", ".join(result.value.series)))
+        elif cmd == "check":
+            failed += any(m.endswith("NOT FOUND")
+                          for m in result.value.messages)
+            for message in result.value.messages:
+                print("{}  {}".format(message, name))
+        else:
+            changed += result.value.written
+            print("{}: {}".format(
+                name, "changed" if result.value.written else "unchanged"))
+            for message in result.value.messages:
+                print("    {}".format(message))
+    if cmd in MODIFY_COMMANDS:
+        print("{} charm(s): {} changed, {} unchanged, {} failed".format(
+            len(results), changed, len(results) - changed - failed, failed))
+    return failed
 
 
 def run():
-    cmd = parse_args()
-    yml = load_yaml(cmd)
-    run_command(cmd, yml)
+    args = parse_args(sys.argv[1:])
+    if args.charm != ALL_CHARMS:
+        charm_dir = args.charms_dir / args.charm
+        if not charm_dir.is_dir():
+            print("dir: {} doesn't exist.".format(charm_dir))
+            sys.exit(1)
+        try:
+            result = run_charm(charm_dir, args.cmd, args.params)
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        print_charm(result, args.cmd)
+        if any(m.endswith("NOT FOUND") for m in result.messages):
+            sys.exit(1)
+        return
+
+    charm_dirs = find_charm_dirs(args.charms_dir)
+    if not charm_dirs:
+        print("No charms found in {}".format(args.charms_dir))
+        sys.exit(1)
+    results = run_pool(
+        functools.partial(run_charm, cmd=args.cmd, params=args.params),
+        charm_dirs, workers=args.workers,
+        processes=args.cmd in MODIFY_COMMANDS)
+    if report(results, args.cmd):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    run()
+    run_profiled(run)
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""Add support for a new release to the charms in one pass per charm.
+
+This does what add-new-release-single (and add-new-release-batch) do: copy
+the previous series and UCA bundles to the new ones and add them to
+tests.yaml, add the new jobs to osci.yaml and .zuul.yaml, update the default
+openstack-origin in config.yaml, add run-on bases to charmcraft.yaml and add
+the new series to metadata.yaml.  The shell version runs find six times and
+then a sed or grep for each edit; here the files are found in one bounded walk
+of the charm, edited in memory and each is written (if it changed) once.  The
+same checks make it safe to run again: an edit is skipped if the new bundle,
+job, codename, version or series is already there.
+
+Usage:
+    add-new-release.py [--charms-dir DIR] [--only NAME] [--charm DIR] [-j N]
+        PREV_SERIES_BUNDLE PREV_UCA_BUNDLE NEW_SERIES_BUNDLE NEW_UCA_BUNDLE
+        PREV_UBUNTU_VERSION NEW_UBUNTU_VERSION
+        PREV_UBUNTU_SERIES NEW_UBUNTU_SERIES
+
+e.g.
+    add-new-release.py lunar-antelope.yaml jammy-antelope.yaml \\
+        mantic-bobcat.yaml jammy-bobcat.yaml 23.04 23.10 lunar mantic
+"""
+
+import argparse
+import functools
+import logging
+import os
+from pathlib import Path
+import re
+import subprocess
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from lib.fleet import (
+    Result,
+    add_fleet_arguments,
+    charm_dirs_from_args,
+    print_summary,
+    run_pool,
+)
+from lib.output import write_if_changed
+from lib.profiling import run_profiled
+from lib.timing import timed
+
+
+logger = logging.getLogger(__name__)
+
+CHARMCRAFT_YAML = 'charmcraft.yaml'
+CONFIG_YAML = 'config.yaml'
+METADATA_YAML = 'metadata.yaml'
+OSCI_YAML = 'osci.yaml'
+TESTS_YAML = 'tests.yaml'
+ZUUL_YAML = '.zuul.yaml'
+TARGET_FILES = (CHARMCRAFT_YAML, CONFIG_YAML, METADATA_YAML, OSCI_YAML,
+                TESTS_YAML, ZUUL_YAML)
+
+# How deep to look for the files; the deepest are the bundles in
+# src/tests/bundles/ of a reactive charm.
+MAX_DEPTH = 4
+# Directories that are never searched (as well as hidden ones).
+SKIP_DIRS = frozenset(('build', 'node_modules', '__pycache__', 'venv'))
+
+ALL_ARCHES = "amd64, s390x, ppc64el, arm64"
+ARCHES = ("amd64", "arm64", "ppc64el", "s390x")
+
+
+class ReleaseSpec(NamedTuple):
+    """The previous and new bundles, Ubuntu versions and series."""
+    prev_series_bundle: str
+    prev_uca_bundle: str
+    new_series_bundle: str
+    new_uca_bundle: str
+    prev_ubuntu_version: str
+    new_ubuntu_version: str
+    prev_ubuntu_series: str
+    new_ubuntu_series: str
+
+    @property
+    def prev_os_codename(self) -> str:
+        return os_codename(self.prev_series_bundle)
+
+    @property
+    def new_os_codename(self) -> str:
+        return os_codename(self.new_series_bundle)
+
+
+class ReleaseResult(NamedTuple):
+    """The files that were written for a charm and the notes on the edits
+    that were skipped."""
+    written: List[Path]
+    notes: List[str]
+
+
+def bundle_release(bundle: str) -> str:
+    """The release of a bundle, e.g. 'jammy-antelope' for
+    'jammy-antelope.yaml'."""
+    return bundle[:-len('.yaml')] if bundle.endswith('.yaml') else bundle
+
+
+def bundle_series(bundle: str) -> str:
+    """The Ubuntu series of a bundle, e.g. 'jammy' for
+    'jammy-antelope.yaml'."""
+    return bundle_release(bundle).rpartition('-')[0]
+
+
+def os_codename(bundle: str) -> str:
+    """The OpenStack codename of a bundle, e.g. 'antelope' for
+    'jammy-antelope.yaml'."""
+    return bundle_release(bundle).rpartition('-')[2]
+
+
+def find_files(charm_dir: Path,
+               names: Iterable[str],
+               max_depth: int = MAX_DEPTH,
+               ) -> Dict[str, List[Path]]:
+    """Find the files with the given names in a charm in one walk.
+
+    The walk is breadth first, so the shallowest match comes first, and
+    sorted within a directory.  Hidden directories, SKIP_DIRS and symlinked
+    directories aren't searched, and nor is anything deeper than max_depth.
+
+    :param charm_dir: the root of the charm repo.
+    :param names: the file names to look for.
+    :param max_depth: how many directories deep to look.
+    :returns: the paths found, by name; every name is a key.
+    """
+    found: Dict[str, List[Path]] = {name: [] for name in names}
+    level = [charm_dir]
+    for _ in range(max_depth + 1):
+        next_level = []
+        for directory in level:
+            try:
+                entries = sorted(os.scandir(directory), key=lambda e: e.name)
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if (not entry.name.startswith('.') and
+                            entry.name not in SKIP_DIRS):
+                        next_level.append(Path(entry.path))
+                elif entry.name in found:
+                    found[entry.name].append(Path(entry.path))
+        level = next_level
+    return found
+
+
+def _pick(paths: List[Path]) -> Optional[Path]:
+    """The file to edit: the shallowest one that isn't a symlink (e.g. a
+    metadata.yaml that links to src/metadata.yaml), else the shallowest."""
+    for path in paths:
+        if not path.is_symlink():
+            return path
+    return paths[0].resolve() if paths else None
+
+
+def replace_first_per_line(text: str, old: str, new: str) -> str:
+    """Replace the first occurrence of old on each line, like
+    sed s/old/new/."""
+    return re.sub(r'^(.*?)' + re.escape(old),
+                  lambda m: m[1] + new, text, flags=re.MULTILINE)
+
+
+def duplicate_lines(text: str, old: str, new: str) -> str:
+    """Follow each line that contains old with a copy where the (last)
+    occurrence of old is replaced by new.
+
+    e.g. '  - jammy-antelope' gets '  - jammy-bobcat' after it.
+    """
+    lines = []
+    for line in text.splitlines(keepends=True):
+        lines.append(line)
+        body = line.rstrip('\n')
+        if old in body:
+            start, _, end = body.rpartition(old)
+            if body != line:
+                lines.append(f"{start}{new}{end}\n")
+            else:
+                lines[-1] = f"{line}\n{start}{new}{end}"
+    return ''.join(lines)
+
+
+def run_on_base(channel: str, arches: str) -> str:
+    """A run-on base in charmcraft.yaml."""
+    return (f"      - name: ubuntu\n"
+            f"        channel: \"{channel}\"\n"
+            f"        architectures: [{arches}]")
+
+
+class CharmFiles:
+    """The files of a charm, read once, edited in memory and written once."""
+
+    def __init__(self, charm_dir: Path):
+        self.charm_dir = charm_dir
+        self.content: Dict[Path, str] = {}
+        self.original: Dict[Path, Optional[str]] = {}
+        self.notes: List[str] = []
+
+    def rel(self, path: Optional[Path]) -> str:
+        if path is None:
+            return '-'
+        try:
+            return str(path.relative_to(self.charm_dir))
+        except ValueError:
+            return str(path)
+
+    def note(self, message: str) -> None:
+        self.notes.append(message)
+
+    def read(self, path: Path) -> str:
+        if path not in self.content:
+            self.content[path] = path.read_text()
+            self.original[path] = self.content[path]
+        return self.content[path]
+
+    def set(self, path: Path, content: str) -> None:
+        if path not in self.original:
+            self.original[path] = path.read_text() if path.exists() else None
+        self.content[path] = content
+
+    def write(self) -> List[Path]:
+        written = []
+        for path, content in self.content.items():
+            if content != self.original[path]:
+                if write_if_changed(path, content):
+                    written.append(path)
+        return written
+
+
+def create_new_bundle(files: CharmFiles,
+                      prev_bundle_path: Optional[Path],
+                      prev_bundle: str,
+                      new_bundle: str,
+                      tests_yaml: Optional[Path],
+                      ) -> Optional[Path]:
+    """Copy the previous bundle to the new one and add it to tests.yaml.
+
+    :returns: the new bundle, if it was created.
+    """
+    if prev_bundle_path is None:
+        files.note(f"Bundle doesn't exist: {prev_bundle}")
+        return None
+    new_bundle_path = prev_bundle_path.parent / new_bundle
+    if new_bundle_path.exists():
+        files.note(f"Bundle already exists: {files.rel(new_bundle_path)}")
+        return None
+
+    prev_release = bundle_release(prev_bundle_path.name)
+    new_release = bundle_release(new_bundle)
+    content = files.read(prev_bundle_path)
+    content = replace_first_per_line(content, prev_release, new_release)
+    content = replace_first_per_line(content,
+                                     bundle_series(prev_bundle_path.name),
+                                     bundle_series(new_bundle))
+    files.set(new_bundle_path, content)
+    if tests_yaml is not None:
+        files.set(tests_yaml, duplicate_lines(files.read(tests_yaml),
+                                              prev_release, new_release))
+    return new_bundle_path
+
+
+def add_new_osci_job(files: CharmFiles,
+                     osci_yaml: Optional[Path],
+                     prev_os_codename: str,
+                     new_os_codename: str,
+                     ) -> None:
+    """Add the unit and functional jobs for the new codename to osci.yaml."""
+    if osci_yaml is None:
+        files.note(f"File doesn't exist: {OSCI_YAML}")
+        return
+    content = files.read(osci_yaml)
+    jobs = [(f"charm-{prev_os_codename}-{kind}-jobs",
+             f"charm-{new_os_codename}-{kind}-jobs")
+            for kind in ('unit', 'functional')]
+    for _, new_job in jobs:
+        if new_job in content:
+            files.note(f"Job {new_job} already exists in "
+                       f"{files.rel(osci_yaml)}")
+            return
+    for prev_job, new_job in jobs:
+        if prev_job in content:
+            content = duplicate_lines(content, prev_job, new_job)
+        else:
+            files.note(f"Job {prev_job} doesn't exist in "
+                       f"{files.rel(osci_yaml)}")
+    files.set(osci_yaml, content)
+
+
+def add_new_zuul_job(files: CharmFiles,
+                     zuul_yaml: Optional[Path],
+                     prev_os_codename: str,
+                     new_os_codename: str,
+                     ) -> None:
+    """Add the job template for the new codename to .zuul.yaml."""
+    if zuul_yaml is None:
+        files.note(f"File doesn't exist: {ZUUL_YAML}")
+        return
+    content = files.read(zuul_yaml)
+    prev_job = f"openstack-python3-charm-{prev_os_codename}-jobs"
+    new_job = f"openstack-python3-charm-{new_os_codename}-jobs"
+    if new_job in content:
+        files.note(f"Job {new_job} already exists in {files.rel(zuul_yaml)}")
+    elif prev_job in content:
+        files.set(zuul_yaml, duplicate_lines(content, prev_job, new_job))
+    else:
+        files.note(f"Job {prev_job} doesn't exist in {files.rel(zuul_yaml)}")
+
+
+def add_new_config_default(files: CharmFiles,
+                           config_yaml: Optional[Path],
+                           prev_os_codename: str,
+                           new_os_codename: str,
+                           ) -> None:
+    """Make the new codename the default in config.yaml."""
+    if config_yaml is None:
+        files.note(f"File doesn't exist: {CONFIG_YAML}")
+        return
+    content = files.read(config_yaml)
+    if new_os_codename in content:
+        files.note(f"{new_os_codename} already exists in "
+                   f"{files.rel(config_yaml)}")
+    elif prev_os_codename in content:
+        files.set(config_yaml, replace_first_per_line(
+            content, f"default: {prev_os_codename}",
+            f"default: {new_os_codename}"))
+    else:
+        files.note(f"{prev_os_codename} doesn't exist in "
+                   f"{files.rel(config_yaml)}")
+
+
+def add_new_run_on_bases(files: CharmFiles,
+                         charmcraft_yaml: Optional[Path],
+                         prev_ubuntu_version: str,
+                         new_ubuntu_version: str,
+                         ) -> None:
+    """Add a run-on base for the new Ubuntu version after each of the
+    previous version's, for all the architectures or each one."""
+    if charmcraft_yaml is None:
+        files.note(f"File doesn't exist: {CHARMCRAFT_YAML}")
+        return
+    content = files.read(charmcraft_yaml)
+    if new_ubuntu_version in content:
+        files.note(f"Version {new_ubuntu_version} already exists in "
+                   f"{files.rel(charmcraft_yaml)}")
+        return
+    arches = (ALL_ARCHES,) if f"[{ALL_ARCHES}]" in content else ARCHES
+    for arch in arches:
+        prev_run_on = run_on_base(prev_ubuntu_version, arch)
+        new_run_on = run_on_base(new_ubuntu_version, arch)
+        content = content.replace(prev_run_on, f"{prev_run_on}\n{new_run_on}",
+                                  1)
+    files.set(charmcraft_yaml, content)
+
+
+def add_new_metadata_series(files: CharmFiles,
+                            metadata_yaml: Optional[Path],
+                            prev_ubuntu_series: str,
+                            new_ubuntu_series: str,
+                            ) -> None:
+    """Add the new series after the previous one in metadata.yaml."""
+    if metadata_yaml is None:
+        files.note(f"File doesn't exist: {METADATA_YAML}")
+        return
+    content = files.read(metadata_yaml)
+    if new_ubuntu_series in content:
+        files.note(f"{new_ubuntu_series} already exists in "
+                   f"{files.rel(metadata_yaml)}")
+    elif prev_ubuntu_series in content:
+        files.set(metadata_yaml, duplicate_lines(
+            content, prev_ubuntu_series, new_ubuntu_series))
+    else:
+        files.note(f"Series {prev_ubuntu_series} does not exist in "
+                   f"{files.rel(metadata_yaml)}")
+
+
+def git_add(charm_dir: Path, paths: List[Path]) -> None:
+    """Add the new bundles to the charm's git index, as the shell version
+    does."""
+    if paths and (charm_dir / '.git').exists():
+        subprocess.run(['git', 'add', '--', *map(str, paths)],
+                       cwd=charm_dir, check=True)
+
+
+def add_new_release(charm_dir: Path, spec: ReleaseSpec) -> ReleaseResult:
+    """Add the new release to a charm.
+
+    :param charm_dir: the root of the charm repo.
+    :param spec: the previous and new release.
+    :returns: the files written and the notes on the skipped edits.
+    """
+    with timed("add-new-release", charm=charm_dir.name):
+        found = find_files(charm_dir, (*TARGET_FILES, spec.prev_series_bundle,
+                                       spec.prev_uca_bundle))
+        path = {name: _pick(found[name]) for name in TARGET_FILES}
+        files = CharmFiles(charm_dir)
+
+        new_bundles = []
+        for prev_bundle, new_bundle in (
+                (spec.prev_series_bundle, spec.new_series_bundle),
+                (spec.prev_uca_bundle, spec.new_uca_bundle)):
+            prev_paths = found[prev_bundle]
+            created = create_new_bundle(
+                files, prev_paths[0] if prev_paths else None,
+                prev_bundle, new_bundle, path[TESTS_YAML])
+            if created is not None:
+                new_bundles.append(created)
+        add_new_osci_job(files, path[OSCI_YAML], spec.prev_os_codename,
+                         spec.new_os_codename)
+        add_new_zuul_job(files, path[ZUUL_YAML], spec.prev_os_codename,
+                         spec.new_os_codename)
+        add_new_config_default(files, path[CONFIG_YAML],
+                               spec.prev_os_codename, spec.new_os_codename)
+        add_new_run_on_bases(files, path[CHARMCRAFT_YAML],
+                             spec.prev_ubuntu_version,
+                             spec.new_ubuntu_version)
+        add_new_metadata_series(files, path[METADATA_YAML],
+                                spec.prev_ubuntu_series,
+                                spec.new_ubuntu_series)
+
+        written = files.write()
+        git_add(charm_dir, [p for p in new_bundles if p in written])
+        return ReleaseResult(written, files.notes)
+
+
+def report(results: List[Result]) -> int:
+    """Print the result, and the notes, for each charm and a summary.
+
+    :param results: the result (a `ReleaseResult`) for each charm directory.
+    :returns: the number of charms that failed.
+    """
+    changed = failed = 0
+    for result in results:
+        name = result.item.name
+        if not result.ok:
+            failed += 1
+            print(f"{name}: FAILED: {result.error}")
+            continue
+        written, notes = result.value
+        if written:
+            changed += 1
+            files = ", ".join(str(p.relative_to(result.item))
+                              for p in written)
+            print(f"{name}: changed {files}")
+        else:
+            print(f"{name}: unchanged")
+        for note in notes:
+            print(f"    {note}")
+    print_summary(len(results), changed, failed)
+    return failed
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description=("Add new release support to the charms: new bundles and "
+                     "updates to tests.yaml, osci.yaml, .zuul.yaml, "
+                     "config.yaml, charmcraft.yaml and metadata.yaml."),
+        epilog=("example: add-new-release.py lunar-antelope.yaml "
+                "jammy-antelope.yaml mantic-bobcat.yaml jammy-bobcat.yaml "
+                "23.04 23.10 lunar mantic"))
+    for field in ReleaseSpec._fields:
+        parser.add_argument(field, metavar=field.upper())
+    add_fleet_arguments(parser,
+                        workers_help="The number of charms to update at once.")
+    parser.add_argument('--log', dest='loglevel',
+                        type=str.upper,
+                        default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'),
+                        help='Loglevel')
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+
+    spec = ReleaseSpec(*(getattr(args, field)
+                         for field in ReleaseSpec._fields))
+    charm_dirs = charm_dirs_from_args(args)
+    if not charm_dirs:
+        logger.error("No charms found in %s", args.charms_dir)
+        sys.exit(1)
+    results = run_pool(functools.partial(add_new_release, spec=spec),
+                       charm_dirs, workers=args.workers, processes=True)
+    if report(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    run_profiled(main)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+# Merge and show the profiles written by the Python tools.
+#
+# Run any of the Python tools with --profile[=cprofile,sample,memory], or set
+# RELEASE_TOOLS_PROFILE for a whole batch, and each invocation writes its own
+# profile files (see lib/profiling.py).  Then use:
+#
+#   batch-profile.py list
+#   batch-profile.py merge [--batch ID]
+#   batch-profile.py show FILE [--sort cumulative] [--top 30]
+#
+# to combine the per-charm profiles of a batch and look at the results.
+
+import argparse
+import json
+import logging
+from pathlib import Path
+import pstats
+import sys
+from typing import List, Optional
+
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+sys.path.append(str(SCRIPT_DIR.parent))
+
+from lib.profiling import (
+    MODES,
+    SUFFIXES,
+    find_profiles,
+    merge_profiles,
+    profile_base_dir,
+    profile_dir,
+    read_folded,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Merge and show the profiles written by the tools.')
+    parser.add_argument('--log', dest='loglevel',
+                        type=str.upper,
+                        default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'),
+                        help='Loglevel')
+
+    subparser = parser.add_subparsers(required=True, dest='cmd')
+
+    subparser.add_parser(
+        'list',
+        help='List the batches that have profiles.')
+
+    merge_command = subparser.add_parser(
+        'merge',
+        help='Merge the per-invocation profiles of a batch.')
+    merge_command.add_argument(
+        '--batch', '-b',
+        dest='batch',
+        default=None,
+        help=('The batch to merge; default is the most recently profiled '
+              'batch.'))
+    merge_command.add_argument(
+        '--output-dir', '-o',
+        dest='output_dir',
+        type=Path,
+        default=None,
+        help='Where to write the merged files; default is <batch>/merged.')
+    merge_command.add_argument(
+        '--top', '-n',
+        dest='top',
+        type=int,
+        default=20,
+        help='How many lines of the merged profiles to show.')
+
+    show_command = subparser.add_parser(
+        'show',
+        help='Show a (merged) profile file.')
+    show_command.add_argument('file', type=Path)
+    show_command.add_argument(
+        '--sort', '-s',
+        dest='sort',
+        default='cumulative',
+        help='The pstats sort key (cprofile profiles only).')
+    show_command.add_argument(
+        '--top', '-n',
+        dest='top',
+        type=int,
+        default=30,
+        help='How many lines to show.')
+    return parser.parse_args(argv)
+
+
+def batch_dirs() -> List[Path]:
+    """The batch directories, oldest first."""
+    base = profile_base_dir()
+    if not base.is_dir():
+        return []
+    return sorted((p for p in base.iterdir() if p.is_dir()),
+                  key=lambda p: p.stat().st_mtime)
+
+
+def show(path: Path, sort: str = 'cumulative', top: int = 30) -> None:
+    """Print a profile file of any of the kinds."""
+    name = path.name
+    if name.endswith(SUFFIXES['cprofile']):
+        pstats.Stats(str(path)).sort_stats(sort).print_stats(top)
+    elif name.endswith(SUFFIXES['sample']):
+        counts = read_folded(path)
+        total = sum(counts.values()) or 1
+        # the self time of each function is the innermost frame of a stack.
+        leaves = {}
+        for stack, count in counts.items():
+            leaf = stack.rsplit(';', 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        print(f"{total} samples")
+        for leaf, count in sorted(leaves.items(),
+                                  key=lambda kv: kv[1],
+                                  reverse=True)[:top]:
+            print(f"{count * 100.0 / total:6.2f}% {count:>8} {leaf}")
+    elif name.endswith(SUFFIXES['memory']):
+        with open(path) as f:
+            data = json.load(f)
+        for key in ('invocations', 'max_peak', 'total_peak', 'peak',
+                    'current'):
+            if key in data:
+                print(f"{key}: {data[key]}")
+        for allocation in data.get('top', [])[:top]:
+            print(f"{allocation['size']:>12} {allocation['count']:>8} "
+                  f"{allocation['location']}")
+    else:
+        logger.error("Don't know how to show %s", path)
+
+
+def do_list() -> int:
+    for directory in batch_dirs():
+        counts = ", ".join(
+            f"{mode}: {len(find_profiles(directory, mode))}"
+            for mode in MODES)
+        print(f"{directory.name:<50} {counts}")
+    return 0
+
+
+def do_merge(batch: Optional[str],
+             output_dir: Optional[Path],
+             top: int,
+             ) -> int:
+    if batch is None:
+        dirs = batch_dirs()
+        if not dirs:
+            print("No profiles found.")
+            return 1
+        directory = dirs[-1]
+    else:
+        directory = profile_dir(batch)
+        if not directory.is_dir():
+            logger.error("No profiles for batch %s", batch)
+            return 1
+    merged = merge_profiles(directory, output_dir)
+    if not merged:
+        print(f"No profiles found in {directory}")
+        return 1
+    for mode, path in merged.items():
+        print(f"Merged {mode} profiles into {path}")
+        show(path, top=top)
+    return 0
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+    if args.cmd == 'list':
+        sys.exit(do_list())
+    if args.cmd == 'merge':
+        sys.exit(do_merge(args.batch, args.output_dir, args.top))
+    show(args.file, sort=args.sort, top=args.top)
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+# Record and report on the per-charm, per-stage timings of batch runs.
+#
+# The batch scripts (via lib/timing.sh) and the Python tools (via
+# lib/timing.py) append JSON lines to the timing file.  Use:
+#
+#   batch-timing.py report [--batch ID | --all]
+#
+# to summarise them into the slowest charms and stages and an estimate of
+# the critical path, and:
+#
+#   batch-timing.py run --stage STAGE [--charm CHARM] -- CMD [ARGS ...]
+#
+# to time an arbitrary command as a stage.
+
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+import subprocess
+import sys
+from typing import List
+
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+sys.path.append(str(SCRIPT_DIR.parent))
+
+from lib.timing import (
+    TIMING_FILE_ENV,
+    dir_size,
+    format_report,
+    last_batch,
+    load_records,
+    summarise,
+    timed,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Record and report on timings of batch runs.')
+    parser.add_argument('--log', dest='loglevel',
+                        type=str.upper,
+                        default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'),
+                        help='Loglevel')
+    parser.add_argument('--file',
+                        dest='file',
+                        type=Path,
+                        default=None,
+                        help=('The timing file; default is '
+                              '$RELEASE_TOOLS_TIMING_FILE or '
+                              '~/.cache/release-tools/timing/timing.jsonl'))
+
+    subparser = parser.add_subparsers(required=True, dest='cmd')
+
+    report_command = subparser.add_parser(
+        'report',
+        help='Summarise the timing records.')
+    batch_group = report_command.add_mutually_exclusive_group()
+    batch_group.add_argument(
+        '--batch', '-b',
+        dest='batch',
+        help='The batch to report on; default is the most recent batch.')
+    batch_group.add_argument(
+        '--all',
+        dest='all',
+        action='store_true',
+        default=False,
+        help='Report on all of the records in the file.')
+    report_command.add_argument(
+        '--top', '-n',
+        dest='top',
+        type=int,
+        default=10,
+        help='How many of the slowest charms and stages to show.')
+    report_command.add_argument(
+        '--format', '-f',
+        dest='format',
+        default='table',
+        choices=('table', 'json'),
+        help='Output format.')
+
+    run_command = subparser.add_parser(
+        'run',
+        help='Run a command and record it as a stage.')
+    run_command.add_argument('--stage', '-s', dest='stage', required=True)
+    run_command.add_argument('--charm', '-c', dest='charm', default=None)
+    run_command.add_argument(
+        '--bytes-path',
+        dest='bytes_path',
+        type=Path,
+        default=None,
+        help=('Record the size of this path (after the command) as the '
+              'bytes moved, e.g. the directory that was cloned.'))
+    run_command.add_argument(dest='command',
+                             nargs=argparse.REMAINDER,
+                             metavar='-- CMD',
+                             help='The command to run.')
+    return parser.parse_args(argv)
+
+
+def do_report(args: argparse.Namespace) -> int:
+    records = load_records(args.file)
+    if not args.all:
+        batch = args.batch or last_batch(records)
+        if batch is None:
+            print("No batches found; use --all to report on all records.")
+            return 1
+        records = [r for r in records if r.get('batch') == batch]
+        print(f"Batch: {batch}")
+    report = summarise(records, top=args.top)
+    if args.format == 'json':
+        print(json.dumps(report._asdict(), indent=2))
+    else:
+        print(format_report(report))
+    return 0
+
+
+def do_run(args: argparse.Namespace) -> int:
+    command = args.command
+    if command and command[0] == '--':
+        command = command[1:]
+    if not command:
+        logger.error("No command given to run.")
+        return 2
+    with timed(args.stage, charm=args.charm) as stage:
+        result = subprocess.run(command)
+        stage.status = result.returncode
+        if args.bytes_path is not None and args.bytes_path.exists():
+            stage.bytes_moved = dir_size(args.bytes_path)
+    return result.returncode
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+    if args.file is not None:
+        os.environ[TIMING_FILE_ENV] = str(args.file)
+    if args.cmd == 'report':
+        sys.exit(do_report(args))
+    sys.exit(do_run(args))
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+# Maintain and query an inventory of the charms in ./charms
+#
+# The inventory is an SQLite database (by default in
+# ~/.cache/release-tools/inventory.sqlite) of the facts that the other tools
+# re-derive from the charm repos: charm type, series, bases/platforms,
+# charm_build_name, zuul templates, gerrit project, bundles and branch, and of
+# the charms (and their channels) that the bundles reference.
+#
+# e.g.
+#   ./charm-inventory.py update
+#   ./charm-inventory.py get keystone charm_type
+#   ./charm-inventory.py list --type source-zaza
+#   ./charm-inventory.py list --missing-series noble
+#   ./charm-inventory.py refs vault
+
+import argparse
+import json
+import logging
+from pathlib import Path
+import sys
+from typing import List
+
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+sys.path.append(str(SCRIPT_DIR.parent))
+
+from lib.fleet import CHARMS_DIR
+from lib.inventory import CharmFacts, Inventory, facts_to_json
+from lib.profiling import run_profiled
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description=('Maintain and query the inventory of facts about the '
+                     'charms in the charms directory.'),
+        epilog=("Run 'update' after fetching or modifying charms; only the "
+                "repos whose files have changed are re-scanned."))
+    parser.add_argument('--log', dest='loglevel',
+                        type=str.upper,
+                        default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'),
+                        help='Loglevel')
+    parser.add_argument('--dir', '-d',
+                        dest='directory',
+                        metavar='DIRECTORY',
+                        help=('The directory containing the charm repos. '
+                              'Defaults to ./charms'))
+    parser.add_argument('--db',
+                        dest='db',
+                        type=Path,
+                        metavar='FILE',
+                        help=('The inventory database.  Defaults to '
+                              '~/.cache/release-tools/inventory.sqlite'))
+
+    subparser = parser.add_subparsers(required=True, dest='cmd')
+
+    update_command = subparser.add_parser(
+        'update',
+        help='Scan the changed charm repos into the inventory.')
+    update_command.add_argument(
+        '--charm', '-c',
+        dest='charms',
+        action='append',
+        metavar='CHARM',
+        help='Only update this charm; repeat for more than one charm.')
+    update_command.add_argument(
+        '--workers', '-j',
+        dest='workers',
+        type=int,
+        default=None,
+        help='The number of repos to scan in parallel.')
+    update_command.add_argument(
+        '--full',
+        dest='full',
+        action='store_true',
+        default=False,
+        help='Re-scan every repo even if it has not changed.')
+
+    show_command = subparser.add_parser(
+        'show',
+        help='Show all the facts for a charm as JSON.')
+    show_command.add_argument(dest='charm', metavar='CHARM')
+
+    get_command = subparser.add_parser(
+        'get',
+        help=('Print a single fact for a charm; lists are printed one item '
+              'per line.  Useful from shell scripts.'))
+    get_command.add_argument(dest='charm', metavar='CHARM')
+    get_command.add_argument(dest='fact', metavar='FACT',
+                             choices=CharmFacts._fields)
+
+    list_command = subparser.add_parser(
+        'list',
+        help='List the charms, optionally filtered.')
+    list_command.add_argument(
+        '--type', '-t',
+        dest='charm_type',
+        help="Only charms of this type, e.g. 'source-zaza'.")
+    list_command.add_argument(
+        '--series',
+        dest='series',
+        help='Only charms that have this series in their metadata.')
+    list_command.add_argument(
+        '--missing-series',
+        dest='missing_series',
+        help='Only charms that do NOT have this series in their metadata.')
+    list_command.add_argument(
+        '--base',
+        dest='base',
+        help="Only charms with this base, e.g. 'ubuntu@22.04'.")
+    list_command.add_argument(
+        '--template',
+        dest='template',
+        help="Only charms with a .zuul.yaml template matching the glob.")
+    list_command.add_argument(
+        '--format', '-f',
+        dest='format',
+        default='names',
+        choices=('names', 'json'),
+        help='Output format.')
+
+    refs_command = subparser.add_parser(
+        'refs',
+        help=("List the bundle lines that reference the charms, with the "
+              "channel they are on."))
+    refs_command.add_argument(dest='charms', metavar='CHARM', nargs='*',
+                              help='The charms; default all of them.')
+    refs_command.add_argument(
+        '--managed',
+        dest='managed',
+        action='store_true',
+        default=False,
+        help=('Only the references that update-channel-single.py sets the '
+              'channel of.'))
+    refs_command.add_argument(
+        '--format', '-f',
+        dest='format',
+        default='lines',
+        choices=('lines', 'files', 'json'),
+        help=("Output format: 'lines' is <charm-dir>/<bundle>:<line> "
+              "<charm> <channel>, 'files' is just the bundle paths."))
+
+    return parser.parse_args(argv)
+
+
+def do_update(args: argparse.Namespace, inventory: Inventory) -> int:
+    summary = inventory.update(names=args.charms,
+                               workers=args.workers,
+                               full=args.full)
+    print(f"Scanned: {len(summary.scanned)}, "
+          f"unchanged: {len(summary.unchanged)}, "
+          f"removed: {len(summary.removed)}, "
+          f"failed: {len(summary.failed)}")
+    for name in summary.failed:
+        print(f"  failed: {name}")
+    return 1 if summary.failed else 0
+
+
+def do_show(args: argparse.Namespace, inventory: Inventory) -> int:
+    try:
+        print(facts_to_json(inventory.facts(args.charm)))
+    except KeyError as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+def do_get(args: argparse.Namespace, inventory: Inventory) -> int:
+    try:
+        value = inventory.get(args.charm, args.fact)
+    except KeyError as e:
+        logger.error(str(e))
+        return 1
+    if isinstance(value, list):
+        for item in value:
+            print(item)
+    elif value is not None:
+        print(value)
+    return 0
+
+
+def do_list(args: argparse.Namespace, inventory: Inventory) -> int:
+    names = inventory.charms()
+    filters = []
+    if args.charm_type:
+        filters.append(inventory.charms_of_type(args.charm_type))
+    if args.series:
+        filters.append(inventory.charms_with_series(args.series))
+    if args.missing_series:
+        filters.append(inventory.charms_without_series(args.missing_series))
+    if args.base:
+        filters.append(inventory.charms_with_base(args.base))
+    if args.template:
+        filters.append(inventory.charms_with_template(args.template))
+    for selected in filters:
+        keep = set(selected)
+        names = [n for n in names if n in keep]
+    if args.format == 'json':
+        print(json.dumps([inventory.facts(n)._asdict() for n in names],
+                         indent=2))
+    else:
+        for name in names:
+            print(name)
+    return 0
+
+
+def do_refs(args: argparse.Namespace, inventory: Inventory) -> int:
+    refs = inventory.bundle_refs(args.charms or None,
+                                 managed_only=args.managed)
+    if args.format == 'json':
+        print(json.dumps([ref._asdict() for ref in refs], indent=2))
+    elif args.format == 'files':
+        for path in dict.fromkeys(str(ref.path) for ref in refs):
+            print(path)
+    else:
+        for ref in refs:
+            print(f"{ref.name}/{ref.bundle}:{ref.line} {ref.charm} "
+                  f"{ref.channel or '-'}")
+    return 0
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+    logging.getLogger('lib').setLevel(getattr(logging, args.loglevel, 'INFO'))
+
+    directory = Path(args.directory) if args.directory else CHARMS_DIR
+    commands = {
+        'update': do_update,
+        'show': do_show,
+        'get': do_get,
+        'list': do_list,
+        'refs': do_refs,
+    }
+    with Inventory(directory, args.db) as inventory:
+        sys.exit(commands[args.cmd](args, inventory))
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    run_profiled(main)
@@ -9,7 +9,6 @@ import argparse
 import logging
 from pathlib import Path
 from typing import List, Optional, NamedTuple
-import requests
 import subprocess
 import sys
 
@@ -20,6 +19,8 @@ CHARMS_DIR = SCRIPT_DIR / 'charms'
 
 from lib.lp_builder import get_charms, Charm
 from lib.channel_map import decode_channel_map
+from lib.timing import timed
+from lib.profiling import run_profiled
 
 # from https://api.snapcraft.io/docs/charms.html
 CHARMHUB_BASE = "https://api.charmhub.io/v2/charms"
@@ -50,13 +51,17 @@ def release(
     ignore_errors: bool = False,
 ):
     """Promote the list of charms from one channel to another."""
+    # requests is slow to import, so only import it when it is used.
+    import requests
+
     releases: List[Release] = []
     errors: List[NoRelease] = []
     already_released: List[Release] = []
     for charm in charms:
         print(charm.charmhub)
         cr = INFO_URL.format(charm=charm.charmhub)
-        result = requests.get(cr).json()
+        with timed('charmhub-info', charm=charm.charmhub):
+            result = requests.get(cr).json()
         try:
             from_revision = decode_channel_map(
                 charm.charmhub, result, track, from_channel,
@@ -140,7 +145,8 @@ def release(
                f"--channel={track}/{to_channel}")
         print(f"Doing: {cmd}")
         try:
-            subprocess.check_call(cmd.split())
+            with timed('release', charm=release.charmhub):
+                subprocess.check_call(cmd.split())
             successes.append(release.charmhub)
         except Exception as e:
             if ignore_errors:
@@ -309,4 +315,4 @@ def main() -> None:
 
 if __name__ == '__main__':
     logging.basicConfig()
-    main()
+    run_profiled(main)
@@ -9,7 +9,6 @@ import argparse
 import logging
 from pathlib import Path
 from typing import List, Optional, NamedTuple
-import requests
 import subprocess
 import sys
 
@@ -20,6 +19,7 @@ CHARMS_DIR = SCRIPT_DIR / 'charms'
 
 from lib.lp_builder import get_charms, Charm
 from lib.channel_map import decode_channel_map
+from lib.profiling import run_profiled
 
 # from https://api.snapcraft.io/docs/charms.html
 CHARMHUB_BASE = "https://api.charmhub.io/v2/charms"
@@ -53,6 +53,9 @@ def clean_track(
     that is released there, then closes the track, and then re-releases the
     revision back to this track.  That cleans the track up.
     """
+    # requests is slow to import, so only import it when it is used.
+    import requests
+
     releases: List[Release] = []
     errors: List[NoRelease] = []
     for charm in charms:
@@ -270,4 +273,4 @@ def main() -> None:
 
 if __name__ == '__main__':
     logging.basicConfig()
-    main()
+    run_profiled(main)
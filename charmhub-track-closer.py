@@ -9,7 +9,6 @@ import argparse
 import logging
 from pathlib import Path
 from typing import List, Optional, NamedTuple
-import requests
 import subprocess
 import sys
 
@@ -20,6 +19,7 @@ CHARMS_DIR = SCRIPT_DIR / 'charms'
 
 from lib.lp_builder import get_charms, Charm
 from lib.channel_map import decode_channel_map_to_risks, RISKS
+from lib.profiling import run_profiled
 
 # from https://api.snapcraft.io/docs/charms.html
 CHARMHUB_BASE = "https://api.charmhub.io/v2/charms"
@@ -61,6 +61,9 @@ def close_track(
     :param ignore_errors: if an error occures, if this is set to True then the
         error is logged rather than stopping the function.
     """
+    # requests is slow to import, so only import it when it is used.
+    import requests
+
     releases: List[Release] = []
     errors: List[NoRelease] = []
     for charm in charms:
@@ -298,4 +301,4 @@ def main() -> None:
 
 if __name__ == '__main__':
     logging.basicConfig()
-    main()
+    run_profiled(main)
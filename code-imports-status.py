@@ -1,18 +1,15 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
 import os
 import glob
 import sys
 
-import git
-import humanize
-import yaml
-
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
-from launchpadlib.launchpad import Launchpad
+from lib.profiling import run_profiled
 
 try:
     from importlib_resources import files, as_file  # type: ignore
@@ -36,9 +33,21 @@ CODE_IMPORT_WARN_CODES = ['Pending Review', 'Invalid']
 CODE_IMPORT_OK_CODES = ['Reviewed']
 
 cachedir = os.path.expanduser("~/.release-tools/cache")
-os.makedirs(cachedir, exist_ok=True)
-launchpad = Launchpad.login_anonymously('charmed-openstack release-tools',
-                                        'production', cachedir, version='devel')
+# The Launchpad connection; made on first use by get_launchpad() so that
+# e.g. --help doesn't need launchpadlib or the network.
+_launchpad = None
+
+
+def get_launchpad():
+    """Log in to Launchpad anonymously, once."""
+    global _launchpad
+    if _launchpad is None:
+        from launchpadlib.launchpad import Launchpad
+        os.makedirs(cachedir, exist_ok=True)
+        _launchpad = Launchpad.login_anonymously(
+            'charmed-openstack release-tools', 'production', cachedir,
+            version='devel')
+    return _launchpad
 
 
 def setup_options():
@@ -56,12 +65,14 @@ def setup_options():
 
 
 def get_lp_repo(project: str):
-    repo = launchpad.git_repositories.getByPath(path=project)
+    repo = get_launchpad().git_repositories.getByPath(path=project)
 
     return repo
 
 
 def get_repo(repo_dst, upstream_url, mirror_url):
+    import git
+
     if os.path.isdir(repo_dst):
         git_repo = git.Repo(repo_dst)
         for remote in git_repo.remotes:
@@ -70,7 +81,7 @@ def get_repo(repo_dst, upstream_url, mirror_url):
         git_repo.remotes.origin.pull()
     else:
         git_repo = git.Repo.clone_from(upstream_url, repo_dst)
-        mirror_remote = git_repo.create_remote('mirror', repo.git_https_url)
+        mirror_remote = git_repo.create_remote('mirror', mirror_url)
         mirror_remote.fetch()
 
     return git_repo
@@ -96,6 +107,7 @@ def find_missing_commits(git_repo):
 
 
 def print_report(output):
+    import humanize
 
     for name, project in output.items():
         if not project['code_import_available']:
@@ -127,8 +139,8 @@ def print_report(output):
                 for line in log.split('\n'):
                     print(f'    {line}')
 
-def main(cfg_dir):
-    opts = setup_options()
+def check_code_imports(opts, cfg_dir):
+    import yaml
 
     if opts.category:
         fpath = os.path.join(cfg_dir, f'{opts.category}.yaml')
@@ -175,7 +187,14 @@ def main(cfg_dir):
         print_report(output)
 
 
-if __name__ == '__main__':
+def main():
+    # parse the options first so that --help needs neither the config nor
+    # Launchpad.
+    opts = setup_options()
     config_dir = files('charmed_openstack_info.data.lp-builder-config')
     with as_file(config_dir) as cfg_dir:
-        main(cfg_dir)
+        check_code_imports(opts, cfg_dir)
+
+
+if __name__ == '__main__':
+    run_profiled(main)
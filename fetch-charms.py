@@ -20,6 +20,8 @@ sys.path.append(str(SCRIPT_DIR.parent))
 CHARMS_DIR = SCRIPT_DIR / 'charms'
 
 from lib.lp_builder import get_charms, Charm
+from lib.profiling import run_profiled
+from lib.timing import dir_size, timed
 
 
 logger = logging.getLogger(__name__)
@@ -106,7 +108,10 @@ def fetch_charms(charms: List[Charm],
         if not dest.exists():
             print(f"Cloning {c.charmhub} from {c.repository} to {dest}")
             command = f"git clone {c.repository} {dest}"
-            check_call(command.split())
+            with timed('clone', charm=c.charmhub) as stage:
+                check_call(command.split())
+                if dest.exists():
+                    stage.bytes_moved = dir_size(dest)
 
         # Ensure that the stable branch has a --track version.
         if branch is not None and branch != 'master':
@@ -123,7 +128,7 @@ def fetch_charms(charms: List[Charm],
         # verify we are checked out into the required branch
         target_branch = "master" if branch is None else branch
         command = f"git checkout {target_branch}"
-        with change_directory_to(dest):
+        with change_directory_to(dest), timed('checkout', charm=c.charmhub):
             try:
                 check_call(command.split())
             except subprocess.CalledProcessError as e:
@@ -363,4 +368,4 @@ def main() -> None:
 
 if __name__ == '__main__':
     logging.basicConfig()
-    main()
+    run_profiled(main)
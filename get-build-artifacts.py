@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+# Pull the build.lock files and pip freezes of the charms from their
+# charmcraft build containers.
+#
+# This does what get-build-lock and get-ops-pip-freeze do for one charm, but
+# for all the charms at once: the containers are listed once and matched to
+# the charms, and then the containers are started (if stopped) and queried
+# concurrently, with at most -j at a time.  By default a reactive (source)
+# charm gets its src/build.lock and an ops charm its pip-freeze.txt.
+
+import argparse
+import csv
+import functools
+import logging
+from pathlib import Path
+import re
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from lib.fleet import (
+    Result,
+    add_fleet_arguments,
+    charm_dirs_from_args,
+    default_workers,
+    print_summary,
+    run_pool,
+)
+from lib.output import write_if_changed
+from lib import readonly
+from lib.profiling import run_profiled
+from lib.timing import timed
+
+
+logger = logging.getLogger(__name__)
+
+LXD_PROJECT = 'charmcraft'
+
+BUILD_LOCK = 'build-lock'
+PIP_FREEZE = 'pip-freeze'
+# where the artifacts go in the charm, as for get-build-lock and
+# get-ops-pip-freeze.
+DEFAULT_DESTS = {
+    BUILD_LOCK: 'src/build.lock',
+    PIP_FREEZE: 'pip-freeze.txt',
+}
+# the artifacts for each kind of charm, when none are asked for.
+ARTIFACTS_BY_STRUCTURE = {
+    'source': (BUILD_LOCK,),
+    'ops': (PIP_FREEZE,),
+}
+
+STAGING_PIP = '/root/parts/charm/build/staging-venv/bin/pip'
+
+
+class Container(NamedTuple):
+    """A charmcraft build container and its state (e.g. RUNNING)."""
+    name: str
+    state: str
+
+
+class Extracted(NamedTuple):
+    """What was done for a charm: the container used, whether it had to be
+    started, the files written and notes on anything skipped."""
+    container: str
+    started: bool
+    written: List[Path]
+    notes: List[str]
+
+
+def lxc(*args: str) -> str:
+    """Run an lxc command in the charmcraft project and return its output.
+
+    :raises: RuntimeError (with lxc's error) if the command fails.
+    """
+    cmd = ['lxc', args[0], '--project', LXD_PROJECT, *args[1:]]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise RuntimeError("lxc isn't installed")
+    if proc.returncode != 0:
+        raise RuntimeError(f"lxc {' '.join(args)} failed: "
+                           f"{proc.stderr.strip()}")
+    return proc.stdout
+
+
+def list_containers() -> List[Container]:
+    """List the charmcraft build containers, once for all the charms."""
+    output = lxc('list', '--format', 'csv', '--columns', 'ns')
+    return [Container(row[0], row[1] if len(row) > 1 else '')
+            for row in csv.reader(output.splitlines()) if row]
+
+
+def build_name(charm_dir: Path) -> str:
+    """The name charmcraft builds the charm as: charm_build_name in
+    osci.yaml, or else the directory name."""
+    return readonly.osci_var(charm_dir, 'charm_build_name', charm_dir.name)
+
+
+def find_container(containers: Sequence[Container],
+                   name: str,
+                   ) -> Optional[Container]:
+    """Find the container of the charm: charmcraft-<name>-<number>-...
+
+    As with get-build-lock, the first one listed is used if there are
+    several.
+    """
+    match = re.compile(rf"^charmcraft-{re.escape(name)}-[0-9]")
+    for container in containers:
+        if match.match(container.name):
+            return container
+    return None
+
+
+def ensure_running(container: Container) -> bool:
+    """Start the container if it is stopped; True if it was started."""
+    if container.state.upper() != 'STOPPED':
+        return False
+    lxc('start', container.name)
+    return True
+
+
+def pull_build_lock(container: Container, dest: Path) -> bool:
+    """Copy the build.lock from the container's /root to dest.
+
+    :returns: True if dest was written, False if it was unchanged.
+    :raises: RuntimeError if the container has no build.lock.
+    """
+    found = lxc('exec', container.name, '--',
+                'find', '/root', '-name', 'build.lock').splitlines()
+    if not found:
+        raise RuntimeError(f"Couldn't find build.lock in {container.name}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pulled = Path(tmpdir) / 'build.lock'
+        lxc('file', 'pull', f"{container.name}{found[0].strip()}",
+            str(pulled))
+        content = pulled.read_bytes()
+    return write_if_changed(dest, content)
+
+
+def pull_pip_freeze(container: Container, dest: Path) -> bool:
+    """Write the pip freeze of the container's staging venv to dest.
+
+    :returns: True if dest was written, False if it was unchanged.
+    """
+    freeze = lxc('exec', container.name, '--', STAGING_PIP, 'freeze')
+    return write_if_changed(dest, freeze.rstrip('\n') + '\n')
+
+
+PULLERS = {
+    BUILD_LOCK: pull_build_lock,
+    PIP_FREEZE: pull_pip_freeze,
+}
+
+
+def artifacts_for(charm_dir: Path) -> Tuple[str, ...]:
+    """The artifacts that a charm has, by its type."""
+    # sqlite3 is slow to import, and the inventory isn't needed for --help.
+    from lib.inventory import classify_charm
+    charm_type = classify_charm(charm_dir) or 'unknown'
+    return ARTIFACTS_BY_STRUCTURE.get(charm_type.split('-')[0], ())
+
+
+def extract(charm_dir: Path,
+            containers: Sequence[Container],
+            artifacts: Sequence[str] = (),
+            dests: Optional[Dict[str, str]] = None,
+            ) -> Extracted:
+    """Pull the artifacts of a charm from its build container.
+
+    :param charm_dir: the root of the charm.
+    :param containers: the charmcraft containers, from `list_containers`.
+    :param artifacts: the artifacts (BUILD_LOCK, PIP_FREEZE) to pull;
+        default is by the type of the charm.
+    :param dests: where to put each artifact, relative to the charm_dir;
+        default is DEFAULT_DESTS.
+    :raises: RuntimeError if there isn't a container for the charm or lxc
+        fails.
+    """
+    dests = {**DEFAULT_DESTS, **(dests or {})}
+    artifacts = tuple(artifacts) or artifacts_for(charm_dir)
+    if not artifacts:
+        return Extracted('', False, [], ["nothing to extract for this type "
+                                         "of charm"])
+    name = build_name(charm_dir)
+    container = find_container(containers, name)
+    if container is None:
+        raise RuntimeError(f"Can't find a container for {name}")
+    written = []
+    with timed('get-build-artifacts', charm=charm_dir.name):
+        started = ensure_running(container)
+        for artifact in artifacts:
+            dest = charm_dir / dests[artifact]
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if PULLERS[artifact](container, dest):
+                written.append(dest)
+    return Extracted(container.name, started, written, [])
+
+
+def report(results: List[Result]) -> int:
+    """Print the result for each charm and a summary.
+
+    :param results: the result (an `Extracted`) for each charm directory.
+    :returns: the number of charms that failed.
+    """
+    changed = failed = 0
+    for result in results:
+        name = result.item.name
+        if not result.ok:
+            failed += 1
+            print(f"{name}: FAILED: {result.error}")
+            continue
+        container, started, written, notes = result.value
+        notes = list(notes)
+        if container:
+            notes.insert(0, f"{container} (started)" if started
+                         else container)
+        if written:
+            changed += 1
+            notes.append("wrote " + ", ".join(
+                str(p.relative_to(result.item)) for p in written))
+        else:
+            notes.append("unchanged")
+        print(f"{name}: {'; '.join(notes)}")
+    print_summary(len(results), changed, failed)
+    return failed
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description=("Pull the build.lock files and pip freezes of the charms "
+                     "from their charmcraft build containers into the charm "
+                     "repos."),
+        epilog=("By default a reactive charm gets its build.lock and an ops "
+                "charm its pip freeze."))
+    add_fleet_arguments(parser,
+                        workers_help=("The number of containers to start and "
+                                      "query at once."))
+    parser.add_argument('--build-lock',
+                        dest='artifacts',
+                        action='append_const',
+                        const=BUILD_LOCK,
+                        help="Pull the build.lock of every charm.")
+    parser.add_argument('--pip-freeze',
+                        dest='artifacts',
+                        action='append_const',
+                        const=PIP_FREEZE,
+                        help="Pull the pip freeze of every charm.")
+    parser.add_argument('--build-lock-dest',
+                        dest='build_lock_dest',
+                        default=DEFAULT_DESTS[BUILD_LOCK],
+                        metavar='PATH',
+                        help=("Where to put the build.lock in the charm; "
+                              "default is %(default)s."))
+    parser.add_argument('--pip-freeze-dest',
+                        dest='pip_freeze_dest',
+                        default=DEFAULT_DESTS[PIP_FREEZE],
+                        metavar='PATH',
+                        help=("Where to put the pip freeze in the charm; "
+                              "default is %(default)s."))
+    parser.add_argument('--log', dest='loglevel',
+                        type=str.upper,
+                        default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'),
+                        help='Loglevel')
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+
+    charm_dirs = charm_dirs_from_args(args)
+    if not charm_dirs:
+        logger.error("No charms found in %s", args.charms_dir)
+        sys.exit(1)
+    try:
+        containers = list_containers()
+    except RuntimeError as e:
+        logger.error("%s", e)
+        sys.exit(1)
+    pull = functools.partial(
+        extract, containers=containers,
+        artifacts=tuple(dict.fromkeys(args.artifacts or ())),
+        dests={BUILD_LOCK: args.build_lock_dest,
+               PIP_FREEZE: args.pip_freeze_dest})
+    # threads, as the work is done by lxc.
+    results = run_pool(pull, charm_dirs,
+                       workers=args.workers or default_workers())
+    if report(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    run_profiled(main)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+# Skip operations on charms whose inputs haven't changed since the last
+# successful run.
+#
+# The batch scripts use this to avoid re-running an operation (copying the
+# tox.ini files, pip-compile, etc.) on every charm when nothing it depends on
+# has changed.  Either:
+#
+#   input-ledger.py run --op OPERATION --input FILE ... -- CMD [ARGS ...]
+#
+# which runs CMD in the charm dir only if the inputs have changed, and records
+# the inputs if CMD succeeds, or, from a shell script:
+#
+#   rc=0
+#   input-ledger.py changed --op OPERATION --input FILE ... || rc=$?
+#   if [ $rc -eq 0 ]; then
+#       ... do the operation ...
+#       input-ledger.py record --op OPERATION --input FILE ...
+#   elif [ $rc -ne 3 ]; then
+#       exit $rc    # the ledger failed
+#   fi
+#
+# Inputs are relative to the charm dir (default: the current directory) and
+# may be files, directories or glob patterns.  --force (or
+# RELEASE_TOOLS_FORCE=1) always runs the operation.
+
+import argparse
+import logging
+import os
+from pathlib import Path
+import subprocess
+import sys
+from typing import List
+
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+sys.path.append(str(SCRIPT_DIR.parent))
+
+from lib.ledger import CHARM_TYPE_INPUTS, Ledger
+from lib.profiling import run_profiled
+
+
+logger = logging.getLogger(__name__)
+
+# Exit code of 'changed' when the inputs are unchanged.  Not 1, which is also
+# what python exits with on an uncaught exception: a failing ledger mustn't
+# look like an unchanged charm.
+UNCHANGED = 3
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description=('Record input hashes per charm and operation so that '
+                     'operations on unchanged charms can be skipped.'))
+    parser.add_argument('--log', dest='loglevel',
+                        type=str.upper,
+                        default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'),
+                        help='Loglevel')
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--op', '-o',
+                        dest='operation',
+                        required=True,
+                        help='The name of the operation.')
+    common.add_argument('--charm-dir', '-d',
+                        dest='charm_dir',
+                        type=Path,
+                        default=Path('.'),
+                        help='The charm dir; default is the current dir.')
+
+    inputs = argparse.ArgumentParser(add_help=False)
+    inputs.add_argument('--input', '-i',
+                        dest='inputs',
+                        action='append',
+                        default=[],
+                        metavar='PATH',
+                        help=('An input file, directory or glob pattern. '
+                              'Repeat for more than one.'))
+    inputs.add_argument('--charm-type-inputs',
+                        dest='charm_type_inputs',
+                        action='store_true',
+                        default=False,
+                        help=('Add the files that determine the charm type '
+                              '(see what-is) to the inputs.'))
+    inputs.add_argument('--extra', '-e',
+                        dest='extra',
+                        action='append',
+                        default=[],
+                        metavar='VALUE',
+                        help=('Extra value (e.g. an argument to the '
+                              'operation) to include in the hash.'))
+    inputs.add_argument('--force', '-f',
+                        dest='force',
+                        action='store_true',
+                        default=os.environ.get('RELEASE_TOOLS_FORCE') == '1',
+                        help=('Treat the inputs as changed.  Also set by '
+                              'RELEASE_TOOLS_FORCE=1'))
+
+    subparser = parser.add_subparsers(required=True, dest='cmd')
+    subparser.add_parser(
+        'changed',
+        parents=[common, inputs],
+        help=(f'Exit 0 if the inputs changed since they were last recorded '
+              f'(or --force), {UNCHANGED} if not.'))
+    subparser.add_parser(
+        'record',
+        parents=[common, inputs],
+        help='Record the inputs after a successful operation.')
+    run_command = subparser.add_parser(
+        'run',
+        parents=[common, inputs],
+        help=('Run the command in the charm dir if the inputs changed, '
+              'recording them if it succeeds.'))
+    run_command.add_argument(dest='command',
+                             nargs=argparse.REMAINDER,
+                             metavar='-- CMD',
+                             help='The command to run.')
+    subparser.add_parser(
+        'forget',
+        parents=[common],
+        help='Forget the recorded inputs so the operation runs next time.')
+    return parser.parse_args(argv)
+
+
+def _inputs(args: argparse.Namespace) -> List[str]:
+    inputs = list(args.inputs)
+    if args.charm_type_inputs:
+        inputs.extend(CHARM_TYPE_INPUTS)
+    return inputs
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+
+    ledger = Ledger(args.operation)
+    charm_dir = args.charm_dir.resolve()
+    name = charm_dir.name
+
+    if args.cmd == 'forget':
+        ledger.forget(charm_dir)
+        return
+
+    inputs = _inputs(args)
+    if args.cmd == 'record':
+        ledger.record(charm_dir, inputs, args.extra)
+        return
+
+    unchanged = (not args.force and
+                 ledger.is_unchanged(charm_dir, inputs, args.extra))
+    if args.cmd == 'changed':
+        if unchanged:
+            print(f" . {name}: inputs for {args.operation} unchanged.")
+        sys.exit(UNCHANGED if unchanged else 0)
+
+    # run
+    command = args.command
+    if command and command[0] == '--':
+        command = command[1:]
+    if not command:
+        logger.error("No command given to run.")
+        sys.exit(2)
+    if unchanged:
+        print(f" . {name}: inputs for {args.operation} unchanged; "
+              f"skipping.")
+        return
+    result = subprocess.run(command, cwd=charm_dir)
+    if result.returncode != 0:
+        # don't record; the operation needs to run again next time.
+        sys.exit(result.returncode)
+    ledger.record(charm_dir, inputs, args.extra)
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    run_profiled(main)
@@ -0,0 +1,179 @@
+"""A small harness for timing operations over a (synthetic) fleet.
+
+A benchmark is a `Case`: an optional setup function that is run, untimed,
+before each repetition (e.g. to restore the files that the operation
+rewrites) and the function that is timed.  `measure` runs a case and the
+results for each case and fleet size are saved as JSON so that a later run
+can be compared against them:
+
+    ~/.cache/release-tools/benchmarks/<label>.json
+
+See run-benchmarks.py for the benchmarks themselves.
+"""
+
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from lib.fleet import user_cache_dir
+
+
+RESULTS_VERSION = 1
+RESULTS_DIR_ENV = 'RELEASE_TOOLS_BENCHMARK_DIR'
+
+
+class Case(NamedTuple):
+    """The functions for one benchmark at one fleet size."""
+    run: Callable[[], None]
+    setup: Optional[Callable[[], None]] = None
+
+
+class BenchResult(NamedTuple):
+    """The timings, in seconds, of a benchmark over the whole fleet."""
+    name: str
+    size: int
+    repeat: int
+    best: float
+    median: float
+    mean: float
+
+    @property
+    def per_charm(self) -> float:
+        return self.best / self.size if self.size else 0.0
+
+
+class Comparison(NamedTuple):
+    name: str
+    size: int
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else 0.0
+
+
+def measure(name: str, size: int, case: Case, repeat: int = 3) -> BenchResult:
+    """Time a case, running its setup before each repetition.
+
+    :param name: the name of the benchmark.
+    :param size: the number of charms in the fleet.
+    :param case: the case to time.
+    :param repeat: how many times to run the case.
+    """
+    timings: List[float] = []
+    for _ in range(max(1, repeat)):
+        if case.setup is not None:
+            case.setup()
+        t0 = time.perf_counter()
+        case.run()
+        timings.append(time.perf_counter() - t0)
+    return BenchResult(name=name,
+                       size=size,
+                       repeat=len(timings),
+                       best=min(timings),
+                       median=statistics.median(timings),
+                       mean=statistics.mean(timings))
+
+
+def results_dir() -> Path:
+    """Where saved results go: $RELEASE_TOOLS_BENCHMARK_DIR or the cache."""
+    path = os.environ.get(RESULTS_DIR_ENV, None)
+    if path:
+        Path(path).mkdir(parents=True, exist_ok=True)
+        return Path(path)
+    return user_cache_dir('benchmarks')
+
+
+def results_path(label: str) -> Path:
+    """The file for a label; a label containing a '/' is used as a path."""
+    if '/' in label or label.endswith('.json'):
+        return Path(label)
+    return results_dir() / f"{label}.json"
+
+
+def save_results(results: List[BenchResult], label: str) -> Path:
+    """Save results under a label.
+
+    :returns: the path of the file written.
+    """
+    path = results_path(label)
+    data = {
+        'version': RESULTS_VERSION,
+        'label': label,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': [r._asdict() for r in results],
+    }
+    tmp = path.with_suffix('.json.new')
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def load_results(label: str) -> List[BenchResult]:
+    """Load the results saved under a label (or from a path).
+
+    :raises FileNotFoundError: if there are no results for the label.
+    :raises ValueError: if the results are from an incompatible version.
+    """
+    with open(results_path(label)) as f:
+        data = json.load(f)
+    if data.get('version') != RESULTS_VERSION:
+        raise ValueError(f"Results {label} are version {data.get('version')}; "
+                         f"expected {RESULTS_VERSION}")
+    return [BenchResult(**r) for r in data['results']]
+
+
+def saved_labels() -> List[str]:
+    return sorted(p.stem for p in results_dir().glob('*.json'))
+
+
+def compare(baseline: List[BenchResult],
+            current: List[BenchResult],
+            ) -> List[Comparison]:
+    """Compare the best times of the benchmarks that are in both results."""
+    base: Dict[tuple, BenchResult] = {(r.name, r.size): r for r in baseline}
+    comparisons: List[Comparison] = []
+    for r in current:
+        b = base.get((r.name, r.size), None)
+        if b is None:
+            continue
+        comparisons.append(Comparison(r.name, r.size, b.best, r.best))
+    return comparisons
+
+
+def regressions(comparisons: List[Comparison],
+                threshold: float,
+                ) -> List[Comparison]:
+    """The comparisons that are slower than the baseline by threshold."""
+    return [c for c in comparisons if c.ratio > threshold]
+
+
+def format_results(results: List[BenchResult]) -> str:
+    lines = [f"{'Benchmark':<28} {'Charms':>6} {'Best(s)':>10} "
+             f"{'Median(s)':>10} {'Per charm(ms)':>14}",
+             f"{'-' * 28} {'-' * 6} {'-' * 10} {'-' * 10} {'-' * 14}"]
+    for r in results:
+        lines.append(f"{r.name:<28} {r.size:>6} {r.best:>10.4f} "
+                     f"{r.median:>10.4f} {r.per_charm * 1000:>14.3f}")
+    return "\n".join(lines)
+
+
+def format_comparison(comparisons: List[Comparison],
+                      threshold: float,
+                      ) -> str:
+    lines = [f"{'Benchmark':<28} {'Charms':>6} {'Baseline(s)':>12} "
+             f"{'Current(s)':>12} {'Ratio':>7}",
+             f"{'-' * 28} {'-' * 6} {'-' * 12} {'-' * 12} {'-' * 7}"]
+    for c in comparisons:
+        flag = "  REGRESSION" if c.ratio > threshold else ""
+        lines.append(f"{c.name:<28} {c.size:>6} {c.baseline:>12.4f} "
+                     f"{c.current:>12.4f} {c.ratio:>7.2f}{flag}")
+    return "\n".join(lines)
@@ -0,0 +1,86 @@
+"""Finding the charms that the bundles (and overlays) in a charm repo use.
+
+The regexes here are the ones that update-channel-single.py uses to find
+the 'charm:' lines in a bundle and the 'channel:' in the same block.  They
+are here so that the charm inventory can index the same references: a charm
+maps to the (bundle, line) locations that use it and their current channel,
+so that an update for a few charms only has to open the bundles that
+reference them.
+"""
+
+import re
+from typing import Iterable, List, NamedTuple, Optional
+
+
+# This matches against a charm: <spec> where spec is either quoted or unquoted
+# version of cs:~openstack-charmers/<name> or
+# cs:~openstack-charmers-next/<name>
+# or ch:<name>
+# Includes 3 capture groups:
+# 1. the whitespace at the beginning of the line
+# 2. the prefix (cs: or ch:)
+# 3. the charm name
+CHARM_MATCH = re.compile(
+    r'^(\s*)charm:\s+(?:|' + r"'" + r'|")'
+    r'(ch:|cs:(?:~openstack-charmers/|~openstack-charmers-next/))'
+    r'([a-zA-Z0-9-]+)(?:|' + r"'" + r'|")\s*(?:|#.*)$')
+CHANNEL_MATCH = re.compile(r'^(\s*)channel:\s+(\S+)\s*(?:|#.*)$')
+# Match any charm; used after the specific CHARM_MATCH to re-write charms using
+# as cs: prefix to a ch: prefix if needed.
+ANY_CHARM_MATCH = re.compile(
+    r'^(\s*)charm:\s+(?:|' + r"'" + r'|")'
+    r'(cs:.*/)'
+    r'([a-zA-Z0-9-]+)(?:|' + r"'" + r'|")\s*(?:|#.*)$')
+
+
+class CharmRef(NamedTuple):
+    """A 'charm:' line in a bundle.
+
+    managed is True if the line matches CHARM_MATCH, i.e. it is a charm whose
+    channel update-channel-single.py sets; otherwise it only matched
+    ANY_CHARM_MATCH (a cs:<owner>/ charm that --ensure-charmhub rewrites).
+    The line numbers start at 1; channel_line is None if the charm's block
+    has no channel.
+    """
+    charm: str
+    line: int
+    prefix: str
+    managed: bool
+    channel: Optional[str]
+    channel_line: Optional[int]
+
+
+def find_charm_refs(lines: Iterable[str]) -> List[CharmRef]:
+    """Find the charms, and their channels, in the lines of a bundle.
+
+    The block of a charm is found in the same way as `modify_channel()` in
+    update-channel-single.py: it is the lines, following the 'charm:' line,
+    that start with the same indent, and its channel is the first 'channel:'
+    at exactly that indent.
+
+    :param lines: the lines of the bundle.
+    :returns: the references in the order they appear in the bundle.
+    """
+    refs: List[CharmRef] = []
+    indent: Optional[str] = None
+    for number, line in enumerate(lines, start=1):
+        if indent is not None:
+            if line.startswith(indent):
+                channel_match = CHANNEL_MATCH.match(line)
+                if channel_match and channel_match[1] == indent:
+                    refs[-1] = refs[-1]._replace(channel=channel_match[2],
+                                                 channel_line=number)
+                    indent = None
+                    continue
+            else:
+                indent = None
+        match = CHARM_MATCH.match(line) or ANY_CHARM_MATCH.match(line)
+        if match:
+            refs.append(CharmRef(charm=match[3],
+                                 line=number,
+                                 prefix=match[2],
+                                 managed=match.re is CHARM_MATCH,
+                                 channel=None,
+                                 channel_line=None))
+            indent = match[1]
+    return refs
@@ -0,0 +1,246 @@
+"""Helpers for tools that operate on the whole fleet of charm repositories.
+
+Most of the tools in this repository work on the charms that have been fetched
+into ./charms/<charm> (see fetch-charms.py).  The original tools are driven
+one charm at a time by the shell batch scripts (do-batch-with, etc.).  This
+module provides the common pieces for tools that handle many charms in a single
+process:
+
+  * `find_charm_dirs` - the charm repos in a charms directory.
+  * `charm_name_for` - the charm that a file belongs to.
+  * `user_cache_dir` - a per-user cache directory outside of the repo.
+  * `expand_filenames` - expand the quoted globs passed to a tool.
+  * `run_pool` - run a function over many items in a bounded worker pool,
+    capturing per-item results and errors so that a report can be printed at
+    the end.
+  * `add_fleet_arguments` and `charm_dirs_from_args` - the common options
+    for choosing the charms, and the charm directories that they give.
+  * `print_summary` - the last line of a tool's report.
+"""
+
+import argparse
+import glob
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, NamedTuple, Optional
+
+
+# The default location that fetch-charms.py puts the charms.
+CHARMS_DIR = Path(__file__).parent.parent.resolve() / 'charms'
+
+
+logger = logging.getLogger(__name__)
+
+
+class Result(NamedTuple):
+    """The outcome of running a function on one item in `run_pool`."""
+    item: Any
+    value: Any
+    error: Optional[BaseException]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def find_charm_dirs(charms_dir: Path,
+                    names: Optional[Iterable[str]] = None,
+                    ) -> List[Path]:
+    """Find the charm repo directories in a charms directory.
+
+    Hidden directories (e.g. .inventory) and plain files are ignored.
+
+    :param charms_dir: the directory containing charms/<charm> directories.
+    :param names: optionally, restrict to these charm (directory) names.
+    :returns: sorted list of charm directories.
+    """
+    wanted = set(names) if names else None
+    found: List[Path] = []
+    try:
+        entries = list(os.scandir(charms_dir))
+    except FileNotFoundError:
+        logger.error("Charms directory %s doesn't exist.", charms_dir)
+        return found
+    for entry in entries:
+        if entry.name.startswith('.') or not entry.is_dir():
+            continue
+        if wanted is not None and entry.name not in wanted:
+            continue
+        found.append(Path(entry.path))
+    return sorted(found)
+
+
+def charm_name_for(path: Path) -> str:
+    """Work out the charm that a file or directory belongs to.
+
+    Walks up from path looking for the root of the charm repo (the directory
+    with the .gitreview file).  If none is found, the name of the path's
+    directory is used.
+
+    :param path: a file or directory in a charm repo.
+    :returns: the charm (directory) name.
+    """
+    path = Path(path).resolve()
+    start = path if path.is_dir() else path.parent
+    for candidate in (start, *start.parents):
+        if (candidate / '.gitreview').exists():
+            return candidate.name
+    return start.name
+
+
+def user_cache_dir(*parts: str) -> Path:
+    """Return (and create) a per-user cache directory for release-tools.
+
+    Uses $XDG_CACHE_HOME if set, otherwise ~/.cache.
+
+    :param parts: optional sub-directories below the release-tools cache dir.
+    :returns: the path to the directory.
+    """
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME', None)
+    if xdg_cache_home is None:
+        xdg_cache_home = str(Path(os.environ['HOME']) / '.cache')
+    path = Path(xdg_cache_home) / 'release-tools'
+    for part in parts:
+        path = path / part
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def expand_filenames(patterns: List[str]) -> List[str]:
+    """Expand any glob patterns in the filenames.
+
+    Filenames without glob characters are kept as they are (even if they
+    don't exist) so that they are reported.
+
+    :param patterns: the filenames and glob patterns.
+    :returns: the filenames, in order, without duplicates.
+    """
+    filenames: List[str] = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            filenames.extend(sorted(glob.glob(pattern)))
+        else:
+            filenames.append(pattern)
+    return list(dict.fromkeys(filenames))
+
+
+def default_workers() -> int:
+    """The default number of workers for a pool."""
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def run_pool(func: Callable[[Any], Any],
+             items: Iterable[Any],
+             workers: Optional[int] = None,
+             processes: bool = False,
+             ) -> List[Result]:
+    """Run func over items in a bounded pool and collect the results.
+
+    Exceptions raised by func are captured on the `Result` rather than
+    propagated so that one failing charm doesn't stop the rest of the batch.
+    With workers == 1 the items are processed serially in this process,
+    which is useful for debugging.
+
+    Note that if processes is True then func (and the items) must be
+    picklable, i.e. func must be a module level function in an importable
+    module.
+
+    :param func: the function to call with each item.
+    :param items: the items to process.
+    :param workers: the maximum number of concurrent workers.
+    :param processes: use a process pool rather than a thread pool.
+    :returns: the results in the same order as the items.
+    """
+    items = list(items)
+    if workers is None:
+        workers = default_workers()
+    workers = max(1, min(workers, len(items) or 1))
+    if workers == 1:
+        results: List[Result] = []
+        for item in items:
+            try:
+                results.append(Result(item, func(item), None))
+            except Exception as e:
+                logger.debug("Processing %s failed: %s", item, str(e))
+                results.append(Result(item, None, e))
+        return results
+    # imported here as it is slow to import and most tools don't need it.
+    import concurrent.futures
+    executor_class = (concurrent.futures.ProcessPoolExecutor if processes
+                      else concurrent.futures.ThreadPoolExecutor)
+    with executor_class(max_workers=workers) as executor:
+        futures = [executor.submit(func, item) for item in items]
+        results = []
+        for item, future in zip(items, futures):
+            try:
+                results.append(Result(item, future.result(), None))
+            except Exception as e:
+                logger.debug("Processing %s failed: %s", item, str(e))
+                results.append(Result(item, None, e))
+    return results
+
+
+def add_fleet_arguments(parser: argparse.ArgumentParser,
+                        workers_help: Optional[str] = None,
+                        ) -> None:
+    """Add the options for choosing the charms, and the number of workers.
+
+    These are --charms-dir, --only (repeatable), --charm (repeatable; the
+    charm in a directory rather than those in --charms-dir) and --workers.
+    Use `charm_dirs_from_args` to get the chosen charm directories.
+
+    :param parser: the parser to add the options to.
+    :param workers_help: the help for --workers/-j; default is "The number
+        of charms to do at once."
+    """
+    parser.add_argument('--charms-dir',
+                        dest='charms_dir',
+                        type=Path,
+                        default=Path(CHARMS_DIR),
+                        metavar='DIR',
+                        help=("The directory of charms; default is "
+                              "%(default)s."))
+    parser.add_argument('--only',
+                        dest='only_charms',
+                        action='append',
+                        metavar='NAME',
+                        help="Only this charm; may be repeated.")
+    parser.add_argument('--charm',
+                        dest='charm_dirs',
+                        type=Path,
+                        action='append',
+                        metavar='DIR',
+                        help=("The charm in DIR (e.g. '.') rather than the "
+                              "charms in --charms-dir; may be repeated."))
+    if workers_help is None:
+        workers_help = "The number of charms to do at once."
+    parser.add_argument('--workers', '-j',
+                        dest='workers',
+                        type=int,
+                        help=workers_help)
+
+
+def charm_dirs_from_args(args: argparse.Namespace) -> List[Path]:
+    """The charm directories chosen by the `add_fleet_arguments` options.
+
+    :param args: the parsed arguments.
+    :returns: the --charm directories if any were given, otherwise the
+        charms (or the --only ones) in --charms-dir.
+    """
+    if args.charm_dirs:
+        return [d.resolve() for d in args.charm_dirs]
+    return find_charm_dirs(args.charms_dir, args.only_charms)
+
+
+def print_summary(total: int, changed: int, failed: int) -> None:
+    """Print the summary line at the end of a tool's report, e.g.
+
+        12 charm(s): 3 changed, 8 unchanged, 1 failed
+
+    :param total: the number of charms processed.
+    :param changed: the number of charms that were changed.
+    :param failed: the number of charms that failed.
+    """
+    print(f"{total} charm(s): {changed} changed, "
+          f"{total - changed - failed} unchanged, {failed} failed")
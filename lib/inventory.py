@@ -0,0 +1,768 @@
+"""An incremental inventory of the charm fleet stored in SQLite.
+
+Nearly every tool in the repo needs the same handful of facts about the charms
+in ./charms/<charm>: what type of charm it is (see what-is), the series in the
+metadata.yaml, the bases/platforms in charmcraft.yaml, the charm_build_name in
+osci.yaml, the templates in .zuul.yaml, the gerrit project in .gitreview, the
+bundle files and the checked out branch.  It also indexes the charms that the
+bundles reference: for each charm, the (repo, bundle, line) of the 'charm:'
+lines that use it and the channel they are on (see lib/bundles.py).
+
+`Inventory.update()` scans the charm repos in parallel and stores those facts
+in an SQLite database.  The scan is incremental: each repo records the
+(size, mtime, sha256) of the files the facts are derived from, and a repo is
+only re-scanned when one of those files (or the checked out branch) has
+changed.  The query methods on `Inventory` (and the charm-inventory.py CLI)
+can then be used instead of running find/grep over the repos every time.
+A repo whose files were touched, but not changed, is recognised from the
+sha256 of the files and isn't re-scanned.
+"""
+
+import configparser
+import hashlib
+import itertools
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from lib.bundles import CharmRef, find_charm_refs
+from lib.fleet import find_charm_dirs, run_pool, user_cache_dir
+from lib import readonly
+
+
+logger = logging.getLogger(__name__)
+
+
+# Bump this if the facts or the schema change; it forces a full re-scan.
+SCHEMA_VERSION = 2
+
+# The dirs (relative to the charm root) that bundles live in.  Matches
+# update-channel-single.py's find_bundles_dirs().
+BUNDLE_DIRS = (('tests', 'bundles'),
+               ('tests', 'bundles', 'overlays'),
+               ('src', 'tests', 'bundles'),
+               ('src', 'tests', 'bundles', 'overlays'))
+
+# The files (relative to the charm root) that the facts are derived from.
+FACT_FILES = ('.gitreview',
+              'metadata.yaml',
+              'src/metadata.yaml',
+              'charmcraft.yaml',
+              'charm-helpers-hooks.yaml',
+              'osci.yaml',
+              '.zuul.yaml',
+              'tests/tests.yaml',
+              'src/tests/tests.yaml')
+
+# The git files that determine which branch is checked out.
+GIT_FILES = ('.git/HEAD',)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS repos (
+    path TEXT PRIMARY KEY,
+    charms_dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    charm_type TEXT,
+    binary_wheels INTEGER,
+    branch TEXT,
+    gitreview_project TEXT,
+    charm_build_name TEXT,
+    scanned_at REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    repo TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    sha256 TEXT,
+    PRIMARY KEY (repo, path)
+);
+CREATE TABLE IF NOT EXISTS series (
+    repo TEXT NOT NULL,
+    series TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bases (
+    repo TEXT NOT NULL,
+    base TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS platforms (
+    repo TEXT NOT NULL,
+    platform TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS zuul_templates (
+    repo TEXT NOT NULL,
+    template TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bundles (
+    repo TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bundle_refs (
+    repo TEXT NOT NULL,
+    bundle TEXT NOT NULL,
+    line INTEGER NOT NULL,
+    charm TEXT NOT NULL,
+    prefix TEXT,
+    managed INTEGER,
+    channel TEXT,
+    channel_line INTEGER
+);
+CREATE INDEX IF NOT EXISTS repos_by_dir ON repos (charms_dir, name);
+CREATE INDEX IF NOT EXISTS series_by_repo ON series (repo);
+CREATE INDEX IF NOT EXISTS bases_by_repo ON bases (repo);
+CREATE INDEX IF NOT EXISTS platforms_by_repo ON platforms (repo);
+CREATE INDEX IF NOT EXISTS templates_by_repo ON zuul_templates (repo);
+CREATE INDEX IF NOT EXISTS bundles_by_repo ON bundles (repo);
+CREATE INDEX IF NOT EXISTS bundle_refs_by_repo ON bundle_refs (repo);
+CREATE INDEX IF NOT EXISTS bundle_refs_by_charm ON bundle_refs (charm);
+"""
+
+# The list-valued facts and the (table, column) they are stored in.
+_LIST_FACTS = (('series', 'series', 'series'),
+               ('bases', 'bases', 'base'),
+               ('platforms', 'platforms', 'platform'),
+               ('zuul_templates', 'zuul_templates', 'template'),
+               ('bundles', 'bundles', 'path'))
+
+
+class CharmFacts(NamedTuple):
+    """The facts about a single charm repo."""
+    name: str
+    path: str
+    charm_type: Optional[str]
+    binary_wheels: bool
+    branch: Optional[str]
+    gitreview_project: Optional[str]
+    charm_build_name: Optional[str]
+    series: List[str]
+    bases: List[str]
+    platforms: List[str]
+    zuul_templates: List[str]
+    bundles: List[str]
+
+
+class BundleRef(NamedTuple):
+    """A reference to a charm in a bundle of a charm repo.
+
+    bundle is relative to the repo; the other fields are as `CharmRef`.
+    """
+    name: str
+    repo: str
+    bundle: str
+    line: int
+    charm: str
+    prefix: str
+    managed: bool
+    channel: Optional[str]
+    channel_line: Optional[int]
+
+    @property
+    def path(self) -> Path:
+        """The absolute path of the bundle."""
+        return Path(self.repo) / self.bundle
+
+
+# (relative path, size, mtime_ns)
+FileStat = Tuple[str, int, int]
+
+
+def default_db_path() -> Path:
+    """The default location of the inventory database."""
+    return user_cache_dir() / 'inventory.sqlite'
+
+
+def _read_text(path: Path) -> Optional[str]:
+    try:
+        return path.read_text()
+    except (FileNotFoundError, IsADirectoryError, UnicodeDecodeError):
+        return None
+
+
+def _load_yaml(path: Path) -> Any:
+    text = _read_text(path)
+    if text is None:
+        return None
+    # yaml is only imported when a charm has to be (re)scanned.
+    import yaml
+    try:
+        return readonly.parse(text)
+    except yaml.YAMLError as e:
+        logger.warning("Couldn't parse %s: %s", path, str(e))
+        return None
+
+
+def find_bundles(charm_dir: Path) -> List[str]:
+    """Find the bundles (and overlays) in the charm repo.
+
+    :param charm_dir: the root of the charm repo.
+    :returns: sorted paths of the bundles relative to the charm_dir.
+    """
+    bundles: List[str] = []
+    for parts in BUNDLE_DIRS:
+        bundles_dir = charm_dir.joinpath(*parts)
+        try:
+            entries = list(os.scandir(bundles_dir))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in entries:
+            if entry.is_symlink() or not entry.is_file():
+                continue
+            if (entry.name.endswith('.yaml') or
+                    entry.name.endswith('.yaml.j2')):
+                bundles.append(str(Path(*parts) / entry.name))
+    return sorted(bundles)
+
+
+def fact_files(charm_dir: Path) -> List[FileStat]:
+    """Stat the files that the facts for a charm are derived from.
+
+    :param charm_dir: the root of the charm repo.
+    :returns: sorted list of (relative path, size, mtime_ns) for the files that
+        exist.
+    """
+    stats: List[FileStat] = []
+    for rel in itertools.chain(FACT_FILES, GIT_FILES,
+                               find_bundles(charm_dir)):
+        try:
+            st = (charm_dir / rel).stat()
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        stats.append((rel, st.st_size, st.st_mtime_ns))
+    return sorted(set(stats))
+
+
+def read_branch(charm_dir: Path) -> Optional[str]:
+    """Read the checked out branch of the repo without running git.
+
+    :returns: the branch name, the commit sha if detached, or None.
+    """
+    head = _read_text(charm_dir / '.git' / 'HEAD')
+    if head is None:
+        return None
+    head = head.strip()
+    if head.startswith('ref: refs/heads/'):
+        return head[len('ref: refs/heads/'):]
+    return head or None
+
+
+def classify_charm(charm_dir: Path, binary: bool = False) -> Optional[str]:
+    """Work out the type of the charm; a Python version of ./what-is.
+
+    Returns '<structure>-<framework>' where structure is one of source,
+    classic, ops or unknown and framework is zaza or unknown.  If binary is
+    True then, as ./what-is-binary, a source charm that builds binary wheels
+    from source is 'source-binary-zaza'.
+
+    :param charm_dir: the root of the charm repo.
+    :param binary: distinguish source-binary-zaza charms.
+    :returns: the charm type or None if the dir is not a charm.
+    """
+    if not (charm_dir / '.gitreview').is_file():
+        return None
+
+    test_framework = 'unknown'
+    for tests_yaml in ('tests/tests.yaml', 'src/tests/tests.yaml'):
+        text = _read_text(charm_dir / tests_yaml)
+        if text is not None and 'gate_bundles:' in text:
+            test_framework = 'zaza'
+            break
+
+    src_metadata = _read_text(charm_dir / 'src' / 'metadata.yaml')
+    root_metadata = _read_text(charm_dir / 'metadata.yaml')
+    if src_metadata is not None and 'name:' in src_metadata:
+        structure = 'source'
+    elif root_metadata is not None and 'name:' in root_metadata:
+        helpers = _read_text(charm_dir / 'charm-helpers-hooks.yaml')
+        if helpers is not None and 'repo:' in helpers:
+            structure = 'classic'
+        else:
+            structure = 'ops'
+    else:
+        structure = 'unknown'
+
+    charm_type = f"{structure}-{test_framework}"
+    if binary and charm_type == 'source-zaza' and _binary_wheels(charm_dir):
+        charm_type = 'source-binary-zaza'
+    return charm_type
+
+
+def _binary_wheels(charm_dir: Path) -> bool:
+    charmcraft = _read_text(charm_dir / 'charmcraft.yaml') or ''
+    return '--binary-wheels-from-source' in charmcraft
+
+
+def _metadata_series(charm_dir: Path) -> List[str]:
+    metadata_file = charm_dir / 'metadata.yaml'
+    if not metadata_file.is_file() or metadata_file.is_symlink():
+        metadata_file = charm_dir / 'src' / 'metadata.yaml'
+    metadata = _load_yaml(metadata_file)
+    if not isinstance(metadata, dict):
+        return []
+    return [str(s) for s in metadata.get('series') or []]
+
+
+def _charmcraft_bases(charm_dir: Path) -> Tuple[List[str], List[str]]:
+    """Return the (bases, platforms) from the charmcraft.yaml.
+
+    The bases are '<name>@<channel>' of the charmcraft v2 run-on entries (or
+    the v3 'base' key).  The platforms are the keys of the v3 'platforms'.
+    """
+    charmcraft = _load_yaml(charm_dir / 'charmcraft.yaml')
+    if not isinstance(charmcraft, dict):
+        return [], []
+    bases: List[str] = []
+
+    def _add(entry: Any) -> None:
+        if isinstance(entry, dict) and 'channel' in entry:
+            base = f"{entry.get('name', 'ubuntu')}@{entry['channel']}"
+            if base not in bases:
+                bases.append(base)
+
+    for base in charmcraft.get('bases') or []:
+        if not isinstance(base, dict):
+            continue
+        if 'channel' in base:
+            _add(base)
+        for entry in base.get('run-on') or base.get('build-on') or []:
+            _add(entry)
+    if charmcraft.get('base') and str(charmcraft['base']) not in bases:
+        bases.append(str(charmcraft['base']))
+    platforms = [str(p) for p in (charmcraft.get('platforms') or {})]
+    return bases, platforms
+
+
+def _osci_charm_build_name(charm_dir: Path) -> Optional[str]:
+    osci = _load_yaml(charm_dir / 'osci.yaml')
+    if not isinstance(osci, list):
+        return None
+    for item in osci:
+        if not isinstance(item, dict):
+            continue
+        project = item.get('project') or {}
+        name = (project.get('vars') or {}).get('charm_build_name')
+        if name:
+            return str(name)
+    return None
+
+
+def _zuul_templates(charm_dir: Path) -> List[str]:
+    zuul = _load_yaml(charm_dir / '.zuul.yaml')
+    if not isinstance(zuul, list):
+        return []
+    templates: List[str] = []
+    for item in zuul:
+        if isinstance(item, dict) and isinstance(item.get('project'), dict):
+            templates.extend(
+                str(t) for t in item['project'].get('templates') or [])
+    return templates
+
+
+def _gitreview_project(charm_dir: Path) -> Optional[str]:
+    text = _read_text(charm_dir / '.gitreview')
+    if text is None:
+        return None
+    parser = configparser.ConfigParser()
+    try:
+        parser.read_string(text)
+        return parser.get('gerrit', 'project', fallback=None)
+    except configparser.Error as e:
+        logger.warning("Couldn't parse %s/.gitreview: %s", charm_dir, str(e))
+        return None
+
+
+def _file_sha256(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _bundle_refs(charm_dir: Path,
+                 bundles: List[str],
+                 ) -> List[Tuple[str, CharmRef]]:
+    refs: List[Tuple[str, CharmRef]] = []
+    for bundle in bundles:
+        text = _read_text(charm_dir / bundle)
+        if text is None:
+            continue
+        refs.extend((bundle, ref)
+                    for ref in find_charm_refs(text.splitlines(True)))
+    return refs
+
+
+def scan_charm(charm_dir: Path,
+               ) -> Tuple[CharmFacts, Dict[str, str],
+                          List[Tuple[str, CharmRef]]]:
+    """Scan a charm repo and return its facts, file hashes and bundle refs.
+
+    :param charm_dir: the root of the charm repo.
+    :returns: (facts, {relative path: sha256}, [(bundle, charm ref)])
+    """
+    hashes: Dict[str, str] = {}
+    for rel, _, _ in fact_files(charm_dir):
+        hashes[rel] = _file_sha256(charm_dir / rel)
+    bases, platforms = _charmcraft_bases(charm_dir)
+    facts = CharmFacts(
+        name=charm_dir.name,
+        path=str(charm_dir),
+        charm_type=classify_charm(charm_dir),
+        binary_wheels=_binary_wheels(charm_dir),
+        branch=read_branch(charm_dir),
+        gitreview_project=_gitreview_project(charm_dir),
+        charm_build_name=_osci_charm_build_name(charm_dir),
+        series=_metadata_series(charm_dir),
+        bases=bases,
+        platforms=platforms,
+        zuul_templates=_zuul_templates(charm_dir),
+        bundles=find_bundles(charm_dir),
+    )
+    return facts, hashes, _bundle_refs(charm_dir, facts.bundles)
+
+
+class UpdateSummary(NamedTuple):
+    scanned: List[str]
+    unchanged: List[str]
+    removed: List[str]
+    failed: List[str]
+
+
+class Inventory:
+    """The inventory of the charms in a charms directory.
+
+    :param charms_dir: the directory with the charm repos (e.g. ./charms).
+    :param db_path: the SQLite database; defaults to the user cache dir.
+    """
+
+    def __init__(self,
+                 charms_dir: Path,
+                 db_path: Optional[Path] = None,
+                 ) -> None:
+        self.charms_dir = Path(charms_dir).resolve()
+        self.db_path = Path(db_path) if db_path else default_db_path()
+        self._conn = sqlite3.connect(str(self.db_path))
+        self._conn.row_factory = sqlite3.Row
+        self._ensure_schema()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> 'Inventory':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _ensure_schema(self) -> None:
+        with self._conn:
+            version = None
+            try:
+                row = self._conn.execute(
+                    "SELECT value FROM meta WHERE key = 'schema_version'"
+                ).fetchone()
+                version = int(row['value']) if row else None
+            except sqlite3.OperationalError:
+                pass
+            if version != SCHEMA_VERSION:
+                # facts may be derived/stored differently; start again.
+                for (table,) in self._conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'table'"
+                ).fetchall():
+                    self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) "
+                "VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+
+    def _stored_stats(self, repo: str) -> Dict[str, Tuple[int, int, str]]:
+        rows = self._conn.execute(
+            "SELECT path, size, mtime_ns, sha256 FROM files WHERE repo = ?",
+            (repo,))
+        return {r['path']: (r['size'], r['mtime_ns'], r['sha256'])
+                for r in rows}
+
+    def _unchanged_stats(self,
+                         charm_dir: Path,
+                         ) -> Optional[List[Tuple[int, int, str, str]]]:
+        """Check whether the files of a repo have changed since the scan.
+
+        A file whose (size, mtime) has changed is hashed; if the hash is the
+        same as when it was scanned (e.g. it was touched, or rewritten with
+        the same content) then it hasn't changed.
+
+        :returns: None if the repo has changed, otherwise the (size,
+            mtime_ns, repo, path) of the files whose stat needs refreshing.
+        """
+        repo = str(charm_dir)
+        stored = self._stored_stats(repo)
+        if not stored:
+            return None
+        current = fact_files(charm_dir)
+        if len(current) != len(stored):
+            return None
+        restat: List[Tuple[int, int, str, str]] = []
+        for rel, size, mtime_ns in current:
+            try:
+                s_size, s_mtime_ns, s_sha = stored[rel]
+            except KeyError:
+                return None
+            if (s_size, s_mtime_ns) == (size, mtime_ns):
+                continue
+            if size != s_size:
+                return None
+            try:
+                if _file_sha256(charm_dir / rel) != s_sha:
+                    return None
+            except OSError:
+                return None
+            restat.append((size, mtime_ns, repo, rel))
+        return restat
+
+    def update(self,
+               names: Optional[Iterable[str]] = None,
+               workers: Optional[int] = None,
+               full: bool = False,
+               ) -> UpdateSummary:
+        """Scan the changed charm repos and update the database.
+
+        :param names: optionally, only consider these charms.
+        :param workers: the size of the worker pool.
+        :param full: re-scan every repo, regardless of whether it changed.
+        :returns: a summary of what was done.
+        """
+        charm_dirs = find_charm_dirs(self.charms_dir, names)
+        to_scan: List[Path] = []
+        unchanged: List[str] = []
+        restat: List[Tuple[int, int, str, str]] = []
+        for charm_dir in charm_dirs:
+            stats = None if full else self._unchanged_stats(charm_dir)
+            if stats is None:
+                to_scan.append(charm_dir)
+            else:
+                unchanged.append(charm_dir.name)
+                restat.extend(stats)
+        logger.debug("Scanning %d repos; %d unchanged.",
+                     len(to_scan), len(unchanged))
+
+        results = run_pool(scan_charm, to_scan, workers=workers,
+                           processes=True)
+        scanned: List[str] = []
+        failed: List[str] = []
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE files SET size = ?, mtime_ns = ? "
+                "WHERE repo = ? AND path = ?", restat)
+            for result in results:
+                if not result.ok:
+                    logger.error("Couldn't scan %s: %s",
+                                 result.item, str(result.error))
+                    failed.append(result.item.name)
+                    continue
+                facts, hashes, refs = result.value
+                self._store(facts, hashes, refs)
+                scanned.append(facts.name)
+            removed: List[str] = []
+            if names is None:
+                present = {str(d) for d in charm_dirs}
+                for row in self._conn.execute(
+                        "SELECT path, name FROM repos WHERE charms_dir = ?",
+                        (str(self.charms_dir),)).fetchall():
+                    if row['path'] not in present:
+                        self._delete(row['path'])
+                        removed.append(row['name'])
+        return UpdateSummary(scanned, unchanged, removed, failed)
+
+    def _delete(self, repo: str) -> None:
+        self._conn.execute("DELETE FROM repos WHERE path = ?", (repo,))
+        self._conn.execute("DELETE FROM files WHERE repo = ?", (repo,))
+        self._conn.execute("DELETE FROM bundle_refs WHERE repo = ?", (repo,))
+        for table, _, _ in _LIST_FACTS:
+            self._conn.execute(f"DELETE FROM {table} WHERE repo = ?", (repo,))
+
+    def _store(self,
+               facts: CharmFacts,
+               hashes: Dict[str, str],
+               refs: List[Tuple[str, CharmRef]],
+               ) -> None:
+        repo = facts.path
+        self._delete(repo)
+        self._conn.execute(
+            "INSERT INTO repos (path, charms_dir, name, charm_type, "
+            "binary_wheels, branch, gitreview_project, charm_build_name, "
+            "scanned_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (repo, str(self.charms_dir), facts.name, facts.charm_type,
+             int(facts.binary_wheels), facts.branch, facts.gitreview_project,
+             facts.charm_build_name, time.time()))
+        for table, field, column in _LIST_FACTS:
+            self._conn.executemany(
+                f"INSERT INTO {table} (repo, {column}) VALUES (?, ?)",
+                ((repo, v) for v in getattr(facts, field)))
+        self._conn.executemany(
+            "INSERT INTO bundle_refs (repo, bundle, line, charm, prefix, "
+            "managed, channel, channel_line) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((repo, bundle, ref.line, ref.charm, ref.prefix, int(ref.managed),
+              ref.channel, ref.channel_line) for bundle, ref in refs))
+        # Store the stat of the files as they were hashed; if a file changed
+        # between hashing and now, the next update will re-scan it.
+        charm_dir = Path(repo)
+        rows = []
+        for rel, sha in hashes.items():
+            try:
+                st = (charm_dir / rel).stat()
+            except FileNotFoundError:
+                continue
+            rows.append((repo, rel, st.st_size, st.st_mtime_ns, sha))
+        self._conn.executemany(
+            "INSERT INTO files (repo, path, size, mtime_ns, sha256) "
+            "VALUES (?, ?, ?, ?, ?)", rows)
+
+    # Queries
+
+    def _repo_rows(self,
+                   where: str = "",
+                   params: Tuple[Any, ...] = (),
+                   ) -> List[sqlite3.Row]:
+        sql = "SELECT * FROM repos WHERE charms_dir = ?"
+        if where:
+            sql += f" AND {where}"
+        sql += " ORDER BY name"
+        return self._conn.execute(
+            sql, (str(self.charms_dir),) + params).fetchall()
+
+    def charms(self) -> List[str]:
+        """All the charm names in the inventory."""
+        return [r['name'] for r in self._repo_rows()]
+
+    def facts(self, name: str) -> CharmFacts:
+        """Return the facts for a charm.
+
+        :param name: the charm (directory) name.
+        :raises: KeyError if the charm isn't in the inventory.
+        """
+        rows = self._repo_rows("name = ?", (name,))
+        if not rows:
+            raise KeyError(f"Charm {name} not in the inventory.")
+        return self._facts_for(rows[0])
+
+    def all_facts(self) -> List[CharmFacts]:
+        """Return the facts for all of the charms."""
+        return [self._facts_for(r) for r in self._repo_rows()]
+
+    def _facts_for(self, row: sqlite3.Row) -> CharmFacts:
+        repo = row['path']
+        lists: Dict[str, List[str]] = {}
+        for table, field, column in _LIST_FACTS:
+            lists[field] = [
+                r[0] for r in self._conn.execute(
+                    f"SELECT {column} FROM {table} WHERE repo = ? "
+                    f"ORDER BY rowid", (repo,))]
+        return CharmFacts(
+            name=row['name'],
+            path=repo,
+            charm_type=row['charm_type'],
+            binary_wheels=bool(row['binary_wheels']),
+            branch=row['branch'],
+            gitreview_project=row['gitreview_project'],
+            charm_build_name=row['charm_build_name'],
+            **lists)
+
+    def get(self, name: str, fact: str) -> Any:
+        """Return a single fact for a charm.
+
+        :raises: KeyError if the charm isn't in the inventory or the fact
+            isn't known.
+        """
+        facts = self.facts(name)
+        if fact not in CharmFacts._fields:
+            raise KeyError(f"Unknown fact: {fact}")
+        return getattr(facts, fact)
+
+    def charms_of_type(self, charm_type: str) -> List[str]:
+        """The charms of a type, e.g. 'source-zaza'."""
+        return [r['name']
+                for r in self._repo_rows("charm_type = ?", (charm_type,))]
+
+    def _charms_with(self, table: str, column: str, value: str,
+                     glob: bool = False) -> List[str]:
+        op = "GLOB" if glob else "="
+        return [r['name'] for r in self._repo_rows(
+            f"path IN (SELECT repo FROM {table} WHERE {column} {op} ?)",
+            (value,))]
+
+    def charms_with_series(self, series: str) -> List[str]:
+        """The charms that list the series in their metadata."""
+        return self._charms_with('series', 'series', series)
+
+    def charms_without_series(self, series: str) -> List[str]:
+        """The charms that don't list the series in their metadata."""
+        with_series = set(self.charms_with_series(series))
+        return [c for c in self.charms() if c not in with_series]
+
+    def charms_with_base(self, base: str) -> List[str]:
+        """The charms with a base, e.g. 'ubuntu@22.04'."""
+        return self._charms_with('bases', 'base', base)
+
+    def charms_with_template(self, pattern: str) -> List[str]:
+        """The charms with a .zuul.yaml template matching the glob pattern."""
+        return self._charms_with('zuul_templates', 'template', pattern,
+                                 glob=True)
+
+    def bundle_refs(self,
+                    charms: Optional[Iterable[str]] = None,
+                    managed_only: bool = False,
+                    ) -> List[BundleRef]:
+        """The references to charms in the bundles of the charm repos.
+
+        :param charms: only the references to these charms; default all.
+        :param managed_only: only the references that update-channel-single.py
+            sets the channel of (i.e. that match CHARM_MATCH).
+        :returns: the references, ordered by repo, bundle and line.
+        """
+        sql = ("SELECT r.name, b.* FROM bundle_refs b "
+               "JOIN repos r ON r.path = b.repo WHERE r.charms_dir = ?")
+        params: List[Any] = [str(self.charms_dir)]
+        if charms is not None:
+            wanted = sorted(set(charms))
+            sql += f" AND b.charm IN ({', '.join('?' * len(wanted))})"
+            params.extend(wanted)
+        if managed_only:
+            sql += " AND b.managed = 1"
+        sql += " ORDER BY r.name, b.bundle, b.line"
+        return [BundleRef(name=r['name'],
+                          repo=r['repo'],
+                          bundle=r['bundle'],
+                          line=r['line'],
+                          charm=r['charm'],
+                          prefix=r['prefix'],
+                          managed=bool(r['managed']),
+                          channel=r['channel'],
+                          channel_line=r['channel_line'])
+                for r in self._conn.execute(sql, params).fetchall()]
+
+    def bundles_referencing(self,
+                            charms: Iterable[str],
+                            ) -> Dict[str, List[Path]]:
+        """The bundles that update-channel-single.py changes for the charms.
+
+        :param charms: the charm names.
+        :returns: {repo name: [absolute bundle paths]}
+        """
+        bundles: Dict[str, List[Path]] = {}
+        for ref in self.bundle_refs(charms, managed_only=True):
+            paths = bundles.setdefault(ref.name, [])
+            if ref.path not in paths:
+                paths.append(ref.path)
+        return bundles
+
+    def query(self, sql: str, params: Tuple[Any, ...] = ()) -> List[Dict]:
+        """Run an arbitrary (read) query against the database."""
+        return [dict(r) for r in self._conn.execute(sql, params).fetchall()]
+
+
+def facts_to_json(facts: CharmFacts) -> str:
+    return json.dumps(facts._asdict(), indent=2)
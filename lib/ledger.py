@@ -0,0 +1,185 @@
+"""A ledger of input hashes to skip operations on unchanged charms.
+
+The batch tools (_update-tox-files, _update-requirements,
+lock-with-pip-compile, ...) run an operation on every charm, even if nothing
+that the operation depends on has changed since it last ran successfully.  The
+ledger records, per operation and charm, a digest of the operation's inputs
+(e.g. the global/ templates plus the files in the charm that are read or
+written).  If the digest is unchanged when the batch is run again, then the
+operation can be skipped for that charm.
+
+The digest should be recorded *after* the operation has run, so that the
+digest covers the files as the operation left them; if someone then edits one
+of those files in the charm, the digest changes and the operation is re-run.
+
+The ledger lives outside of the repo, in ~/.cache/release-tools/ledger/, with
+a file per operation and charm so that charms can be processed concurrently.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+from pathlib import Path
+import re
+from typing import Iterable, List, Optional
+
+from lib.fleet import user_cache_dir
+
+
+logger = logging.getLogger(__name__)
+
+
+# The files in a charm that ./what-is uses to determine the charm type.  Most
+# operations choose what to do based on the charm type, so they are usually
+# part of the inputs.
+CHARM_TYPE_INPUTS = ('.gitreview',
+                     'metadata.yaml',
+                     'src/metadata.yaml',
+                     'charm-helpers-hooks.yaml',
+                     'charmcraft.yaml',
+                     'tests/tests.yaml',
+                     'src/tests/tests.yaml')
+
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9._-]+')
+
+
+def _hash_file(path: Path, digest: 'hashlib._Hash') -> None:
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+
+
+def expand_inputs(charm_dir: Path, inputs: Iterable[str]) -> List[Path]:
+    """Expand the inputs into a sorted list of paths.
+
+    Relative inputs are relative to the charm_dir.  Inputs may be glob
+    patterns.  Inputs that don't exist are kept (and hashed as missing), so
+    that a file appearing or disappearing changes the digest.
+
+    :param charm_dir: the root of the charm.
+    :param inputs: the input files, directories or glob patterns.
+    :returns: the paths.
+    """
+    paths = set()
+    for spec in inputs:
+        path = Path(spec) if os.path.isabs(spec) else charm_dir / spec
+        if glob.has_magic(str(path)):
+            paths.update(Path(p) for p in glob.glob(str(path)))
+        else:
+            paths.add(path)
+    return sorted(paths)
+
+
+def input_digest(charm_dir: Path,
+                 inputs: Iterable[str],
+                 extra: Iterable[str] = (),
+                 ) -> str:
+    """Compute the digest of the inputs for an operation on a charm.
+
+    Directories are hashed recursively.  The names of the inputs are part of
+    the digest, relative to the charm_dir where possible.
+
+    :param charm_dir: the root of the charm.
+    :param inputs: the input files, directories or glob patterns.
+    :param extra: extra strings (e.g. the operation's arguments) to include.
+    :returns: the hex digest.
+    """
+    charm_dir = charm_dir.resolve()
+    digest = hashlib.sha256()
+    for value in extra:
+        digest.update(f"extra:{value}\0".encode())
+    for path in expand_inputs(charm_dir, inputs):
+        if path.is_dir():
+            files = sorted(p for p in path.rglob('*') if p.is_file())
+        else:
+            files = [path]
+        for file in files:
+            try:
+                name = str(file.resolve().relative_to(charm_dir))
+            except ValueError:
+                name = str(file.resolve())
+            digest.update(f"file:{name}\0".encode())
+            try:
+                _hash_file(file, digest)
+            except (FileNotFoundError, NotADirectoryError):
+                digest.update(b"missing\0")
+    return digest.hexdigest()
+
+
+class Ledger:
+    """The ledger for an operation.
+
+    :param operation: the name of the operation (e.g. 'update-tox-files').
+    :param ledger_dir: where the ledger is kept; default is the user cache.
+    """
+
+    def __init__(self,
+                 operation: str,
+                 ledger_dir: Optional[Path] = None,
+                 ) -> None:
+        self.operation = operation
+        if ledger_dir is None:
+            ledger_dir = user_cache_dir('ledger')
+        self.ledger_dir = Path(ledger_dir) / _SAFE_NAME.sub('_', operation)
+
+    def _entry(self, charm_dir: Path) -> Path:
+        charm_dir = charm_dir.resolve()
+        path_hash = hashlib.sha1(str(charm_dir).encode()).hexdigest()[:12]
+        return self.ledger_dir / f"{charm_dir.name}-{path_hash}"
+
+    def recorded(self, charm_dir: Path) -> Optional[str]:
+        """Return the digest recorded for the charm, if any."""
+        try:
+            return self._entry(charm_dir).read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def is_unchanged(self,
+                     charm_dir: Path,
+                     inputs: Iterable[str],
+                     extra: Iterable[str] = (),
+                     ) -> bool:
+        """Return True if the inputs match the last recorded digest.
+
+        :param charm_dir: the root of the charm.
+        :param inputs: the input files, directories or glob patterns.
+        :param extra: extra strings to include in the digest.
+        """
+        recorded = self.recorded(charm_dir)
+        if recorded is None:
+            return False
+        return recorded == input_digest(charm_dir, inputs, extra)
+
+    def record(self,
+               charm_dir: Path,
+               inputs: Iterable[str],
+               extra: Iterable[str] = (),
+               ) -> str:
+        """Record the current digest of the inputs for the charm.
+
+        Call this after the operation has completed successfully.
+
+        :returns: the digest recorded.
+        """
+        digest = input_digest(charm_dir, inputs, extra)
+        entry = self._entry(charm_dir)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.new")
+        tmp.write_text(digest + "\n")
+        os.replace(tmp, entry)
+        logger.debug("Recorded %s for %s: %s",
+                     self.operation, charm_dir, digest)
+        return digest
+
+    def forget(self, charm_dir: Optional[Path] = None) -> None:
+        """Forget the digest for a charm, or for all charms if None."""
+        if charm_dir is not None:
+            try:
+                self._entry(charm_dir).unlink()
+            except FileNotFoundError:
+                pass
+            return
+        if self.ledger_dir.is_dir():
+            for entry in self.ledger_dir.iterdir():
+                entry.unlink()
@@ -1,15 +1,35 @@
-import glob
+import contextlib
+import copy
+import functools
+import hashlib
 import logging
+import marshal
 import os
 from pathlib import Path
-from typing import List, Optional, Dict, Any
-import yaml
+import sys
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 try:
     from importlib_resources import files, as_file  # type: ignore
 except ImportError:
     from importlib.resources import files, as_file  # type: ignore
 
+from lib.fleet import user_cache_dir
+from lib import readonly
+
 
 """Understanding the various configs.
 
@@ -69,15 +89,21 @@ and:
         launchpad: charm-ovn-central
         repository: https://opendev.org/x/charm-ovn-central.git
 
-The 'raw' configs pulled from the files are cached in the module global
-_YAML_SECTIONS which is a `Dict[str, Any]`
-
+The config is read into an immutable `LpBuilderConfig` model which is cached
+in the module global _CONFIG.  Each file (section) is parsed only when it is
+first needed, so a tool that works on one section (e.g. `get_charms('ovn')`)
+only parses that file.  The model holds a `Project` for each charm, with the
+default branches and team of its section applied, and indexes them by charmhub
+name, launchpad name and section so that looking up a charm is O(1).
+`LpBuilderConfig.channel_table` resolves, once, the channel each charm gets
+for a list of branches (see `ChannelTable`).  The other views of the config
+(`get_yaml_config`, `get_lp_builder_config` and `get_lp_builder_config_for`)
+are derived from the model rather than by parsing the files again.
 
 This module also provides a class, called `Charm` that provides the data.  It
-is a 'thin' wrapper, in that it has a "name", and then all the other 'fields'
-just read into the _YAML_SECTIONS.  To get a charm definition, use `get_charm`
-if the name is already known.  `get_charms` gets all the charms, or those by a
-section.
+is a 'thin' wrapper over the charm's `Project` in the model.  To get a charm
+definition, use `Charm(name)` if the name is already known.  `get_charms` gets
+all the charms, or those by a section.
 """
 
 # type Alias for LpConfig struture.
@@ -90,29 +116,485 @@ RawConfig = Dict[str, Dict[str, Any]]
 
 logger = logging.getLogger(__name__)
 
+# If set, the directory of lp-builder-config/*.yaml files to use instead of the
+# ones in the installed charmed_openstack_info package; e.g. for a synthetic
+# config for tests and benchmarks.
+CONFIG_DIR_ENV = 'RELEASE_TOOLS_LP_BUILDER_CONFIG_DIR'
+# Set to '0' to always parse the yaml files rather than using the snapshots.
+SNAPSHOT_ENV = 'RELEASE_TOOLS_LP_BUILDER_SNAPSHOT'
+# Bump this if the format of the snapshot changes.
+SNAPSHOT_VERSION = 2
+
+
+# cache the parsed config as it's not going to change
+_CONFIG: Optional['LpBuilderConfig'] = None
+
+
+class Project:
+    """A project (charm) from the lp-builder config.
+
+    The project has the default branches and team from its section applied.
+    Instances are immutable; `config` returns a mutable copy of the project's
+    config in the format of the yaml files.
+    """
+
+    __slots__ = ('charmhub', 'name', 'launchpad', 'repository', 'team',
+                 'section', 'branches', '_raw')
+
+    charmhub: str
+    name: str
+    launchpad: str
+    repository: str
+    team: Optional[str]
+    section: str
+    # {<branch-name>: (track/channel, ...)}
+    branches: Mapping[str, Tuple[str, ...]]
+    _raw: Dict[str, Any]
+
+    def __init__(self, section: str, raw: Dict[str, Any]) -> None:
+        """Initialise a project from its config.
+
+        :param section: the section the project is in.
+        :param raw: the project's config, with the defaults applied.
+        :raises: KeyError if the charmhub key is missing.
+        """
+        branches = raw.get('branches', None) or {}
+        _set = object.__setattr__
+        _set(self, 'charmhub', raw['charmhub'])
+        _set(self, 'name', raw.get('name', raw['charmhub']))
+        _set(self, 'launchpad', raw.get('launchpad', None))
+        _set(self, 'repository', raw.get('repository', None))
+        _set(self, 'team', raw.get('team', None))
+        _set(self, 'section', section)
+        _set(self, 'branches', MappingProxyType({
+            branch: tuple((spec or {}).get('channels', None) or ())
+            for branch, spec in branches.items()}))
+        _set(self, '_raw', raw)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"Project is immutable; can't set {name}")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"Project is immutable; can't delete {name}")
+
+    def __repr__(self) -> str:
+        return f"Project({self.section}:{self.charmhub})"
+
+    @property
+    def raw_branches(self) -> Dict[str, Dict[str, Any]]:
+        """A copy of the branches in the format of the yaml files."""
+        return copy.deepcopy(self._raw.get('branches', None) or {})
+
+    def config(self) -> Dict[str, Any]:
+        """A copy of the project's config, including the section."""
+        config = copy.deepcopy(self._raw)
+        config['section'] = self.section
+        return config
+
+
+class _Section(NamedTuple):
+    """The model of one section (yaml file) of the config."""
+    raw: Optional[Dict[str, Any]]
+    projects: Tuple[Project, ...]
+    # the first project in the section for each charmhub name.
+    by_charmhub: Mapping[str, Project]
+    lp_config: LpConfig
+
+
+class _Indexes(NamedTuple):
+    """The indexes over all the sections of the config."""
+    raw: RawConfig
+    projects: Tuple[Project, ...]
+    by_charmhub: Mapping[str, Project]
+    by_launchpad: Mapping[str, Project]
+    by_section: Mapping[str, Tuple[Project, ...]]
+    by_channel: Mapping[str, Tuple[Tuple[str, str], ...]]
+    lp_config: LpConfig
+    section_lp_configs: YamlConfig
+
+
+class LpBuilderConfig:
+    """The parsed lp-builder config, with indexes over the projects.
+
+    Sections are loaded lazily: `section`, `section_lp_config` and `get` only
+    load the sections that they need, in section order, and the whole config
+    is only loaded when one of the views over all of it (`raw`, `projects`,
+    `by_charmhub`, etc.) is first used.
+
+    Instances are immutable, and are shared by all the callers of
+    `get_config`, so the views (`raw`, `lp_config` and `section_lp_configs`)
+    must not be modified; the module level functions return copies.
+    """
+
+    __slots__ = ('_loaders', '_sections', '_indexes', '_channel_tables')
+
+    _loaders: Mapping[str, Callable[[], Any]]
+    _sections: Dict[str, _Section]
+    _indexes: Optional[_Indexes]
+    _channel_tables: Dict[tuple, 'ChannelTable']
+
+    def __init__(self,
+                 raw: Optional[RawConfig] = None,
+                 loaders: Optional[Mapping[str, Callable[[], Any]]] = None,
+                 ) -> None:
+        """Build the model from the raw config, or loaders, of each section.
+
+        If a charm is in more than one section, its project (`get`,
+        `by_charmhub`, etc.) is from the first one (in section order), as
+        `find_config_for` always did, and its branches in `lp_config` are
+        from the last one, as `get_lp_builder_config` always did.
+
+        :param raw: the parsed yaml files by section.
+        :param loaders: functions, by section, that return the parsed yaml of
+            the section; each is only called when the section is needed.
+        """
+        if loaders is None:
+            loaders = {section: functools.partial(_identity, section_config)
+                       for section, section_config in (raw or {}).items()}
+        _set = object.__setattr__
+        _set(self, '_loaders', MappingProxyType(dict(loaders)))
+        _set(self, '_sections', {})
+        _set(self, '_indexes', None)
+        _set(self, '_channel_tables', {})
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(
+            f"LpBuilderConfig is immutable; can't set {name}")
+
+    def _section(self, section: str) -> _Section:
+        """Get the model of a section, loading it if needed.
+
+        :raises: KeyError if the section doesn't exist.
+        """
+        try:
+            return self._sections[section]
+        except KeyError:
+            pass
+        section_config = self._loaders[section]()
+        projects: List[Project] = []
+        by_charmhub: Dict[str, Project] = {}
+        lp_config: LpConfig = {}
+        for project_config in _section_projects(section, section_config):
+            project = Project(section, project_config)
+            projects.append(project)
+            by_charmhub.setdefault(project.charmhub, project)
+            lp_config[project.charmhub] = {
+                branch: list(channels)
+                for branch, channels in project.branches.items()}
+        model = _Section(raw=section_config,
+                         projects=tuple(projects),
+                         by_charmhub=MappingProxyType(by_charmhub),
+                         lp_config=lp_config)
+        self._sections[section] = model
+        return model
+
+    def _index(self) -> _Indexes:
+        """Load all the sections and index them."""
+        if self._indexes is not None:
+            return self._indexes
+        raw: RawConfig = {}
+        projects: List[Project] = []
+        by_charmhub: Dict[str, Project] = {}
+        by_launchpad: Dict[str, Project] = {}
+        by_section: Dict[str, Tuple[Project, ...]] = {}
+        lp_config: LpConfig = {}
+        section_lp_configs: YamlConfig = {}
+        for section in self._loaders:
+            model = self._section(section)
+            raw[section] = model.raw  # type: ignore
+            for project in model.projects:
+                # as before, the branches of a charm that is in more than
+                # one section are from the last one.
+                lp_config[project.charmhub] = \
+                    model.lp_config[project.charmhub]
+                if project.charmhub in by_charmhub:
+                    if by_charmhub[project.charmhub] is not project:
+                        logger.warning(
+                            "Charm %s is in sections %s and %s; using the "
+                            "project from %s and the branches from %s",
+                            project.charmhub,
+                            by_charmhub[project.charmhub].section, section,
+                            by_charmhub[project.charmhub].section, section)
+                    continue
+                projects.append(project)
+                by_charmhub[project.charmhub] = project
+                if project.launchpad:
+                    by_launchpad.setdefault(project.launchpad, project)
+            by_section[section] = model.projects
+            section_lp_configs[section] = model.lp_config
+        indexes = _Indexes(raw=raw,
+                           projects=tuple(projects),
+                           by_charmhub=MappingProxyType(by_charmhub),
+                           by_launchpad=MappingProxyType(by_launchpad),
+                           by_section=MappingProxyType(by_section),
+                           by_channel=_invert_channels(lp_config),
+                           lp_config=lp_config,
+                           section_lp_configs=section_lp_configs)
+        object.__setattr__(self, '_indexes', indexes)
+        return indexes
+
+    @property
+    def raw(self) -> RawConfig:
+        return self._index().raw
+
+    @property
+    def projects(self) -> Tuple[Project, ...]:
+        return self._index().projects
+
+    @property
+    def by_charmhub(self) -> Mapping[str, Project]:
+        return self._index().by_charmhub
+
+    @property
+    def by_launchpad(self) -> Mapping[str, Project]:
+        return self._index().by_launchpad
+
+    @property
+    def by_section(self) -> Mapping[str, Tuple[Project, ...]]:
+        return self._index().by_section
+
+    @property
+    def by_channel(self) -> Mapping[str, Tuple[Tuple[str, str], ...]]:
+        """{<track/channel>: ((<charm>, <branch>), ...)}"""
+        return self._index().by_channel
+
+    @property
+    def lp_config(self) -> LpConfig:
+        return self._index().lp_config
+
+    @property
+    def section_lp_configs(self) -> YamlConfig:
+        return self._index().section_lp_configs
+
+    @property
+    def sections(self) -> List[str]:
+        return list(self._loaders.keys())
+
+    @property
+    def loaded_sections(self) -> List[str]:
+        """The sections that have been loaded so far."""
+        return [section for section in self._loaders
+                if section in self._sections]
+
+    def get(self, charmhub: str) -> Project:
+        """Get a project by charmhub name.
+
+        Only the sections up to the one with the charm are loaded.
+
+        :raises: KeyError if the charm isn't in the config.
+        """
+        if self._indexes is not None:
+            project = self._indexes.by_charmhub.get(charmhub, None)
+        else:
+            project = None
+            for section in self._loaders:
+                project = self._section(section).by_charmhub.get(
+                    charmhub, None)
+                if project is not None:
+                    break
+        if project is None:
+            raise KeyError(f"Couldn't find {charmhub} in the config.")
+        return project
+
+    def get_by_launchpad(self, launchpad: str) -> Project:
+        """Get a project by launchpad name.
+
+        :raises: KeyError if no charm has the launchpad name.
+        """
+        try:
+            return self.by_launchpad[launchpad]
+        except KeyError:
+            raise KeyError(f"Couldn't find launchpad {launchpad} in the "
+                           f"config.")
+
+    def section(self, section: str) -> Tuple[Project, ...]:
+        """The projects in a section, or all of them for ':all:'.
+
+        :raises: KeyError if the section doesn't exist.
+        """
+        if section == ":all:":
+            return self.projects
+        return self._section(section).projects
+
+    def section_lp_config(self, section: str) -> LpConfig:
+        """The LpConfig of just the section.
+
+        :raises: KeyError if the section doesn't exist.
+        """
+        return self._section(section).lp_config
+
+    def channel_table(self,
+                      branches: Sequence[str],
+                      ignore_tracks: Sequence[str] = (),
+                      enforce_edge: bool = False,
+                      ) -> 'ChannelTable':
+        """The (cached) channel table for the branches and policy.
+
+        See `build_channel_table` for the arguments.
+        """
+        key = (tuple(branches), tuple(ignore_tracks), enforce_edge)
+        try:
+            return self._channel_tables[key]
+        except KeyError:
+            pass
+        table = build_channel_table(
+            self.lp_config, branches, ignore_tracks, enforce_edge)
+        self._channel_tables[key] = table
+        return table
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+def _section_projects(section: str,
+                      section_config: Optional[Dict[str, Any]],
+                      ) -> Iterator[Dict[str, Any]]:
+    """Yield the projects of a section with the defaults applied.
+
+    The returned configs are new dictionaries; the raw config isn't changed.
+    """
+    if not section_config or 'projects' not in section_config:
+        logger.warning('Section %s contains no projects key?', section)
+        return
+    defaults = section_config.get('defaults', None) or {}
+    for project in section_config['projects'] or []:
+        project_config = dict(project)
+        if 'branches' not in project:
+            try:
+                project_config['branches'] = defaults['branches']
+            except KeyError:
+                logger.warning("No branches or default branches for "
+                               "charmhub: %s", project.get('charmhub'))
+        if 'team' not in project:
+            try:
+                project_config['team'] = defaults['team']
+            except KeyError:
+                logger.warning("No team or default team for "
+                               "charmhub: %s", project.get('charmhub'))
+        yield project_config
+
+
+class ChannelTable(NamedTuple):
+    """The channel each charm resolves to for a list of branches.
 
-# cache the LP config as it's not going to change
-_LP_CONFIG: Optional[LpConfig] = None
-_YAML_CONFIG: YamlConfig = {}
-_RAW_CONFIG: Optional[RawConfig] = None
+    `channels` is the lookup used when rewriting bundles and `by_channel` is
+    the inverse; e.g. the charms (and branches) that publish to 2024.1/edge.
+    """
+    # {<charm>: <track/channel>}
+    channels: Mapping[str, str]
+    # {<charm>: <branch>} - the branch that gave the channel.
+    branches: Mapping[str, str]
+    # {<track/channel>: ((<charm>, <branch>), ...)}
+    by_channel: Mapping[str, Tuple[Tuple[str, str], ...]]
+
+    def channel_for(self, charm: Optional[str]) -> Optional[str]:
+        """The channel for the charm, or None if it doesn't resolve."""
+        return self.channels.get(charm, None) if charm is not None else None
+
+    def charms_for(self, channel: str) -> List[str]:
+        """The charms that resolve to the channel."""
+        return [charm for charm, _ in self.by_channel.get(channel, ())]
+
+
+def resolve_channel(tracks: Iterable[str],
+                    ignore_tracks: Sequence[str] = (),
+                    enforce_edge: bool = False,
+                    ) -> Optional[str]:
+    """Pick the channel to use from a branch's tracks/channels.
+
+    :param tracks: the tracks/channels of a branch, in config order.
+    :param ignore_tracks: tracks to skip; the test is 'starts with' so that
+        e.g. 'latest' matches any latest/<risk>.
+    :param enforce_edge: if True, the channel is made <track>/edge.
+    :returns: the first track that isn't ignored, or None.
+    """
+    for track in tracks:
+        if track.startswith(tuple(ignore_tracks)):
+            continue
+        if enforce_edge and '/' in track:
+            track = "{}/edge".format(track.split('/')[0])
+        return track
+    return None
+
+
+def build_channel_table(lp_config: LpConfig,
+                        branches: Sequence[str],
+                        ignore_tracks: Sequence[str] = (),
+                        enforce_edge: bool = False,
+                        ) -> ChannelTable:
+    """Resolve the channel of every charm in an LpConfig for the branches.
+
+    The branches are tried in order for each charm, and the first one that
+    gives a channel (see `resolve_channel`) is used.  Charms without any of
+    the branches aren't in the table.
+
+    :param lp_config: the charm <-> branch <-> track/channel mapping.
+    :param branches: the git branches to try.
+    :param ignore_tracks: tracks (or prefixes) to skip.
+    :param enforce_edge: if True, channels are made <track>/edge.
+    """
+    ignore = tuple(ignore_tracks)
+    channels: Dict[str, str] = {}
+    channel_branches: Dict[str, str] = {}
+    for charm, charm_branches in lp_config.items():
+        for branch in branches:
+            tracks = charm_branches.get(branch, None)
+            if not tracks:
+                continue
+            channel = resolve_channel(tracks, ignore, enforce_edge)
+            if channel is not None:
+                channels[charm] = channel
+                channel_branches[charm] = branch
+                break
+    return ChannelTable(
+        channels=MappingProxyType(channels),
+        branches=MappingProxyType(channel_branches),
+        by_channel=_invert_channels(
+            {charm: {channel_branches[charm]: [channel]}
+             for charm, channel in channels.items()}))
+
+
+def _invert_channels(lp_config: LpConfig,
+                     ) -> Mapping[str, Tuple[Tuple[str, str], ...]]:
+    """Index an LpConfig by channel: {channel: ((charm, branch), ...)}."""
+    by_channel: Dict[str, List[Tuple[str, str]]] = {}
+    for charm, charm_branches in lp_config.items():
+        for branch, tracks in charm_branches.items():
+            for track in tracks:
+                by_channel.setdefault(track, []).append((charm, branch))
+    return MappingProxyType({channel: tuple(entries)
+                             for channel, entries in by_channel.items()})
 
 
 class Charm:
     """Class to provide data for the charm.
 
     Provides convenient (and potentially type-safe) methods and properties for
-    a charm.
+    a charm.  It is a cheap view over the charm's `Project` in the config.
 
     Note, causes parsing of the yaml files in the `LP_DIR` on first use.
     """
 
-    def __init__(self, charmhub: str):
+    __slots__ = ('_charmhub', '_project')
+
+    def __init__(self, charmhub: str, project: Optional[Project] = None):
         """Initialise a charm config.
 
+        :param charmhub: the charmhub name of the charm.
+        :param project: the charm's project, if already known.
         :raises: Exception if couldn't find the charm or a config error occurs.
         """
         self._charmhub = charmhub
-        self._config = find_config_for(charmhub)
+        self._project = project or get_config().get(charmhub)
+
+    def __repr__(self) -> str:
+        return f"Charm({self._charmhub})"
+
+    @property
+    def project(self) -> Project:
+        """Returns the charm's project in the lp-builder config."""
+        return self._project
 
     @property
     def charmhub(self) -> str:
@@ -132,7 +614,7 @@ class Charm:
 
         :returns: the name of the charm.
         """
-        return self._config['name']
+        return self._project.name
 
     @property
     def section(self) -> str:
@@ -142,7 +624,7 @@ class Charm:
 
         :returns: the section of the charm.
         """
-        return self._config['section']
+        return self._project.section
 
     @property
     def launchpad(self) -> str:
@@ -150,7 +632,7 @@ class Charm:
 
         :returns: the launchpad name of the charm.
         """
-        return self._config['launchpad']
+        return self._project.launchpad
 
     @property
     def repository(self) -> str:
@@ -158,7 +640,7 @@ class Charm:
 
         :returns: the repository URL of the charm.
         """
-        return self._config['repository']
+        return self._project.repository
 
     @property
     def raw_branches(self) -> Dict[str, Dict[str, Dict[str, List[str]]]]:
@@ -178,23 +660,16 @@ class Charm:
 
         :returns: the repository URL of the charm.
         """
-        return self._config['branches'].copy()
+        return self._project.raw_branches
 
     @property
     def branches(self) -> List[str]:
         """Get the list of branches for the charm."""
-        try:
-            return list(self._config['branches'].keys())
-        except KeyError:
-            return []
+        return list(self._project.branches.keys())
 
     def channels_for(self, branch: str) -> List[str]:
         """Get the tracks/channels for a particular branch."""
-        try:
-            channels = self.branches[branch]
-            return channels['channels']
-        except KeyError:
-            return []
+        return list(self._project.branches.get(branch, ()))
 
 
 def find_config_for(charmhub: str) -> Dict[str, Any]:
@@ -223,49 +698,255 @@ def find_config_for(charmhub: str) -> Dict[str, Any]:
     :raises: KeyError if the charm couldn't be found.
     :raises: Exception if the config couldn't be read.
     """
-    raw_config = get_yaml_config()
-    for section, section_config in raw_config.items():
-        for project in section_config['projects']:
-            if project['charmhub'] == charmhub:
-                # we've found the charm; now get the correct branches onto it.
-                project_config = project.copy()
-                if 'branches' not in project:
-                    try:
-                        project_config['branches'] = \
-                            section_config['defaults']['branches']
-                    except KeyError:
-                        logging.warning(f"No branches or default branches for "
-                                        f"charmhub: {charmhub}")
-                if 'team' not in project:
-                    try:
-                        project_config['team'] = \
-                            section_config['defaults']['team']
-                    except KeyError:
-                        logging.warning(f"No team or default team for "
-                                        f"charmhub: {charmhub}")
-                project_config['section'] = section
-                return project_config
-    raise KeyError(f"Couldn't find {charmhub} in the config.")
+    return get_config().get(charmhub).config()
+
+
+def channel_table(branches: Sequence[str],
+                  ignore_tracks: Sequence[str] = (),
+                  enforce_edge: bool = False,
+                  ) -> ChannelTable:
+    """The channel table for the branches over all the configured charms.
+
+    See `build_channel_table`.
+    """
+    return get_config().channel_table(branches, ignore_tracks, enforce_edge)
+
+
+def charms_for_channel(channel: str) -> List[Tuple[str, str]]:
+    """The (charm, branch) pairs that publish to a track/channel."""
+    return list(get_config().by_channel.get(channel, ()))
 
 
 def get_charms(section: str) -> List[Charm]:
     """Get all the charm names, optionally restricting to a section.
 
+    As with `Charm`, a charm that is in more than one section is the project
+    in the first one, even if a later section is asked for.
+
     :returns: the list of charm names.
     :raises: Exception if couldn't read the config.
     """
     assert section is not None
-    raw_config = get_yaml_config()
-    charms: List[Charm] = []
-    for _section, section_config in raw_config.items():
-        if section != ":all:" and _section != section:
-            continue
-        for project in section_config['projects']:
-            charms.append(Charm(project['charmhub']))
-    return charms
+    config = get_config()
+    try:
+        projects = config.section(section)
+    except KeyError:
+        return []
+    return [Charm(project.charmhub, config.get(project.charmhub))
+            for project in projects]
+
+
+@contextlib.contextmanager
+def config_dir() -> Iterator[Path]:
+    """The directory containing the lp-builder-config/*.yaml files.
+
+    This is $RELEASE_TOOLS_LP_BUILDER_CONFIG_DIR if it is set, otherwise the
+    data directory of the installed charmed_openstack_info package.
+    """
+    override = os.environ.get(CONFIG_DIR_ENV, None)
+    if override:
+        yield Path(override)
+        return
+    config_files = files('charmed_openstack_info.data.lp-builder-config')
+    with as_file(config_files) as cfg_dir:
+        yield Path(cfg_dir)
+
+
+def local_config_file() -> Path:
+    """The local override of the config.
+
+    If a $XDG_CONFIG_HOME/charmhub_lb_tools/config.yaml exists, then it is
+    used to determine the configuration rather than the installed module.
+    This is to allow interactive use to override the version on github (e.g.
+    if a PR hasn't landed yet).  It may be a directory of lp-builder-config
+    *.yaml files, or a single file that is used as the only section (named
+    after the file).
+    """
+    xdg_config_home = os.environ.get('XDG_CONFIG_HOME', None)
+    if xdg_config_home is None:
+        xdg_config_home = str(Path(os.environ['HOME']) / '.config')
+    return Path(xdg_config_home) / 'charmhub_lb_tools' / 'config.yaml'
+
+
+@contextlib.contextmanager
+def _config_files() -> Iterator[Tuple[str, List[Path], bool]]:
+    """The config files to read, including local overrides.
+
+    :returns: the origin of the files (for the snapshot key), the files, and
+        whether the files can be read after the context has exited.
+    """
+    local = local_config_file()
+    if not os.environ.get(CONFIG_DIR_ENV, None) and local.exists():
+        if local.is_dir():
+            yield 'local', sorted(local.glob('*.yaml')), True
+        else:
+            yield 'local', [local], True
+        return
+    if os.environ.get(CONFIG_DIR_ENV, None):
+        origin = 'local'
+        lazy = True
+    else:
+        origin = _package_version()
+        # an installed package that isn't a zip is used in place.
+        lazy = isinstance(
+            files('charmed_openstack_info.data.lp-builder-config'), Path)
+    with config_dir() as cfg_dir:
+        yield origin, sorted(cfg_dir.glob('*.yaml')), lazy
+
+
+def _package_version() -> str:
+    import importlib.metadata
+    try:
+        return importlib.metadata.version('charmed_openstack_info')
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def _parse_yaml(config_file: Path, content: bytes) -> Any:
+    # yaml is only imported (by readonly.parse) when a file has to be parsed;
+    # usually the snapshot is used instead.
+    try:
+        return readonly.parse(content)
+    except Exception as e:
+        logging.error("Couldn't read config_file: %s due to: %s",
+                      config_file, str(e))
+        raise
+
+
+def _read_yaml_file(config_file: Path) -> Any:
+    try:
+        content = config_file.read_bytes()
+    except Exception as e:
+        logging.error("Couldn't read config_file: %s due to: %s",
+                      config_file, str(e))
+        raise
+    return _parse_yaml(config_file, content)
+
+
+def snapshot_enabled() -> bool:
+    return os.environ.get(SNAPSHOT_ENV, '1') != '0'
+
+
+def snapshot_dir() -> Path:
+    """The directory that the compiled snapshots of the sections are kept in.
+
+    marshal's format depends on the Python version, so that is in the name.
+    """
+    return user_cache_dir('lp-builder', "py{}{}".format(*sys.version_info[:2]))
+
 
+def snapshot_path(config_file: Path) -> Path:
+    """The file that the compiled snapshot of a config file is kept in."""
+    key = hashlib.sha1(str(config_file).encode()).hexdigest()[:12]
+    return snapshot_dir() / f"{config_file.stem}-{key}.marshal"
 
-### TODO: OLD - needs refactoring into using new config
+
+def _read_snapshot(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'rb') as f:
+            snapshot = marshal.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        logger.debug("Ignoring unreadable snapshot %s: %s", path, str(e))
+        return None
+    if (not isinstance(snapshot, dict) or
+            snapshot.get('version', None) != SNAPSHOT_VERSION):
+        return None
+    return snapshot
+
+
+def _write_snapshot(path: Path, snapshot: Dict[str, Any]) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.new")
+    try:
+        with open(tmp, 'wb') as f:
+            marshal.dump(snapshot, f)
+        os.replace(tmp, path)
+    except (OSError, ValueError) as e:
+        # ValueError if the config has a type that marshal can't store.
+        logger.debug("Couldn't write the snapshot %s: %s", path, str(e))
+        with contextlib.suppress(OSError):
+            tmp.unlink()
+
+
+def _load_section(origin: str, config_file: Path) -> Any:
+    """Load a config file, using its compiled snapshot if it is current.
+
+    The snapshot is current if it was made from the same origin (package
+    version) and the file has the same mtime and size.  If they differ, the
+    file is read and hashed, and if the hash still matches (e.g. the file was
+    just touched), the snapshot is used and refreshed; only otherwise is the
+    file parsed.
+
+    :param origin: the package version, or 'local' for an override.
+    :param config_file: the file to load.
+    :returns: the parsed yaml of the file.
+    """
+    path = snapshot_path(config_file)
+    st = config_file.stat()
+    stat = (st.st_mtime_ns, st.st_size)
+    snapshot = _read_snapshot(path)
+    if snapshot is not None and snapshot['origin'] != origin:
+        snapshot = None
+    if snapshot is not None and snapshot['stat'] == stat:
+        return snapshot['raw']
+    content = config_file.read_bytes()
+    digest = hashlib.sha256(content).hexdigest()
+    if snapshot is not None and snapshot['hash'] == digest:
+        raw = snapshot['raw']
+    else:
+        raw = _parse_yaml(config_file, content)
+    _write_snapshot(path, {
+        'version': SNAPSHOT_VERSION,
+        'origin': origin,
+        'path': str(config_file),
+        'stat': stat,
+        'hash': digest,
+        'raw': raw,
+    })
+    return raw
+
+
+def load_config() -> LpBuilderConfig:
+    """Get a new `LpBuilderConfig` over the config files.
+
+    The files are found, but each is only parsed when its section is first
+    needed.  Unless $RELEASE_TOOLS_LP_BUILDER_SNAPSHOT is '0', a compiled
+    snapshot of each parsed file is kept in the user's cache directory so that
+    the yaml only needs parsing when the file changes.  Use `get_config` to
+    use the cached config.
+    """
+    with _config_files() as (origin, config_files, lazy):
+        if snapshot_enabled():
+            loaders = {config_file.stem: functools.partial(
+                _load_section, origin, config_file)
+                for config_file in config_files}
+        else:
+            loaders = {config_file.stem: functools.partial(
+                _read_yaml_file, config_file)
+                for config_file in config_files}
+        if not lazy:
+            # the files only exist until the context exits.
+            return LpBuilderConfig(
+                {section: loader() for section, loader in loaders.items()})
+    return LpBuilderConfig(loaders=loaders)
+
+
+def get_config() -> LpBuilderConfig:
+    """Get the (cached) config model; it is read on first use.
+
+    :raises: Exception if a config file couldn't be read.
+    """
+    global _CONFIG
+    if _CONFIG is None:
+        _CONFIG = load_config()
+    return _CONFIG
+
+
+def reset_caches() -> None:
+    """Forget the parsed config so that it is read again on next use."""
+    global _CONFIG
+    _CONFIG = None
 
 
 def get_lp_builder_config() -> LpConfig:
@@ -284,29 +965,7 @@ def get_lp_builder_config() -> LpConfig:
 
     :returns: The charm <-> branch <-> track/channel mapping.
     """
-    global _LP_CONFIG
-    if _LP_CONFIG is not None:
-        return _LP_CONFIG.copy()
-    lp_config = {}
-    # see if the local config is set up?
-    xdg_config_home = os.environ.get('XDG_CONFIG_HOME', None)
-    if xdg_config_home is None:
-        xdg_config_home = Path(os.environ['HOME']) / '.config'
-    local_config_file = (Path(xdg_config_home) / 'charmhub_lb_tools' /
-                         'config.yaml')
-
-    def _parse_files(_cfg_dir: Path | str) -> None:
-        for config_file in glob.glob(f'{_cfg_dir}/*.yaml'):
-            lp_config.update(parse_lp_builder_config_file(Path(config_file)))
-
-    if local_config_file.exists():
-        _parse_files(local_config_file)
-    else:
-        config_dir = files('charmed_openstack_info.data.lp-builder-config')
-        with as_file(config_dir) as cfg_dir:
-            _parse_files(cfg_dir)
-    _LP_CONFIG = lp_config
-    return lp_config.copy()
+    return get_config().lp_config.copy()
 
 
 def sections() -> List[str]:
@@ -314,23 +973,16 @@ def sections() -> List[str]:
 
     :returns: List of section names.
     """
-    config_dir = files('charmed_openstack_info.data.lp-builder-config')
-    with as_file(config_dir) as cfg_dir:
-        return list(Path(name).stem for name in glob.glob(f'{cfg_dir}/*.yaml'))
+    return get_config().sections
 
 
 def get_lp_builder_config_for(name: str) -> LpConfig:
     """Fetch the lp config fo a specific name.
 
     :returns: The cham <-> branch <-> track/channel mapping.
+    :raises: KeyError if the section doesn't exist.
     """
-    global _YAML_CONFIG
-    try:
-        return _YAML_CONFIG[name]
-    except KeyError:
-        pass
-    get_lp_builder_config()
-    return _YAML_CONFIG[name]
+    return get_config().section_lp_config(name).copy()
 
 
 def get_yaml_config() -> RawConfig:
@@ -341,23 +993,7 @@ def get_yaml_config() -> RawConfig:
     :returns: the entire config for all of the files, split by section.
     :raises: Exception if the config file couldn't be read.
     """
-    global _RAW_CONFIG
-    if _RAW_CONFIG is not None:
-        return _RAW_CONFIG.copy()
-    _RAW_CONFIG = {}
-    config_dir = files('charmed_openstack_info.data.lp-builder-config')
-    with as_file(config_dir) as cfg_dir:
-        for config_file in glob.glob(f'{cfg_dir}/*.yaml'):
-            name = Path(config_file).stem
-            try:
-                with open(config_file) as f:
-                    raw_config = yaml.safe_load(f)
-            except Exception as e:
-                logging.error("Couldn't read config_file: %s due to: %s",
-                              config_file, str(e))
-                raise
-            _RAW_CONFIG[name] = raw_config
-    return _RAW_CONFIG.copy()
+    return get_config().raw.copy()
 
 
 def parse_lp_builder_config_file(config_file: Path) -> LpConfig:
@@ -365,40 +1001,6 @@ def parse_lp_builder_config_file(config_file: Path) -> LpConfig:
 
     :param config_file: the file to read.
     """
-    global _YAML_CONFIG
     name: str = config_file.stem
-    try:
-        return _YAML_CONFIG[name]
-    except KeyError:
-        pass
-    try:
-        with open(config_file) as f:
-            raw_config = yaml.safe_load(f)
-    except Exception as e:
-        logging.error("Couldn't read config_file: %s due to: %s",
-                      config_file, str(e))
-        raise
-    # load defaults if they exist
-    try:
-        default_branches = {
-            k: v['channels']
-            for k, v in raw_config['defaults']['branches'].items()}
-    except KeyError:
-        default_branches = {}
-    # Now iterate through the config and add default branches if now branches
-    # are specificed.
-    lp_config: LpConfig = {}
-    try:
-        for project in raw_config['projects']:
-            try:
-                branches = {
-                    k: v['channels']
-                    for k, v in project['branches'].items()}
-            except KeyError:
-                branches = default_branches.copy()
-            lp_config[project['charmhub']] = branches
-    except KeyError:
-        # just ignore the file if there are no projects
-        logging.warning('File %s contains no projects key?', config_file)
-    _YAML_CONFIG[name] = lp_config
-    return lp_config
+    return LpBuilderConfig(
+        {name: _read_yaml_file(config_file)}).section_lp_config(name)
@@ -0,0 +1,125 @@
+"""Write-only-if-changed, atomic output for the file editors.
+
+The editors (update-channel-single.py, _update-charmcraft.py,
+update-build-lock.py, update-zuul-jobs.py, ...) render the new content of a
+file in memory and then call `write_if_changed()`.  That compares the content
+with the bytes already in the file and only writes if they differ, so that an
+unchanged file keeps its mtime (which keeps git status, rsync and the
+inventory's change detection fast and quiet).  When it does write, it writes a
+temporary file in the same directory, fsyncs it and renames it over the
+original, so that the file is never left half written.
+
+The files that were written are recorded: `touched_files()` returns them for
+the current process and, if $RELEASE_TOOLS_TOUCHED_FILE is set, each path is
+appended to that file (one per line) so that the later stages of a batch can
+see which files were changed.
+"""
+
+import io
+import os
+from pathlib import Path
+import stat
+import threading
+from typing import Any, Iterable, List, Optional, Union
+
+
+TOUCHED_FILE_ENV = 'RELEASE_TOOLS_TOUCHED_FILE'
+
+_touched: List[Path] = []
+_touched_lock = threading.Lock()
+
+
+def dumps(dumper: Any, data: Any) -> str:
+    """Render data with a dumper that writes to a stream, e.g. ruamel's YAML.
+
+    :param dumper: an object with a dump(data, stream) method.
+    :param data: the data to render.
+    :returns: the rendered text.
+    """
+    stream = io.StringIO()
+    dumper.dump(data, stream)
+    return stream.getvalue()
+
+
+def _read_bytes(path: Path) -> Optional[bytes]:
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _record(path: Path) -> None:
+    with _touched_lock:
+        _touched.append(path)
+    touched_file = os.environ.get(TOUCHED_FILE_ENV, None)
+    if touched_file:
+        # a single append so that concurrent writers don't interleave lines.
+        fd = os.open(touched_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                     0o644)
+        try:
+            os.write(fd, f"{path}\n".encode())
+        finally:
+            os.close(fd)
+
+
+def write_if_changed(path: Union[str, Path],
+                     content: Union[str, bytes],
+                     encoding: str = 'utf-8',
+                     ) -> bool:
+    """Atomically write content to path, but only if it has changed.
+
+    The permissions of an existing file are kept.  If path is a symlink, the
+    file that it points to is written and the link is kept, as open(path,
+    'w') would.
+
+    :param path: the file to write.
+    :param content: the new content of the file.
+    :param encoding: the encoding of content if it is a str.
+    :returns: True if the file was written.
+    """
+    path = Path(path)
+    data = content.encode(encoding) if isinstance(content, str) else content
+    if _read_bytes(path) == data:
+        return False
+    # replace the target of a symlink, not the link itself.
+    target = Path(os.path.realpath(path))
+    tmp = target.with_name(f".{target.name}.{os.getpid()}."
+                           f"{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp, stat.S_IMODE(target.stat().st_mode))
+        except FileNotFoundError:
+            pass
+        os.replace(tmp, target)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    _record(path)
+    return True
+
+
+def write_lines_if_changed(path: Union[str, Path],
+                           lines: Iterable[str],
+                           ) -> bool:
+    """As `write_if_changed()` for a list of lines (with their newlines)."""
+    return write_if_changed(path, ''.join(lines))
+
+
+def touched_files() -> List[Path]:
+    """The files that this process has written, in the order written."""
+    with _touched_lock:
+        return list(_touched)
+
+
+def reset_touched() -> None:
+    """Forget the files that have been written; mainly for the tests."""
+    with _touched_lock:
+        _touched.clear()
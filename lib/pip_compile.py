@@ -0,0 +1,410 @@
+"""The pip-compile jobs of lock-with-pip-compile, for many charms at once.
+
+lock-with-pip-compile locks one charm at a time and, within a charm, runs
+pip-compile for each python version and set of *.in files one after the
+other, although the compiles don't depend on each other.  This module works
+out the jobs for a charm from its type (the same plans as the shell script):
+
+  1. move the *requirements.txt files to *.in (if the .in doesn't exist);
+  2. the compiles, e.g. requirements.in + test-requirements.in with
+     python3.8 -> merged-requirements-py38.txt, each of which is skipped if
+     its output already exists, as the shell script doesn't overwrite them;
+  3. record the inputs in the ledger, once all the compiles have succeeded.
+
+so that lock-with-pip-compile.py can run the compiles of all the charms in
+one bounded pool.
+
+The virtualenvs with pip-tools are shared, as in the shell script:
+<venvs_dir>/<python>-venv.  pip's HTTP and wheel cache is shared by all the
+compiles ($PIP_CACHE_DIR in the release-tools cache).  pip-tools' dependency
+cache is rewritten by each compile, so concurrent compiles mustn't share it:
+each worker slot has its own (see `CacheSlots`).
+
+Most charms' .in files are copies of global/<charm-type>/, so the same
+resolution would be computed for dozens of charms.  The results are kept in a
+content-addressed cache (see `ResultCache`), keyed by the normalised contents
+of the inputs, the python and pip-tools versions and pip's index and
+constraints settings, so a lock computed for one charm is copied to every
+other charm with the same inputs.  As the inputs may refer to branches
+(git+...@master) and unpinned packages, the results expire after a maximum
+age, so that the locks are re-resolved now and then.
+"""
+
+import contextlib
+import functools
+import hashlib
+import logging
+import os
+from pathlib import Path
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from lib.fleet import user_cache_dir
+from lib.ledger import CHARM_TYPE_INPUTS
+from lib.timing import timed
+
+
+logger = logging.getLogger(__name__)
+
+# The venvs are in the root of release-tools, as lock-with-pip-compile makes
+# them.
+VENVS_DIR = Path(__file__).parent.parent.resolve()
+
+LEDGER_OPERATION = 'lock-with-pip-compile'
+LEDGER_INPUTS = ('*.in', 'src/*.in',
+                 '*requirements*.txt', 'src/*requirements*.txt',
+                 *CHARM_TYPE_INPUTS)
+
+# what run_compile did.
+COMPILED = 'compiled'
+CACHED = 'cached'
+
+# re-resolve the locks at least this often.
+DEFAULT_MAX_AGE_DAYS = 7.0
+
+# the environment that changes what pip-compile resolves (pip reads its
+# options from $PIP_<OPTION>).
+PIP_SETTINGS_ENV = ('PIP_INDEX_URL', 'PIP_EXTRA_INDEX_URL', 'PIP_FIND_LINKS',
+                    'PIP_NO_INDEX', 'PIP_CONSTRAINT', 'PIP_PRE',
+                    'PIP_ONLY_BINARY', 'PIP_NO_BINARY')
+
+_COMMENT = re.compile(r'(^|\s)#.*$')
+# -r/-c lines, whose files are part of the inputs.
+_INCLUDE = re.compile(
+    r'^(?:-r|-c|--requirement|--constraint)(?:\s*=\s*|\s+|(?=\S))(\S+)$')
+
+
+class Compile(NamedTuple):
+    """A pip-compile of the inputs to the output with a python version."""
+    python: str
+    inputs: Tuple[str, ...]
+    output: str
+
+
+class CharmPlan(NamedTuple):
+    """The .txt files to move to .in, and then the compiles, for a charm."""
+    moves: Tuple[str, ...]
+    compiles: Tuple[Compile, ...]
+
+
+class CompileJob(NamedTuple):
+    """A compile to run in a charm."""
+    charm_dir: Path
+    step: Compile
+
+
+def _merged(python: str, suffix: str) -> Compile:
+    return Compile(python, ('requirements.in', 'test-requirements.in'),
+                   f"merged-requirements-{suffix}.txt")
+
+
+# the plans, by charm type (see ./what-is), from lock-with-pip-compile.
+PLANS = {
+    'classic-zaza': CharmPlan(
+        ('requirements.txt', 'test-requirements.txt'),
+        (_merged('python3.8', 'py38'),
+         _merged('python3.10', 'py310'),
+         Compile('python3.8', ('test-requirements.in',),
+                 'test-requirements-py38.txt'))),
+    'source-zaza': CharmPlan(
+        ('requirements.txt', 'test-requirements.txt',
+         'src/test-requirements.txt'),
+        (_merged('python3.8', 'py38'),
+         _merged('python3.10', 'py310'),
+         Compile('python3.8', ('src/test-requirements.in',),
+                 'src/test-requirements-py38.txt'),
+         Compile('python3.8', ('test-requirements.in',),
+                 'test-requirements-py38.txt'),
+         Compile('python3.10', ('test-requirements.in',),
+                 'test-requirements-py310.txt'))),
+    'ops-zaza': CharmPlan(
+        ('requirements.txt', 'test-requirements.txt'),
+        (_merged('python3.8', 'py38'),
+         _merged('python3.10', 'py310'),
+         Compile('python3.10', ('requirements.in',), 'requirements.txt'))),
+}
+
+
+def move_txt_to_in(charm_dir: Path, rel: str) -> str:
+    """Move something.txt to something.in if something.in doesn't exist.
+
+    :returns: what was done.
+    :raises: FileNotFoundError if neither exists.
+    """
+    txt = charm_dir / rel
+    in_file = txt.with_suffix('.in')
+    if in_file.exists():
+        return f"in file {rel[:-4]}.in already exists; not moving .txt -> .in"
+    txt.rename(in_file)
+    return f"Moving file {rel} -> {rel[:-4]}.in"
+
+
+def plan_charm(charm_dir: Path,
+               charm_type: Optional[str],
+               ) -> Tuple[List[CompileJob], List[str]]:
+    """Move the .txt files to .in and work out the compiles for a charm.
+
+    A compile whose output already exists is skipped.
+
+    :param charm_dir: the root of the charm.
+    :param charm_type: the type of the charm, e.g. source-zaza.
+    :returns: the compiles to run, and notes on what was done or skipped.
+    :raises: FileNotFoundError if the inputs of a compile are missing; none
+        of the charm's compiles should be run then.
+    """
+    plan = PLANS.get(charm_type or '')
+    if plan is None:
+        return [], [f"Not locking {charm_type}"]
+    notes = [move_txt_to_in(charm_dir, rel) for rel in plan.moves]
+    jobs = []
+    for step in plan.compiles:
+        if (charm_dir / step.output).exists():
+            notes.append(f"file {step.output} already exists; "
+                         f"not overwriting")
+            continue
+        missing = [i for i in step.inputs if not (charm_dir / i).exists()]
+        if missing:
+            raise FileNotFoundError(
+                f"{' '.join(missing)} files not found; not doing pip compile "
+                f"for {step.python}")
+        jobs.append(CompileJob(charm_dir, step))
+    return jobs, notes
+
+
+def venv_dir(python: str, venvs_dir: Path = VENVS_DIR) -> Path:
+    return venvs_dir / f"{python}-venv"
+
+
+def pip_compile_path(python: str, venvs_dir: Path = VENVS_DIR) -> Path:
+    return venv_dir(python, venvs_dir) / 'bin' / 'pip-compile'
+
+
+def ensure_venv(python: str, venvs_dir: Path = VENVS_DIR) -> bool:
+    """Create the venv for the python version, with pip-tools, if it doesn't
+    exist.
+
+    :returns: True if it was created.
+    :raises: RuntimeError if it couldn't be created.
+    """
+    venv = venv_dir(python, venvs_dir)
+    if venv.exists():
+        return False
+    interpreter = shutil.which(python)
+    if interpreter is None:
+        raise RuntimeError(f"{python} isn't installed")
+    logger.info("Creating venv and installing python %s", python)
+    for cmd in (['virtualenv', '-p', interpreter, str(venv)],
+                [str(venv / 'bin' / 'pip'), 'install', 'pip-tools']):
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(cmd)} failed: "
+                               f"{proc.stderr.strip()}")
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def pip_tools_version(python: str, venvs_dir: Path = VENVS_DIR) -> str:
+    """The version of pip-tools in the venv, e.g. 'pip-compile, version 7.3.0'.
+
+    :raises: RuntimeError if it can't be run.
+    """
+    pip_compile = pip_compile_path(python, venvs_dir)
+    try:
+        proc = subprocess.run([str(pip_compile), '--version'],
+                              capture_output=True, text=True)
+    except OSError as e:
+        raise RuntimeError(f"pip-compile is missing at {pip_compile}: {e}")
+    if proc.returncode != 0:
+        raise RuntimeError(f"{pip_compile} --version failed: "
+                           f"{proc.stderr.strip()}")
+    return proc.stdout.strip()
+
+
+def normalise_requirements(path: Path, _seen: Tuple[Path, ...] = ()) -> str:
+    """The contents of a requirements file without comments, blank lines or
+    surrounding whitespace, with the files that it includes (-r and -c)
+    inlined, so that files that resolve the same are the same.
+
+    :param path: the requirements (.in) file.
+    :returns: the normalised contents; a missing file is '<missing>'.
+    """
+    try:
+        text = path.read_text()
+    except (FileNotFoundError, NotADirectoryError):
+        return '<missing>\n'
+    _seen = _seen or (path.resolve(),)
+    lines = []
+    for line in text.splitlines():
+        line = _COMMENT.sub('', line).strip()
+        if not line:
+            continue
+        lines.append(line)
+        include = _INCLUDE.match(line)
+        if include and '://' not in include.group(1):
+            included = (path.parent / include.group(1)).resolve()
+            if included not in _seen:
+                lines.append(normalise_requirements(
+                    included, _seen + (included,)).rstrip('\n'))
+    return ''.join(f"{line}\n" for line in lines)
+
+
+class ResultCache:
+    """The pip-compile results, by a digest of what they depend on.
+
+    :param max_age: how long, in seconds, a result is used for.
+    :param cache_dir: where the results are kept; default is the user cache.
+    """
+
+    def __init__(self,
+                 max_age: float = DEFAULT_MAX_AGE_DAYS * 86400,
+                 cache_dir: Optional[Path] = None,
+                 ) -> None:
+        self.max_age = max_age
+        if cache_dir is None:
+            cache_dir = user_cache_dir('pip-compile-results')
+        self.cache_dir = Path(cache_dir)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def key(self, job: CompileJob, pip_tools: str) -> str:
+        """The digest of the inputs of the compile, the versions and pip's
+        settings.
+
+        The input and output names are included as pip-compile writes them
+        into the output.
+
+        :param job: the compile.
+        :param pip_tools: the version of pip-tools, see `pip_tools_version`.
+        """
+        charm_dir, step = job
+        digest = hashlib.sha256()
+        for value in (step.python, pip_tools, step.output,
+                      *(f"{name}={os.environ.get(name, '')}"
+                        for name in PIP_SETTINGS_ENV)):
+            digest.update(f"{value}\0".encode())
+        for name in step.inputs:
+            digest.update(f"input:{name}\0".encode())
+            digest.update(
+                normalise_requirements(charm_dir / name).encode())
+        return digest.hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    @contextlib.contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """Hold the key, so that the compiles with the same inputs wait for
+        the first one rather than resolving the same thing at once."""
+        with self._locks_lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            yield
+
+    def get(self, key: str) -> Optional[bytes]:
+        """The result for the key, if there is one that isn't too old."""
+        entry = self._entry(key)
+        try:
+            if time.time() - entry.stat().st_mtime > self.max_age:
+                return None
+            return entry.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, result: bytes) -> None:
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.new")
+        tmp.write_bytes(result)
+        os.replace(tmp, entry)
+
+
+def pip_cache_dir() -> Path:
+    """pip's HTTP and wheel cache, shared by all the compiles."""
+    return user_cache_dir('pip')
+
+
+class CacheSlots:
+    """A pip-tools cache directory for each concurrent compile.
+
+    A compile takes a free slot for as long as it runs, so no two compiles
+    use the same directory at the same time, and there are only as many
+    directories as workers.
+
+    :param workers: the number of concurrent compiles.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self._free: 'queue.Queue[int]' = queue.Queue()
+        for slot in range(max(1, workers)):
+            self._free.put(slot)
+
+    @contextlib.contextmanager
+    def take(self) -> Iterator[Path]:
+        slot = self._free.get()
+        try:
+            yield user_cache_dir('pip-tools', str(slot))
+        finally:
+            self._free.put(slot)
+
+
+def run_compile(job: CompileJob,
+                slots: CacheSlots,
+                venvs_dir: Path = VENVS_DIR,
+                results: Optional[ResultCache] = None,
+                ) -> Optional[str]:
+    """Run a compile, or copy its result from the results cache.
+
+    :param job: the compile.
+    :param slots: the pip-tools cache slots.
+    :param venvs_dir: where the venvs are.
+    :param results: the results cache, if it is to be used.
+    :returns: COMPILED or CACHED, or None if the output appeared in the
+        meantime.
+    :raises: RuntimeError if pip-compile is missing or fails.
+    """
+    charm_dir, step = job
+    pip_compile = pip_compile_path(step.python, venvs_dir)
+    if not pip_compile.exists():
+        raise RuntimeError(f"pip-compile is missing at {pip_compile}")
+    if results is None:
+        return _compile(job, pip_compile, slots)
+    key = results.key(job, pip_tools_version(step.python, venvs_dir))
+    with results.lock(key):
+        if (charm_dir / step.output).exists():
+            return None
+        result = results.get(key)
+        if result is not None:
+            logger.debug("%s: %s from the results cache", charm_dir.name,
+                         step.output)
+            (charm_dir / step.output).write_bytes(result)
+            return CACHED
+        status = _compile(job, pip_compile, slots)
+        if status is not None:
+            results.put(key, (charm_dir / step.output).read_bytes())
+        return status
+
+
+def _compile(job: CompileJob,
+             pip_compile: Path,
+             slots: CacheSlots,
+             ) -> Optional[str]:
+    charm_dir, step = job
+    if (charm_dir / step.output).exists():
+        return None
+    env = dict(os.environ, PIP_CACHE_DIR=str(pip_cache_dir()))
+    with slots.take() as cache_dir, \
+            timed('pip-compile', charm=charm_dir.name):
+        proc = subprocess.run(
+            [str(pip_compile), '--cache-dir', str(cache_dir),
+             '-o', step.output, *step.inputs],
+            cwd=charm_dir, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1:] or ['']
+        raise RuntimeError(f"pip-compile -o {step.output} failed: "
+                           f"{error[0]}")
+    return COMPILED
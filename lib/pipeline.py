@@ -0,0 +1,430 @@
+"""Apply a pipeline of transforms to the files of the charms.
+
+A migration is usually several edits to the same few files of each charm:
+e.g. cc3ify and the charm-tools channel in charmcraft.yaml, the charmbuild job
+in .zuul.yaml and a new py3 testenv in tox.ini.  Run as separate tools, each
+edit re-reads, re-parses and re-writes the files.  A pipeline lists the edits
+in a YAML spec instead:
+
+    transforms:
+      - charmcraft.cc3ify
+      - charmcraft.charm-tools:
+          channel: 3.x/stable
+      - zuul.add-charmbuild
+      - tox.add-py3:
+          version: "3.12"
+          template: "3.10"
+
+For each charm, each file is parsed once (when the first transform that
+targets it runs), the transforms are applied in the order of the spec and
+then each edited file is written once, and only if it changed (see
+lib/output.py).  If a transform fails, none of the charm's files are written.
+Transforms for a file that the charm doesn't have are skipped.
+
+The transforms are the ones in the tools (_update-charmcraft.py,
+update-zuul-jobs.py, update-tox.py, _update-metadata.py and
+update-build-lock.py); see `TRANSFORMS`.  run-pipeline.py runs a pipeline
+over the charms in parallel.
+"""
+
+import argparse
+import functools
+import importlib.util
+import json
+import logging
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from lib.output import dumps, write_if_changed
+from lib import readonly
+from lib.timing import timed
+
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = Path(__file__).parent.parent.resolve()
+
+# marks a transform parameter that must be given in the spec.
+REQUIRED = object()
+
+
+class PipelineError(Exception):
+    """The pipeline spec is invalid."""
+
+
+@functools.lru_cache(maxsize=None)
+def load_tool(filename: str) -> ModuleType:
+    """Load one of the (hyphenated) tools in the repo as a module.
+
+    Each tool is loaded once per process.
+
+    :param filename: the tool's filename, e.g. 'update-tox.py'.
+    """
+    name = Path(filename).stem.replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, REPO_DIR / filename)
+    module = importlib.util.module_from_spec(spec)  # type: ignore
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+@functools.lru_cache(maxsize=None)
+def _yaml(kind: str) -> Any:
+    """The round-trip YAML instance for a kind of file, configured as the
+    tool that edits it configures it."""
+    if kind == 'charmcraft':
+        return load_tool('_update-charmcraft.py').get_yaml()
+    if kind in ('zuul', 'osci'):
+        return load_tool('update-zuul-jobs.py')._make_yaml()
+    from ruamel.yaml import YAML
+    return YAML(typ='rt')
+
+
+class FileKind(NamedTuple):
+    """A file of a charm that transforms edit (or read).
+
+    paths are the candidate paths relative to the charm; the first that is a
+    file (and not a symlink, unless it is the last candidate) is used.
+    """
+    paths: Tuple[str, ...]
+    load: Callable[[str, Path], Any]
+    render: Callable[[str, Any], str]
+
+
+def _load_yaml(kind: str, path: Path) -> Any:
+    with open(path) as f:
+        return _yaml(kind).load(f)
+
+
+def _render_yaml(kind: str, doc: Any) -> str:
+    return dumps(_yaml(kind), doc)
+
+
+def _load_read_only(kind: str, path: Path) -> Any:
+    return readonly.load(path)
+
+
+def _load_text(kind: str, path: Path) -> str:
+    return path.read_text()
+
+
+def _render_text(kind: str, doc: str) -> str:
+    return doc
+
+
+def _load_json(kind: str, path: Path) -> Any:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _render_json(kind: str, doc: Any) -> str:
+    return json.dumps(doc, indent=2)
+
+
+FILE_KINDS: Dict[str, FileKind] = {
+    'charmcraft': FileKind(('charmcraft.yaml',), _load_yaml, _render_yaml),
+    'zuul': FileKind(('.zuul.yaml',), _load_yaml, _render_yaml),
+    'metadata': FileKind(('metadata.yaml', 'src/metadata.yaml'),
+                         _load_yaml, _render_yaml),
+    'tox': FileKind(('tox.ini',), _load_text, _render_text),
+    'build-lock': FileKind(('src/build.lock', 'build.lock'),
+                           _load_json, _render_json),
+    # only read, for the charmcraft_channel.
+    'osci': FileKind(('osci.yaml',), _load_read_only, _render_yaml),
+}
+
+
+class CharmFiles:
+    """The files of a charm, each parsed once when it is first used.
+
+    :param charm_dir: the root of the charm repo.
+    """
+
+    def __init__(self, charm_dir: Path) -> None:
+        self.charm_dir = charm_dir
+        self._paths: Dict[str, Optional[Path]] = {}
+        self._docs: Dict[str, Any] = {}
+        self._edited: List[str] = []
+
+    def path(self, kind: str) -> Optional[Path]:
+        """The path of the file of this kind, or None if there isn't one."""
+        if kind not in self._paths:
+            found = None
+            candidates = FILE_KINDS[kind].paths
+            for i, rel in enumerate(candidates):
+                path = self.charm_dir / rel
+                if path.is_file() and (not path.is_symlink() or
+                                       i == len(candidates) - 1):
+                    found = path
+                    break
+            self._paths[kind] = found
+        return self._paths[kind]
+
+    def doc(self, kind: str) -> Any:
+        """The parsed file of this kind.
+
+        :raises: FileNotFoundError if the charm doesn't have the file.
+        """
+        if kind not in self._docs:
+            path = self.path(kind)
+            if path is None:
+                raise FileNotFoundError(
+                    f"{self.charm_dir.name} has no "
+                    f"{' or '.join(FILE_KINDS[kind].paths)}")
+            self._docs[kind] = FILE_KINDS[kind].load(kind, path)
+        return self._docs[kind]
+
+    def edit(self, kind: str, doc: Any = None) -> None:
+        """Mark the file as edited, optionally replacing the parsed file."""
+        if doc is not None:
+            self._docs[kind] = doc
+        if kind not in self._edited:
+            self._edited.append(kind)
+
+    def write(self) -> List[Path]:
+        """Write the edited files that have changed.
+
+        :returns: the paths of the files written.
+        """
+        written: List[Path] = []
+        for kind in self._edited:
+            path = self.path(kind)
+            if write_if_changed(
+                    path, FILE_KINDS[kind].render(kind, self._docs[kind])):
+                written.append(path)  # type: ignore
+        return written
+
+
+class Transform(NamedTuple):
+    """A transform: the kind of file it edits, the parameters (and their
+    defaults) it takes and the function that applies it."""
+    kind: str
+    params: Dict[str, Any]
+    apply: Callable[[CharmFiles, Dict[str, Any]], None]
+    help: str
+
+
+def _charmcraft(func_name: str,
+                ) -> Callable[[CharmFiles, Dict[str, Any]], None]:
+    def apply(files: CharmFiles, params: Dict[str, Any]) -> None:
+        func = getattr(load_tool('_update-charmcraft.py'), func_name)
+        params = dict(params)
+        # as on the command line, comma separated lists are accepted.
+        if isinstance(params.get('add_build_arguments'), str):
+            params['add_build_arguments'] = (
+                params['add_build_arguments'].split(','))
+        if isinstance(params.get('platforms'), list):
+            params['platforms'] = ','.join(params['platforms'])
+        if isinstance(params.get('bases'), list):
+            params['bases'] = [str(b) for b in params['bases']]
+        files.edit('charmcraft',
+                   func(argparse.Namespace(**params),
+                        files.doc('charmcraft')))
+    return apply
+
+
+def _build_lock(func_name: str,
+                ) -> Callable[[CharmFiles, Dict[str, Any]], None]:
+    def apply(files: CharmFiles, params: Dict[str, Any]) -> None:
+        func = getattr(load_tool('update-build-lock.py'), func_name)
+        spec = params.get('spec')
+        if spec is not None and not isinstance(spec, str):
+            params = {**params, 'spec': json.dumps(spec)}
+        files.edit('build-lock',
+                   func(argparse.Namespace(**params),
+                        files.doc('build-lock')))
+    return apply
+
+
+def _add_charmbuild(files: CharmFiles, params: Dict[str, Any]) -> None:
+    tool = load_tool('update-zuul-jobs.py')
+    charm_name = params['charm_name']
+    if charm_name is None:
+        charm_name = files.doc('metadata').get('name')
+        if not charm_name:
+            raise ValueError(f"'name' key not found in "
+                             f"{files.path('metadata')}")
+    channel = params['charmcraft_channel']
+    if channel is None:
+        channel = tool.find_charmcraft_channel(files.doc('osci'))
+        if not channel:
+            raise ValueError(f"'charmcraft_channel' not found in "
+                             f"{files.path('osci')}")
+    if tool.add_charmbuild_job(files.doc('zuul'), files.path('zuul'),
+                               charm_name, channel):
+        files.edit('zuul')
+
+
+def _replace_template(files: CharmFiles, params: Dict[str, Any]) -> None:
+    tool = load_tool('update-zuul-jobs.py')
+    if tool.replace_template(files.doc('zuul'), files.path('zuul'),
+                             params['pattern'], params['with']):
+        files.edit('zuul')
+
+
+def _add_py3(files: CharmFiles, params: Dict[str, Any]) -> None:
+    tool = load_tool('update-tox.py')
+    versions = params['version']
+    if isinstance(versions, list):
+        versions = [str(v) for v in versions]
+    else:
+        versions = tool.split_versions(str(versions))
+    files.edit('tox', tool.clone_py3_sections(
+        files.doc('tox'), versions, str(params['template'])))
+
+
+def _series(func_name: str) -> Callable[[CharmFiles, Dict[str, Any]], None]:
+    def apply(files: CharmFiles, params: Dict[str, Any]) -> None:
+        func = getattr(load_tool('_update-metadata.py'), func_name)
+        if func(files.doc('metadata'), str(params['series']).lower()):
+            files.edit('metadata')
+    return apply
+
+
+_LOCK_PARAMS = {'type': REQUIRED, 'item': None, 'package': None}
+
+TRANSFORMS: Dict[str, Transform] = {
+    'charmcraft.delete': Transform(
+        'charmcraft', {'bases': REQUIRED}, _charmcraft('delete_bases'),
+        "Remove the run-on/build-on bases with these channels."),
+    'charmcraft.cc3ify': Transform(
+        'charmcraft', {'base': None, 'platforms': None},
+        _charmcraft('cc3ify'),
+        "Convert charmcraft.yaml to the charmcraft 3 format."),
+    'charmcraft.charm-tools': Transform(
+        'charmcraft', {'channel': None, 'add_build_arguments': None},
+        _charmcraft('charm_tools'),
+        "Set the charm snap channel and reactive build arguments."),
+    'zuul.add-charmbuild': Transform(
+        'zuul', {'charm_name': None, 'charmcraft_channel': None},
+        _add_charmbuild,
+        "Add the charmbuild check job to .zuul.yaml; the charm name and "
+        "channel default to metadata.yaml's name and osci.yaml's "
+        "charmcraft_channel."),
+    'zuul.replace-template': Transform(
+        'zuul', {'pattern': REQUIRED, 'with': REQUIRED}, _replace_template,
+        "Replace the .zuul.yaml template matching the glob pattern."),
+    'tox.add-py3': Transform(
+        'tox', {'version': REQUIRED, 'template': REQUIRED}, _add_py3,
+        "Add [testenv:pyXYZ] sections to tox.ini by cloning the "
+        "template's; version may be a list."),
+    'metadata.add-series': Transform(
+        'metadata', {'series': REQUIRED}, _series('add_series_to'),
+        "Add a series to metadata.yaml."),
+    'metadata.remove-series': Transform(
+        'metadata', {'series': REQUIRED}, _series('remove_series_from'),
+        "Remove a series from metadata.yaml."),
+    'build-lock.add': Transform(
+        'build-lock', {**_LOCK_PARAMS, 'spec': REQUIRED},
+        _build_lock('add_lock'), "Add a lock to the build.lock."),
+    'build-lock.modify': Transform(
+        'build-lock', {**_LOCK_PARAMS, 'spec': REQUIRED},
+        _build_lock('modify_lock'), "Modify a lock in the build.lock."),
+    'build-lock.delete': Transform(
+        'build-lock', dict(_LOCK_PARAMS), _build_lock('delete_lock'),
+        "Delete a lock from the build.lock."),
+    'build-lock.lock-layer': Transform(
+        'build-lock', {**_LOCK_PARAMS, 'type': 'layer'},
+        _build_lock('lock_layer'),
+        "Lock the layers' branches to their commits."),
+}
+
+
+class Step(NamedTuple):
+    """A transform in a pipeline and its parameters (with the defaults)."""
+    name: str
+    params: Dict[str, Any]
+
+
+class Pipeline(NamedTuple):
+    steps: List[Step]
+
+    def kinds(self) -> List[str]:
+        """The kinds of file that the pipeline edits, in order of first use."""
+        return list(dict.fromkeys(TRANSFORMS[s.name].kind
+                                  for s in self.steps))
+
+
+def _step(item: Any) -> Step:
+    if isinstance(item, str):
+        name, params = item, {}
+    elif isinstance(item, dict) and len(item) == 1:
+        name, params = next(iter(item.items()))
+        params = params or {}
+    else:
+        raise PipelineError(
+            f"A transform must be a name or a single key mapping: {item!r}")
+    try:
+        transform = TRANSFORMS[name]
+    except KeyError:
+        raise PipelineError(f"Unknown transform: {name}")
+    if not isinstance(params, dict):
+        raise PipelineError(f"The parameters of {name} must be a mapping")
+    params = {str(k).replace('-', '_') if k != 'with' else k: v
+              for k, v in params.items()}
+    unknown = sorted(set(params) - set(transform.params))
+    if unknown:
+        raise PipelineError(
+            f"Unknown parameter(s) for {name}: {', '.join(unknown)}")
+    merged = {**transform.params, **params}
+    missing = sorted(k for k, v in merged.items() if v is REQUIRED)
+    if missing:
+        raise PipelineError(
+            f"Missing parameter(s) for {name}: {', '.join(missing)}")
+    return Step(name, merged)
+
+
+def parse_pipeline(data: Any) -> Pipeline:
+    """Validate a parsed pipeline spec.
+
+    :param data: the spec; a mapping with a 'transforms' list.
+    :raises: PipelineError if the spec is invalid.
+    """
+    if not isinstance(data, dict) or not isinstance(
+            data.get('transforms'), list):
+        raise PipelineError("The spec must be a mapping with a 'transforms' "
+                            "list")
+    if not data['transforms']:
+        raise PipelineError("The spec has no transforms")
+    return Pipeline([_step(item) for item in data['transforms']])
+
+
+def load_pipeline(path: Path) -> Pipeline:
+    """Load and validate a pipeline spec from a YAML file."""
+    import yaml
+    try:
+        with open(path) as f:
+            data = yaml.safe_load(f)
+    except yaml.YAMLError as e:
+        raise PipelineError(f"Couldn't parse {path}: {e}")
+    return parse_pipeline(data)
+
+
+class CharmResult(NamedTuple):
+    """The files written for a charm and those that it doesn't have."""
+    written: List[Path]
+    missing: List[str]
+
+
+def run_charm(charm_dir: Path, pipeline: Pipeline) -> CharmResult:
+    """Run the pipeline on a charm.
+
+    :param charm_dir: the root of the charm repo.
+    :param pipeline: the pipeline.
+    :returns: the files written and the missing files whose transforms were
+        skipped.
+    :raises: Exception if a transform failed; nothing is written.
+    """
+    with timed('pipeline', charm=charm_dir.name):
+        files = CharmFiles(charm_dir)
+        missing: List[str] = []
+        for step in pipeline.steps:
+            transform = TRANSFORMS[step.name]
+            if files.path(transform.kind) is None:
+                rel = FILE_KINDS[transform.kind].paths[0]
+                if rel not in missing:
+                    missing.append(rel)
+                continue
+            logger.debug("%s: %s", charm_dir.name, step.name)
+            transform.apply(files, step.params)
+        return CharmResult(files.write(), missing)
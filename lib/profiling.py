@@ -0,0 +1,415 @@
+"""Profiling hooks for the Python entry points.
+
+The tools run their main function via `run_profiled`:
+
+    if __name__ == '__main__':
+        logging.basicConfig()
+        run_profiled(main)
+
+Profiling is off unless the tool is run with --profile (or --profile=MODES)
+or $RELEASE_TOOLS_PROFILE is set.  MODES is a comma separated list of:
+
+  * cprofile - a cProfile profile, saved as pstats (.pstats)
+  * sample   - a wall clock sampling profile of the main thread, saved in
+               the 'folded' format used by flamegraph.pl/speedscope (.folded)
+  * memory   - tracemalloc peak and the top allocations (.memory.json)
+
+'1', 'yes' or 'all' select all of the modes.  --profile with no modes is
+'cprofile'.  --profile also sets $RELEASE_TOOLS_PROFILE so that any tools
+that the profiled tool runs are profiled too.
+
+Each invocation writes its own files to:
+
+    $RELEASE_TOOLS_PROFILE_DIR/<batch>/<tool>-<dir>-<pid>-<time>.<ext>
+
+where the default directory is ~/.cache/release-tools/profile and <batch>
+is $RELEASE_TOOLS_BATCH_ID (set by the batch scripts, see lib/timing.sh) or
+'adhoc'.  As a batch runs a tool once per charm, `merge_profiles` (and
+batch-profile.py merge) combine the files for a batch into one of each kind.
+"""
+
+import collections
+import contextlib
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+)
+
+# The profilers are only imported when profiling is asked for, as every tool
+# imports this module.
+if TYPE_CHECKING:
+    import pstats
+    import tracemalloc
+
+from lib.fleet import user_cache_dir
+from lib.timing import BATCH_ID_ENV
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV = 'RELEASE_TOOLS_PROFILE'
+PROFILE_DIR_ENV = 'RELEASE_TOOLS_PROFILE_DIR'
+PROFILE_OPTION = '--profile'
+
+MODES = ('cprofile', 'sample', 'memory')
+ALL_MODES = ('1', 'yes', 'all')
+SUFFIXES = {
+    'cprofile': '.pstats',
+    'sample': '.folded',
+    'memory': '.memory.json',
+}
+
+# The interval between samples for the wall clock sampler, in seconds.
+SAMPLE_INTERVAL = 0.005
+# The number of frames tracemalloc keeps per allocation and the number of
+# allocation sites that are saved.
+MEMORY_FRAMES = 10
+MEMORY_TOP = 50
+
+
+def parse_modes(value: Optional[str]) -> Set[str]:
+    """Parse a comma separated list of profile modes.
+
+    :param value: e.g. 'cprofile,memory'; '', '0' or None for no profiling.
+    :returns: the set of modes.
+    :raises ValueError: if an unknown mode is given.
+    """
+    if not value or value in ('0', 'no'):
+        return set()
+    if value.lower() in ALL_MODES:
+        return set(MODES)
+    modes = {m.strip().lower() for m in value.split(',') if m.strip()}
+    unknown = modes - set(MODES)
+    if unknown:
+        raise ValueError(
+            f"Unknown profile mode(s): {', '.join(sorted(unknown))}; "
+            f"choose from {', '.join(MODES)}")
+    return modes
+
+
+def pop_profile_option(argv: List[str]) -> Optional[str]:
+    """Remove --profile[=MODES] from argv (in place) and return the modes.
+
+    :param argv: the arguments, e.g. sys.argv.
+    :returns: the modes given, 'cprofile' if just --profile, or None.
+    """
+    for i, arg in enumerate(argv[1:], start=1):
+        if arg == '--':
+            break
+        if arg == PROFILE_OPTION:
+            del argv[i]
+            return 'cprofile'
+        if arg.startswith(PROFILE_OPTION + '='):
+            del argv[i]
+            return arg.split('=', 1)[1]
+    return None
+
+
+def profile_base_dir() -> Path:
+    """The directory containing the per-batch profile directories."""
+    base = os.environ.get(PROFILE_DIR_ENV, None)
+    return Path(base) if base else user_cache_dir('profile')
+
+
+def profile_dir(batch: Optional[str] = None) -> Path:
+    """The directory that the profiles for a batch are written to.
+
+    :param batch: the batch id; default is $RELEASE_TOOLS_BATCH_ID or 'adhoc'.
+    """
+    return profile_base_dir() / (
+        batch or os.environ.get(BATCH_ID_ENV, None) or 'adhoc')
+
+
+def profile_stem(tool: str) -> str:
+    """The per-invocation file name, without the suffix, for a profile."""
+    return "{}-{}-{}-{}".format(tool,
+                                Path.cwd().name or 'root',
+                                os.getpid(),
+                                time.strftime('%Y%m%d-%H%M%S'))
+
+
+class WallClockSampler:
+    """Sample the stack of a thread at a fixed wall clock interval.
+
+    Unlike cProfile this sees time spent blocked (e.g. in subprocesses or
+    network calls) and adds very little overhead to the sampled thread.  The
+    samples are counted by stack, which can be written in the 'folded'
+    format: 'outer;inner;innermost count'.
+    """
+
+    def __init__(self,
+                 interval: float = SAMPLE_INTERVAL,
+                 thread_id: Optional[int] = None,
+                 ) -> None:
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.counts: Dict[str, int] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run,
+                                        name='wall-clock-sampler',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id, None)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} "
+                             f"({Path(code.co_filename).name}:"
+                             f"{code.co_firstlineno})")
+                frame = frame.f_back
+            del frame
+            self.counts[';'.join(reversed(stack))] += 1
+
+    def write_folded(self, path: Path) -> None:
+        write_folded(self.counts, path)
+
+
+def write_folded(counts: Dict[str, int], path: Path) -> None:
+    """Write stack counts in the folded format, most common first."""
+    with open(path, 'w') as f:
+        for stack, count in sorted(counts.items(),
+                                   key=lambda kv: kv[1],
+                                   reverse=True):
+            f.write(f"{stack} {count}\n")
+
+
+def read_folded(path: Path) -> Dict[str, int]:
+    """Read a folded stack file into a dictionary of stack: count."""
+    counts: Dict[str, int] = collections.Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            try:
+                counts[stack] += int(count)
+            except ValueError:
+                continue
+    return counts
+
+
+def memory_summary(snapshot: 'tracemalloc.Snapshot',
+                   peak: int,
+                   current: int,
+                   top: int = MEMORY_TOP,
+                   ) -> Dict[str, Any]:
+    """Summarise a tracemalloc snapshot into a JSON serialisable dict.
+
+    :param snapshot: the snapshot taken at the end of the run.
+    :param peak: the peak traced memory in bytes.
+    :param current: the traced memory in bytes when the snapshot was taken.
+    :param top: how many allocation sites to keep.
+    """
+    import tracemalloc
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ))
+    allocations = []
+    for stat in snapshot.statistics('lineno')[:top]:
+        frame = stat.traceback[0]
+        allocations.append({'location': f"{frame.filename}:{frame.lineno}",
+                            'size': stat.size,
+                            'count': stat.count})
+    return {'peak': peak, 'current': current, 'top': allocations}
+
+
+@contextlib.contextmanager
+def profiled(modes: Iterable[str],
+             tool: Optional[str] = None,
+             output_dir: Optional[Path] = None,
+             ) -> Iterator[Dict[str, Path]]:
+    """Profile the enclosed block and write the profiles when it exits.
+
+    The profiles are written even if the block raises (including
+    SystemExit), so that failing runs can be profiled too.
+
+    :param modes: the profile modes; see MODES.
+    :param tool: the tool name used in the file names; default is the
+        script name.
+    :param output_dir: where to write the files; default is `profile_dir()`.
+    :returns: a dictionary of mode: path, filled in once the block exits.
+    """
+    import cProfile
+    import tracemalloc
+    modes = set(modes)
+    written: Dict[str, Path] = {}
+    profiler: Optional[cProfile.Profile] = None
+    sampler: Optional[WallClockSampler] = None
+    if 'memory' in modes:
+        tracemalloc.start(MEMORY_FRAMES)
+    if 'sample' in modes:
+        sampler = WallClockSampler()
+        sampler.start()
+    if 'cprofile' in modes:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield written
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            sampler.stop()
+        memory: Optional[Dict[str, Any]] = None
+        if 'memory' in modes:
+            current, peak = tracemalloc.get_traced_memory()
+            memory = memory_summary(tracemalloc.take_snapshot(), peak, current)
+            tracemalloc.stop()
+        try:
+            output_dir = output_dir or profile_dir()
+            output_dir.mkdir(parents=True, exist_ok=True)
+            stem = output_dir / profile_stem(
+                tool or Path(sys.argv[0]).name or 'python')
+            if profiler is not None:
+                written['cprofile'] = Path(f"{stem}{SUFFIXES['cprofile']}")
+                profiler.dump_stats(written['cprofile'])
+            if sampler is not None:
+                written['sample'] = Path(f"{stem}{SUFFIXES['sample']}")
+                sampler.write_folded(written['sample'])
+            if memory is not None:
+                written['memory'] = Path(f"{stem}{SUFFIXES['memory']}")
+                with open(written['memory'], 'w') as f:
+                    json.dump(memory, f, indent=2)
+            for path in written.values():
+                logger.info("Wrote profile %s", path)
+        except OSError as e:
+            # profiling must never break the tool being profiled.
+            logger.error("Couldn't write profiles: %s", str(e))
+
+
+def run_profiled(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a tool's main function, profiling it if asked to.
+
+    Removes --profile[=MODES] from sys.argv (so that the tool's own argument
+    parsing doesn't see it) and falls back to $RELEASE_TOOLS_PROFILE.
+
+    :param func: the main function.
+    :returns: whatever func returns.
+    """
+    option = pop_profile_option(sys.argv)
+    if option is not None:
+        os.environ[PROFILE_ENV] = option
+    try:
+        modes = parse_modes(os.environ.get(PROFILE_ENV, None))
+    except ValueError as e:
+        sys.exit(f"ERROR: {e}")
+    if not modes:
+        return func(*args, **kwargs)
+    with profiled(modes):
+        return func(*args, **kwargs)
+
+
+def find_profiles(directory: Path, mode: str) -> List[Path]:
+    """The profiles of one mode in a (batch) directory, in name order."""
+    return sorted(directory.glob(f"*{SUFFIXES[mode]}"))
+
+
+def merge_pstats(paths: List[Path], output: Path) -> 'pstats.Stats':
+    """Merge cProfile profiles into one pstats file.
+
+    :param paths: the .pstats files.
+    :param output: the merged file to write.
+    :returns: the merged stats.
+    """
+    import pstats
+    stats = pstats.Stats(*(str(p) for p in paths))
+    stats.dump_stats(output)
+    return stats
+
+
+def merge_folded(paths: List[Path], output: Path) -> Dict[str, int]:
+    """Merge folded stack samples by adding up the counts per stack."""
+    counts: Dict[str, int] = collections.Counter()
+    for path in paths:
+        counts.update(read_folded(path))
+    write_folded(counts, output)
+    return counts
+
+
+def merge_memory(paths: List[Path],
+                 output: Path,
+                 top: int = MEMORY_TOP,
+                 ) -> Dict[str, Any]:
+    """Merge tracemalloc summaries.
+
+    The result has the number of invocations, the largest and the total of
+    the peaks, and the allocation sites with their sizes and counts added
+    up across the invocations.
+    """
+    sizes: Dict[str, int] = collections.Counter()
+    counts: Dict[str, int] = collections.Counter()
+    peaks: List[int] = []
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f)
+        peaks.append(data.get('peak', 0))
+        for allocation in data.get('top', []):
+            sizes[allocation['location']] += allocation['size']
+            counts[allocation['location']] += allocation['count']
+    merged = {
+        'invocations': len(peaks),
+        'max_peak': max(peaks) if peaks else 0,
+        'total_peak': sum(peaks),
+        'top': [{'location': location, 'size': size,
+                 'count': counts[location]}
+                for location, size in sizes.most_common(top)],
+    }
+    with open(output, 'w') as f:
+        json.dump(merged, f, indent=2)
+    return merged
+
+
+def merge_profiles(directory: Path,
+                   output_dir: Optional[Path] = None,
+                   ) -> Dict[str, Path]:
+    """Merge all the per-invocation profiles in a batch directory.
+
+    :param directory: the batch directory, see `profile_dir`.
+    :param output_dir: where to write the merged-* files; default is
+        directory/merged.
+    :returns: a dictionary of mode: merged file for the modes found.
+    """
+    output_dir = output_dir or (directory / 'merged')
+    output_dir.mkdir(parents=True, exist_ok=True)
+    mergers = {
+        'cprofile': merge_pstats,
+        'sample': merge_folded,
+        'memory': merge_memory,
+    }
+    merged: Dict[str, Path] = {}
+    for mode, merger in mergers.items():
+        paths = find_profiles(directory, mode)
+        if not paths:
+            continue
+        output = output_dir / f"merged{SUFFIXES[mode]}"
+        merger(paths, output)
+        merged[mode] = output
+    return merged
@@ -0,0 +1,125 @@
+"""Fast, cached, read-only access to the YAML files of the charms.
+
+Many code paths only read a value or two from a YAML file: the charm's name
+from metadata.yaml, the charmcraft_channel or charm_build_name from
+osci.yaml, the series of a charm, ...  A round-trip load with ruamel (which
+keeps the comments and the formatting so that the file can be written back)
+is several times slower than a plain load with LibYAML's CSafeLoader, and
+ruamel is slow to import too.  So the round-trip loaders are for the files
+that are being modified; everything else reads through `load()`.
+
+The parsed files are cached per process by (path, mtime, size), so that e.g.
+a fleet run that asks several questions of the same osci.yaml only parses it
+once, and a file that has been changed since is parsed again.  The data
+returned is shared with the cache and must not be modified; use a round-trip
+loader (or copy.deepcopy()) to modify it.
+"""
+
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import Any, Dict, Optional, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+# (path) -> (mtime_ns, size, data)
+_cache: Dict[str, Tuple[int, int, Any]] = {}
+_cache_lock = threading.Lock()
+
+_MISSING = object()
+
+
+def safe_loader() -> Any:
+    """The fastest safe yaml Loader available: LibYAML's if it is built."""
+    # yaml is only imported when a file has to be parsed.
+    import yaml
+    try:
+        return yaml.CSafeLoader
+    except AttributeError:
+        return yaml.SafeLoader
+
+
+def parse(content: Union[str, bytes]) -> Any:
+    """Parse YAML content with `safe_loader()`.
+
+    :raises: yaml.YAMLError if the content isn't valid YAML.
+    """
+    import yaml
+    return yaml.load(content, Loader=safe_loader())
+
+
+def load(path: Union[str, Path]) -> Any:
+    """Load a YAML file for reading, from the cache if it hasn't changed.
+
+    :param path: the file to load.
+    :returns: the parsed file; it must not be modified.
+    :raises: OSError if the file can't be read, yaml.YAMLError if it isn't
+        valid YAML.
+    """
+    key = os.fspath(path)
+    st = os.stat(key)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    with open(key, 'rb') as f:
+        data = parse(f.read())
+    with _cache_lock:
+        _cache[key] = (st.st_mtime_ns, st.st_size, data)
+    return data
+
+
+def load_or_none(path: Union[str, Path]) -> Any:
+    """As `load()`, but None if the file is missing or can't be parsed."""
+    try:
+        return load(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Couldn't parse %s: %s", path, str(e))
+        return None
+
+
+def cache_clear() -> None:
+    """Forget the cached files; mainly for the tests."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def metadata_path(charm_dir: Path) -> Optional[Path]:
+    """The charm's metadata.yaml: the one in the root, unless that is a
+    symlink (e.g. to src/metadata.yaml) or missing, else src/metadata.yaml."""
+    root = charm_dir / 'metadata.yaml'
+    if root.is_file() and not root.is_symlink():
+        return root
+    src = charm_dir / 'src' / 'metadata.yaml'
+    if src.is_file():
+        return src
+    return None
+
+
+def metadata(charm_dir: Path) -> Any:
+    """The charm's parsed metadata.yaml, or None."""
+    path = metadata_path(charm_dir)
+    return load_or_none(path) if path else None
+
+
+def osci_var(charm_dir: Path, var: str, default: Any = None) -> Any:
+    """A var from the first project in osci.yaml that sets it.
+
+    :param charm_dir: the root of the charm repo.
+    :param var: the var, e.g. 'charm_build_name'.
+    :param default: returned if osci.yaml is missing or doesn't set the var.
+    """
+    data = load_or_none(charm_dir / 'osci.yaml')
+    if isinstance(data, list):
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            project = item.get('project') or {}
+            value = (project.get('vars') or {}).get(var, _MISSING)
+            if value is not _MISSING and value is not None:
+                return value
+    return default
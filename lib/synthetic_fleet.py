@@ -0,0 +1,546 @@
+"""Generate a synthetic fleet of charm repositories.
+
+The benchmarks (see run-benchmarks.py) and some of the tests need a fleet of
+charms that looks like ./charms after fetch-charms.py, along with a matching
+lp-builder config, but without network access or the charmed_openstack_info
+package.  `generate_fleet` writes:
+
+    <root>/charms/<charm>/...          the charm repos
+    <root>/lp-builder-config/*.yaml    the lp-builder config for them
+
+Point $RELEASE_TOOLS_LP_BUILDER_CONFIG_DIR (see lib/lp_builder.py) at
+`SyntheticFleet.config_dir` to have lib.lp_builder use the synthetic config.
+
+The charms are a mix of reactive ('source') charms, which keep their
+metadata, bundles and build.lock under src/, and ops charms.  Each has a
+charmcraft.yaml (v2 bases), metadata.yaml, osci.yaml, .zuul.yaml, tox.ini,
+build.lock, .gitreview, tests.yaml and bundles with overlays that refer to
+other charms in the fleet.  The output is deterministic for a given size and
+seed.
+"""
+
+import json
+from pathlib import Path
+import random
+import textwrap
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import yaml
+
+
+# The sections of the lp-builder config and the branches the charms in them
+# have.  The first branch of each section is 'master'.
+SECTION_BRANCHES: Dict[str, Dict[str, List[str]]] = {
+    'openstack': {
+        'master': ['latest/edge'],
+        'stable/2023.1': ['2023.1/edge'],
+        'stable/2023.2': ['2023.2/edge'],
+        'stable/2024.1': ['2024.1/edge'],
+    },
+    'ceph': {
+        'master': ['latest/edge'],
+        'stable/quincy.2': ['quincy/edge'],
+        'stable/reef': ['reef/edge'],
+        'stable/squid-jammy': ['squid/edge'],
+    },
+    'ovn': {
+        'master': ['latest/edge'],
+        'stable/22.03': ['22.03/edge'],
+        'stable/23.09': ['23.09/edge'],
+        'stable/24.03': ['24.03/edge'],
+    },
+    'misc': {
+        'master': ['latest/edge'],
+        'stable/jammy': ['2.4/edge'],
+        'stable/focal': ['2.0.3/edge'],
+    },
+}
+SECTIONS = tuple(SECTION_BRANCHES.keys())
+
+BUNDLES = ('jammy-antelope', 'jammy-bobcat', 'jammy-caracal',
+           'noble-caracal')
+ARCHITECTURES = ('amd64', 'arm64', 'ppc64el', 's390x')
+CHARMHUB_RISKS = ('stable', 'candidate', 'beta', 'edge')
+
+# How many other charms appear in each bundle, and how many layers and
+# python modules in each build.lock.
+BUNDLE_APPLICATIONS = 8
+BUILD_LOCK_LAYERS = 12
+BUILD_LOCK_MODULES = 40
+
+# The default constraints file of the py310 env, as in the charms' tox.ini.
+TEST_CONSTRAINTS = ("https://raw.githubusercontent.com/openstack-charmers/"
+                    "zaza-openstack-tests/master/constraints/"
+                    "constraints-2024.1.txt")
+
+# The kinds of files that `generate_fleet` can (re)write.
+FILE_KINDS = ('gitreview', 'metadata', 'charmcraft', 'osci', 'zuul', 'tox',
+              'build-lock', 'tests', 'bundles')
+
+
+class SyntheticCharm(NamedTuple):
+    """A charm in the synthetic fleet."""
+    name: str
+    section: str
+    charm_type: str
+    path: Path
+
+    @property
+    def source_dir(self) -> Path:
+        """Where metadata.yaml, the bundles and the build.lock are."""
+        if self.charm_type == 'source':
+            return self.path / 'src'
+        return self.path
+
+    @property
+    def bundles_dir(self) -> Path:
+        return self.source_dir / 'tests' / 'bundles'
+
+    @property
+    def build_lock(self) -> Path:
+        return self.source_dir / 'build.lock'
+
+
+class SyntheticFleet(NamedTuple):
+    """The result of `generate_fleet`."""
+    root: Path
+    charms_dir: Path
+    config_dir: Path
+    charms: List[SyntheticCharm]
+
+    @property
+    def names(self) -> List[str]:
+        return [c.name for c in self.charms]
+
+
+def charm_name(index: int) -> str:
+    return f"synth-{index:04d}"
+
+
+def fleet_charms(root: Path, size: int) -> List[SyntheticCharm]:
+    """The charms of a fleet of the given size, without writing anything."""
+    charms: List[SyntheticCharm] = []
+    for i in range(size):
+        name = charm_name(i)
+        section = SECTIONS[i % len(SECTIONS)]
+        # a third of the charms are ops charms; the rest are reactive.
+        charm_type = 'ops' if i % 3 == 2 else 'source'
+        charms.append(
+            SyntheticCharm(name, section, charm_type, root / 'charms' / name))
+    return charms
+
+
+def _write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def gitreview(charm: SyntheticCharm) -> str:
+    return textwrap.dedent(f"""\
+        [gerrit]
+        host=review.opendev.org
+        port=29418
+        project=openstack/charm-{charm.name}.git
+        defaultbranch=master
+        """)
+
+
+def metadata_yaml(charm: SyntheticCharm) -> str:
+    return textwrap.dedent(f"""\
+        name: {charm.name}
+        summary: A synthetic charm for benchmarking
+        maintainer: OpenStack Charmers <openstack-charmers@lists.ubuntu.com>
+        description: |
+          {charm.name} is generated by lib/synthetic_fleet.py.
+        tags:
+          - openstack
+        series:
+          - jammy
+          - noble
+        provides:
+          {charm.name.replace('-', '')}-api:
+            interface: http
+        requires:
+          shared-db:
+            interface: mysql-shared
+          identity-service:
+            interface: keystone
+        """)
+
+
+def charmcraft_yaml(charm: SyntheticCharm) -> str:
+    if charm.charm_type == 'source':
+        parts = textwrap.dedent("""\
+            parts:
+              charm:
+                source: src/
+                plugin: reactive
+                reactive-charm-build-arguments:
+                  - --verbose
+                build-packages:
+                  - libpython3-dev
+                build-snaps:
+                  - charm
+            """)
+    else:
+        parts = textwrap.dedent("""\
+            parts:
+              charm:
+                plugin: dump
+                source: .
+                prime:
+                  - hooks/*
+                  - metadata.yaml
+            """)
+    bases = []
+    for channel in ('22.04', '24.04'):
+        for arch in ARCHITECTURES:
+            bases.extend([
+                "  - build-on:",
+                "      - name: ubuntu",
+                f"        channel: \"{channel}\"",
+                f"        architectures: [{arch}]",
+                "    run-on:",
+                "      - name: ubuntu",
+                f"        channel: \"{channel}\"",
+                f"        architectures: [{arch}]",
+            ])
+    return "type: charm\n\n" + parts + "\nbases:\n" + "\n".join(bases) + "\n"
+
+
+def osci_yaml(charm: SyntheticCharm) -> str:
+    lines = [
+        "- project:",
+        "    templates:",
+        "      - charm-unit-jobs-py310",
+        "      - charm-functional-jobs",
+        "    check:",
+        "      jobs:",
+    ]
+    lines.extend(f"        - {b}" for b in BUNDLES)
+    lines.extend([
+        "    vars:",
+        "      needs_charm_build: true",
+        f"      charm_build_name: {charm.name}",
+        "      build_type: charmcraft",
+        "      charmcraft_channel: 2.x/stable",
+    ])
+    return "\n".join(lines) + "\n"
+
+
+def zuul_yaml(charm: SyntheticCharm) -> str:
+    return textwrap.dedent("""\
+        - project:
+            templates:
+              - openstack-python3-charm-jobs
+              - openstack-cover-jobs
+            check:
+              jobs:
+                - osci-lint
+        """)
+
+
+def tox_ini(charm: SyntheticCharm) -> str:
+    lint_dir = 'src' if charm.charm_type == 'source' else 'hooks'
+    return textwrap.dedent(f"""\
+        [tox]
+        envlist = pep8,py3
+        skipsdist = True
+        sitepackages = False
+        skip_missing_interpreters = False
+
+        [testenv]
+        setenv = VIRTUAL_ENV={{envdir}}
+                 PYTHONHASHSEED=0
+        allowlist_externals =
+            charmcraft
+            rename.sh
+        passenv =
+            no_proxy
+            http_proxy
+            https_proxy
+
+        [testenv:build]
+        basepython = python3
+        deps = -r{{toxinidir}}/build-requirements.txt
+        commands =
+            charmcraft clean
+            charmcraft -v pack
+            {{toxinidir}}/rename.sh
+
+        [testenv:py3]
+        basepython = python3
+        deps =
+            -r{{toxinidir}}/requirements.txt
+            -r{{toxinidir}}/test-requirements.txt
+        commands = stestr run --slowest {{posargs}}
+
+        [testenv:py310]
+        basepython = python3.10
+        deps =
+            -c {{env:TEST_CONSTRAINTS_FILE:{TEST_CONSTRAINTS}}}
+            -r{{toxinidir}}/requirements.txt
+            -r{{toxinidir}}/test-requirements-py310.txt
+        commands = stestr run --slowest {{posargs}}
+
+        [testenv:pep8]
+        basepython = python3
+        deps = flake8==3.9.2
+        commands = flake8 {{posargs}} {lint_dir} unit_tests
+
+        [flake8]
+        ignore = E402,E226,W503,W504
+        exclude = */charmhelpers
+        """)
+
+
+def build_lock(charm: SyntheticCharm, rng: random.Random) -> str:
+    locks: List[Dict[str, Any]] = []
+    for i in range(BUILD_LOCK_LAYERS):
+        sha = '%040x' % rng.getrandbits(160)
+        locks.append({
+            'type': 'layer',
+            'item': f"layer:synthetic-{i}",
+            'url': f"https://github.com/openstack/charm-layer-{i}.git",
+            'vcs': None,
+            'branch': 'refs/heads/master',
+            'commit': sha,
+        })
+    for i in range(BUILD_LOCK_MODULES):
+        locks.append({
+            'type': 'python_module',
+            'package': f"synthetic-module-{i}",
+            'vcs': None,
+            'version': f"{i % 7}.{i % 5}.{i}",
+        })
+    return json.dumps({'locks': locks}, indent=2) + "\n"
+
+
+def tests_yaml(charm: SyntheticCharm) -> str:
+    bundles = "".join(f"  - {b}\n" for b in BUNDLES)
+    return (f"charm_name: {charm.name}\n"
+            "gate_bundles:\n" + bundles +
+            "smoke_bundles:\n" + f"  - {BUNDLES[-1]}\n" +
+            "tests:\n"
+            "  - zaza.openstack.charm_tests.synthetic.tests.Test\n")
+
+
+def bundle_yaml(charm: SyntheticCharm,
+                bundle: str,
+                others: List[SyntheticCharm],
+                ) -> str:
+    series, release = bundle.split('-')
+    lines = [
+        "variables:",
+        f"  openstack-origin: &openstack-origin cloud:{series}-{release}",
+        "",
+        f"series: {series}",
+        "",
+        "comment:",
+        "  - 'machines section to decide order of deployment.'",
+        "",
+        "machines:",
+    ]
+    lines.extend(f"  '{i}':" for i in range(len(others) + 1))
+    lines.extend(["", "applications:", ""])
+    # the charm under test comes from the local build.
+    prefix = '../../../' if charm.charm_type == 'source' else '../../'
+    lines.extend([
+        f"  {charm.name}:",
+        f"    charm: {prefix}{charm.name}.charm",
+        "    num_units: 1",
+        "    options:",
+        "      openstack-origin: *openstack-origin",
+        "    to:",
+        "      - '0'",
+        "",
+    ])
+    for i, other in enumerate(others, start=1):
+        channel = SECTION_BRANCHES[other.section]['master'][0]
+        lines.extend([
+            f"  {other.name}:",
+            f"    charm: ch:{other.name}",
+            "    num_units: 1",
+            "    options:",
+            "      openstack-origin: *openstack-origin",
+            "    to:",
+            f"      - '{i}'",
+            f"    channel: {channel}",
+            "",
+        ])
+    lines.extend(["relations:", ""])
+    for other in others:
+        lines.extend([
+            "  - - '{}:shared-db'".format(charm.name),
+            "    - '{}:shared-db'".format(other.name),
+            "",
+        ])
+    return "\n".join(lines)
+
+
+def overlay_yaml(charm: SyntheticCharm) -> str:
+    return textwrap.dedent(f"""\
+        applications:
+          {charm.name}:
+            charm: ch:{charm.name}
+            channel: latest/edge
+            options:
+              debug: true
+        """)
+
+
+def write_charm(charm: SyntheticCharm,
+                fleet: List[SyntheticCharm],
+                rng: random.Random,
+                kinds: Iterable[str] = FILE_KINDS,
+                ) -> None:
+    """Write the files of one synthetic charm.
+
+    :param charm: the charm to write.
+    :param fleet: all the charms, for the other charms in the bundles.
+    :param rng: the random number generator (for repeatable output).
+    :param kinds: the kinds of files to write; see FILE_KINDS.
+    """
+    kinds = set(kinds)
+    # always draw the random numbers so that the output for a kind doesn't
+    # depend on which other kinds are written.
+    others = [c for c in fleet if c is not charm]
+    bundle_charms = {
+        bundle: rng.sample(others, min(BUNDLE_APPLICATIONS, len(others)))
+        for bundle in BUNDLES}
+    lock = build_lock(charm, rng)
+    if 'gitreview' in kinds:
+        _write(charm.path / '.gitreview', gitreview(charm))
+        _write(charm.path / '.git' / 'HEAD', "ref: refs/heads/master\n")
+    if 'metadata' in kinds:
+        _write(charm.source_dir / 'metadata.yaml', metadata_yaml(charm))
+    if 'charmcraft' in kinds:
+        _write(charm.path / 'charmcraft.yaml', charmcraft_yaml(charm))
+    if 'osci' in kinds:
+        _write(charm.path / 'osci.yaml', osci_yaml(charm))
+    if 'zuul' in kinds:
+        _write(charm.path / '.zuul.yaml', zuul_yaml(charm))
+    if 'tox' in kinds:
+        _write(charm.path / 'tox.ini', tox_ini(charm))
+    if 'build-lock' in kinds and charm.charm_type == 'source':
+        _write(charm.build_lock, lock)
+    if 'tests' in kinds:
+        _write(charm.source_dir / 'tests' / 'tests.yaml', tests_yaml(charm))
+    if 'bundles' in kinds:
+        for bundle, members in bundle_charms.items():
+            _write(charm.bundles_dir / f"{bundle}.yaml",
+                   bundle_yaml(charm, bundle, members))
+        _write(charm.bundles_dir / 'overlays' / 'local-charm-overlay.yaml.j2',
+               overlay_yaml(charm))
+
+
+def lp_builder_config(charms: List[SyntheticCharm]) -> Dict[str, Any]:
+    """The lp-builder config, by section, for the charms.
+
+    The openstack, ceph and ovn sections use default branches; the misc
+    section has the branches on each project, as the real config does.
+    """
+    config: Dict[str, Any] = {}
+    for section, branches in SECTION_BRANCHES.items():
+        raw_branches = {branch: {'channels': list(channels)}
+                        for branch, channels in branches.items()}
+        defaults: Dict[str, Any] = {'team': 'openstack-charmers'}
+        if section != 'misc':
+            defaults['branches'] = raw_branches
+        projects = []
+        for charm in charms:
+            if charm.section != section:
+                continue
+            project: Dict[str, Any] = {
+                'name': f"Synthetic {charm.name}",
+                'charmhub': charm.name,
+                'launchpad': f"charm-{charm.name}",
+                'repository': (f"https://opendev.org/openstack/"
+                               f"charm-{charm.name}.git"),
+            }
+            if section == 'misc':
+                project['branches'] = raw_branches
+            projects.append(project)
+        config[section] = {'defaults': defaults, 'projects': projects}
+    return config
+
+
+def write_lp_builder_config(config_dir: Path,
+                            charms: List[SyntheticCharm],
+                            ) -> None:
+    config_dir.mkdir(parents=True, exist_ok=True)
+    for section, section_config in lp_builder_config(charms).items():
+        with open(config_dir / f"{section}.yaml", 'w') as f:
+            f.write(f"# Synthetic {section} charms\n")
+            yaml.safe_dump(section_config, f, sort_keys=False)
+
+
+def generate_fleet(root: Path,
+                   size: int,
+                   seed: int = 0,
+                   kinds: Optional[Iterable[str]] = None,
+                   ) -> SyntheticFleet:
+    """Generate (or regenerate parts of) a synthetic fleet.
+
+    :param root: the directory to write the fleet into.
+    :param size: the number of charms.
+    :param seed: the seed for the random choices.
+    :param kinds: if set, only (re)write these kinds of files (see
+        FILE_KINDS) and not the lp-builder config; e.g. to restore the files
+        that a benchmark modifies.
+    :returns: the fleet.
+    """
+    root = Path(root)
+    charms = fleet_charms(root, size)
+    rng = random.Random(seed)
+    for charm in charms:
+        write_charm(charm, charms, rng,
+                    FILE_KINDS if kinds is None else kinds)
+    config_dir = root / 'lp-builder-config'
+    if kinds is None:
+        write_lp_builder_config(config_dir, charms)
+    return SyntheticFleet(root, root / 'charms', config_dir, charms)
+
+
+def charmhub_info(charm: str,
+                  tracks: Iterable[str],
+                  revision_base: int = 1,
+                  ) -> Dict[str, Any]:
+    """A charmhub info response with a channel-map for the tracks.
+
+    Each track has all of the risks for the 22.04 and 24.04 bases on every
+    architecture; as published charms do, the revision is the same for all
+    architectures of a base in a channel.
+
+    :param charm: the charm name.
+    :param tracks: the tracks to include.
+    :param revision_base: the first revision number.
+    :returns: the data as returned by the charmhub info endpoint.
+    """
+    channel_map = []
+    revision = revision_base
+    for track in tracks:
+        for risk in CHARMHUB_RISKS:
+            for base_channel in ('22.04', '24.04'):
+                bases = [{'architecture': arch,
+                          'channel': base_channel,
+                          'name': 'ubuntu'}
+                         for arch in ARCHITECTURES]
+                for arch in ARCHITECTURES:
+                    channel_map.append({
+                        'channel': {
+                            'base': {'architecture': arch,
+                                     'channel': base_channel,
+                                     'name': 'ubuntu'},
+                            'name': f"{track}/{risk}",
+                            'risk': risk,
+                            'track': track,
+                        },
+                        'revision': {
+                            'bases': bases,
+                            'revision': revision,
+                            'version': str(revision),
+                        },
+                    })
+                revision += 1
+    return {'name': charm, 'channel-map': channel_map}
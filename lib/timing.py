@@ -0,0 +1,276 @@
+"""Per-charm, per-stage timing records for batch runs.
+
+Each stage of a batch (clone, classify, transform, commit, review, build,
+push, ...) appends a JSON line to the timing file:
+
+    {"batch": "...", "tool": "fetch-charms.py", "charm": "aodh",
+     "stage": "clone", "start": 1700000000.0, "duration": 2.5,
+     "status": 0, "bytes": 1234567, "pid": 1234}
+
+The timing file is $RELEASE_TOOLS_TIMING_FILE, or
+~/.cache/release-tools/timing/timing.jsonl if that isn't set.  The batch
+scripts set $RELEASE_TOOLS_BATCH_ID so that the records for a batch can be
+picked out of the file.  Set RELEASE_TOOLS_TIMING=0 to disable recording.
+
+The shell batch scripts record their stages with lib/timing.sh, which writes
+the same format.  `summarise` and batch-timing.py's report turn the records
+into the slowest charms and stages and a critical path estimate.
+"""
+
+import contextlib
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from lib.fleet import user_cache_dir
+
+
+logger = logging.getLogger(__name__)
+
+TIMING_FILE_ENV = 'RELEASE_TOOLS_TIMING_FILE'
+BATCH_ID_ENV = 'RELEASE_TOOLS_BATCH_ID'
+TIMING_ENABLED_ENV = 'RELEASE_TOOLS_TIMING'
+
+
+def timing_enabled() -> bool:
+    return os.environ.get(TIMING_ENABLED_ENV, '1') != '0'
+
+
+def timing_file() -> Path:
+    """The file that timing records are appended to."""
+    path = os.environ.get(TIMING_FILE_ENV, None)
+    if path:
+        return Path(path)
+    return user_cache_dir('timing') / 'timing.jsonl'
+
+
+def record(stage: str,
+           start: float,
+           duration: float,
+           charm: Optional[str] = None,
+           status: int = 0,
+           bytes_moved: Optional[int] = None,
+           tool: Optional[str] = None,
+           ) -> None:
+    """Append a timing record to the timing file.
+
+    Each record is written with a single append so that concurrent writers
+    (e.g. a worker pool) don't interleave lines.
+
+    :param stage: the name of the stage, e.g. 'clone'.
+    :param start: the wall clock start time (seconds since the epoch).
+    :param duration: the duration in seconds.
+    :param charm: the charm; None for stages that cover the whole fleet.
+    :param status: the exit status of the stage; 0 is success.
+    :param bytes_moved: optionally, the bytes read/written/fetched.
+    :param tool: the tool recording the stage; default is the script name.
+    """
+    if not timing_enabled():
+        return
+    data = {
+        'batch': os.environ.get(BATCH_ID_ENV, None),
+        'tool': tool or Path(sys.argv[0]).name,
+        'charm': charm,
+        'stage': stage,
+        'start': round(start, 6),
+        'duration': round(duration, 6),
+        'status': status,
+        'bytes': bytes_moved,
+        'pid': os.getpid(),
+    }
+    path = timing_file()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(data) + "\n").encode())
+        finally:
+            os.close(fd)
+    except OSError as e:
+        # timing must never break the tool being timed.
+        logger.debug("Couldn't write timing record to %s: %s", path, str(e))
+
+
+class Stage:
+    """A stage being timed by `timed`; the status and bytes can be set."""
+
+    __slots__ = ('name', 'charm', 'status', 'bytes_moved')
+
+    def __init__(self, name: str, charm: Optional[str]) -> None:
+        self.name = name
+        self.charm = charm
+        self.status = 0
+        self.bytes_moved: Optional[int] = None
+
+
+@contextlib.contextmanager
+def timed(stage: str,
+          charm: Optional[str] = None,
+          tool: Optional[str] = None,
+          ) -> Iterator[Stage]:
+    """Time the enclosed block as a stage and record it.
+
+    If the block raises, the stage is recorded with a non-zero status (the
+    exit code for SystemExit) and the exception propagates.
+
+    :param stage: the name of the stage.
+    :param charm: the charm, if the stage is for a single charm.
+    :param tool: the tool name; default is the script name.
+    """
+    current = Stage(stage, charm)
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield current
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+        current.status = current.status or code
+        raise
+    except BaseException:
+        current.status = current.status or 1
+        raise
+    finally:
+        record(stage, start, time.perf_counter() - t0,
+               charm=current.charm,
+               status=current.status,
+               bytes_moved=current.bytes_moved,
+               tool=tool)
+
+
+def dir_size(path: Path) -> int:
+    """The total size, in bytes, of the files below path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def load_records(path: Optional[Path] = None,
+                 batch: Optional[str] = None,
+                 ) -> List[Dict[str, Any]]:
+    """Load the timing records, optionally just for one batch.
+
+    Lines that can't be decoded are skipped.
+
+    :param path: the timing file; default is `timing_file()`.
+    :param batch: if set, only the records for this batch id.
+    """
+    path = path or timing_file()
+    records: List[Dict[str, Any]] = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    continue
+                if batch is not None and data.get('batch') != batch:
+                    continue
+                records.append(data)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def last_batch(records: List[Dict[str, Any]]) -> Optional[str]:
+    """The batch id of the most recent record that has one."""
+    for data in reversed(records):
+        if data.get('batch'):
+            return data['batch']
+    return None
+
+
+class StageTotal(NamedTuple):
+    name: str
+    total: float
+    count: int
+    failures: int
+    bytes_moved: int
+
+
+class Report(NamedTuple):
+    slowest_charms: List[StageTotal]
+    slowest_stages: List[StageTotal]
+    critical_path: float
+    critical_charm: Optional[str]
+    serial_total: float
+    wall: float
+
+
+def _totals(records: List[Dict[str, Any]], key: str) -> List[StageTotal]:
+    totals: Dict[str, Tuple[float, int, int, int]] = {}
+    for data in records:
+        name = data.get(key)
+        if name is None:
+            continue
+        total, count, failures, nbytes = totals.get(name, (0.0, 0, 0, 0))
+        totals[name] = (total + data.get('duration', 0.0),
+                        count + 1,
+                        failures + (1 if data.get('status') else 0),
+                        nbytes + (data.get('bytes') or 0))
+    return sorted((StageTotal(name, *values)
+                   for name, values in totals.items()),
+                  key=lambda t: t.total, reverse=True)
+
+
+def summarise(records: List[Dict[str, Any]], top: int = 10) -> Report:
+    """Summarise the timing records.
+
+    The critical path estimate is the wall time if every charm were processed
+    in parallel: the slowest charm's total plus the stages that aren't for a
+    single charm.  Note that if stages nest (e.g. a batch stage that runs a
+    per-charm tool) the nested time is counted at both levels; use the tool
+    or stage names to tell them apart.
+
+    :param records: the timing records.
+    :param top: how many of the slowest charms and stages to return.
+    """
+    if not records:
+        return Report([], [], 0.0, None, 0.0, 0.0)
+    charms = _totals(records, 'charm')
+    stages = _totals(records, 'stage')
+    fleet_wide = sum(d.get('duration', 0.0) for d in records
+                     if d.get('charm') is None)
+    slowest_charm = charms[0] if charms else None
+    critical = fleet_wide + (slowest_charm.total if slowest_charm else 0.0)
+    serial_total = sum(d.get('duration', 0.0) for d in records)
+    wall = (max(d['start'] + d.get('duration', 0.0) for d in records) -
+            min(d['start'] for d in records))
+    return Report(
+        slowest_charms=charms[:top],
+        slowest_stages=stages[:top],
+        critical_path=critical,
+        critical_charm=slowest_charm.name if slowest_charm else None,
+        serial_total=serial_total,
+        wall=wall)
+
+
+def format_report(report: Report) -> str:
+    """Format a `Report` as tables for the terminal."""
+    lines: List[str] = []
+
+    def _table(title: str, totals: List[StageTotal]) -> None:
+        lines.append(f"{title:<30} {'Total(s)':>10} {'Count':>6} "
+                     f"{'Failed':>6} {'Bytes':>12}")
+        lines.append(f"{'-' * 30} {'-' * 10} {'-' * 6} {'-' * 6} "
+                     f"{'-' * 12}")
+        for t in totals:
+            lines.append(f"{t.name:<30} {t.total:>10.2f} {t.count:>6} "
+                         f"{t.failures:>6} {t.bytes_moved:>12}")
+        lines.append("")
+
+    _table("Slowest charms", report.slowest_charms)
+    _table("Slowest stages", report.slowest_stages)
+    lines.append(f"Observed wall time:      {report.wall:10.2f}s")
+    lines.append(f"Sum of stage times:      {report.serial_total:10.2f}s")
+    lines.append(f"Critical path estimate:  {report.critical_path:10.2f}s "
+                 f"(slowest charm: {report.critical_charm or '-'})")
+    return "\n".join(lines)
@@ -0,0 +1,68 @@
+# Timing records for the shell batch scripts; source this file.
+#
+# Writes the same JSON lines as lib/timing.py (see that file for the format)
+# so that batch-timing.py report can summarise shell and Python stages
+# together.  Usage:
+#
+#   source "$script_dir/lib/timing.sh"
+#   timing_start_batch
+#   timed <stage> <charm|-> command [args ...]
+#
+# timed runs the command (which may be a shell function) in a subshell with
+# set -e, records the stage and returns the command's exit status.  A shell
+# function stops at its first failing step, unless timed itself is on the
+# left of || or && or in an if condition: bash then ignores set -e in the
+# whole command, so take the status with set +e instead:
+#
+#   set +e; timed <stage> <charm> command; rc=$?; set -e
+#
+# The command runs in a subshell, so it can't set variables for the caller.
+# Use '-' as the charm for stages that cover the whole fleet.
+
+_timing_file="${RELEASE_TOOLS_TIMING_FILE:-${XDG_CACHE_HOME:-$HOME/.cache}/release-tools/timing/timing.jsonl}"
+_timing_tool="$(basename "$0")"
+
+# Start a batch if one isn't already in progress, so that nested scripts
+# share the batch id.
+function timing_start_batch {
+    if [ -z "$RELEASE_TOOLS_BATCH_ID" ]; then
+        export RELEASE_TOOLS_BATCH_ID="${_timing_tool}-$(date +%Y%m%d-%H%M%S)-$$"
+    fi
+}
+
+function timed {
+    local stage="$1"
+    local charm="$2"
+    shift 2
+    local start=$(date +%s.%N)
+    local rc=0
+    # '"$@" || rc=$?' would turn off set -e inside a shell function, so that
+    # a failing step in the middle of it would be ignored.  The command is
+    # run in a subshell with set -e instead, and its status taken after.
+    local errexit=0
+    if [[ $- == *e* ]]; then
+        errexit=1
+    fi
+    set +e
+    ( set -e; "$@" )
+    rc=$?
+    if [[ $errexit == 1 ]]; then
+        set -e
+    fi
+    local end=$(date +%s.%N)
+    if [[ "${RELEASE_TOOLS_TIMING:-1}" != "0" ]]; then
+        local charm_json="null"
+        if [[ "$charm" != "-" ]]; then
+            charm_json="\"$charm\""
+        fi
+        local batch_json="null"
+        if [ -n "$RELEASE_TOOLS_BATCH_ID" ]; then
+            batch_json="\"$RELEASE_TOOLS_BATCH_ID\""
+        fi
+        mkdir -p "$(dirname "$_timing_file")"
+        printf '{"batch": %s, "tool": "%s", "charm": %s, "stage": "%s", "start": %s, "duration": %s, "status": %d, "bytes": null, "pid": %d}\n' \
+            "$batch_json" "$_timing_tool" "$charm_json" "$stage" "$start" \
+            "$(awk "BEGIN {printf \"%.6f\", $end - $start}")" "$rc" "$$" >> "$_timing_file" || true
+    fi
+    return $rc
+}
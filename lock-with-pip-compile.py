@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+# Lock the requirements of many charms with pip-compile at once.
+#
+# This does what lock-with-pip-compile does in each charm (see
+# lib/pip_compile.py for the plans), but the compiles of all the charms, for
+# all the python versions, are run concurrently in one bounded pool.  The
+# venvs, the ledger and the "don't overwrite an existing output" rule are the
+# same as the shell script's, so the two can be used on the same charms.
+# Compiles with the same inputs as one already done (by this run or one in
+# the last --max-age days) are copied from the results cache instead.
+
+import argparse
+import collections
+import functools
+import logging
+from pathlib import Path
+import sys
+from typing import Dict, List, NamedTuple, Optional
+
+from lib.fleet import (
+    Result,
+    add_fleet_arguments,
+    charm_dirs_from_args,
+    default_workers,
+    print_summary,
+    run_pool,
+)
+from lib.ledger import Ledger
+from lib import pip_compile
+from lib.pip_compile import CompileJob
+from lib.profiling import run_profiled
+
+
+logger = logging.getLogger(__name__)
+
+
+class CharmLock(NamedTuple):
+    """The compiles planned for a charm, and the notes from planning; jobs is
+    None if the charm's inputs are unchanged."""
+    jobs: Optional[List[CompileJob]]
+    notes: List[str]
+
+
+def plan(charm_dir: Path, force: bool = False) -> CharmLock:
+    """Check the ledger, move the .txt files to .in and plan the compiles."""
+    # sqlite3 is slow to import, and the inventory isn't needed for --help.
+    from lib.inventory import classify_charm
+    ledger = Ledger(pip_compile.LEDGER_OPERATION)
+    if (not force and
+            ledger.is_unchanged(charm_dir, pip_compile.LEDGER_INPUTS)):
+        return CharmLock(None, ["Inputs unchanged; not locking"])
+    jobs, notes = pip_compile.plan_charm(charm_dir, classify_charm(charm_dir))
+    return CharmLock(jobs, notes)
+
+
+def report(charm_dirs: List[Path],
+           plans: Dict[Path, Result],
+           compiles: Dict[Path, List[Result]],
+           ) -> int:
+    """Print the result for each charm and a summary.
+
+    :returns: the number of charms that failed.
+    """
+    locked = failed = 0
+    for charm_dir in charm_dirs:
+        name = charm_dir.name
+        planned = plans[charm_dir]
+        if not planned.ok:
+            failed += 1
+            print(f"{name}: FAILED: {planned.error}")
+            continue
+        results = compiles.get(charm_dir, [])
+        errors = [r.error for r in results if not r.ok]
+        if errors:
+            failed += 1
+            print(f"{name}: FAILED: {'; '.join(map(str, errors))}")
+        elif planned.value.jobs is None:
+            print(f"{name}: unchanged")
+        else:
+            locked += 1
+            outputs = [r.item.step.output +
+                       (" (cached)" if r.value == pip_compile.CACHED else "")
+                       for r in results if r.value]
+            print(f"{name}: locked {', '.join(outputs) or 'nothing'}")
+        for note in planned.value.notes:
+            print(f"    {note}")
+    statuses = [r.value for results in compiles.values() for r in results]
+    if statuses:
+        print(f"{statuses.count(pip_compile.COMPILED)} compile(s) run, "
+              f"{statuses.count(pip_compile.CACHED)} from the results cache")
+    print_summary(len(charm_dirs), locked, failed)
+    return failed
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description=("Lock the requirements of the charms with pip-compile, "
+                     "running the compiles concurrently."))
+    add_fleet_arguments(parser,
+                        workers_help="The number of compiles to run at once.")
+    parser.add_argument('--venvs-dir',
+                        dest='venvs_dir',
+                        type=Path,
+                        metavar='DIR',
+                        help=("Where the <python>-venv virtualenvs with "
+                              "pip-tools are (or are made); default is the "
+                              "release-tools directory, as for "
+                              "lock-with-pip-compile."))
+    parser.add_argument('--force',
+                        action='store_true',
+                        help="Lock even if the inputs haven't changed.")
+    parser.add_argument('--max-age',
+                        dest='max_age',
+                        type=float,
+                        default=pip_compile.DEFAULT_MAX_AGE_DAYS,
+                        metavar='DAYS',
+                        help=("Copy the result of a compile with the same "
+                              "inputs if it is at most DAYS old, otherwise "
+                              "resolve again; 0 always resolves.  Default "
+                              "is %(default)s."))
+    parser.add_argument('--log', dest='loglevel',
+                        type=str.upper,
+                        default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'),
+                        help='Loglevel')
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+
+    charm_dirs = charm_dirs_from_args(args)
+    if not charm_dirs:
+        logger.error("No charms found in %s", args.charms_dir)
+        sys.exit(1)
+    # pip-compile is run in each charm dir, so the venvs must be absolute.
+    venvs_dir = (args.venvs_dir or pip_compile.VENVS_DIR).resolve()
+    workers = args.workers or default_workers()
+
+    # the planning is quick; the charms are planned in threads.
+    plans = {r.item: r for r in run_pool(
+        functools.partial(plan, force=args.force), charm_dirs,
+        workers=workers)}
+    jobs = [job for r in plans.values() if r.ok and r.value.jobs
+            for job in r.value.jobs]
+
+    # make any missing venvs, once each, before the compiles that need them.
+    pythons = sorted({job.step.python for job in jobs})
+    venvs = {r.item: r for r in run_pool(
+        functools.partial(pip_compile.ensure_venv, venvs_dir=venvs_dir),
+        pythons, workers=len(pythons) or 1)}
+    for result in venvs.values():
+        if not result.ok:
+            logger.error("%s", result.error)
+
+    slots = pip_compile.CacheSlots(workers)
+    results = pip_compile.ResultCache(max_age=args.max_age * 86400)
+    compiles: Dict[Path, List[Result]] = collections.defaultdict(list)
+    for result in run_pool(
+            functools.partial(pip_compile.run_compile, slots=slots,
+                              venvs_dir=venvs_dir, results=results),
+            jobs, workers=workers):
+        compiles[result.item.charm_dir].append(result)
+
+    # record the inputs of the charms whose compiles all succeeded.
+    ledger = Ledger(pip_compile.LEDGER_OPERATION)
+    for charm_dir, planned in plans.items():
+        if (planned.ok and planned.value.jobs is not None and
+                all(r.ok for r in compiles.get(charm_dir, []))):
+            ledger.record(charm_dir, pip_compile.LEDGER_INPUTS)
+
+    if report(charm_dirs, plans, compiles):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    run_profiled(main)
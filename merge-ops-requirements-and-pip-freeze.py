@@ -7,6 +7,9 @@ import re
 import sys
 from typing import List, Optional, NamedTuple, Iterator, Dict
 
+from lib.output import write_lines_if_changed
+from lib.profiling import run_profiled
+
 
 logger = logging.getLogger(__name__)
 
@@ -59,8 +62,7 @@ def read_file(file_name: str) -> Iterator[str]:
 
 
 def write_file(filename: str, output: List[str]) -> None:
-    with open(filename, "wt") as f:
-        f.writelines(f"{o}\n" for o in output)
+    write_lines_if_changed(filename, (f"{o}\n" for o in output))
 
 
 def merge(requirement: str, vcs: Dict[str, str]) -> str:
@@ -106,4 +108,4 @@ def main() -> None:
 
 if __name__ == "__main__":
     logging.basicConfig()
-    main()
+    run_profiled(main)
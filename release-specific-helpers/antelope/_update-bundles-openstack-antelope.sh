@@ -16,25 +16,22 @@ vault_branch="1.8"
 
 
 
+# Pass --charms-dir <dir> to update all of the charms in <dir> in one go.
 function update_bundles {
-    local charm_dir=$1
-    (
-        cd $charm_dir
-        # remove any existing channel specs
-        $repo_dir/update-channel-single --log DEBUG \
-            --remove-channel
-        # Then overwrite with branches appropirate to ceph-pacific
-        $repo_dir/update-channel-single --log DEBUG \
-            --branch stable/$openstack_branch \
-            --branch stable/$ovn_branch \
-            --branch stable/$mysql_branch   \
-            --branch stable/$hacluster_branch \
-            --branch stable/$vault_branch \
-            --branch stable/$rabbitmq_server_branch \
-            --branch stable/$ceph_branch \
-            --set-local-charm \
-            --enforce-edge
-    )
+    # remove any existing channel specs and set the channels from the
+    # branches appropriate to the release, in one pass.
+    $repo_dir/update-channel-single --log DEBUG \
+        --remove-channel \
+        --branch stable/$openstack_branch \
+        --branch stable/$ovn_branch \
+        --branch stable/$mysql_branch \
+        --branch stable/$hacluster_branch \
+        --branch stable/$vault_branch \
+        --branch stable/$rabbitmq_server_branch \
+        --branch stable/$ceph_branch \
+        --set-local-charm \
+        --enforce-edge \
+        "$@"
 }
 
-update_bundles .
+update_bundles "$@"
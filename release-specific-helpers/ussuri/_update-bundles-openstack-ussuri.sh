@@ -10,29 +10,26 @@ worktree_branch="stable/yoga"
 ceph_release="octopus"
 openstack_release="ussuri"
 
+# Pass --charms-dir <dir> to update all of the charms in <dir> in one go.
 function update_bundles {
-    local charm_dir=$1
-    (
-        cd $charm_dir
-        # remove any existing channel specs
-        $repo_dir/update-channel-single.py --log DEBUG \
-            --remove-channel \
-            --disable-local-overlay
-        # set all the branches to latest/edge and ch: prefixes
-        $repo_dir/update-channel-single.py --log DEBUG --branch master \
-            --ensure-charmhub --enforce-edge
-        # Then overwrite with branches appropirate to ceph-pacific
-        $repo_dir/update-channel-single.py --log DEBUG \
-            --branch stable/$openstack_release \
-            --branch stable/20.03 \
-            --branch stable/5.7   \
-            --branch stable/focal \
-            --branch stable/1.7 \
-            --branch stable/jammy \
-            --branch stable/$ceph_release \
-            --set-local-charm \
-            --enforce-edge
-    )
+    # remove any existing channel specs and set the channels from the
+    # branches appropriate to the release, falling back to master
+    # (latest/edge) and ch: prefixes, in one pass.
+    $repo_dir/update-channel-single.py --log DEBUG \
+        --remove-channel \
+        --disable-local-overlay \
+        --ensure-charmhub \
+        --branch stable/$openstack_release \
+        --branch stable/20.03 \
+        --branch stable/5.7 \
+        --branch stable/focal \
+        --branch stable/1.7 \
+        --branch stable/jammy \
+        --branch stable/$ceph_release \
+        --branch master \
+        --set-local-charm \
+        --enforce-edge \
+        "$@"
 }
 
-update_bundles .
+update_bundles "$@"
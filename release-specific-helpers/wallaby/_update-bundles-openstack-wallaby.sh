@@ -16,29 +16,26 @@ vault_branch="1.7"
 
 
 
+# Pass --charms-dir <dir> to update all of the charms in <dir> in one go.
 function update_bundles {
-    local charm_dir=$1
-    (
-        cd $charm_dir
-        # remove any existing channel specs
-        $repo_dir/update-channel-single.py --log DEBUG \
-            --remove-channel \
-            --disable-local-overlay
-        # set all the branches to latest/edge and ch: prefixes
-        $repo_dir/update-channel-single.py --log DEBUG --branch master \
-            --ensure-charmhub --enforce-edge
-        # Then overwrite with branches appropirate to ceph-pacific
-        $repo_dir/update-channel-single.py --log DEBUG \
-            --branch stable/$openstack_branch \
-            --branch stable/$ovn_branch \
-            --branch stable/$mysql_branch   \
-            --branch stable/$hacluster_branch \
-            --branch stable/$vault_branch \
-            --branch stable/$rabbitmq_server_branch \
-            --branch stable/$ceph_branch \
-            --set-local-charm \
-            --enforce-edge
-    )
+    # remove any existing channel specs and set the channels from the
+    # branches appropriate to the release, falling back to master
+    # (latest/edge) and ch: prefixes, in one pass.
+    $repo_dir/update-channel-single.py --log DEBUG \
+        --remove-channel \
+        --disable-local-overlay \
+        --ensure-charmhub \
+        --branch stable/$openstack_branch \
+        --branch stable/$ovn_branch \
+        --branch stable/$mysql_branch \
+        --branch stable/$hacluster_branch \
+        --branch stable/$vault_branch \
+        --branch stable/$rabbitmq_server_branch \
+        --branch stable/$ceph_branch \
+        --branch master \
+        --set-local-charm \
+        --enforce-edge \
+        "$@"
 }
 
-update_bundles .
+update_bundles "$@"
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+
+# Benchmark the tools' core operations on synthetic fleets of charms.
+#
+# Generates a synthetic fleet (see lib/synthetic_fleet.py) of each size and
+# times the operations that the batch tools do per charm, over the whole
+# fleet.  Results can be saved and compared against a previous run:
+#
+#   run-benchmarks.py run --sizes 10,100,1000 --save before
+#   ... make changes ...
+#   run-benchmarks.py run --sizes 10,100,1000 --save after --compare before
+#   run-benchmarks.py compare before after
+#
+# and a fleet can be generated to try the tools out on:
+#
+#   run-benchmarks.py generate --size 100 /tmp/fleet
+
+import argparse
+import contextlib
+import fnmatch
+import importlib.util
+import io
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+from types import ModuleType
+from typing import Callable, Dict, List
+
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+sys.path.append(str(SCRIPT_DIR.parent))
+
+from ruamel.yaml import YAML
+
+from lib import lp_builder, readonly
+from lib.benchmark import (
+    BenchResult,
+    Case,
+    compare,
+    format_comparison,
+    format_results,
+    load_results,
+    measure,
+    regressions,
+    save_results,
+    saved_labels,
+)
+from lib.channel_map import decode_channel_map
+from lib.synthetic_fleet import SyntheticFleet, charmhub_info, generate_fleet
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (10, 100, 1000)
+
+
+def load_script(filename: str) -> ModuleType:
+    """Load one of the (hyphenated) scripts in this directory as a module."""
+    name = Path(filename).stem.replace('-', '_')
+    spec = importlib.util.spec_from_file_location(name, SCRIPT_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)  # type: ignore
+    return module
+
+
+def _namespace(**kwargs) -> argparse.Namespace:
+    return argparse.Namespace(**kwargs)
+
+
+def _restore(fleet: SyntheticFleet, *kinds: str) -> Callable[[], None]:
+    """A setup function that rewrites the given kinds of files."""
+    def _setup() -> None:
+        generate_fleet(fleet.root, len(fleet.charms), kinds=kinds)
+    return _setup
+
+
+def bench_modify_channel(fleet: SyntheticFleet) -> Case:
+    ucs = load_script('update-channel-single.py')
+    branches = ['stable/2024.1', 'stable/reef', 'stable/24.03',
+                'stable/jammy']
+    bundles = [b for c in fleet.charms
+               for b in ucs.find_bundles_in_dirs(
+                   ucs.find_bundles_dirs(c.path))]
+
+    def _run() -> None:
+        lp_config = lp_builder.get_lp_builder_config()
+        table = lp_builder.channel_table(branches, [], True)
+        for bundle in bundles:
+            ucs.modify_channel(fleet.names, lp_config, bundle, None, branches,
+                               True, [], None, True, True, table)
+
+    return Case(_run, _restore(fleet, 'bundles'))
+
+
+def bench_update_fleet(fleet: SyntheticFleet) -> Case:
+    ucs = load_script('update-channel-single.py')
+    branches = ['stable/2024.1', 'stable/reef', 'stable/24.03',
+                'stable/jammy', 'master']
+
+    def _run() -> None:
+        lp_config = lp_builder.get_lp_builder_config()
+        update = ucs.BundleUpdate(
+            charms=fleet.names,
+            lp_config=lp_config,
+            channel=None,
+            branches=branches,
+            ensure_charmhub_prefix=True,
+            ignore_tracks=[],
+            disable_local_overlay=True,
+            set_local_charm=True,
+            enforce_edge=True,
+            channel_table=lp_builder.channel_table(branches, [], True),
+            remove_unresolved=True)
+        ucs.update_fleet(ucs.find_charm_dirs(fleet.charms_dir), update)
+
+    return Case(_run, _restore(fleet, 'bundles'))
+
+
+def _charmcraft_case(fleet: SyntheticFleet,
+                     transform: str,
+                     args: argparse.Namespace,
+                     ) -> Case:
+    ucc = load_script('_update-charmcraft.py')
+    func = getattr(ucc, transform)
+    files = [c.path / 'charmcraft.yaml' for c in fleet.charms]
+
+    def _run() -> None:
+        # as the tool does: load, transform and dump each charmcraft.yaml.
+        for path in files:
+            yaml = YAML(typ="rt")
+            yaml.preserve_quotes = True
+            yaml.indent(mapping=2, sequence=4, offset=2)
+            with open(path) as f:
+                charmcraft = yaml.load(f)
+            yaml.dump(func(args, charmcraft), io.StringIO())
+
+    return Case(_run)
+
+
+def bench_cc3ify(fleet: SyntheticFleet) -> Case:
+    return _charmcraft_case(fleet, 'cc3ify',
+                            _namespace(base=None, platforms=None))
+
+
+def bench_delete_bases(fleet: SyntheticFleet) -> Case:
+    return _charmcraft_case(fleet, 'delete_bases',
+                            _namespace(bases=['24.04']))
+
+
+def bench_add_py3(fleet: SyntheticFleet) -> Case:
+    update_tox = load_script('update-tox.py')
+    args = [_namespace(tox_ini=c.path / 'tox.ini',
+                       version='3.12',
+                       template='3.10')
+            for c in fleet.charms]
+
+    def _run() -> None:
+        for a in args:
+            update_tox.add_py3(a)
+
+    return Case(_run, _restore(fleet, 'tox'))
+
+
+def bench_process_zuul_yaml(fleet: SyntheticFleet) -> Case:
+    uzj = load_script('update-zuul-jobs.py')
+
+    # the charmbuild job is for the charms with metadata.yaml in the root.
+    charms = [c for c in fleet.charms if c.source_dir == c.path]
+
+    def _run() -> None:
+        for c in charms:
+            uzj.update_zuul_yaml(c.path, add_charmbuild=True)
+
+    return Case(_run, _restore(fleet, 'zuul'))
+
+
+def bench_read_queries_round_trip(fleet: SyntheticFleet) -> Case:
+    uzj = load_script('update-zuul-jobs.py')
+
+    def _run() -> None:
+        # the charm name and the charmcraft channel, with round-trip loads.
+        for c in fleet.charms:
+            uzj.load_yaml_file(c.source_dir / 'metadata.yaml').get('name')
+            uzj.find_charmcraft_channel(
+                uzj.load_yaml_file(c.path / 'osci.yaml'))
+
+    return Case(_run)
+
+
+def bench_read_queries(fleet: SyntheticFleet) -> Case:
+    def _run() -> None:
+        # as bench_read_queries_round_trip, with the read-only loader.
+        for c in fleet.charms:
+            readonly.metadata(c.path).get('name')
+            readonly.osci_var(c.path, 'charmcraft_channel')
+
+    # cleared so that each run parses the files.
+    return Case(_run, readonly.cache_clear)
+
+
+def _build_lock_case(fleet: SyntheticFleet,
+                     operation: str,
+                     args: argparse.Namespace,
+                     ) -> Case:
+    ubl = load_script('update-build-lock.py')
+    func = getattr(ubl, operation)
+    files = [c.build_lock for c in fleet.charms if c.build_lock.exists()]
+
+    def _run() -> None:
+        # as the tool does: load, apply the operation and serialise.
+        for path in files:
+            with open(path) as f:
+                locks = json.load(f)
+            json.dumps(func(args, locks), indent=2)
+
+    return Case(_run)
+
+
+def bench_build_lock_add(fleet: SyntheticFleet) -> Case:
+    return _build_lock_case(fleet, 'add_lock', _namespace(
+        type='python_module', item=None, package='new-module',
+        spec=json.dumps({'vcs': None, 'version': '1.0.0'})))
+
+
+def bench_build_lock_modify(fleet: SyntheticFleet) -> Case:
+    return _build_lock_case(fleet, 'modify_lock', _namespace(
+        type='python_module', item=None, package='synthetic-module-39',
+        spec=json.dumps({'version': '2.0.0'})))
+
+
+def bench_build_lock_delete(fleet: SyntheticFleet) -> Case:
+    return _build_lock_case(fleet, 'delete_lock', _namespace(
+        type='layer', item='layer:synthetic-11', package=None))
+
+
+def bench_build_lock_lock_layer(fleet: SyntheticFleet) -> Case:
+    return _build_lock_case(fleet, 'lock_layer', _namespace(
+        type='layer', item=':all:', package=None))
+
+
+def bench_build_lock_apply(fleet: SyntheticFleet) -> Case:
+    ubl = load_script('update-build-lock.py')
+    files = [c.build_lock for c in fleet.charms if c.build_lock.exists()]
+    ops = [
+        ubl.LockOp('delete', 'layer', item='layer:synthetic-11'),
+        ubl.LockOp('modify', 'python_module', package='synthetic-module-39',
+                   spec=json.dumps({'version': '2.0.0'})),
+        ubl.LockOp('add', 'python_module', package='new-module',
+                   spec=json.dumps({'vcs': None, 'version': '1.0.0'})),
+        ubl.LockOp('lock-layer', 'layer'),
+    ]
+
+    def _run() -> None:
+        # the four operations above on one loaded copy of each build.lock.
+        for path in files:
+            with open(path) as f:
+                index = ubl.LockIndex(json.load(f))
+            for op in ops:
+                ubl.OPERATIONS[op.cmd](index, op)
+            json.dumps(index.locks, indent=2)
+
+    return Case(_run)
+
+
+def bench_decode_channel_map(fleet: SyntheticFleet) -> Case:
+    infos = [(c.name, charmhub_info(c.name,
+                                    ['latest', '2023.1', '2023.2', '2024.1']))
+             for c in fleet.charms]
+
+    def _run() -> None:
+        for name, info in infos:
+            decode_channel_map(name, info, '2024.1', 'stable', '22.04',
+                               'amd64')
+
+    return Case(_run)
+
+
+def bench_lp_builder_load(fleet: SyntheticFleet) -> Case:
+    def _run() -> None:
+        lp_builder.get_lp_builder_config()
+        lp_builder.get_yaml_config()
+
+    def _setup() -> None:
+        # no snapshot, so the files are parsed (and the snapshot written).
+        lp_builder.reset_caches()
+        shutil.rmtree(lp_builder.snapshot_dir())
+
+    return Case(_run, _setup)
+
+
+def bench_lp_builder_load_snapshot(fleet: SyntheticFleet) -> Case:
+    def _run() -> None:
+        lp_builder.get_lp_builder_config()
+        lp_builder.get_yaml_config()
+
+    def _setup() -> None:
+        lp_builder.reset_caches()
+        lp_builder.load_config()
+        lp_builder.reset_caches()
+
+    return Case(_run, _setup)
+
+
+def bench_lp_builder_load_section(fleet: SyntheticFleet) -> Case:
+    def _run() -> None:
+        for charm in lp_builder.get_charms('ovn'):
+            charm.launchpad
+
+    def _setup() -> None:
+        lp_builder.reset_caches()
+        shutil.rmtree(lp_builder.snapshot_dir())
+
+    return Case(_run, _setup)
+
+
+def bench_lp_builder_get_charms(fleet: SyntheticFleet) -> Case:
+    def _run() -> None:
+        for charm in lp_builder.get_charms(':all:'):
+            charm.launchpad
+            charm.branches
+
+    def _setup() -> None:
+        # parse the files first so that just the lookups are timed.
+        lp_builder.reset_caches()
+        lp_builder.get_yaml_config()
+
+    return Case(_run, _setup)
+
+
+def bench_lp_builder_lookup(fleet: SyntheticFleet) -> Case:
+    names = fleet.names
+
+    def _run() -> None:
+        for name in names:
+            lp_builder.Charm(name).repository
+            lp_builder.get_lp_builder_config()[name]
+
+    def _setup() -> None:
+        lp_builder.reset_caches()
+        lp_builder.get_yaml_config()
+        lp_builder.get_lp_builder_config()
+
+    return Case(_run, _setup)
+
+
+BENCHMARKS: Dict[str, Callable[[SyntheticFleet], Case]] = {
+    'modify_channel': bench_modify_channel,
+    'update_fleet': bench_update_fleet,
+    'cc3ify': bench_cc3ify,
+    'delete_bases': bench_delete_bases,
+    'add_py3': bench_add_py3,
+    'process_zuul_yaml': bench_process_zuul_yaml,
+    'build_lock.add': bench_build_lock_add,
+    'build_lock.modify': bench_build_lock_modify,
+    'build_lock.delete': bench_build_lock_delete,
+    'build_lock.lock_layer': bench_build_lock_lock_layer,
+    'build_lock.apply': bench_build_lock_apply,
+    'read_queries.round_trip': bench_read_queries_round_trip,
+    'read_queries': bench_read_queries,
+    'decode_channel_map': bench_decode_channel_map,
+    'lp_builder.load': bench_lp_builder_load,
+    'lp_builder.load_snapshot': bench_lp_builder_load_snapshot,
+    'lp_builder.load_section': bench_lp_builder_load_section,
+    'lp_builder.get_charms': bench_lp_builder_get_charms,
+    'lp_builder.lookup': bench_lp_builder_lookup,
+}
+
+
+def select_benchmarks(patterns: List[str]) -> List[str]:
+    if not patterns:
+        return list(BENCHMARKS.keys())
+    return [name for name in BENCHMARKS
+            if any(fnmatch.fnmatch(name, p) for p in patterns)]
+
+
+def run_benchmarks(sizes: List[int],
+                   names: List[str],
+                   repeat: int,
+                   fleet_dir: Path,
+                   ) -> List[BenchResult]:
+    """Run the named benchmarks on a generated fleet of each size.
+
+    :param sizes: the fleet sizes.
+    :param names: the benchmarks to run.
+    :param repeat: the number of repetitions of each.
+    :param fleet_dir: where to generate the fleets.
+    :returns: the results.
+    """
+    results: List[BenchResult] = []
+    saved_env = os.environ.get(lp_builder.CONFIG_DIR_ENV, None)
+    try:
+        for size in sizes:
+            root = fleet_dir / f"fleet-{size}"
+            if root.exists():
+                shutil.rmtree(root)
+            logger.info("Generating a fleet of %d charms in %s", size, root)
+            fleet = generate_fleet(root, size)
+            os.environ[lp_builder.CONFIG_DIR_ENV] = str(fleet.config_dir)
+            lp_builder.reset_caches()
+            for name in names:
+                case = BENCHMARKS[name](fleet)
+                # the tools print a lot; don't time the terminal.
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = measure(name, size, case, repeat=repeat)
+                logger.info("%s[%d]: best %.4fs", name, size, result.best)
+                results.append(result)
+    finally:
+        if saved_env is None:
+            os.environ.pop(lp_builder.CONFIG_DIR_ENV, None)
+        else:
+            os.environ[lp_builder.CONFIG_DIR_ENV] = saved_env
+        lp_builder.reset_caches()
+    return results
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the tools on synthetic fleets of charms.')
+    parser.add_argument('--log', dest='loglevel',
+                        type=str.upper,
+                        default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'),
+                        help='Loglevel')
+
+    subparser = parser.add_subparsers(required=True, dest='cmd')
+
+    run_command = subparser.add_parser(
+        'run',
+        help='Run the benchmarks.')
+    run_command.add_argument(
+        '--sizes',
+        dest='sizes',
+        type=lambda s: [int(v) for v in s.split(',')],
+        default=list(DEFAULT_SIZES),
+        help='Comma separated fleet sizes; default is 10,100,1000.')
+    run_command.add_argument(
+        '--repeat', '-r',
+        dest='repeat',
+        type=int,
+        default=3,
+        help='How many times to run each benchmark; the best is kept.')
+    run_command.add_argument(
+        '--only',
+        dest='only',
+        action='append',
+        metavar='PATTERN',
+        default=[],
+        help='Only run benchmarks matching this glob; may be repeated.')
+    run_command.add_argument(
+        '--fleet-dir',
+        dest='fleet_dir',
+        type=Path,
+        default=None,
+        help=('Where to generate the fleets; default is a temporary '
+              'directory that is removed afterwards.'))
+    run_command.add_argument(
+        '--save',
+        dest='save',
+        metavar='LABEL',
+        default=None,
+        help='Save the results under this label (or to this .json path).')
+    run_command.add_argument(
+        '--compare',
+        dest='compare',
+        metavar='LABEL',
+        default=None,
+        help='Compare the results with those saved under this label.')
+    run_command.add_argument(
+        '--threshold',
+        dest='threshold',
+        type=float,
+        default=1.25,
+        help=('The ratio to the baseline above which a benchmark is a '
+              'regression; default 1.25.'))
+
+    compare_command = subparser.add_parser(
+        'compare',
+        help='Compare two sets of saved results.')
+    compare_command.add_argument('baseline', metavar='BASELINE')
+    compare_command.add_argument('current', metavar='CURRENT')
+    compare_command.add_argument(
+        '--threshold',
+        dest='threshold',
+        type=float,
+        default=1.25,
+        help=('The ratio to the baseline above which a benchmark is a '
+              'regression; default 1.25.'))
+
+    subparser.add_parser(
+        'list',
+        help='List the benchmarks and the saved results.')
+
+    generate_command = subparser.add_parser(
+        'generate',
+        help='Generate a synthetic fleet.')
+    generate_command.add_argument(
+        '--size', '-n',
+        dest='size',
+        type=int,
+        default=10,
+        help='The number of charms.')
+    generate_command.add_argument(
+        '--seed',
+        dest='seed',
+        type=int,
+        default=0,
+        help='The random seed.')
+    generate_command.add_argument('directory', type=Path)
+    return parser.parse_args(argv)
+
+
+def report_comparison(baseline: List[BenchResult],
+                      current: List[BenchResult],
+                      threshold: float,
+                      ) -> int:
+    comparisons = compare(baseline, current)
+    print(format_comparison(comparisons, threshold))
+    slower = regressions(comparisons, threshold)
+    if slower:
+        print(f"\n{len(slower)} benchmark(s) slower than the baseline by "
+              f"more than {threshold:.2f}x")
+        return 1
+    return 0
+
+
+def do_run(args: argparse.Namespace) -> int:
+    names = select_benchmarks(args.only)
+    if not names:
+        logger.error("No benchmarks match %s", ", ".join(args.only))
+        return 2
+    if args.fleet_dir is not None:
+        args.fleet_dir.mkdir(parents=True, exist_ok=True)
+        results = run_benchmarks(args.sizes, names, args.repeat,
+                                 args.fleet_dir)
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = run_benchmarks(args.sizes, names, args.repeat,
+                                     Path(tmpdir))
+    print(format_results(results))
+    if args.save:
+        print(f"Saved results to {save_results(results, args.save)}")
+    if args.compare:
+        print()
+        return report_comparison(load_results(args.compare), results,
+                                 args.threshold)
+    return 0
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+    if args.cmd == 'run':
+        sys.exit(do_run(args))
+    if args.cmd == 'compare':
+        sys.exit(report_comparison(load_results(args.baseline),
+                                   load_results(args.current),
+                                   args.threshold))
+    if args.cmd == 'list':
+        print("Benchmarks:")
+        for name in BENCHMARKS:
+            print(f"  {name}")
+        print("Saved results:")
+        for label in saved_labels():
+            print(f"  {label}")
+        return
+    fleet = generate_fleet(args.directory, args.size, seed=args.seed)
+    print(f"Generated {len(fleet.charms)} charms in {fleet.charms_dir}")
+    print(f"Use: export {lp_builder.CONFIG_DIR_ENV}={fleet.config_dir}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# Run a pipeline of transforms (from _update-charmcraft.py,
+# update-zuul-jobs.py, update-tox.py, _update-metadata.py and
+# update-build-lock.py) over the charms in one go; each file is parsed and
+# written once per charm.  See lib/pipeline.py for the spec.
+
+import argparse
+import functools
+import logging
+from pathlib import Path
+import sys
+from typing import List
+
+from lib.fleet import CHARMS_DIR, Result, find_charm_dirs, run_pool
+from lib.profiling import run_profiled
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description=("Apply a pipeline of transforms to the charmcraft.yaml, "
+                     ".zuul.yaml, tox.ini, metadata.yaml and build.lock "
+                     "files of the charms."),
+        epilog=("The SPEC is a YAML file with a 'transforms' list; each item "
+                "is a transform name or a mapping of the name to its "
+                "parameters.  Use --list to see the transforms."))
+    parser.add_argument('spec',
+                        nargs='?',
+                        type=Path,
+                        metavar='SPEC',
+                        help="The pipeline spec.")
+    parser.add_argument('--list',
+                        dest='list_transforms',
+                        action='store_true',
+                        help="List the transforms and their parameters.")
+    parser.add_argument('--charms-dir',
+                        dest='charms_dir',
+                        type=Path,
+                        default=Path(CHARMS_DIR),
+                        metavar='DIR',
+                        help=("The directory of charms; default is "
+                              "%(default)s."))
+    parser.add_argument('--only',
+                        dest='only_charms',
+                        action='append',
+                        metavar='NAME',
+                        help=("Only run the pipeline on this charm; may be "
+                              "repeated."))
+    parser.add_argument('--workers', '-j',
+                        dest='workers',
+                        type=int,
+                        help="The number of charms to process at once.")
+    parser.add_argument('--log', dest='loglevel',
+                        type=str.upper,
+                        default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'),
+                        help='Loglevel')
+    args = parser.parse_args(argv)
+    if not args.spec and not args.list_transforms:
+        parser.error("the following arguments are required: SPEC")
+    return args
+
+
+def list_transforms() -> None:
+    """Print the transforms, their parameters and what they do."""
+    from lib.pipeline import REQUIRED, TRANSFORMS
+    for name, transform in TRANSFORMS.items():
+        params = ", ".join(
+            f"{param} (required)" if default is REQUIRED else param
+            for param, default in transform.params.items())
+        print(f"{name}: {params or '-'}")
+        print(f"    {transform.help}")
+
+
+def report(results: List[Result], charms_dir: Path) -> int:
+    """Print the result for each charm and a summary.
+
+    :param results: the result (a `CharmResult`) for each charm directory.
+    :param charms_dir: the charms directory, to shorten the paths.
+    :returns: the number of charms that failed.
+    """
+    changed = failed = 0
+    for result in results:
+        name = result.item.name
+        if not result.ok:
+            failed += 1
+            print(f"{name}: FAILED: {result.error}")
+            continue
+        written, missing = result.value
+        notes = "".join(f" (no {rel})" for rel in missing)
+        if written:
+            changed += 1
+            files = ", ".join(str(p.relative_to(result.item))
+                              for p in written)
+            print(f"{name}: changed {files}{notes}")
+        else:
+            print(f"{name}: unchanged{notes}")
+    print(f"{len(results)} charm(s): {changed} changed, "
+          f"{len(results) - changed - failed} unchanged, {failed} failed")
+    return failed
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+
+    if args.list_transforms:
+        list_transforms()
+        return
+
+    from lib.pipeline import PipelineError, load_pipeline, run_charm
+    try:
+        pipeline = load_pipeline(args.spec)
+    except (OSError, PipelineError) as e:
+        logger.error("%s", e)
+        sys.exit(1)
+    charm_dirs = find_charm_dirs(args.charms_dir, args.only_charms)
+    if not charm_dirs:
+        logger.error("No charms found in %s", args.charms_dir)
+        sys.exit(1)
+    results = run_pool(functools.partial(run_charm, pipeline=pipeline),
+                       charm_dirs, workers=args.workers, processes=True)
+    if report(results, args.charms_dir):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    run_profiled(main)
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+
+# Post-Release Repo Tasks, for all the charms at once:
+#   - Create the <branch>-updates branch from origin/stable/<branch>.
+#   - Flip stable charm-helpers and Zaza bits.
+#   - Update .gitreview with new stable branch name.
+#
+# This does what update-stable-charms (add-gerrit-remote and
+# stable-branch-updates for each charm in turn) does, but the charms are
+# fetched and updated concurrently and the files are edited in memory.
+
+import argparse
+import functools
+import logging
+from pathlib import Path
+import re
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+from lib.fleet import (
+    Result,
+    add_fleet_arguments,
+    charm_dirs_from_args,
+    print_summary,
+    run_pool,
+)
+from lib.output import write_if_changed
+from lib.profiling import run_profiled
+from lib.timing import timed
+
+
+logger = logging.getLogger(__name__)
+
+# The charms are fetched in threads; this is mostly waiting on the network so
+# more workers than CPUs are used.
+FETCH_WORKERS = 16
+
+CHARM_HELPERS_YAMLS = ('charm-helpers-hooks.yaml', 'charm-helpers-tests.yaml')
+
+# charm-helpers at the end of a line in the charm-helpers yaml files.
+CHARM_HELPERS_REPO = re.compile(r'https://github\.com/juju/charm-helpers$',
+                                re.MULTILINE)
+# the git URLs (followed by #egg=...) in the requirements files.
+CHARMS_OPENSTACK_GIT = re.compile(r'openstack/charms\.openstack\.git(?=#)')
+CHARM_HELPERS_GIT = re.compile(r'juju/charm-helpers\.git(?=#)')
+ZAZA_GIT = re.compile(r'openstack-charmers/zaza\.git(?=#)')
+ZAZA_OPENSTACK_TESTS_GIT = re.compile(
+    r'openstack-charmers/zaza-openstack-tests\.git(?=#)')
+
+
+class Rewrite(NamedTuple):
+    """Pin git URLs in a file to the stable branch.
+
+    The file is left alone if it already has skip_if in it.
+    """
+    path: str
+    skip_if: str
+    patterns: Tuple[Pattern, ...]
+
+
+REACTIVE_REWRITES = (
+    Rewrite('src/wheelhouse.txt', 'charms.openstack.git@stable',
+            (CHARMS_OPENSTACK_GIT,)),
+    Rewrite('src/wheelhouse.txt', 'charm-helpers.git@stable',
+            (CHARM_HELPERS_GIT,)),
+    Rewrite('test-requirements.txt', 'charms.openstack.git@stable',
+            (CHARMS_OPENSTACK_GIT,)),
+    Rewrite('src/test-requirements.txt', 'zaza-openstack-tests.git@stable',
+            (ZAZA_GIT, ZAZA_OPENSTACK_TESTS_GIT)),
+)
+CLASSIC_REWRITES = (
+    Rewrite('test-requirements.txt', 'zaza-openstack-tests.git@stable',
+            (ZAZA_GIT, ZAZA_OPENSTACK_TESTS_GIT)),
+)
+
+GERRIT_URL = 'ssh://{username}@review.openstack.org:29418/{project}'
+
+
+class StableResult(NamedTuple):
+    """What was done to a charm: the branch that was created or checked out
+    (if any), whether the gerrit remote was added and the files written."""
+    branch: Optional[str]
+    gerrit_remote: bool
+    written: List[Path]
+
+
+def git(charm_dir: Path, *args: str) -> str:
+    """Run a git command in the charm and return its output.
+
+    :raises: RuntimeError (with git's error) if the command fails.
+    """
+    proc = subprocess.run(['git', *args], cwd=charm_dir, capture_output=True,
+                          text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed: "
+                           f"{proc.stderr.strip()}")
+    return proc.stdout
+
+
+def ensure_gerrit_remote(charm_dir: Path, username: str) -> bool:
+    """Add a gerrit remote, from the project in .gitreview, if there isn't
+    one.
+
+    :returns: True if the remote was added.
+    """
+    if 'gerrit' in git(charm_dir, 'remote').split():
+        return False
+    project = None
+    for line in (charm_dir / '.gitreview').read_text().splitlines():
+        if line.startswith('project='):
+            project = line[len('project='):].strip()
+    if not project:
+        raise RuntimeError("No project in .gitreview")
+    git(charm_dir, 'remote', 'add', 'gerrit',
+        GERRIT_URL.format(username=username, project=project))
+    return True
+
+
+def ensure_branch(charm_dir: Path, branch: str) -> Optional[str]:
+    """Check out <branch>-updates, creating it from origin/stable/<branch>.
+
+    :returns: the branch if it was created or checked out, None if it was
+        already checked out.
+    """
+    updates = f"{branch}-updates"
+    if git(charm_dir, 'branch', '--show-current').strip() == updates:
+        return None
+    exists = subprocess.run(
+        ['git', 'rev-parse', '--verify', '--quiet', f"refs/heads/{updates}"],
+        cwd=charm_dir, capture_output=True).returncode == 0
+    if exists:
+        git(charm_dir, 'checkout', '--quiet', updates)
+    else:
+        git(charm_dir, 'checkout', '--quiet', '-b', updates,
+            f"origin/stable/{branch}")
+    return updates
+
+
+def pin_to_stable(content: str,
+                  patterns: Tuple[Pattern, ...],
+                  release: str,
+                  ) -> str:
+    """Add @stable/<release> to the URLs that the patterns match."""
+    for pattern in patterns:
+        content = pattern.sub(lambda m: f"{m[0]}@stable/{release}", content)
+    return content
+
+
+def update_gitreview(content: str, branch: str) -> str:
+    """Add the defaultbranch to .gitreview if it hasn't got one."""
+    if 'defaultbranch' in content:
+        return content
+    return f"{content}\ndefaultbranch=stable/{branch}\n"
+
+
+def update_files(charm_dir: Path,
+                 release: str,
+                 branch: str,
+                 ) -> Tuple[List[Path], List[Path]]:
+    """Make the stable edits to the charm's files in memory and write them.
+
+    :returns: the files written, and those of them to add to the git index
+        (as stable-branch-updates does: .gitreview and the charm-helpers
+        yaml files).
+    """
+    # the files, by path relative to the charm, as read and as edited.
+    original: Dict[str, Optional[str]] = {}
+    contents: Dict[str, str] = {}
+    to_add: List[str] = []
+
+    def read(rel: str) -> Optional[str]:
+        if rel not in original:
+            try:
+                original[rel] = (charm_dir / rel).read_text()
+            except FileNotFoundError:
+                original[rel] = None
+        return contents.get(rel, original[rel])
+
+    gitreview = read('.gitreview')
+    if gitreview is not None:
+        contents['.gitreview'] = update_gitreview(gitreview, branch)
+        to_add.append('.gitreview')
+    for name in CHARM_HELPERS_YAMLS:
+        for rel in (name, f"src/{name}"):
+            content = read(rel)
+            if content is not None:
+                contents[rel] = pin_to_stable(content, (CHARM_HELPERS_REPO,),
+                                              release)
+                to_add.append(rel)
+    reactive = (charm_dir / 'src' / 'layer.yaml').exists()
+    rewrites = REACTIVE_REWRITES if reactive else CLASSIC_REWRITES
+    for rewrite in rewrites:
+        content = read(rewrite.path)
+        if content is not None and rewrite.skip_if not in content:
+            contents[rewrite.path] = pin_to_stable(content, rewrite.patterns,
+                                                   release)
+
+    written = []
+    for rel, content in contents.items():
+        if content != original[rel]:
+            if write_if_changed(charm_dir / rel, content):
+                written.append(charm_dir / rel)
+    return written, [charm_dir / rel for rel in to_add
+                     if charm_dir / rel in written]
+
+
+def update_charm(charm_dir: Path,
+                 release: str,
+                 branch: str,
+                 fetch: bool = True,
+                 username: Optional[str] = None,
+                 ) -> StableResult:
+    """Fetch the charm, create the updates branch and make the stable edits.
+
+    :param charm_dir: the root of the charm repo.
+    :param release: the OpenStack codename, e.g. antelope, for the libraries.
+    :param branch: the stable branch of the charm, e.g. 2023.1.
+    :param fetch: whether to run git fetch --all first.
+    :param username: if set, add a gerrit remote for this user if missing.
+    :returns: what was done.
+    """
+    gerrit_remote = False
+    if username:
+        gerrit_remote = ensure_gerrit_remote(charm_dir, username)
+    if fetch:
+        with timed('fetch', charm=charm_dir.name):
+            git(charm_dir, 'fetch', '--all', '--quiet')
+    with timed('stable-branch-updates', charm=charm_dir.name):
+        updates_branch = ensure_branch(charm_dir, branch)
+        written, to_add = update_files(charm_dir, release, branch)
+        if to_add:
+            git(charm_dir, 'add', '--', *map(str, to_add))
+    return StableResult(updates_branch, gerrit_remote, written)
+
+
+def report(results: List[Result]) -> int:
+    """Print the result for each charm and a summary.
+
+    :param results: the result (a `StableResult`) for each charm directory.
+    :returns: the number of charms that failed.
+    """
+    changed = failed = 0
+    for result in results:
+        name = result.item.name
+        if not result.ok:
+            failed += 1
+            print(f"{name}: FAILED: {result.error}")
+            continue
+        branch, gerrit_remote, written = result.value
+        notes = []
+        if gerrit_remote:
+            notes.append("added gerrit remote")
+        if branch:
+            notes.append(f"on {branch}")
+        if written:
+            changed += 1
+            notes.append("changed " + ", ".join(
+                str(p.relative_to(result.item)) for p in written))
+        else:
+            notes.append("unchanged")
+        print(f"{name}: {'; '.join(notes)}")
+    print_summary(len(results), changed, failed)
+    return failed
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(
+        description=("Post-release repo tasks: create the <branch>-updates "
+                     "branch of each charm, flip the stable charm-helpers "
+                     "and Zaza bits and set the .gitreview defaultbranch."),
+        epilog=("e.g. 'stable-branch-updates.py antelope 2023.1' means "
+                "'stable/antelope' for the libraries and 'stable/2023.1' for "
+                "the charms."))
+    parser.add_argument('release',
+                        help="The OpenStack codename, e.g. antelope.")
+    parser.add_argument('branch',
+                        help="The stable branch of the charms, e.g. 2023.1.")
+    add_fleet_arguments(parser,
+                        workers_help=("The number of charms to fetch and "
+                                      "update at once; default is "
+                                      "%(default)s."))
+    parser.set_defaults(workers=FETCH_WORKERS)
+    parser.add_argument('--gerrit-username',
+                        dest='username',
+                        metavar='USER',
+                        help=("Add a gerrit remote for USER to the charms "
+                              "that don't have one, as add-gerrit-remote "
+                              "does."))
+    parser.add_argument('--no-fetch',
+                        dest='fetch',
+                        action='store_false',
+                        help="Don't run git fetch --all first.")
+    parser.add_argument('--log', dest='loglevel',
+                        type=str.upper,
+                        default='INFO',
+                        choices=('DEBUG', 'INFO', 'WARN', 'ERROR', 'CRITICAL'),
+                        help='Loglevel')
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+
+    charm_dirs = charm_dirs_from_args(args)
+    if not charm_dirs:
+        logger.error("No charms found in %s", args.charms_dir)
+        sys.exit(1)
+    update = functools.partial(update_charm, release=args.release,
+                               branch=args.branch, fetch=args.fetch,
+                               username=args.username)
+    # threads, as the work is done by git.
+    results = run_pool(update, charm_dirs, workers=args.workers)
+    if report(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    run_profiled(main)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Tests for add-new-release.py."""
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tests.fixtures import run_main, write
+
+# add-new-release.py has a hyphen in its name so it can't be imported with a
+# normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "add_new_release",
+    _REPO_ROOT / "add-new-release.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+ARGS = ('lunar-antelope.yaml', 'jammy-antelope.yaml', 'mantic-bobcat.yaml',
+        'jammy-bobcat.yaml', '23.04', '23.10', 'lunar', 'mantic')
+SPEC = _mod.ReleaseSpec(*ARGS)
+
+CHARMCRAFT_YAML = """\
+    type: charm
+    bases:
+      - build-on:
+          - name: ubuntu
+            channel: "22.04"
+            architectures: [amd64]
+        run-on:
+          - name: ubuntu
+            channel: "22.04"
+            architectures: [amd64]
+          - name: ubuntu
+            channel: "23.04"
+            architectures: [amd64]
+      - build-on:
+          - name: ubuntu
+            channel: "22.04"
+            architectures: [arm64]
+        run-on:
+          - name: ubuntu
+            channel: "23.04"
+            architectures: [arm64]
+    """
+
+
+def make_charm(charms_dir: Path, name: str) -> Path:
+    charm_dir = charms_dir / name
+    bundles = charm_dir / 'tests' / 'bundles'
+    write(bundles / 'lunar-antelope.yaml', """\
+        variables:
+          openstack-origin: &openstack-origin distro
+        series: lunar
+        comment: lunar-antelope, lunar-antelope
+        """)
+    write(bundles / 'jammy-antelope.yaml', """\
+        variables:
+          openstack-origin: &openstack-origin cloud:jammy-antelope
+        series: jammy
+        """)
+    write(charm_dir / 'tests' / 'tests.yaml', """\
+        gate_bundles:
+          - jammy-antelope
+          - lunar-antelope
+        smoke_bundles:
+          - jammy-antelope""")
+    write(charm_dir / 'osci.yaml', """\
+        - project:
+            templates:
+              - charm-unit-jobs-py310
+              - charm-antelope-unit-jobs
+              - charm-antelope-functional-jobs
+        """)
+    write(charm_dir / '.zuul.yaml', """\
+        - project:
+            templates:
+              - openstack-python3-charm-antelope-jobs
+        """)
+    write(charm_dir / 'config.yaml', """\
+        options:
+          openstack-origin:
+            default: antelope
+            description: antelope is the default
+        """)
+    write(charm_dir / 'charmcraft.yaml', CHARMCRAFT_YAML)
+    write(charm_dir / 'metadata.yaml', """\
+        name: aodh
+        series:
+          - jammy
+          - lunar
+        """)
+    return charm_dir
+
+
+class TestEdits(unittest.TestCase):
+
+    def test_bundle_names(self):
+        self.assertEqual(_mod.bundle_release('jammy-antelope.yaml'),
+                         'jammy-antelope')
+        self.assertEqual(_mod.bundle_series('jammy-antelope.yaml'), 'jammy')
+        self.assertEqual(SPEC.prev_os_codename, 'antelope')
+        self.assertEqual(SPEC.new_os_codename, 'bobcat')
+
+    def test_replace_first_per_line(self):
+        self.assertEqual(
+            _mod.replace_first_per_line("a.b a.b\nxa.b\naxb\n", "a.b", "c"),
+            "c a.b\nxc\naxb\n")
+
+    def test_duplicate_lines(self):
+        self.assertEqual(
+            _mod.duplicate_lines("  - lunar\n  - lunar, lunar\nend", "lunar",
+                                 "mantic"),
+            "  - lunar\n  - mantic\n  - lunar, lunar\n  - lunar, mantic\nend")
+        self.assertEqual(_mod.duplicate_lines("- lunar", "lunar", "mantic"),
+                         "- lunar\n- mantic")
+
+
+class TestFindFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_walk(self):
+        for rel in ('metadata.yaml', 'src/metadata.yaml', '.tox/metadata.yaml',
+                    'build/metadata.yaml', 'a/b/c/d/e/metadata.yaml',
+                    'a/b/c/d/metadata.yaml'):
+            write(self.tmpdir / rel, "")
+        found = _mod.find_files(self.tmpdir, ['metadata.yaml', 'tests.yaml'])
+        self.assertEqual(found, {
+            'metadata.yaml': [self.tmpdir / 'metadata.yaml',
+                              self.tmpdir / 'src' / 'metadata.yaml',
+                              self.tmpdir / 'a/b/c/d/metadata.yaml'],
+            'tests.yaml': []})
+
+    def test_pick_skips_symlink(self):
+        write(self.tmpdir / 'src' / 'metadata.yaml', "")
+        (self.tmpdir / 'metadata.yaml').symlink_to('src/metadata.yaml')
+        found = _mod.find_files(self.tmpdir, ['metadata.yaml'])
+        self.assertEqual(_mod._pick(found['metadata.yaml']),
+                         self.tmpdir / 'src' / 'metadata.yaml')
+
+
+class TestAddNewRelease(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charms_dir = self.tmpdir / 'charms'
+        self.charm_dir = make_charm(self.charms_dir, 'aodh')
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _read(self, rel: str) -> str:
+        return (self.charm_dir / rel).read_text()
+
+    def test_add(self):
+        result = _mod.add_new_release(self.charm_dir, SPEC)
+        self.assertEqual(
+            [str(p.relative_to(self.charm_dir)) for p in result.written],
+            ['tests/bundles/mantic-bobcat.yaml', 'tests/tests.yaml',
+             'tests/bundles/jammy-bobcat.yaml', 'osci.yaml', '.zuul.yaml',
+             'config.yaml', 'charmcraft.yaml', 'metadata.yaml'])
+        self.assertEqual(result.notes, [])
+        self.assertEqual(self._read('tests/bundles/mantic-bobcat.yaml'),
+                         "variables:\n"
+                         "  openstack-origin: &openstack-origin distro\n"
+                         "series: mantic\n"
+                         "comment: mantic-bobcat, mantic-antelope\n")
+        self.assertIn("cloud:jammy-bobcat",
+                      self._read('tests/bundles/jammy-bobcat.yaml'))
+        self.assertEqual(self._read('tests/tests.yaml'),
+                         "gate_bundles:\n"
+                         "  - jammy-antelope\n  - jammy-bobcat\n"
+                         "  - lunar-antelope\n  - mantic-bobcat\n"
+                         "smoke_bundles:\n"
+                         "  - jammy-antelope\n  - jammy-bobcat")
+        self.assertIn("      - charm-antelope-unit-jobs\n"
+                      "      - charm-bobcat-unit-jobs\n"
+                      "      - charm-antelope-functional-jobs\n"
+                      "      - charm-bobcat-functional-jobs\n",
+                      self._read('osci.yaml'))
+        self.assertIn("      - openstack-python3-charm-antelope-jobs\n"
+                      "      - openstack-python3-charm-bobcat-jobs\n",
+                      self._read('.zuul.yaml'))
+        self.assertIn("    default: bobcat\n"
+                      "    description: antelope is the default\n",
+                      self._read('config.yaml'))
+        charmcraft = self._read('charmcraft.yaml')
+        for arch in ('amd64', 'arm64'):
+            self.assertIn(_mod.run_on_base('23.04', arch) + "\n" +
+                          _mod.run_on_base('23.10', arch), charmcraft)
+        self.assertEqual(charmcraft.count('"23.10"'), 2)
+        self.assertIn("  - lunar\n  - mantic\n", self._read('metadata.yaml'))
+
+    def test_again_is_a_noop(self):
+        _mod.add_new_release(self.charm_dir, SPEC)
+        before = {p: p.read_text() for p in self.charm_dir.rglob('*')
+                  if p.is_file()}
+        result = _mod.add_new_release(self.charm_dir, SPEC)
+        self.assertEqual(result.written, [])
+        self.assertEqual(result.notes, [
+            "Bundle already exists: tests/bundles/mantic-bobcat.yaml",
+            "Bundle already exists: tests/bundles/jammy-bobcat.yaml",
+            "Job charm-bobcat-unit-jobs already exists in osci.yaml",
+            "Job openstack-python3-charm-bobcat-jobs already exists in "
+            ".zuul.yaml",
+            "bobcat already exists in config.yaml",
+            "Version 23.10 already exists in charmcraft.yaml",
+            "mantic already exists in metadata.yaml"])
+        self.assertEqual({p: p.read_text() for p in before}, before)
+
+    def test_all_arches(self):
+        write(self.charm_dir / 'charmcraft.yaml', """\
+            bases:
+              - run-on:
+                  - name: ubuntu
+                    channel: "23.04"
+                    architectures: [amd64, s390x, ppc64el, arm64]
+            """)
+        _mod.add_new_release(self.charm_dir, SPEC)
+        self.assertTrue(self._read('charmcraft.yaml').endswith(
+            _mod.run_on_base('23.10', _mod.ALL_ARCHES) + "\n"))
+
+    def test_missing_files(self):
+        for rel in ('tests/bundles/lunar-antelope.yaml', 'config.yaml',
+                    'osci.yaml'):
+            (self.charm_dir / rel).unlink()
+        result = _mod.add_new_release(self.charm_dir, SPEC)
+        self.assertEqual(result.notes[:3], [
+            "Bundle doesn't exist: lunar-antelope.yaml",
+            "File doesn't exist: osci.yaml",
+            "File doesn't exist: config.yaml"])
+        self.assertFalse(
+            (self.charm_dir / 'tests/bundles/mantic-bobcat.yaml').exists())
+        self.assertNotIn('mantic-bobcat', self._read('tests/tests.yaml'))
+        self.assertIn('jammy-bobcat', self._read('tests/tests.yaml'))
+
+    def test_main(self):
+        make_charm(self.charms_dir, 'barbican')
+        (self.charms_dir / 'barbican' / 'metadata.yaml').write_text(
+            "name: barbican\nseries:\n  - jammy\n  - mantic\n")
+        lines = run_main(_mod, ['add-new-release.py', '--charms-dir',
+                                str(self.charms_dir), '-j', '1', *ARGS])
+        self.assertIn("    mantic already exists in metadata.yaml", lines)
+        self.assertEqual(lines[-1],
+                         "2 charm(s): 2 changed, 0 unchanged, 0 failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
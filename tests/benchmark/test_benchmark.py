@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Tests for the synthetic fleet, lib/benchmark.py and run-benchmarks.py."""
+
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+from lib import benchmark
+from lib import inventory
+from lib import lp_builder
+from lib.synthetic_fleet import generate_fleet
+
+# run-benchmarks.py has a hyphen in its name so it can't be imported with a
+# normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "run_benchmarks",
+    _REPO_ROOT / "run-benchmarks.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+class TestSyntheticFleet(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        lp_builder.reset_caches()
+
+    def test_generate_fleet(self):
+        fleet = generate_fleet(self.tmpdir, 6)
+        self.assertEqual(len(fleet.charms), 6)
+        for charm in fleet.charms:
+            self.assertEqual(inventory.classify_charm(charm.path),
+                             f"{charm.charm_type}-zaza")
+            for path in (charm.path / 'charmcraft.yaml',
+                         charm.path / 'osci.yaml',
+                         charm.path / '.zuul.yaml',
+                         charm.bundles_dir / 'jammy-caracal.yaml'):
+                self.assertIsNotNone(yaml.safe_load(path.read_text()))
+
+    def test_generate_is_repeatable(self):
+        fleet = generate_fleet(self.tmpdir, 4)
+        bundle = fleet.charms[0].bundles_dir / 'noble-caracal.yaml'
+        before = bundle.read_text()
+        bundle.write_text("changed\n")
+        generate_fleet(self.tmpdir, 4, kinds=['bundles'])
+        self.assertEqual(bundle.read_text(), before)
+
+    def test_lp_builder_config(self):
+        fleet = generate_fleet(self.tmpdir, 8)
+        with mock.patch.dict(os.environ, {
+                lp_builder.CONFIG_DIR_ENV: str(fleet.config_dir),
+                'XDG_CACHE_HOME': str(self.tmpdir / 'cache')}):
+            lp_builder.reset_caches()
+            charms = lp_builder.get_charms(':all:')
+            self.assertEqual(sorted(c.charmhub for c in charms),
+                             fleet.names)
+            config = lp_builder.get_lp_builder_config()
+            self.assertEqual(config['synth-0000']['stable/2024.1'],
+                             ['2024.1/edge'])
+            # misc charms have their own branches rather than defaults.
+            self.assertEqual(config['synth-0003']['stable/jammy'],
+                             ['2.4/edge'])
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        patcher = mock.patch.dict(os.environ, {
+            benchmark.RESULTS_DIR_ENV: str(self.tmpdir / 'results'),
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_run_all_benchmarks(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = _mod.run_benchmarks(
+                [3], list(_mod.BENCHMARKS.keys()), 1, self.tmpdir)
+        self.assertEqual([r.name for r in results],
+                         list(_mod.BENCHMARKS.keys()))
+        self.assertNotIn(lp_builder.CONFIG_DIR_ENV, os.environ)
+
+    def test_select_benchmarks(self):
+        self.assertEqual(_mod.select_benchmarks(['build_lock.*']),
+                         ['build_lock.add', 'build_lock.modify',
+                          'build_lock.delete', 'build_lock.lock_layer',
+                          'build_lock.apply'])
+
+    def test_save_load_compare(self):
+        baseline = [benchmark.BenchResult('a', 10, 3, 1.0, 1.1, 1.2),
+                    benchmark.BenchResult('b', 10, 3, 1.0, 1.0, 1.0)]
+        current = [benchmark.BenchResult('a', 10, 3, 1.5, 1.5, 1.5),
+                   benchmark.BenchResult('b', 10, 3, 0.5, 0.5, 0.5),
+                   benchmark.BenchResult('c', 10, 3, 0.5, 0.5, 0.5)]
+        benchmark.save_results(baseline, 'baseline')
+        self.assertEqual(benchmark.saved_labels(), ['baseline'])
+        self.assertEqual(benchmark.load_results('baseline'), baseline)
+        comparisons = benchmark.compare(baseline, current)
+        self.assertEqual([c.name for c in comparisons], ['a', 'b'])
+        self.assertEqual(
+            [c.name for c in benchmark.regressions(comparisons, 1.25)],
+            ['a'])
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Tests for lib/bundles.py."""
+
+import textwrap
+import unittest
+
+from lib import bundles
+
+
+BUNDLE = textwrap.dedent("""\
+    applications:
+      vault:
+        charm: ch:vault
+        channel: 1.7/stable  # pinned
+        num_units: 1
+      keystone:
+        charm: 'cs:~openstack-charmers-next/keystone'
+        num_units: 3
+      mysql:
+        charm: cs:~someone/mysql-innodb-cluster
+        options:
+          channel: not-this-one
+        channel: 8.0/edge
+      local:
+        charm: ../../keystone.charm
+    """)
+
+
+class TestFindCharmRefs(unittest.TestCase):
+
+    def test_refs(self):
+        refs = bundles.find_charm_refs(BUNDLE.splitlines(True))
+        self.assertEqual(refs, [
+            bundles.CharmRef('vault', 3, 'ch:', True, '1.7/stable', 4),
+            bundles.CharmRef('keystone', 7, 'cs:~openstack-charmers-next/',
+                             True, None, None),
+            bundles.CharmRef('mysql-innodb-cluster', 10, 'cs:~someone/',
+                             False, '8.0/edge', 13),
+        ])
+
+    def test_charm_at_end_of_file(self):
+        refs = bundles.find_charm_refs(["applications:\n",
+                                        "  vault:\n",
+                                        "    charm: ch:vault\n"])
+        self.assertEqual(refs, [
+            bundles.CharmRef('vault', 3, 'ch:', True, None, None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+"""Helpers shared by the tests of the fleet tools."""
+
+import contextlib
+import io
+import textwrap
+from pathlib import Path
+from types import ModuleType
+from typing import List
+from unittest import mock
+
+
+def write(path: Path, text: str) -> None:
+    """Write the dedented text to path, making its directory if needed."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(textwrap.dedent(text))
+
+
+def run_main(mod: ModuleType, argv: List[str]) -> List[str]:
+    """Run the main() of a tool with argv and return the lines it printed.
+
+    If the tool exits then "exit <code>" is the last line.
+    """
+    out = io.StringIO()
+    with mock.patch('sys.argv', argv), contextlib.redirect_stdout(out):
+        try:
+            mod.main()
+        except SystemExit as e:
+            out.write(f"exit {e.code}\n")
+    return out.getvalue().splitlines()
+
+
+def make_charm(charms_dir: Path, name: str, source: bool = False) -> Path:
+    """Make a minimal charm repo, charms_dir/<name>: a .gitreview, a
+    tests/tests.yaml and a metadata.yaml (in src/ for a source charm)."""
+    charm_dir = charms_dir / name
+    write(charm_dir / '.gitreview', "[gerrit]\n")
+    write(charm_dir / 'tests' / 'tests.yaml', "gate_bundles:\n  - jammy\n")
+    metadata = 'src/metadata.yaml' if source else 'metadata.yaml'
+    write(charm_dir / metadata, f"name: {name}\n")
+    return charm_dir
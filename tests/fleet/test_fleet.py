@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Tests for lib/fleet.py."""
+
+import argparse
+import contextlib
+import io
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from lib import fleet
+from tests.fixtures import write
+
+
+class TestFleetArguments(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        for name in ('aodh', 'barbican', 'cinder'):
+            write(self.tmpdir / name / '.gitreview', "[gerrit]\n")
+        write(self.tmpdir / '.inventory' / 'db', "")
+        self.parser = argparse.ArgumentParser()
+        fleet.add_fleet_arguments(self.parser)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def charm_dirs(self, *argv):
+        args = self.parser.parse_args(['--charms-dir', str(self.tmpdir),
+                                       *argv])
+        return fleet.charm_dirs_from_args(args)
+
+    def test_all_charms(self):
+        self.assertEqual([d.name for d in self.charm_dirs()],
+                         ['aodh', 'barbican', 'cinder'])
+
+    def test_only(self):
+        self.assertEqual([d.name for d in self.charm_dirs(
+            '--only', 'cinder', '--only', 'aodh')], ['aodh', 'cinder'])
+
+    def test_charm_dirs(self):
+        # --charm wins over --charms-dir and --only.
+        self.assertEqual(
+            self.charm_dirs('--only', 'aodh',
+                            '--charm', str(self.tmpdir / 'barbican')),
+            [(self.tmpdir / 'barbican').resolve()])
+
+    def test_workers(self):
+        args = self.parser.parse_args(['-j', '3'])
+        self.assertEqual(args.workers, 3)
+        self.assertEqual(args.charms_dir, Path(fleet.CHARMS_DIR))
+
+
+class TestPrintSummary(unittest.TestCase):
+
+    def test_print_summary(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            fleet.print_summary(12, 3, 1)
+        self.assertEqual(out.getvalue(),
+                         "12 charm(s): 3 changed, 8 unchanged, 1 failed\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Tests for get-build-artifacts.py."""
+
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tests.fixtures import make_charm, run_main, write
+
+# get-build-artifacts.py has hyphens in its name so it can't be imported with
+# a normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "get_build_artifacts",
+    _REPO_ROOT / "get-build-artifacts.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+# a stand-in for lxc.  The containers are the directories in $FAKE_LXC_DIR,
+# with their state in <container>/state and their files in <container>/fs;
+# the staging venv's pip prints its own contents as the freeze.  Each call is
+# logged to $FAKE_LXC_DIR/calls.
+FAKE_LXC = f"""\
+    #!{sys.executable}
+    import os, shutil, sys
+    from pathlib import Path
+
+    root = Path(os.environ['FAKE_LXC_DIR'])
+    with open(root / 'calls', 'a') as f:
+        f.write(' '.join(sys.argv[1:]) + '\\n')
+    cmd, project, args = sys.argv[1], sys.argv[2:4], sys.argv[4:]
+    if project != ['--project', 'charmcraft']:
+        sys.exit("wrong project")
+
+    def container(name):
+        if not (root / name).is_dir():
+            sys.exit(f"Error: Instance not found: {{name}}")
+        return root / name
+
+    if cmd == 'list':
+        for c in sorted(p for p in root.iterdir() if p.is_dir()):
+            print(f"{{c.name}},{{(c / 'state').read_text().strip()}}")
+    elif cmd == 'start':
+        (container(args[0]) / 'state').write_text('RUNNING')
+    elif cmd == 'exec':
+        c = container(args[0])
+        if (c / 'state').read_text().strip() != 'RUNNING':
+            sys.exit("Error: Instance is not running")
+        command = args[2:]
+        fs = c / 'fs'
+        if command[0] == 'find':
+            for path in sorted(fs.rglob(command[3])):
+                print('/' + str(path.relative_to(fs)))
+        elif command[1:] == ['freeze']:
+            pip = fs / command[0].lstrip('/')
+            if not pip.exists():
+                sys.exit(f"{{command[0]}}: not found")
+            print(pip.read_text(), end='')
+    elif cmd == 'file' and args[0] == 'pull':
+        name, _, path = args[1].partition('/')
+        shutil.copy(container(name) / 'fs' / path, args[2])
+    else:
+        sys.exit(f"unknown command {{cmd}}")
+    """
+
+FREEZE = "ops==2.4.1\nops-openstack @ git+https://x@abc\n"
+BUILD_LOCK = '{"locks": []}\n'
+
+
+class TestGetBuildArtifacts(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charms_dir = self.tmpdir / 'charms'
+        self.lxc_dir = self.tmpdir / 'lxc'
+        bin_dir = self.tmpdir / 'bin'
+        write(bin_dir / 'lxc', FAKE_LXC)
+        (bin_dir / 'lxc').chmod(0o755)
+        self.lxc_dir.mkdir()
+        patcher = mock.patch.dict(os.environ, {
+            'PATH': f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+            'FAKE_LXC_DIR': str(self.lxc_dir),
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.aodh = make_charm(self.charms_dir, 'aodh', source=True)
+        self.ceph = make_charm(self.charms_dir, 'ceph-dashboard')
+        self.add_container('charmcraft-aodh-1234-0-0-amd64', 'RUNNING',
+                           {'root/parts/charm/src/build.lock': BUILD_LOCK})
+        self.add_container(
+            'charmcraft-ceph-dashboard-5678-0-0-amd64', 'STOPPED',
+            {_mod.STAGING_PIP.lstrip('/'): FREEZE})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def add_container(self, name, state, files):
+        write(self.lxc_dir / name / 'state', state)
+        for path, text in files.items():
+            write(self.lxc_dir / name / 'fs' / path, text)
+
+    def calls(self):
+        return (self.lxc_dir / 'calls').read_text().splitlines()
+
+    def _main(self, *args):
+        return run_main(_mod, ['get-build-artifacts.py', '--charms-dir',
+                               str(self.charms_dir), '-j', '2', *args])
+
+    def test_find_container(self):
+        containers = [_mod.Container('charmcraft-ceph-mon-1-0', 'RUNNING'),
+                      _mod.Container('charmcraft-ceph-2-0', 'STOPPED'),
+                      _mod.Container('charmcraft-ceph-3-0', 'RUNNING')]
+        self.assertEqual(_mod.find_container(containers, 'ceph'),
+                         containers[1])
+        self.assertIsNone(_mod.find_container(containers, 'ceph-osd'))
+
+    def test_build_name(self):
+        write(self.aodh / 'osci.yaml', """\
+            - project:
+                vars:
+                  charm_build_name: aodh-charm
+            """)
+        self.assertEqual(_mod.build_name(self.aodh), 'aodh-charm')
+        self.assertEqual(_mod.build_name(self.ceph), 'ceph-dashboard')
+
+    def test_by_charm_type(self):
+        lines = self._main()
+        self.assertEqual(lines, [
+            "aodh: charmcraft-aodh-1234-0-0-amd64; wrote src/build.lock",
+            "ceph-dashboard: charmcraft-ceph-dashboard-5678-0-0-amd64 "
+            "(started); wrote pip-freeze.txt",
+            "2 charm(s): 2 changed, 0 unchanged, 0 failed"])
+        self.assertEqual((self.aodh / 'src' / 'build.lock').read_text(),
+                         BUILD_LOCK)
+        self.assertEqual((self.ceph / 'pip-freeze.txt').read_text(), FREEZE)
+        # the containers are listed once, and only the stopped one started.
+        calls = self.calls()
+        self.assertEqual([c for c in calls if c.startswith('list')],
+                         ['list --project charmcraft --format csv '
+                          '--columns ns'])
+        self.assertEqual([c for c in calls if c.startswith('start')],
+                         ['start --project charmcraft '
+                          'charmcraft-ceph-dashboard-5678-0-0-amd64'])
+
+        # again, nothing changes.
+        lines = self._main()
+        self.assertEqual(lines[-1],
+                         "2 charm(s): 0 changed, 2 unchanged, 0 failed")
+
+    def test_failures(self):
+        make_charm(self.charms_dir, 'barbican', source=True)
+        self.add_container('charmcraft-designate-1-0-0-amd64', 'RUNNING', {})
+        make_charm(self.charms_dir, 'designate', source=True)
+        lines = self._main('--build-lock')
+        self.assertIn("barbican: FAILED: Can't find a container for barbican",
+                      lines)
+        self.assertIn("designate: FAILED: Couldn't find build.lock in "
+                      "charmcraft-designate-1-0-0-amd64", lines)
+        self.assertIn("ceph-dashboard: FAILED: Couldn't find build.lock in "
+                      "charmcraft-ceph-dashboard-5678-0-0-amd64", lines)
+        self.assertEqual(lines[-2:], [
+            "4 charm(s): 1 changed, 0 unchanged, 3 failed", "exit 1"])
+
+    def test_classic_charm_and_dests(self):
+        classic = make_charm(self.charms_dir, 'cinder')
+        write(classic / 'charm-helpers-hooks.yaml', "repo: x\n")
+        lines = self._main('--only', 'cinder', '--only', 'ceph-dashboard',
+                           '--pip-freeze-dest', 'locks/freeze.txt')
+        self.assertIn("cinder: nothing to extract for this type of charm; "
+                      "unchanged", lines)
+        self.assertEqual((self.ceph / 'locks' / 'freeze.txt').read_text(),
+                         FREEZE)
+
+    def test_no_lxc(self):
+        with mock.patch.dict(os.environ, {'PATH': str(self.tmpdir / 'none')}):
+            lines = self._main()
+        self.assertEqual(lines, ["exit 1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
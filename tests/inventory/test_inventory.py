@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Tests for lib/inventory.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from lib import inventory
+from tests.fixtures import write
+
+
+def make_source_charm(charms_dir: Path, name: str) -> Path:
+    """Make a minimal reactive (source) charm repo."""
+    charm_dir = charms_dir / name
+    write(charm_dir / '.gitreview', f"""\
+        [gerrit]
+        host=review.opendev.org
+        port=29418
+        project=openstack/charm-{name}.git
+        """)
+    write(charm_dir / '.git' / 'HEAD', "ref: refs/heads/master\n")
+    write(charm_dir / 'src' / 'metadata.yaml', f"""\
+        name: {name}
+        series:
+          - jammy
+          - noble
+        """)
+    write(charm_dir / 'src' / 'tests' / 'tests.yaml', """\
+        charm_name: test
+        gate_bundles:
+          - jammy-caracal
+        """)
+    write(charm_dir / 'charmcraft.yaml', """\
+        type: charm
+        bases:
+          - build-on:
+              - name: ubuntu
+                channel: "22.04"
+                architectures: [amd64]
+            run-on:
+              - name: ubuntu
+                channel: "22.04"
+                architectures: [amd64, arm64]
+        """)
+    write(charm_dir / 'osci.yaml', f"""\
+        - project:
+            templates:
+              - charm-unit-jobs-py310
+            vars:
+              charm_build_name: {name}
+        """)
+    write(charm_dir / '.zuul.yaml', """\
+        - project:
+            templates:
+              - openstack-python3-charm-jobs
+              - openstack-cover-jobs
+        """)
+    write(charm_dir / 'src' / 'tests' / 'bundles' / 'jammy-caracal.yaml',
+          "series: jammy\n")
+    write(charm_dir / 'src' / 'tests' / 'bundles' / 'overlays' /
+          'local-charm-overlay.yaml.j2', "applications: {}\n")
+    return charm_dir
+
+
+def make_classic_charm(charms_dir: Path, name: str) -> Path:
+    """Make a minimal classic charm repo with a charmcraft v3 file."""
+    charm_dir = charms_dir / name
+    write(charm_dir / '.gitreview', f"""\
+        [gerrit]
+        project=openstack/charm-{name}.git
+        defaultbranch=stable/2024.1
+        """)
+    write(charm_dir / '.git' / 'HEAD', "ref: refs/heads/stable/2024.1\n")
+    write(charm_dir / 'metadata.yaml', f"""\
+        name: {name}
+        series:
+          - jammy
+        """)
+    write(charm_dir / 'charm-helpers-hooks.yaml',
+          "repo: https://github.com/juju/charm-helpers\n")
+    write(charm_dir / 'charmcraft.yaml', """\
+        type: charm
+        base: ubuntu@22.04
+        platforms:
+          amd64:
+          arm64:
+        """)
+    return charm_dir
+
+
+class TestClassify(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_source_zaza(self):
+        charm_dir = make_source_charm(self.tmpdir, 'aodh')
+        self.assertEqual(inventory.classify_charm(charm_dir), 'source-zaza')
+
+    def test_source_binary_zaza(self):
+        charm_dir = make_source_charm(self.tmpdir, 'aodh')
+        with (charm_dir / 'charmcraft.yaml').open('a') as f:
+            f.write("# - --binary-wheels-from-source\n")
+        self.assertEqual(inventory.classify_charm(charm_dir), 'source-zaza')
+        self.assertEqual(inventory.classify_charm(charm_dir, binary=True),
+                         'source-binary-zaza')
+
+    def test_classic_unknown(self):
+        charm_dir = make_classic_charm(self.tmpdir, 'nova-compute')
+        self.assertEqual(inventory.classify_charm(charm_dir),
+                         'classic-unknown')
+
+    def test_not_a_charm(self):
+        (self.tmpdir / 'empty').mkdir()
+        self.assertIsNone(inventory.classify_charm(self.tmpdir / 'empty'))
+
+
+class TestInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charms_dir = self.tmpdir / 'charms'
+        self.db = self.tmpdir / 'inventory.sqlite'
+        make_source_charm(self.charms_dir, 'aodh')
+        make_classic_charm(self.charms_dir, 'nova-compute')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _update(self, **kwargs):
+        with inventory.Inventory(self.charms_dir, self.db) as inv:
+            return inv.update(workers=1, **kwargs)
+
+    def test_facts(self):
+        self._update()
+        with inventory.Inventory(self.charms_dir, self.db) as inv:
+            self.assertEqual(inv.charms(), ['aodh', 'nova-compute'])
+            facts = inv.facts('aodh')
+            self.assertEqual(facts.charm_type, 'source-zaza')
+            self.assertEqual(facts.branch, 'master')
+            self.assertEqual(facts.gitreview_project,
+                             'openstack/charm-aodh.git')
+            self.assertEqual(facts.charm_build_name, 'aodh')
+            self.assertEqual(facts.series, ['jammy', 'noble'])
+            self.assertEqual(facts.bases, ['ubuntu@22.04'])
+            self.assertEqual(facts.zuul_templates,
+                             ['openstack-python3-charm-jobs',
+                              'openstack-cover-jobs'])
+            self.assertEqual(
+                facts.bundles,
+                ['src/tests/bundles/jammy-caracal.yaml',
+                 'src/tests/bundles/overlays/local-charm-overlay.yaml.j2'])
+            facts = inv.facts('nova-compute')
+            self.assertEqual(facts.branch, 'stable/2024.1')
+            self.assertEqual(facts.bases, ['ubuntu@22.04'])
+            self.assertEqual(facts.platforms, ['amd64', 'arm64'])
+
+    def test_queries(self):
+        self._update()
+        with inventory.Inventory(self.charms_dir, self.db) as inv:
+            self.assertEqual(inv.charms_of_type('source-zaza'), ['aodh'])
+            self.assertEqual(inv.charms_with_series('jammy'),
+                             ['aodh', 'nova-compute'])
+            self.assertEqual(inv.charms_without_series('noble'),
+                             ['nova-compute'])
+            self.assertEqual(inv.charms_with_template('openstack-python3-*'),
+                             ['aodh'])
+            self.assertEqual(inv.get('nova-compute', 'charm_type'),
+                             'classic-unknown')
+            with self.assertRaises(KeyError):
+                inv.facts('keystone')
+
+    def test_incremental(self):
+        summary = self._update()
+        self.assertEqual(summary.scanned, ['aodh', 'nova-compute'])
+        summary = self._update()
+        self.assertEqual(summary.scanned, [])
+        self.assertEqual(summary.unchanged, ['aodh', 'nova-compute'])
+        # change a fact file; only that repo is re-scanned.
+        metadata = self.charms_dir / 'nova-compute' / 'metadata.yaml'
+        metadata.write_text("name: nova-compute\nseries: [noble]\n")
+        st = metadata.stat()
+        os.utime(metadata, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        summary = self._update()
+        self.assertEqual(summary.scanned, ['nova-compute'])
+        with inventory.Inventory(self.charms_dir, self.db) as inv:
+            self.assertEqual(inv.facts('nova-compute').series, ['noble'])
+
+    def test_touched_files_are_not_rescanned(self):
+        self._update()
+        metadata = self.charms_dir / 'nova-compute' / 'metadata.yaml'
+        st = metadata.stat()
+        os.utime(metadata, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        summary = self._update()
+        self.assertEqual(summary.scanned, [])
+        self.assertEqual(summary.unchanged, ['aodh', 'nova-compute'])
+
+    def test_bundle_refs(self):
+        bundle = (self.charms_dir / 'aodh' / 'src' / 'tests' / 'bundles' /
+                  'jammy-caracal.yaml')
+        write(bundle, """\
+            applications:
+              aodh:
+                charm: ../../../aodh.charm
+              vault:
+                charm: ch:vault
+                channel: 1.7/stable
+              mysql:
+                charm: cs:~someone/mysql-innodb-cluster
+            """)
+        self._update()
+        with inventory.Inventory(self.charms_dir, self.db) as inv:
+            refs = inv.bundle_refs(['vault'])
+            self.assertEqual(
+                [(r.name, r.bundle, r.line, r.channel) for r in refs],
+                [('aodh', 'src/tests/bundles/jammy-caracal.yaml', 5,
+                  '1.7/stable')])
+            self.assertEqual(len(inv.bundle_refs()), 2)
+            self.assertEqual(inv.bundles_referencing(['vault']),
+                             {'aodh': [bundle.resolve()]})
+            self.assertEqual(
+                inv.bundles_referencing(['mysql-innodb-cluster']), {})
+        # the refs follow the changes to the bundle.
+        bundle.write_text(bundle.read_text().replace('1.7/stable',
+                                                     '1.8/stable'))
+        st = bundle.stat()
+        os.utime(bundle, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertEqual(self._update().scanned, ['aodh'])
+        with inventory.Inventory(self.charms_dir, self.db) as inv:
+            self.assertEqual([r.channel for r in inv.bundle_refs(['vault'])],
+                             ['1.8/stable'])
+
+    def test_removed_repo(self):
+        self._update()
+        shutil.rmtree(self.charms_dir / 'aodh')
+        summary = self._update()
+        self.assertEqual(summary.removed, ['aodh'])
+        with inventory.Inventory(self.charms_dir, self.db) as inv:
+            self.assertEqual(inv.charms(), ['nova-compute'])
+
+
+if __name__ == "__main__":
+    unittest.main()
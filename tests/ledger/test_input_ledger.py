@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Tests for the exit codes of input-ledger.py."""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+_REPO_ROOT = Path(__file__).parents[2]
+
+# the exit code of 'changed' when the inputs are unchanged.
+UNCHANGED = 3
+
+
+class TestInputLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charm_dir = self.tmpdir / 'aodh'
+        self.charm_dir.mkdir()
+        (self.charm_dir / 'tox.ini').write_text("[tox]\n")
+        self.env = dict(os.environ, XDG_CACHE_HOME=str(self.tmpdir / 'cache'))
+        self.env.pop('RELEASE_TOOLS_FORCE', None)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _ledger(self, cmd):
+        return subprocess.run(
+            [sys.executable, str(_REPO_ROOT / 'input-ledger.py'), cmd,
+             '--op', 'update-tox', '--charm-dir', str(self.charm_dir),
+             '--input', 'tox.ini'],
+            env=self.env, capture_output=True, text=True).returncode
+
+    def test_changed_then_unchanged(self):
+        self.assertEqual(self._ledger('changed'), 0)
+        self.assertEqual(self._ledger('record'), 0)
+        self.assertEqual(self._ledger('changed'), UNCHANGED)
+        (self.charm_dir / 'tox.ini').write_text("[tox]\nenvlist = py3\n")
+        self.assertEqual(self._ledger('changed'), 0)
+
+    def test_a_failing_ledger_is_not_unchanged(self):
+        # the ledger can't be read, as its directory is a file.
+        ledger_dir = self.tmpdir / 'cache' / 'release-tools' / 'ledger'
+        ledger_dir.mkdir(parents=True)
+        (ledger_dir / 'update-tox').write_text("")
+        rc = self._ledger('changed')
+        self.assertNotEqual(rc, 0)
+        self.assertNotEqual(rc, UNCHANGED)
+
+
+if __name__ == "__main__":
+    unittest.main()
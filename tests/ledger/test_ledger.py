@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Tests for lib/ledger.py."""
+
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from lib.ledger import Ledger, input_digest
+
+
+class TestLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charm_dir = self.tmpdir / 'charms' / 'aodh'
+        self.charm_dir.mkdir(parents=True)
+        self.global_dir = self.tmpdir / 'global'
+        self.global_dir.mkdir()
+        (self.global_dir / 'tox.ini').write_text("[tox]\n")
+        (self.charm_dir / 'tox.ini').write_text("[tox]\n")
+        (self.charm_dir / 'requirements.txt').write_text("pbr\n")
+        self.inputs = [str(self.global_dir), 'tox.ini', '*.txt']
+        self.ledger = Ledger('update-tox', self.tmpdir / 'ledger')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_not_recorded_is_changed(self):
+        self.assertFalse(self.ledger.is_unchanged(self.charm_dir,
+                                                  self.inputs))
+
+    def test_record_then_unchanged(self):
+        self.ledger.record(self.charm_dir, self.inputs)
+        self.assertTrue(self.ledger.is_unchanged(self.charm_dir,
+                                                 self.inputs))
+
+    def test_global_change_detected(self):
+        self.ledger.record(self.charm_dir, self.inputs)
+        (self.global_dir / 'tox.ini').write_text("[tox]\nskipsdist = True\n")
+        self.assertFalse(self.ledger.is_unchanged(self.charm_dir,
+                                                  self.inputs))
+
+    def test_new_glob_match_detected(self):
+        self.ledger.record(self.charm_dir, self.inputs)
+        (self.charm_dir / 'test-requirements.txt').write_text("flake8\n")
+        self.assertFalse(self.ledger.is_unchanged(self.charm_dir,
+                                                  self.inputs))
+
+    def test_missing_file_appearing_detected(self):
+        inputs = self.inputs + ['src/tox.ini']
+        self.ledger.record(self.charm_dir, inputs)
+        (self.charm_dir / 'src').mkdir()
+        (self.charm_dir / 'src' / 'tox.ini').write_text("")
+        self.assertFalse(self.ledger.is_unchanged(self.charm_dir, inputs))
+
+    def test_extra_values_in_digest(self):
+        self.ledger.record(self.charm_dir, self.inputs, ['py310'])
+        self.assertTrue(self.ledger.is_unchanged(
+            self.charm_dir, self.inputs, ['py310']))
+        self.assertFalse(self.ledger.is_unchanged(
+            self.charm_dir, self.inputs, ['py311']))
+
+    def test_operations_are_separate(self):
+        self.ledger.record(self.charm_dir, self.inputs)
+        other = Ledger('update-requirements', self.tmpdir / 'ledger')
+        self.assertFalse(other.is_unchanged(self.charm_dir, self.inputs))
+
+    def test_forget(self):
+        self.ledger.record(self.charm_dir, self.inputs)
+        self.ledger.forget(self.charm_dir)
+        self.assertIsNone(self.ledger.recorded(self.charm_dir))
+
+    def test_digest_is_independent_of_cwd_spelling(self):
+        self.assertEqual(
+            input_digest(self.charm_dir, ['tox.ini']),
+            input_digest(self.charm_dir / '..' / 'aodh', ['tox.ini']))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""Tests for lib/lp_builder.py."""
+
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import lp_builder
+
+
+OVN_YAML = """\
+# OVN Charms
+defaults:
+  team: openstack-charmers
+  branches:
+    master:
+      channels:
+        - latest/edge
+    stable/20.03:
+      channels:
+        - openstack-ussuri/edge
+        - 20.03/edge
+
+projects:
+  - name: OVN Central
+    charmhub: ovn-central
+    launchpad: charm-ovn-central
+    repository: https://opendev.org/x/charm-ovn-central.git
+  - name: OVN Chassis
+    charmhub: ovn-chassis
+    launchpad: charm-ovn-chassis
+    repository: https://opendev.org/x/charm-ovn-chassis.git
+"""
+
+MISC_YAML = """\
+# Miscellaneous Charms used for OpenStack
+defaults:
+  team: openstack-charmers
+
+projects:
+  - name: HA Cluster Charm
+    charmhub: hacluster
+    launchpad: charm-hacluster
+    repository: https://opendev.org/openstack/charm-hacluster.git
+    branches:
+      master:
+        channels:
+          - latest/edge
+      stable/focal:
+        channels:
+          - 2.0.3/edge
+  - name: Duplicate OVN Central
+    charmhub: ovn-central
+    launchpad: charm-ovn-central-dup
+    repository: https://example.com/ovn-central.git
+"""
+
+
+class TestLpBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        (self.tmpdir / 'ovn.yaml').write_text(textwrap.dedent(OVN_YAML))
+        (self.tmpdir / 'misc.yaml').write_text(textwrap.dedent(MISC_YAML))
+        patcher = mock.patch.dict(os.environ, {
+            lp_builder.CONFIG_DIR_ENV: str(self.tmpdir),
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        lp_builder.reset_caches()
+        self.addCleanup(lp_builder.reset_caches)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_charm_with_default_branches(self):
+        charm = lp_builder.Charm('ovn-chassis')
+        self.assertEqual(charm.name, 'OVN Chassis')
+        self.assertEqual(charm.section, 'ovn')
+        self.assertEqual(charm.launchpad, 'charm-ovn-chassis')
+        self.assertEqual(charm.branches, ['master', 'stable/20.03'])
+        self.assertEqual(charm.channels_for('stable/20.03'),
+                         ['openstack-ussuri/edge', '20.03/edge'])
+        self.assertEqual(charm.channels_for('stable/unknown'), [])
+        self.assertEqual(charm.project.team, 'openstack-charmers')
+        self.assertEqual(charm.raw_branches['master'],
+                         {'channels': ['latest/edge']})
+
+    def test_unknown_charm(self):
+        with self.assertRaises(KeyError):
+            lp_builder.Charm('unknown')
+
+    def test_get_charms(self):
+        self.assertEqual(
+            [c.charmhub for c in lp_builder.get_charms(':all:')],
+            ['hacluster', 'ovn-central', 'ovn-chassis'])
+        self.assertEqual(
+            [c.charmhub for c in lp_builder.get_charms('ovn')],
+            ['ovn-central', 'ovn-chassis'])
+        self.assertEqual(lp_builder.get_charms('unknown'), [])
+        self.assertEqual(sorted(lp_builder.sections()), ['misc', 'ovn'])
+
+    def test_duplicate_uses_first_section(self):
+        self.assertEqual(lp_builder.Charm('ovn-central').section, 'misc')
+        self.assertEqual(
+            [c.section for c in lp_builder.get_charms('ovn')],
+            ['misc', 'ovn'])
+        self.assertEqual(
+            lp_builder.get_config().get_by_launchpad(
+                'charm-ovn-central-dup').charmhub,
+            'ovn-central')
+        # but, as before, the branches are from the last section.
+        self.assertEqual(lp_builder.get_lp_builder_config()['ovn-central'],
+                         {'master': ['latest/edge'],
+                          'stable/20.03': ['openstack-ussuri/edge',
+                                           '20.03/edge']})
+
+    def test_lp_config_views(self):
+        config = lp_builder.get_lp_builder_config()
+        self.assertEqual(config['hacluster'],
+                         {'master': ['latest/edge'],
+                          'stable/focal': ['2.0.3/edge']})
+        self.assertEqual(
+            sorted(lp_builder.get_lp_builder_config_for('ovn').keys()),
+            ['ovn-central', 'ovn-chassis'])
+        with self.assertRaises(KeyError):
+            lp_builder.get_lp_builder_config_for('unknown')
+        # the returned views are copies.
+        config['new-charm'] = {}
+        self.assertNotIn('new-charm', lp_builder.get_lp_builder_config())
+        self.assertEqual(sorted(lp_builder.get_yaml_config().keys()),
+                         ['misc', 'ovn'])
+
+    def test_find_config_for(self):
+        config = lp_builder.find_config_for('ovn-chassis')
+        self.assertEqual(config['section'], 'ovn')
+        self.assertEqual(config['team'], 'openstack-charmers')
+        config['branches']['master']['channels'].append('other/edge')
+        self.assertEqual(
+            lp_builder.Charm('ovn-chassis').channels_for('master'),
+            ['latest/edge'])
+
+    def test_sections_are_loaded_lazily(self):
+        config = lp_builder.get_config()
+        self.assertEqual(config.loaded_sections, [])
+        self.assertEqual(
+            sorted(lp_builder.get_lp_builder_config_for('ovn').keys()),
+            ['ovn-central', 'ovn-chassis'])
+        self.assertEqual(config.loaded_sections, ['ovn'])
+        # the charms are resolved to their first section, so the sections
+        # before ovn are loaded too.
+        self.assertEqual([c.charmhub for c in lp_builder.get_charms('ovn')],
+                         ['ovn-central', 'ovn-chassis'])
+        self.assertEqual(config.loaded_sections, ['misc', 'ovn'])
+        with self.assertRaises(KeyError):
+            config.section('unknown')
+
+    def test_get_loads_sections_in_order(self):
+        config = lp_builder.get_config()
+        self.assertEqual(config.sections, ['misc', 'ovn'])
+        # hacluster is in the first section, so ovn isn't loaded.
+        self.assertEqual(lp_builder.Charm('hacluster').section, 'misc')
+        self.assertEqual(config.loaded_sections, ['misc'])
+        self.assertEqual(lp_builder.Charm('ovn-chassis').section, 'ovn')
+        self.assertEqual(config.loaded_sections, ['misc', 'ovn'])
+
+    def test_charm_is_lightweight(self):
+        charm = lp_builder.Charm('hacluster')
+        self.assertFalse(hasattr(charm, '__dict__'))
+        self.assertIs(charm.project, lp_builder.get_config().get('hacluster'))
+
+    def test_model_is_immutable(self):
+        project = lp_builder.get_config().get('hacluster')
+        with self.assertRaises(AttributeError):
+            project.section = 'other'
+        with self.assertRaises(TypeError):
+            project.branches['master'] = ('other/edge',)
+        with self.assertRaises(AttributeError):
+            lp_builder.get_config().projects = ()
+
+    def test_parse_lp_builder_config_file(self):
+        self.assertEqual(
+            lp_builder.parse_lp_builder_config_file(self.tmpdir / 'ovn.yaml'),
+            {'ovn-central': {'master': ['latest/edge'],
+                             'stable/20.03': ['openstack-ussuri/edge',
+                                              '20.03/edge']},
+             'ovn-chassis': {'master': ['latest/edge'],
+                             'stable/20.03': ['openstack-ussuri/edge',
+                                              '20.03/edge']}})
+
+
+class TestChannelTable(unittest.TestCase):
+
+    LP_CONFIG = {
+        'ovn-central': {'master': ['latest/edge'],
+                        'stable/20.03': ['openstack-ussuri/edge',
+                                         '20.03/edge']},
+        'hacluster': {'master': ['latest/edge'],
+                      'stable/focal': ['2.0.3/stable']},
+        'other': {'master': []},
+    }
+
+    def test_resolve_channel(self):
+        tracks = ['openstack-ussuri/edge', '20.03/stable']
+        self.assertEqual(lp_builder.resolve_channel(tracks),
+                         'openstack-ussuri/edge')
+        self.assertEqual(lp_builder.resolve_channel(tracks, ['openstack']),
+                         '20.03/stable')
+        self.assertEqual(
+            lp_builder.resolve_channel(tracks, ['openstack'], True),
+            '20.03/edge')
+        self.assertIsNone(lp_builder.resolve_channel(tracks, ['open', '20']))
+
+    def test_branches_are_tried_in_order(self):
+        table = lp_builder.build_channel_table(
+            self.LP_CONFIG, ['stable/focal', 'stable/20.03'])
+        self.assertEqual(dict(table.channels),
+                         {'ovn-central': 'openstack-ussuri/edge',
+                          'hacluster': '2.0.3/stable'})
+        self.assertEqual(table.branches['hacluster'], 'stable/focal')
+        self.assertIsNone(table.channel_for('other'))
+        self.assertIsNone(table.channel_for(None))
+
+    def test_ignored_tracks_fall_through_to_next_branch(self):
+        table = lp_builder.build_channel_table(
+            self.LP_CONFIG, ['stable/20.03', 'master'], ['openstack', '20'],
+            enforce_edge=True)
+        self.assertEqual(table.channel_for('ovn-central'), 'latest/edge')
+        self.assertEqual(table.branches['ovn-central'], 'master')
+
+    def test_inverted_index(self):
+        table = lp_builder.build_channel_table(
+            self.LP_CONFIG, ['master'], enforce_edge=True)
+        self.assertEqual(table.charms_for('latest/edge'),
+                         ['ovn-central', 'hacluster'])
+        self.assertEqual(table.by_channel['latest/edge'][0],
+                         ('ovn-central', 'master'))
+        self.assertEqual(table.charms_for('2.0.3/edge'), [])
+
+    def test_config_channel_tables(self):
+        tmpdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmpdir)
+        (tmpdir / 'ovn.yaml').write_text(textwrap.dedent(OVN_YAML))
+        with mock.patch.dict(os.environ, {
+                lp_builder.CONFIG_DIR_ENV: str(tmpdir),
+                lp_builder.SNAPSHOT_ENV: '0'}):
+            lp_builder.reset_caches()
+            self.addCleanup(lp_builder.reset_caches)
+            table = lp_builder.channel_table(['stable/20.03'], ['openstack'])
+            self.assertIs(table, lp_builder.channel_table(
+                ['stable/20.03'], ['openstack']))
+            self.assertEqual(table.charms_for('20.03/edge'),
+                             ['ovn-central', 'ovn-chassis'])
+            self.assertEqual(
+                lp_builder.charms_for_channel('openstack-ussuri/edge'),
+                [('ovn-central', 'stable/20.03'),
+                 ('ovn-chassis', 'stable/20.03')])
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.config_dir = self.tmpdir / 'config'
+        self.config_dir.mkdir()
+        (self.config_dir / 'ovn.yaml').write_text(textwrap.dedent(OVN_YAML))
+        (self.config_dir / 'misc.yaml').write_text(textwrap.dedent(MISC_YAML))
+        patcher = mock.patch.dict(os.environ, {
+            lp_builder.CONFIG_DIR_ENV: str(self.config_dir),
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lp_builder.reset_caches)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _load(self):
+        """Load the config, returning the number of files parsed."""
+        with mock.patch.object(lp_builder, '_parse_yaml',
+                               wraps=lp_builder._parse_yaml) as parse:
+            config = lp_builder.load_config()
+            self.assertEqual(sorted(config.by_charmhub.keys()),
+                             ['hacluster', 'ovn-central', 'ovn-chassis'])
+        return parse.call_count
+
+    def test_snapshot_used(self):
+        self.assertEqual(self._load(), 2)
+        self.assertTrue(lp_builder.snapshot_path(
+            self.config_dir / 'ovn.yaml').exists())
+        self.assertEqual(self._load(), 0)
+
+    def test_touched_file_uses_snapshot(self):
+        self._load()
+        ovn = self.config_dir / 'ovn.yaml'
+        os.utime(ovn, ns=(0, ovn.stat().st_mtime_ns + 10 ** 9))
+        self.assertEqual(self._load(), 0)
+        # and the snapshot is refreshed with the new mtime.
+        self.assertEqual(self._load(), 0)
+
+    def test_changed_file_is_parsed(self):
+        self._load()
+        ovn = self.config_dir / 'ovn.yaml'
+        ovn.write_text(ovn.read_text().replace('OVN Chassis', 'Chassis'))
+        self.assertEqual(self._load(), 1)
+        self.assertEqual(lp_builder.load_config().get('ovn-chassis').name,
+                         'Chassis')
+
+    def test_corrupt_snapshot_is_ignored(self):
+        self._load()
+        lp_builder.snapshot_path(self.config_dir / 'misc.yaml').write_bytes(
+            b'not a snapshot')
+        self.assertEqual(self._load(), 1)
+
+    def test_snapshot_disabled(self):
+        with mock.patch.dict(os.environ, {lp_builder.SNAPSHOT_ENV: '0'}):
+            self.assertEqual(self._load(), 2)
+            self.assertEqual(self._load(), 2)
+        self.assertEqual(list(lp_builder.snapshot_dir().iterdir()), [])
+
+    def test_local_config_override(self):
+        local = self.tmpdir / 'xdg' / 'charmhub_lb_tools' / 'config.yaml'
+        local.parent.mkdir(parents=True)
+        local.write_text(textwrap.dedent(OVN_YAML))
+        with mock.patch.dict(os.environ, {
+                'XDG_CONFIG_HOME': str(self.tmpdir / 'xdg')}):
+            del os.environ[lp_builder.CONFIG_DIR_ENV]
+            config = lp_builder.load_config()
+            self.assertEqual(config.sections, ['config'])
+            local.unlink()
+            local.mkdir()
+            (local / 'misc.yaml').write_text(textwrap.dedent(MISC_YAML))
+            config = lp_builder.load_config()
+            self.assertEqual(config.sections, ['misc'])
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Tests for lib/output.py."""
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import output
+
+
+class TestWriteIfChanged(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.path = self.tmpdir / 'build.lock'
+        output.reset_touched()
+        self.addCleanup(output.reset_touched)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_new_file(self):
+        self.assertTrue(output.write_if_changed(self.path, "new\n"))
+        self.assertEqual(self.path.read_text(), "new\n")
+        self.assertEqual(output.touched_files(), [self.path])
+
+    def test_unchanged_file_is_not_written(self):
+        self.path.write_text("same\n")
+        os.utime(self.path, ns=(0, 0))
+        self.assertFalse(output.write_if_changed(self.path, "same\n"))
+        self.assertFalse(output.write_lines_if_changed(self.path, ["same\n"]))
+        self.assertEqual(self.path.stat().st_mtime_ns, 0)
+        self.assertEqual(output.touched_files(), [])
+
+    def test_changed_file_keeps_mode(self):
+        self.path.write_text("old\n")
+        self.path.chmod(0o600)
+        self.assertTrue(output.write_lines_if_changed(self.path,
+                                                      ["a\n", "b\n"]))
+        self.assertEqual(self.path.read_text(), "a\nb\n")
+        self.assertEqual(stat.S_IMODE(self.path.stat().st_mode), 0o600)
+        # no temporary files are left behind.
+        self.assertEqual(list(self.tmpdir.iterdir()), [self.path])
+
+    def test_symlink_is_kept(self):
+        target = self.tmpdir / 'src' / 'metadata.yaml'
+        target.parent.mkdir()
+        target.write_text("old\n")
+        link = self.tmpdir / 'metadata.yaml'
+        link.symlink_to('src/metadata.yaml')
+        self.assertTrue(output.write_if_changed(link, "new\n"))
+        self.assertTrue(link.is_symlink())
+        self.assertEqual(target.read_text(), "new\n")
+        self.assertEqual(output.touched_files(), [link])
+        self.assertEqual(sorted(p.name for p in target.parent.iterdir()),
+                         ['metadata.yaml'])
+
+    def test_failed_write_leaves_the_file(self):
+        self.path.write_text("old\n")
+        with mock.patch.object(output.os, 'replace',
+                               side_effect=OSError("boom")):
+            with self.assertRaises(OSError):
+                output.write_if_changed(self.path, "new\n")
+        self.assertEqual(self.path.read_text(), "old\n")
+        self.assertEqual(list(self.tmpdir.iterdir()), [self.path])
+
+    def test_touched_file(self):
+        touched = self.tmpdir / 'touched.txt'
+        with mock.patch.dict(os.environ,
+                             {output.TOUCHED_FILE_ENV: str(touched)}):
+            output.write_if_changed(self.path, b"1")
+            output.write_if_changed(self.path, b"1")
+            output.write_if_changed(self.tmpdir / 'other', b"2")
+        self.assertEqual(touched.read_text().splitlines(),
+                         [str(self.path), str(self.tmpdir / 'other')])
+
+    def test_dumps(self):
+        class Dumper:
+            def dump(self, data, stream):
+                stream.write(repr(data))
+
+        self.assertEqual(output.dumps(Dumper(), [1]), "[1]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""Tests for lib/pip_compile.py and lock-with-pip-compile.py."""
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import pip_compile
+from tests.fixtures import make_charm, run_main, write
+
+# lock-with-pip-compile.py has hyphens in its name so it can't be imported
+# with a normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "lock_with_pip_compile",
+    _REPO_ROOT / "lock-with-pip-compile.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+# a stand-in for pip-compile: writes the inputs to the -o file, or fails if
+# an input contains 'conflict'.  Each compile is logged to
+# $FAKE_PIP_COMPILE_LOG, if set.
+FAKE_PIP_COMPILE = """\
+    #!/bin/sh
+    while [ $# -gt 0 ]; do
+        case "$1" in
+            --version) echo "pip-compile, version 7.3.0"; exit 0;;
+            --cache-dir) cache="$2"; shift 2;;
+            -o) out="$2"; shift 2;;
+            *) break;;
+        esac
+    done
+    [ -d "$cache" ] || { echo "no cache dir" >&2; exit 2; }
+    if grep -q conflict "$@"; then
+        echo "Could not find a version that matches conflict" >&2
+        exit 1
+    fi
+    cat "$@" > "$out"
+    [ -z "$FAKE_PIP_COMPILE_LOG" ] || echo "$out" >> "$FAKE_PIP_COMPILE_LOG"
+    """
+
+
+def make_typed_charm(charms_dir: Path, name: str, charm_type: str) -> Path:
+    charm_dir = make_charm(charms_dir, name,
+                           source=charm_type == 'source-zaza')
+    write(charm_dir / 'requirements.txt', "charmhelpers\n")
+    write(charm_dir / 'test-requirements.txt', "stestr\n")
+    if charm_type == 'source-zaza':
+        write(charm_dir / 'src' / 'test-requirements.txt', "zaza\n")
+    if charm_type == 'classic-zaza':
+        write(charm_dir / 'charm-helpers-hooks.yaml', "repo: x\n")
+    return charm_dir
+
+
+def make_venvs(venvs_dir: Path) -> None:
+    for python in ('python3.8', 'python3.10'):
+        path = pip_compile.pip_compile_path(python, venvs_dir)
+        write(path, FAKE_PIP_COMPILE)
+        path.chmod(0o755)
+
+
+class TestPlanCharm(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _outputs(self, jobs):
+        return [(job.step.python, job.step.output) for job in jobs]
+
+    def test_classic(self):
+        charm_dir = make_typed_charm(self.tmpdir, 'aodh', 'classic-zaza')
+        jobs, notes = pip_compile.plan_charm(charm_dir, 'classic-zaza')
+        self.assertEqual(notes, [
+            "Moving file requirements.txt -> requirements.in",
+            "Moving file test-requirements.txt -> test-requirements.in"])
+        self.assertTrue((charm_dir / 'requirements.in').exists())
+        self.assertFalse((charm_dir / 'requirements.txt').exists())
+        self.assertEqual(self._outputs(jobs), [
+            ('python3.8', 'merged-requirements-py38.txt'),
+            ('python3.10', 'merged-requirements-py310.txt'),
+            ('python3.8', 'test-requirements-py38.txt')])
+        self.assertEqual({job.charm_dir for job in jobs}, {charm_dir})
+
+    def test_source_skips_existing_output(self):
+        charm_dir = make_typed_charm(self.tmpdir, 'barbican', 'source-zaza')
+        write(charm_dir / 'merged-requirements-py310.txt', "locked\n")
+        jobs, notes = pip_compile.plan_charm(charm_dir, 'source-zaza')
+        self.assertIn("file merged-requirements-py310.txt already exists; "
+                      "not overwriting", notes)
+        self.assertEqual(self._outputs(jobs), [
+            ('python3.8', 'merged-requirements-py38.txt'),
+            ('python3.8', 'src/test-requirements-py38.txt'),
+            ('python3.8', 'test-requirements-py38.txt'),
+            ('python3.10', 'test-requirements-py310.txt')])
+
+    def test_in_already_exists(self):
+        charm_dir = make_typed_charm(self.tmpdir, 'ceph', 'ops-zaza')
+        write(charm_dir / 'requirements.in', "ops\n")
+        jobs, notes = pip_compile.plan_charm(charm_dir, 'ops-zaza')
+        self.assertEqual(notes[0], "in file requirements.in already exists; "
+                                   "not moving .txt -> .in")
+        # requirements.txt is kept, so it isn't compiled again.
+        self.assertEqual(self._outputs(jobs), [
+            ('python3.8', 'merged-requirements-py38.txt'),
+            ('python3.10', 'merged-requirements-py310.txt')])
+
+    def test_missing_inputs(self):
+        charm_dir = make_typed_charm(self.tmpdir, 'aodh', 'classic-zaza')
+        (charm_dir / 'test-requirements.txt').unlink()
+        with self.assertRaises(FileNotFoundError):
+            pip_compile.plan_charm(charm_dir, 'classic-zaza')
+
+    def test_unknown_type(self):
+        charm_dir = make_typed_charm(self.tmpdir, 'aodh', 'classic-zaza')
+        self.assertEqual(pip_compile.plan_charm(charm_dir, 'unknown-zaza'),
+                         ([], ["Not locking unknown-zaza"]))
+        self.assertTrue((charm_dir / 'requirements.txt').exists())
+
+
+class TestCacheSlots(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_slots_are_not_shared(self):
+        slots = pip_compile.CacheSlots(2)
+        with slots.take() as first, slots.take() as second:
+            self.assertNotEqual(first, second)
+            self.assertTrue(first.is_dir())
+            taken = threading.Event()
+
+            def take():
+                with slots.take():
+                    taken.set()
+
+            thread = threading.Thread(target=take)
+            thread.start()
+            self.assertFalse(taken.wait(0.1))
+        thread.join()
+        self.assertTrue(taken.is_set())
+
+
+class TestLockWithPipCompile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charms_dir = self.tmpdir / 'charms'
+        self.venvs_dir = self.tmpdir / 'venvs'
+        make_venvs(self.venvs_dir)
+        self.classic = make_typed_charm(self.charms_dir, 'aodh',
+                                        'classic-zaza')
+        self.source = make_typed_charm(self.charms_dir, 'barbican',
+                                       'source-zaza')
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _main(self, *args):
+        return run_main(_mod, ['lock-with-pip-compile.py',
+                               '--charms-dir', str(self.charms_dir),
+                               '--venvs-dir', str(self.venvs_dir),
+                               '--max-age', '0', '-j', '2', *args])
+
+    def test_lock(self):
+        lines = self._main()
+        self.assertIn("aodh: locked merged-requirements-py38.txt, "
+                      "merged-requirements-py310.txt, "
+                      "test-requirements-py38.txt", lines)
+        self.assertEqual(lines[-1],
+                         "2 charm(s): 2 changed, 0 unchanged, 0 failed")
+        self.assertEqual(
+            (self.classic / 'merged-requirements-py38.txt').read_text(),
+            "charmhelpers\nstestr\n")
+        self.assertEqual(
+            (self.source / 'src' / 'test-requirements-py38.txt').read_text(),
+            "zaza\n")
+
+        # the inputs are unchanged, so nothing is done again...
+        lines = self._main()
+        self.assertIn("aodh: unchanged", lines)
+        self.assertEqual(lines[-1],
+                         "2 charm(s): 0 changed, 2 unchanged, 0 failed")
+        # ...and with --force the existing outputs are not overwritten.
+        (self.classic / 'merged-requirements-py38.txt').write_text("kept\n")
+        lines = self._main('--force', '--only', 'aodh')
+        self.assertIn("aodh: locked nothing", lines)
+        self.assertIn("    file merged-requirements-py38.txt already exists; "
+                      "not overwriting", lines)
+        self.assertEqual(
+            (self.classic / 'merged-requirements-py38.txt').read_text(),
+            "kept\n")
+
+    def test_failed_compile_is_not_recorded(self):
+        write(self.source / 'src' / 'test-requirements.txt', "conflict\n")
+        lines = self._main()
+        self.assertIn("barbican: FAILED: pip-compile -o "
+                      "src/test-requirements-py38.txt failed: Could not find "
+                      "a version that matches conflict", lines)
+        self.assertEqual(lines[-2:], [
+            "2 charm(s): 1 changed, 0 unchanged, 1 failed", "exit 1"])
+        # the other compiles of the charm were still run.
+        self.assertTrue(
+            (self.source / 'merged-requirements-py38.txt').exists())
+
+        # the failed charm is tried again; only the failed compile is left.
+        write(self.source / 'src' / 'test-requirements.in', "zaza\n")
+        lines = self._main()
+        self.assertIn("aodh: unchanged", lines)
+        self.assertIn("barbican: locked src/test-requirements-py38.txt",
+                      lines)
+
+    def test_relative_venvs_dir(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir)
+        self.addCleanup(os.chdir, cwd)
+        lines = run_main(_mod, ['lock-with-pip-compile.py',
+                                '--charms-dir', 'charms',
+                                '--venvs-dir', 'venvs',
+                                '--max-age', '0', '-j', '2'])
+        self.assertEqual(lines[-1],
+                         "2 charm(s): 2 changed, 0 unchanged, 0 failed")
+
+    def test_missing_venv(self):
+        shutil.rmtree(self.venvs_dir / 'python3.10-venv')
+        with mock.patch.object(pip_compile.shutil, 'which',
+                               return_value=None):
+            lines = self._main('--only', 'aodh')
+        self.assertIn("aodh: FAILED: pip-compile is missing at "
+                      f"{self.venvs_dir}/python3.10-venv/bin/pip-compile",
+                      lines)
+        self.assertTrue(
+            (self.classic / 'merged-requirements-py38.txt').exists())
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charms_dir = self.tmpdir / 'charms'
+        self.venvs_dir = self.tmpdir / 'venvs'
+        self.log = self.tmpdir / 'compiles.log'
+        make_venvs(self.venvs_dir)
+        self.charm_dirs = [make_typed_charm(self.charms_dir, name, 'ops-zaza')
+                           for name in ('aodh', 'barbican', 'ceph')]
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache'),
+            'FAKE_PIP_COMPILE_LOG': str(self.log)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _main(self, *args):
+        return run_main(_mod, ['lock-with-pip-compile.py',
+                               '--charms-dir', str(self.charms_dir),
+                               '--venvs-dir', str(self.venvs_dir), *args])
+
+    def _compiles(self):
+        return self.log.read_text().splitlines() if self.log.exists() else []
+
+    def test_normalise_requirements(self):
+        write(self.tmpdir / 'a.in', "# a comment\n\n  ops  # pinned\n"
+                                    "-r b.in\ngit+x@master#egg=y\n")
+        write(self.tmpdir / 'b.in', "requests\n-r a.in\n")
+        self.assertEqual(
+            pip_compile.normalise_requirements(self.tmpdir / 'a.in'),
+            "ops\n-r b.in\nrequests\n-r a.in\ngit+x@master#egg=y\n")
+        self.assertEqual(
+            pip_compile.normalise_requirements(self.tmpdir / 'c.in'),
+            "<missing>\n")
+
+    def test_same_inputs_are_compiled_once(self):
+        # the comments and blank lines don't change the resolution.
+        write(self.charm_dirs[1] / 'test-requirements.txt',
+              "# tests\n\nstestr  # the runner\n")
+        lines = self._main('-j', '3')
+        self.assertEqual(sorted(self._compiles()), [
+            'merged-requirements-py310.txt', 'merged-requirements-py38.txt',
+            'requirements.txt'])
+        self.assertEqual(lines[-2:], [
+            "3 compile(s) run, 6 from the results cache",
+            "3 charm(s): 3 changed, 0 unchanged, 0 failed"])
+        self.assertEqual(sum("(cached)" in line for line in lines), 2)
+        for charm_dir in self.charm_dirs:
+            self.assertEqual(
+                (charm_dir / 'merged-requirements-py38.txt').read_text(),
+                (self.charm_dirs[0] /
+                 'merged-requirements-py38.txt').read_text())
+
+        # a new charm, or a charm whose outputs were removed, is locked from
+        # the cache without compiling.
+        make_typed_charm(self.charms_dir, 'designate', 'ops-zaza')
+        lines = self._main('-j', '2', '--only', 'designate')
+        self.assertIn("designate: locked merged-requirements-py38.txt "
+                      "(cached), merged-requirements-py310.txt (cached), "
+                      "requirements.txt (cached)", lines)
+        self.assertEqual(len(self._compiles()), 3)
+
+    def test_what_is_in_the_key(self):
+        self._main('-j', '1', '--only', 'aodh')
+        self.assertEqual(len(self._compiles()), 3)
+        # a different index is resolved again.
+        with mock.patch.dict(os.environ, {'PIP_INDEX_URL': 'http://mirror'}):
+            self._main('-j', '1', '--only', 'barbican')
+        self.assertEqual(len(self._compiles()), 6)
+        # as is a different input.
+        write(self.charm_dirs[2] / 'requirements.txt', "charmhelpers\nops\n")
+        self._main('-j', '1', '--only', 'ceph')
+        self.assertEqual(self._compiles()[6:], [
+            'merged-requirements-py38.txt', 'merged-requirements-py310.txt',
+            'requirements.txt'])
+
+    def test_max_age(self):
+        self._main('-j', '1', '--only', 'aodh')
+        # make the results a day old.
+        results = self.tmpdir / 'cache' / 'release-tools' / \
+            'pip-compile-results'
+        day_ago = time.time() - 86400
+        for entry in results.rglob('*'):
+            if entry.is_file():
+                os.utime(entry, (day_ago, day_ago))
+        self._main('-j', '1', '--only', 'barbican', '--max-age', '2')
+        self.assertEqual(len(self._compiles()), 3)
+        lines = self._main('-j', '1', '--only', 'ceph', '--max-age', '0.5')
+        self.assertEqual(len(self._compiles()), 6)
+        self.assertEqual(lines[-2], "3 compile(s) run, 0 from the results "
+                                    "cache")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Tests for lib/pipeline.py and run-pipeline.py."""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import pipeline
+from tests.fixtures import write
+
+# run-pipeline.py has a hyphen in its name so it can't be imported with a
+# normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "run_pipeline",
+    _REPO_ROOT / "run-pipeline.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+REACTIVE_CHARMCRAFT = (_REPO_ROOT / 'tests' / 'charm_tools' /
+                       'reactive_charm.yaml')
+TOX_INI = _REPO_ROOT / 'tests' / 'update_tox' / 'tox_py310_only.ini'
+
+SPEC = """\
+    transforms:
+      - charmcraft.charm-tools:
+          channel: 3.x/stable
+      - zuul.add-charmbuild
+      - tox.add-py3:
+          version: "3.12"
+          template: "3.10"
+      - metadata.add-series:
+          series: noble
+    """
+
+
+def make_charm(charms_dir: Path, name: str) -> Path:
+    charm_dir = charms_dir / name
+    charm_dir.mkdir(parents=True)
+    shutil.copy(REACTIVE_CHARMCRAFT, charm_dir / 'charmcraft.yaml')
+    shutil.copy(TOX_INI, charm_dir / 'tox.ini')
+    write(charm_dir / 'src' / 'metadata.yaml', f"""\
+        name: {name}
+        series:
+          - jammy
+        """)
+    write(charm_dir / 'metadata.yaml', f"name: {name}\nseries: [jammy]\n")
+    write(charm_dir / '.zuul.yaml', """\
+        - project:
+            templates:
+              - openstack-python3-charm-jobs
+        """)
+    write(charm_dir / 'osci.yaml', """\
+        - project:
+            vars:
+              charmcraft_channel: 2.x/stable
+        """)
+    return charm_dir
+
+
+class TestParsePipeline(unittest.TestCase):
+
+    def test_steps(self):
+        p = pipeline.parse_pipeline({'transforms': [
+            'charmcraft.cc3ify',
+            {'build-lock.delete': {'type': 'layer', 'item': 'layer:basic'}},
+            {'zuul.replace-template': {'pattern': 'a*', 'with': 'b'}},
+        ]})
+        self.assertEqual([s.name for s in p.steps],
+                         ['charmcraft.cc3ify', 'build-lock.delete',
+                          'zuul.replace-template'])
+        self.assertEqual(p.steps[0].params, {'base': None, 'platforms': None})
+        self.assertEqual(p.steps[1].params,
+                         {'type': 'layer', 'item': 'layer:basic',
+                          'package': None})
+        self.assertEqual(p.kinds(), ['charmcraft', 'build-lock', 'zuul'])
+
+    def test_hyphenated_params(self):
+        p = pipeline.parse_pipeline({'transforms': [
+            {'charmcraft.charm-tools': {'add-build-arguments': '-v'}}]})
+        self.assertEqual(p.steps[0].params['add_build_arguments'], '-v')
+
+    def test_invalid(self):
+        for data in (None,
+                     {'transforms': []},
+                     {'transforms': ['no.such-transform']},
+                     {'transforms': [{'tox.add-py3': {'version': '3.12'}}]},
+                     {'transforms': [{'metadata.add-series': {
+                         'series': 'noble', 'colour': 'red'}}]},
+                     {'transforms': [{'a': {}, 'b': {}}]}):
+            with self.subTest(data=data):
+                with self.assertRaises(pipeline.PipelineError):
+                    pipeline.parse_pipeline(data)
+
+
+class TestRunCharm(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charms_dir = self.tmpdir / 'charms'
+        self.charm_dir = make_charm(self.charms_dir, 'aodh')
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _pipeline(self, spec=SPEC):
+        spec_file = self.tmpdir / 'spec.yaml'
+        write(spec_file, spec)
+        return pipeline.load_pipeline(spec_file)
+
+    def _run(self, p):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pipeline.run_charm(self.charm_dir, p)
+
+    def test_all_files(self):
+        result = self._run(self._pipeline())
+        self.assertEqual(
+            result.written,
+            [self.charm_dir / f for f in ('charmcraft.yaml', '.zuul.yaml',
+                                          'tox.ini', 'metadata.yaml')])
+        self.assertEqual(result.missing, [])
+        self.assertIn('charm/3.x/stable',
+                      (self.charm_dir / 'charmcraft.yaml').read_text())
+        zuul = (self.charm_dir / '.zuul.yaml').read_text()
+        self.assertIn('charmbuild_charmcraft_channel: 2.x/stable', zuul)
+        self.assertIn('charm_build_name: aodh', zuul)
+        self.assertIn('[testenv:py312]',
+                      (self.charm_dir / 'tox.ini').read_text())
+        # the root metadata.yaml is used, not the one in src/.
+        self.assertIn('noble', (self.charm_dir / 'metadata.yaml').read_text())
+        self.assertNotIn(
+            'noble', (self.charm_dir / 'src' / 'metadata.yaml').read_text())
+        # osci.yaml is only read.
+        self.assertEqual(self._run(self._pipeline()).written, [])
+
+    def test_metadata_symlink(self):
+        (self.charm_dir / 'metadata.yaml').unlink()
+        (self.charm_dir / 'metadata.yaml').symlink_to('src/metadata.yaml')
+        self._run(self._pipeline())
+        self.assertTrue((self.charm_dir / 'metadata.yaml').is_symlink())
+        self.assertIn(
+            'noble', (self.charm_dir / 'src' / 'metadata.yaml').read_text())
+
+    def test_failure_writes_nothing(self):
+        before = {p: p.read_text() for p in self.charm_dir.iterdir()
+                  if p.is_file()}
+        p = self._pipeline(SPEC.replace('"3.10"', '"3.9"'))
+        with self.assertRaises(ValueError):
+            self._run(p)
+        self.assertEqual({p: p.read_text() for p in before}, before)
+
+    def test_missing_file(self):
+        (self.charm_dir / 'tox.ini').unlink()
+        result = self._run(self._pipeline())
+        self.assertEqual(result.missing, ['tox.ini'])
+        self.assertIn(self.charm_dir / 'charmcraft.yaml', result.written)
+
+    def test_same_as_tools(self):
+        other = make_charm(self.tmpdir / 'other', 'aodh')
+        self._run(self._pipeline())
+        tox = pipeline.load_tool('update-tox.py')
+        with contextlib.redirect_stdout(io.StringIO()):
+            tox.add_py3(argparse.Namespace(tox_ini=other / 'tox.ini',
+                                           version='3.12', template='3.10'))
+        self.assertEqual((self.charm_dir / 'tox.ini').read_text(),
+                         (other / 'tox.ini').read_text())
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charms_dir = self.tmpdir / 'charms'
+        make_charm(self.charms_dir, 'aodh')
+        make_charm(self.charms_dir, 'barbican')
+        (self.charms_dir / 'barbican' / 'osci.yaml').write_text("[]\n")
+        self.spec = self.tmpdir / 'spec.yaml'
+        write(self.spec, SPEC)
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _main(self, *argv):
+        out = io.StringIO()
+        with mock.patch('sys.argv', ['run-pipeline.py', *argv]), \
+                contextlib.redirect_stdout(out):
+            try:
+                _mod.main()
+                code = 0
+            except SystemExit as e:
+                code = e.code
+        return code, out.getvalue().splitlines()
+
+    def test_report(self):
+        code, lines = self._main('--charms-dir', str(self.charms_dir),
+                                 '-j', '1', str(self.spec))
+        self.assertEqual(code, 1)
+        self.assertIn("aodh: changed charmcraft.yaml, .zuul.yaml, tox.ini, "
+                      "metadata.yaml", lines)
+        self.assertTrue(any(line.startswith("barbican: FAILED: "
+                                            "'charmcraft_channel' not found")
+                            for line in lines))
+        self.assertEqual(lines[-1],
+                         "2 charm(s): 1 changed, 0 unchanged, 1 failed")
+        self.assertNotIn('noble', (self.charms_dir / 'barbican' /
+                                   'metadata.yaml').read_text())
+
+    def test_only(self):
+        code, lines = self._main('--charms-dir', str(self.charms_dir),
+                                 '--only', 'aodh', '-j', '1', str(self.spec))
+        self.assertEqual(code, 0)
+        self.assertEqual(lines[-1],
+                         "1 charm(s): 1 changed, 0 unchanged, 0 failed")
+
+    def test_bad_spec(self):
+        write(self.spec, "transforms:\n  - tox.add-py3\n")
+        code, _ = self._main('--charms-dir', str(self.charms_dir),
+                             str(self.spec))
+        self.assertEqual(code, 1)
+
+    def test_list(self):
+        code, lines = self._main('--list')
+        self.assertEqual(code, 0)
+        self.assertIn("tox.add-py3: version (required), template (required)",
+                      lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Tests for lib/profiling.py."""
+
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import profiling
+
+
+def _work():
+    time.sleep(0.03)
+    return [str(i) * 10 for i in range(10000)]
+
+
+class TestOptions(unittest.TestCase):
+
+    def test_parse_modes(self):
+        self.assertEqual(profiling.parse_modes(None), set())
+        self.assertEqual(profiling.parse_modes('0'), set())
+        self.assertEqual(profiling.parse_modes('1'), set(profiling.MODES))
+        self.assertEqual(profiling.parse_modes('cprofile, memory'),
+                         {'cprofile', 'memory'})
+        with self.assertRaises(ValueError):
+            profiling.parse_modes('cprofile,bogus')
+
+    def test_pop_profile_option(self):
+        argv = ['tool', '--profile', 'add', 'x']
+        self.assertEqual(profiling.pop_profile_option(argv), 'cprofile')
+        self.assertEqual(argv, ['tool', 'add', 'x'])
+        argv = ['tool', 'add', '--profile=sample,memory']
+        self.assertEqual(profiling.pop_profile_option(argv), 'sample,memory')
+        self.assertEqual(argv, ['tool', 'add'])
+        argv = ['tool', 'run', '--', 'cmd', '--profile']
+        self.assertIsNone(profiling.pop_profile_option(argv))
+        self.assertEqual(argv, ['tool', 'run', '--', 'cmd', '--profile'])
+
+
+class TestProfiled(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        patcher = mock.patch.dict(os.environ, {
+            profiling.PROFILE_DIR_ENV: str(self.tmpdir),
+            profiling.BATCH_ID_ENV: 'batch-1',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _profile(self, tool):
+        with profiling.profiled(profiling.MODES, tool=tool) as written:
+            _work()
+        return written
+
+    def test_profiled_writes_each_mode(self):
+        written = self._profile('tool')
+        self.assertEqual(set(written), set(profiling.MODES))
+        for path in written.values():
+            self.assertEqual(path.parent, self.tmpdir / 'batch-1')
+            self.assertTrue(path.name.startswith('tool-'))
+        stats = pstats.Stats(str(written['cprofile']))
+        self.assertTrue(any(func[2] == '_work' for func in stats.stats))
+        self.assertTrue(any('_work' in stack for stack in
+                            profiling.read_folded(written['sample'])))
+        with open(written['memory']) as f:
+            memory = json.load(f)
+        self.assertGreater(memory['peak'], 0)
+
+    def test_profiled_on_exit(self):
+        with self.assertRaises(SystemExit):
+            with profiling.profiled(['cprofile'], tool='tool') as written:
+                raise SystemExit(1)
+        self.assertTrue(written['cprofile'].exists())
+
+    def test_run_profiled_disabled(self):
+        with mock.patch.object(profiling.sys, 'argv', ['tool']), \
+                mock.patch.dict(os.environ, {profiling.PROFILE_ENV: ''}):
+            self.assertEqual(profiling.run_profiled(lambda x: x + 1, 1), 2)
+        self.assertFalse((self.tmpdir / 'batch-1').exists())
+
+    def test_merge_profiles(self):
+        # two invocations need different file names.
+        with mock.patch.object(profiling.os, 'getpid', return_value=1):
+            self._profile('tool')
+        with mock.patch.object(profiling.os, 'getpid', return_value=2):
+            self._profile('tool')
+        merged = profiling.merge_profiles(self.tmpdir / 'batch-1')
+        self.assertEqual(set(merged), set(profiling.MODES))
+        stats = pstats.Stats(str(merged['cprofile']))
+        work = [v for k, v in stats.stats.items() if k[2] == '_work']
+        # (primitive calls, total calls, ...)
+        self.assertEqual(work[0][1], 2)
+        with open(merged['memory']) as f:
+            memory = json.load(f)
+        self.assertEqual(memory['invocations'], 2)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Tests for lib/readonly.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from lib import readonly
+from tests.fixtures import write
+
+
+class TestLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        readonly.cache_clear()
+        self.addCleanup(readonly.cache_clear)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cached(self):
+        path = self.tmpdir / 'a.yaml'
+        write(path, "name: aodh\n")
+        data = readonly.load(path)
+        self.assertEqual(data, {'name': 'aodh'})
+        self.assertIs(readonly.load(path), data)
+        self.assertIs(readonly.load(str(path)), data)
+
+    def test_changed_file_is_reloaded(self):
+        path = self.tmpdir / 'a.yaml'
+        write(path, "name: aodh\n")
+        readonly.load(path)
+        # same size; only the mtime differs.
+        write(path, "name: nova\n")
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertEqual(readonly.load(path), {'name': 'nova'})
+
+    def test_load_or_none(self):
+        write(self.tmpdir / 'bad.yaml', "a: [\n")
+        self.assertIsNone(readonly.load_or_none(self.tmpdir / 'bad.yaml'))
+        self.assertIsNone(readonly.load_or_none(self.tmpdir / 'missing.yaml'))
+        with self.assertRaises(FileNotFoundError):
+            readonly.load(self.tmpdir / 'missing.yaml')
+
+
+class TestCharmQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.charm_dir = Path(tempfile.mkdtemp())
+        readonly.cache_clear()
+        self.addCleanup(readonly.cache_clear)
+
+    def tearDown(self):
+        shutil.rmtree(self.charm_dir)
+
+    def test_metadata_path(self):
+        self.assertIsNone(readonly.metadata_path(self.charm_dir))
+        write(self.charm_dir / 'src' / 'metadata.yaml', "name: src\n")
+        (self.charm_dir / 'metadata.yaml').symlink_to('src/metadata.yaml')
+        self.assertEqual(readonly.metadata_path(self.charm_dir),
+                         self.charm_dir / 'src' / 'metadata.yaml')
+        (self.charm_dir / 'metadata.yaml').unlink()
+        write(self.charm_dir / 'metadata.yaml', "name: root\n")
+        self.assertEqual(readonly.metadata(self.charm_dir), {'name': 'root'})
+
+    def test_osci_var(self):
+        self.assertIsNone(
+            readonly.osci_var(self.charm_dir, 'charm_build_name'))
+        write(self.charm_dir / 'osci.yaml', """\
+            - project:
+                templates:
+                  - charm-unit-jobs-py310
+            - project:
+                vars:
+                  # charm_build_name: commented-out
+                  charm_build_name: aodh
+                  needs_charm_build: false
+            """)
+        self.assertEqual(
+            readonly.osci_var(self.charm_dir, 'charm_build_name'), 'aodh')
+        self.assertIs(
+            readonly.osci_var(self.charm_dir, 'needs_charm_build'), False)
+        self.assertEqual(
+            readonly.osci_var(self.charm_dir, 'charmcraft_channel', 'x'), 'x')
+
+
+if __name__ == "__main__":
+    unittest.main()
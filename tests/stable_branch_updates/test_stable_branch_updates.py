@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Tests for stable-branch-updates.py."""
+
+import importlib.util
+import os
+import shutil
+import subprocess
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tests.fixtures import run_main, write
+
+# stable-branch-updates.py has a hyphen in its name so it can't be imported
+# with a normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "stable_branch_updates",
+    _REPO_ROOT / "stable-branch-updates.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'Test', 'GIT_AUTHOR_EMAIL': 'test@example.com',
+    'GIT_COMMITTER_NAME': 'Test', 'GIT_COMMITTER_EMAIL': 'test@example.com',
+    'GIT_CONFIG_GLOBAL': os.devnull, 'GIT_CONFIG_NOSYSTEM': '1',
+}
+
+ZAZA = textwrap.dedent("""\
+    git+https://github.com/openstack-charmers/zaza.git#egg=zaza
+    git+https://github.com/openstack-charmers/zaza-openstack-tests.git#egg=zaza.openstack
+    """)
+
+
+def _git(cwd: Path, *args: str) -> str:
+    return subprocess.run(['git', *args], cwd=cwd, check=True,
+                          capture_output=True, text=True).stdout
+
+
+def make_charm(tmpdir: Path, name: str, reactive: bool) -> Path:
+    """Make an origin for a charm, with a stable/2023.1 branch, and clone it
+    into tmpdir/charms/<name>."""
+    work = tmpdir / 'work' / name
+    work.mkdir(parents=True)
+    _git(work, 'init', '-q', '-b', 'master')
+    write(work / '.gitreview', f"""\
+        [gerrit]
+        host=review.opendev.org
+        port=29418
+        project=openstack/charm-{name}.git
+        """)
+    write(work / 'charm-helpers-hooks.yaml', """\
+        repo: https://github.com/juju/charm-helpers
+        destination: charmhelpers
+        """)
+    if reactive:
+        write(work / 'src' / 'layer.yaml', "includes: []\n")
+        write(work / 'src' / 'wheelhouse.txt', """\
+            git+https://github.com/openstack/charms.openstack.git#egg=charms.openstack
+            git+https://github.com/juju/charm-helpers.git#egg=charmhelpers
+            """)
+        write(work / 'src' / 'test-requirements.txt', ZAZA)
+    else:
+        write(work / 'test-requirements.txt', ZAZA)
+    _git(work, 'add', '-A')
+    _git(work, 'commit', '-q', '-m', 'init')
+    _git(work, 'branch', 'stable/2023.1')
+    origin = tmpdir / 'origins' / f"{name}.git"
+    _git(tmpdir, 'clone', '-q', '--bare', str(work), str(origin))
+    charm_dir = tmpdir / 'charms' / name
+    _git(tmpdir, 'clone', '-q', str(origin), str(charm_dir))
+    return charm_dir
+
+
+class TestRewrites(unittest.TestCase):
+
+    def test_pin_to_stable(self):
+        self.assertEqual(
+            _mod.pin_to_stable(ZAZA, (_mod.ZAZA_GIT,
+                                      _mod.ZAZA_OPENSTACK_TESTS_GIT),
+                               'antelope'),
+            ZAZA.replace('.git#', '.git@stable/antelope#'))
+        # only at the end of the line in the charm-helpers yaml files.
+        self.assertEqual(
+            _mod.pin_to_stable(
+                "repo: https://github.com/juju/charm-helpers\n"
+                "x: https://github.com/juju/charm-helpers.git\n",
+                (_mod.CHARM_HELPERS_REPO,), 'antelope'),
+            "repo: https://github.com/juju/charm-helpers@stable/antelope\n"
+            "x: https://github.com/juju/charm-helpers.git\n")
+
+    def test_update_gitreview(self):
+        self.assertEqual(_mod.update_gitreview("[gerrit]\n", "2023.1"),
+                         "[gerrit]\n\ndefaultbranch=stable/2023.1\n")
+        content = "[gerrit]\ndefaultbranch=stable/zed\n"
+        self.assertEqual(_mod.update_gitreview(content, "2023.1"), content)
+
+
+class TestStableBranchUpdates(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache'), **GIT_ENV})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.reactive = make_charm(self.tmpdir, 'aodh', reactive=True)
+        self.classic = make_charm(self.tmpdir, 'cinder', reactive=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_reactive(self):
+        result = _mod.update_charm(self.reactive, 'antelope', '2023.1')
+        self.assertEqual(result.branch, '2023.1-updates')
+        self.assertEqual(
+            [str(p.relative_to(self.reactive)) for p in result.written],
+            ['.gitreview', 'charm-helpers-hooks.yaml', 'src/wheelhouse.txt',
+             'src/test-requirements.txt'])
+        self.assertEqual(_git(self.reactive, 'branch', '--show-current'),
+                         "2023.1-updates\n")
+        self.assertEqual(
+            _git(self.reactive, 'status', '--short').splitlines(),
+            ["M  .gitreview", "M  charm-helpers-hooks.yaml",
+             " M src/test-requirements.txt", " M src/wheelhouse.txt"])
+        self.assertIn(
+            "charms.openstack.git@stable/antelope#egg=charms.openstack\n"
+            "git+https://github.com/juju/charm-helpers.git@stable/antelope#",
+            (self.reactive / 'src' / 'wheelhouse.txt').read_text())
+        self.assertTrue((self.reactive / '.gitreview').read_text().endswith(
+            "\ndefaultbranch=stable/2023.1\n"))
+
+        # and again is a no-op.
+        result = _mod.update_charm(self.reactive, 'antelope', '2023.1')
+        self.assertEqual(result, _mod.StableResult(None, False, []))
+
+    def test_existing_branch(self):
+        _git(self.classic, 'branch', '2023.1-updates', 'origin/stable/2023.1')
+        result = _mod.update_charm(self.classic, 'antelope', '2023.1',
+                                   fetch=False)
+        self.assertEqual(result.branch, '2023.1-updates')
+        self.assertIn("zaza.git@stable/antelope#",
+                      (self.classic / 'test-requirements.txt').read_text())
+
+    def test_gerrit_remote(self):
+        # the gerrit remote can't be fetched here.
+        result = _mod.update_charm(self.classic, 'antelope', '2023.1',
+                                   fetch=False, username='jdoe')
+        self.assertTrue(result.gerrit_remote)
+        self.assertEqual(
+            _git(self.classic, 'remote', 'get-url', 'gerrit').strip(),
+            "ssh://jdoe@review.openstack.org:29418/openstack/charm-cinder.git")
+        self.assertFalse(_mod.ensure_gerrit_remote(self.classic, 'jdoe'))
+
+    def test_main(self):
+        shutil.rmtree(self.tmpdir / 'origins' / 'cinder.git')
+        lines = run_main(_mod, ['stable-branch-updates.py', '--charms-dir',
+                                str(self.tmpdir / 'charms'),
+                                'antelope', '2023.1'])
+        self.assertTrue(lines[0].startswith(
+            "aodh: on 2023.1-updates; changed .gitreview"))
+        self.assertTrue(lines[1].startswith(
+            "cinder: FAILED: git fetch --all --quiet failed: "))
+        self.assertEqual(lines[-2:], [
+            "2 charm(s): 1 changed, 0 unchanged, 1 failed", "exit 1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Import-time budget for the tools' entry points.
+
+Each tool is run with `python -X importtime <tool> --help` and the imports
+are checked: the heavy modules (network clients, yaml parsers, profilers and
+pools) must only be imported on the code paths that use them, and the total
+import time must be within a budget.  The budget is generous, so that slow
+machines don't fail, and can be changed with $RELEASE_TOOLS_IMPORT_BUDGET_MS.
+"""
+
+import os
+from pathlib import Path
+import subprocess
+import sys
+from typing import Dict, Tuple
+import unittest
+
+
+_REPO_ROOT = Path(__file__).parents[2]
+
+BUDGET_ENV = 'RELEASE_TOOLS_IMPORT_BUDGET_MS'
+DEFAULT_BUDGET_MS = 250
+
+# modules that no tool should import just to start up.
+HEAVY_MODULES = (
+    'concurrent.futures',
+    'cProfile',
+    'git',
+    'humanize',
+    'importlib.metadata',
+    'launchpadlib',
+    'pstats',
+    'requests',
+    'ruamel.yaml',
+    'tracemalloc',
+    'yaml',
+)
+
+# the tools, and the heavy modules that they need anyway.
+TOOLS = {
+    '_update-charmcraft.py': (),
+    '_update-metadata.py': (),
+    'add-new-release.py': (),
+    'batch-profile.py': ('pstats',),
+    'batch-timing.py': (),
+    'charm-inventory.py': (),
+    'charmhub-releaser.py': (),
+    'charmhub-track-cleaner.py': (),
+    'charmhub-track-closer.py': (),
+    'code-imports-status.py': (),
+    'fetch-charms.py': (),
+    'get-build-artifacts.py': (),
+    'input-ledger.py': (),
+    'lock-with-pip-compile.py': (),
+    'merge-ops-requirements-and-pip-freeze.py': (),
+    'run-pipeline.py': (),
+    'stable-branch-updates.py': (),
+    'update-build-lock.py': (),
+    'update-channel-single.py': (),
+    'update-tox.py': (),
+    'update-zuul-jobs.py': (),
+}
+
+
+def import_times(tool: str) -> Tuple[Dict[str, int], int]:
+    """Run the tool with --help and parse the -X importtime output.
+
+    :returns: the cumulative import time, in microseconds, of each module,
+        and the total of the top level imports.
+    """
+    env = dict(os.environ)
+    # let the modules' bytecode be cached, so that compiling isn't timed.
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', str(_REPO_ROOT / tool),
+         '--help'],
+        cwd=_REPO_ROOT, env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE, text=True, check=False)
+    modules: Dict[str, int] = {}
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        try:
+            cumulative_us = int(cumulative)
+        except ValueError:
+            # the header line.
+            continue
+        modules[name.strip()] = cumulative_us
+        if not name.startswith('  '):
+            total += cumulative_us
+    return modules, total
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_tools_are_known(self):
+        tools = {path.name for path in _REPO_ROOT.glob('*.py')}
+        # run-benchmarks.py is a development tool that needs the parsers.
+        tools.discard('run-benchmarks.py')
+        self.assertEqual(tools, set(TOOLS.keys()))
+
+    def test_no_heavy_imports_at_startup(self):
+        for tool, allowed in TOOLS.items():
+            with self.subTest(tool=tool):
+                modules, _ = import_times(tool)
+                self.assertTrue(modules)
+                heavy = sorted(m for m in HEAVY_MODULES
+                               if m in modules and m not in allowed)
+                self.assertEqual(heavy, [])
+
+    def test_import_time_budget(self):
+        budget_ms = int(os.environ.get(BUDGET_ENV, DEFAULT_BUDGET_MS))
+        for tool in TOOLS:
+            with self.subTest(tool=tool):
+                # the first run caches the bytecode; use the best of the rest.
+                best = min(import_times(tool)[1] for _ in range(3))
+                self.assertLessEqual(
+                    best / 1000, budget_ms,
+                    f"{tool} took {best / 1000:.1f}ms to import; the budget "
+                    f"is {budget_ms}ms (${BUDGET_ENV})")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Tests for lib/timing.py."""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import timing
+
+
+class TestTimed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.timing_file = self.tmpdir / 'timing.jsonl'
+        patcher = mock.patch.dict(os.environ, {
+            timing.TIMING_FILE_ENV: str(self.timing_file),
+            timing.BATCH_ID_ENV: 'batch-1',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_timed_records_stage(self):
+        with timing.timed('clone', charm='aodh', tool='test') as stage:
+            stage.bytes_moved = 100
+        records = timing.load_records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['batch'], 'batch-1')
+        self.assertEqual(records[0]['charm'], 'aodh')
+        self.assertEqual(records[0]['stage'], 'clone')
+        self.assertEqual(records[0]['tool'], 'test')
+        self.assertEqual(records[0]['status'], 0)
+        self.assertEqual(records[0]['bytes'], 100)
+        self.assertGreaterEqual(records[0]['duration'], 0.0)
+
+    def test_timed_records_failure(self):
+        with self.assertRaises(ValueError):
+            with timing.timed('transform', charm='aodh'):
+                raise ValueError("boom")
+        with self.assertRaises(SystemExit):
+            with timing.timed('transform', charm='barbican'):
+                raise SystemExit(3)
+        records = timing.load_records()
+        self.assertEqual([r['status'] for r in records], [1, 3])
+
+    def test_disabled(self):
+        with mock.patch.dict(os.environ, {timing.TIMING_ENABLED_ENV: '0'}):
+            with timing.timed('clone', charm='aodh'):
+                pass
+        self.assertFalse(self.timing_file.exists())
+
+    def test_load_records_batch(self):
+        timing.record('clone', 1.0, 1.0, charm='aodh')
+        with mock.patch.dict(os.environ, {timing.BATCH_ID_ENV: 'batch-2'}):
+            timing.record('clone', 2.0, 1.0, charm='aodh')
+        with self.timing_file.open('a') as f:
+            f.write("not json\n")
+        self.assertEqual(len(timing.load_records()), 2)
+        self.assertEqual(len(timing.load_records(batch='batch-2')), 1)
+        self.assertEqual(timing.last_batch(timing.load_records()), 'batch-2')
+
+
+_REPO_ROOT = Path(__file__).parents[2]
+
+# a batch script with a stage whose middle step fails.
+SHELL_SCRIPT = """\
+source "{repo}/lib/timing.sh"
+function three_steps {{
+    echo first
+    false
+    echo third
+}}
+{call}
+"""
+TIMED_CALL = """\
+timed lock aodh three_steps
+echo "after: $?"
+"""
+# the way to take the status in a set -e script, as in do-batch-with-cmd2.
+CAPTURED_CALL = """\
+set +e
+timed lock aodh three_steps
+rc=$?
+set -e
+echo "after: $rc"
+"""
+
+
+class TestTimedShell(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.timing_file = self.tmpdir / 'timing.jsonl'
+        patcher = mock.patch.dict(os.environ, {
+            timing.TIMING_FILE_ENV: str(self.timing_file),
+            timing.BATCH_ID_ENV: 'batch-1',
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, *options, call=TIMED_CALL):
+        script = self.tmpdir / 'batch'
+        script.write_text(SHELL_SCRIPT.format(repo=_REPO_ROOT, call=call))
+        return subprocess.run(['bash', *options, str(script)],
+                              capture_output=True, text=True)
+
+    def test_failing_step_stops_the_function(self):
+        proc = self._run()
+        self.assertEqual(proc.stdout.splitlines(), ["first", "after: 1"])
+        records = timing.load_records()
+        self.assertEqual([(r['stage'], r['charm'], r['status'])
+                          for r in records], [('lock', 'aodh', 1)])
+
+    def test_failing_step_stops_a_set_e_script(self):
+        proc = self._run('-e')
+        self.assertEqual(proc.returncode, 1)
+        self.assertEqual(proc.stdout.splitlines(), ["first"])
+        self.assertEqual([r['status'] for r in timing.load_records()], [1])
+
+    def test_status_captured_in_a_set_e_script(self):
+        proc = self._run('-e', call=CAPTURED_CALL)
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(proc.stdout.splitlines(), ["first", "after: 1"])
+
+
+class TestSummarise(unittest.TestCase):
+
+    def _record(self, stage, charm, start, duration, status=0):
+        return {'batch': 'b', 'stage': stage, 'charm': charm,
+                'start': start, 'duration': duration, 'status': status,
+                'bytes': None}
+
+    def test_empty(self):
+        report = timing.summarise([])
+        self.assertEqual(report.critical_path, 0.0)
+        self.assertIsNone(report.critical_charm)
+
+    def test_summarise(self):
+        records = [
+            self._record('fetch', None, 0.0, 2.0),
+            self._record('clone', 'aodh', 2.0, 3.0),
+            self._record('commit', 'aodh', 5.0, 1.0),
+            self._record('clone', 'barbican', 2.0, 5.0, status=1),
+        ]
+        report = timing.summarise(records, top=1)
+        self.assertEqual(report.critical_charm, 'barbican')
+        self.assertEqual(report.critical_path, 7.0)
+        self.assertEqual(report.serial_total, 11.0)
+        self.assertEqual(report.wall, 7.0)
+        self.assertEqual(len(report.slowest_charms), 1)
+        self.assertEqual(report.slowest_stages[0].name, 'clone')
+        self.assertEqual(report.slowest_stages[0].count, 2)
+        self.assertEqual(report.slowest_stages[0].failures, 1)
+        self.assertIn("barbican", timing.format_report(report))
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""Tests for update-build-lock.py."""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# update-build-lock.py has hyphens in its name so it can't be imported with a
+# normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "update_build_lock",
+    _REPO_ROOT / "update-build-lock.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+def make_locks():
+    return {'locks': [
+        {'type': 'layer', 'item': 'layer:basic', 'branch': 'master',
+         'commit': 'abc'},
+        {'type': 'python_module', 'package': 'charmhelpers',
+         'branch': 'master', 'version': '1'},
+        {'type': 'python_module', 'package': 'Tempita', 'version': '0.5'},
+        {'type': 'python_module', 'package': 'Tempita', 'version': '0.6'},
+    ]}
+
+
+def _args(**kwargs):
+    return argparse.Namespace(**{'item': None, 'package': None, 'spec': None,
+                                 **kwargs})
+
+
+class TestOperations(unittest.TestCase):
+
+    def test_add(self):
+        locks = make_locks()
+        result = _mod.add_lock(_args(type='python_module', package='zaza',
+                                     spec='{"version": "2"}'), locks)
+        self.assertIs(result, locks)
+        self.assertEqual(locks['locks'][-1],
+                         {'type': 'python_module', 'package': 'zaza',
+                          'version': '2'})
+        with self.assertRaisesRegex(RuntimeError, "already exists"):
+            _mod.add_lock(_args(type='python_module', package='zaza',
+                                spec='{}'), locks)
+
+    def test_modify(self):
+        locks = _mod.modify_lock(
+            _args(type='python_module', package='charmhelpers',
+                  spec='{"branch": "stable/2024.1"}'), make_locks())
+        self.assertEqual(locks['locks'][1]['branch'], 'stable/2024.1')
+        with self.assertRaisesRegex(RuntimeError, "Couldn't find"):
+            _mod.modify_lock(_args(type='layer', item='layer:nope',
+                                   spec='{}'), locks)
+        with self.assertRaisesRegex(RuntimeError, "Couldn't decode"):
+            _mod.modify_lock(_args(type='layer', item='layer:basic',
+                                   spec='{'), locks)
+
+    def test_delete_removes_all_matches(self):
+        locks = _mod.delete_lock(_args(type='python_module',
+                                       package='Tempita'), make_locks())
+        self.assertEqual([s.get('package') for s in locks['locks']],
+                         [None, 'charmhelpers'])
+        with self.assertRaisesRegex(RuntimeError, "Couldn't find"):
+            _mod.delete_lock(_args(type='python_module', package='Tempita'),
+                             locks)
+
+    def test_lock_layer(self):
+        locks = _mod.lock_layer(_args(type='layer'), make_locks())
+        self.assertEqual(locks['locks'][0]['branch'], 'abc')
+        self.assertEqual(locks['locks'][1]['branch'], 'master')
+
+    def test_index_follows_edits(self):
+        index = _mod.LockIndex(make_locks())
+        _mod.delete_from(index, _args(type='layer', item='layer:basic'))
+        _mod.add_to(index, _args(type='layer', item='layer:basic',
+                                 spec={'commit': 'def'}))
+        _mod.modify_in(index, _args(type='layer', item='layer:basic',
+                                    spec={'branch': 'x'}))
+        self.assertEqual(index.locks['locks'][-1],
+                         {'commit': 'def', 'type': 'layer',
+                          'item': 'layer:basic', 'branch': 'x'})
+
+
+class TestLoadOps(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _load(self, text):
+        path = self.tmpdir / 'ops.jsonl'
+        path.write_text(textwrap.dedent(text))
+        return _mod.load_ops(path)
+
+    def test_load(self):
+        ops = self._load(
+            '# comment\n'
+            '\n'
+            '{"op": "delete", "type": "python_module", "package": "Tempita"}\n'
+            '{"op": "modify", "type": "layer", "item": "layer:basic", '
+            '"spec": {"branch": "x"}}\n'
+            '{"op": "lock-layer", "type": "layer"}\n')
+        self.assertEqual(ops, [
+            _mod.LockOp('delete', 'python_module', package='Tempita'),
+            _mod.LockOp('modify', 'layer', item='layer:basic',
+                        spec={'branch': 'x'}),
+            _mod.LockOp('lock-layer', 'layer'),
+        ])
+
+    def test_invalid(self):
+        for line in ('{"op": "rename", "type": "layer", "item": "a"}',
+                     '{"op": "delete", "type": "snap", "item": "a"}',
+                     '{"op": "delete", "type": "layer", "package": "a"}',
+                     '{"op": "add", "type": "layer", "item": "a"}',
+                     '{"op": "delete", "type": "layer", "item": "a", "x": 1}',
+                     '["delete"]',
+                     '{"op": '):
+            with self.subTest(line=line):
+                with self.assertRaisesRegex(RuntimeError, r"ops.jsonl:1: "):
+                    self._load(line + "\n")
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.files = []
+        for charm in ('aodh', 'barbican', 'cinder'):
+            path = self.tmpdir / charm / 'src' / 'build.lock'
+            path.parent.mkdir(parents=True)
+            path.write_text(json.dumps(make_locks(), indent=2))
+            self.files.append(path)
+        # barbican doesn't have charmhelpers locked.
+        locks = make_locks()
+        del locks['locks'][1]
+        self.files[1].write_text(json.dumps(locks, indent=2))
+        self.ops = self.tmpdir / 'ops.jsonl'
+        self.ops.write_text(
+            '{"op": "delete", "type": "python_module", "package": "Tempita"}\n'
+            '{"op": "modify", "type": "python_module", '
+            '"package": "charmhelpers", '
+            '"spec": {"branch": "stable/2024.1"}}\n')
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _main(self, *argv):
+        out = io.StringIO()
+        with mock.patch('sys.argv', ['update-build-lock.py', *argv]), \
+                contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(io.StringIO()):
+            try:
+                _mod.main()
+                code = 0
+            except SystemExit as e:
+                code = e.code
+        return code, out.getvalue().splitlines()
+
+    def test_apply(self):
+        before = self.files[1].read_text()
+        code, lines = self._main(
+            '-j', '1', '--file', str(self.tmpdir / '*' / 'src' / 'build.lock'),
+            'apply', '--ops', str(self.ops))
+        self.assertEqual(code, 1)
+        self.assertEqual(lines[0], f"{self.files[0]}: changed")
+        self.assertTrue(lines[1].startswith(f"{self.files[1]}: FAILED: "))
+        self.assertEqual(lines[-1],
+                         "3 file(s): 2 changed, 0 unchanged, 1 failed")
+        # the failed file isn't written, even though the delete worked.
+        self.assertEqual(self.files[1].read_text(), before)
+        locks = json.loads(self.files[2].read_text())
+        self.assertEqual([s.get('package') for s in locks['locks']],
+                         [None, 'charmhelpers'])
+        self.assertEqual(locks['locks'][1]['branch'], 'stable/2024.1')
+
+    def test_one_operation_on_many_files(self):
+        code, lines = self._main(
+            '-j', '1', '--file', str(self.files[0]), '--file',
+            str(self.files[2]), '--type', 'python_module', '--package',
+            'charmhelpers', 'modify', '--spec', '{"version": "2"}')
+        self.assertEqual(code, 0)
+        self.assertEqual(lines[-1],
+                         "2 file(s): 2 changed, 0 unchanged, 0 failed")
+
+    def test_arguments(self):
+        for argv in (('--file', 'x', 'delete'),
+                     ('--file', 'x', '--type', 'layer', 'delete'),
+                     ('--type', 'layer', '--item', 'a', 'delete'),
+                     ('--file', 'x', '--type', 'layer', 'apply', '--ops',
+                      'y')):
+            with self.subTest(argv=argv):
+                code, _ = self._main(*argv)
+                self.assertEqual(code, 2)
+
+    def test_failure_exit_code(self):
+        # a RuntimeError (here, no such package to delete) is logged, and the
+        # script exits non-zero.
+        proc = subprocess.run(
+            [sys.executable, str(_REPO_ROOT / 'update-build-lock.py'),
+             '--file', str(self.files[1]), '--type', 'python_module',
+             '--package', 'nothing-here', 'delete'],
+            capture_output=True, text=True,
+            env=dict(os.environ, XDG_CACHE_HOME=str(self.tmpdir / 'cache')))
+        self.assertEqual(proc.returncode, 1)
+        self.assertIn("Problem with arguments or file", proc.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Tests for update-channel-single.py."""
+
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import lp_builder
+
+# update-channel-single.py has a hyphen in its name so it can't be imported
+# with a normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "update_channel_single",
+    _REPO_ROOT / "update-channel-single.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+LP_CONFIG = {
+    'keystone': {'master': ['latest/edge'],
+                 'stable/2024.1': ['2024.1/candidate']},
+    'ceph-mon': {'master': ['latest/edge'],
+                 'stable/reef': ['reef/stable']},
+    'hacluster': {'master': ['latest/edge']},
+}
+
+BUNDLE = """\
+local_overlay_enabled: False
+applications:
+  keystone:
+    charm: ch:keystone
+    channel: latest/edge
+    num_units: 1
+  ceph-mon:
+    charm: cs:~openstack-charmers-next/ceph-mon
+    num_units: 3
+  hacluster:
+    charm: ch:hacluster
+    channel: 2.4/edge
+  mysql:
+    charm: ch:mysql-innodb-cluster
+    channel: 8.0/edge
+"""
+
+
+class TestModifyChannel(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.bundle = self.tmpdir / 'jammy-caracal.yaml'
+        self.bundle.write_text(BUNDLE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _modify(self, branches, ignore_tracks=(), enforce_edge=False,
+                channel_table=None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            _mod.modify_channel(
+                list(LP_CONFIG.keys()), LP_CONFIG, self.bundle, None,
+                branches, True, list(ignore_tracks), None, False,
+                enforce_edge, channel_table)
+        return self.bundle.read_text()
+
+    def test_branches(self):
+        result = self._modify(['stable/2024.1', 'stable/reef'])
+        self.assertIn("  keystone:\n    charm: ch:keystone\n"
+                      "    channel: 2024.1/candidate\n", result)
+        self.assertIn("    charm: ch:ceph-mon\n    num_units: 3\n"
+                      "    channel: reef/stable\n", result)
+        # no matching branch, so the channel is left alone.
+        self.assertIn("    charm: ch:hacluster\n    channel: 2.4/edge\n",
+                      result)
+        self.assertIn("    channel: 8.0/edge\n", result)
+
+    def test_ignore_and_enforce_edge(self):
+        result = self._modify(['stable/reef', 'master'], ['reef'], True)
+        self.assertIn("    charm: ch:keystone\n    channel: latest/edge\n",
+                      result)
+        self.assertIn("    num_units: 3\n    channel: latest/edge\n", result)
+        self.assertIn("    charm: ch:hacluster\n    channel: latest/edge\n",
+                      result)
+
+    def test_remove_unresolved(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            changed = _mod.modify_channel(
+                ['keystone', 'ceph-mon', 'hacluster', 'mysql-innodb-cluster'],
+                LP_CONFIG, self.bundle, None, ['stable/2024.1'], True, [],
+                None, False, False, None, True)
+        self.assertTrue(changed)
+        result = self.bundle.read_text()
+        self.assertIn("    charm: ch:keystone\n    channel: 2024.1/candidate\n"
+                      "    num_units: 1\n", result)
+        self.assertIn("    charm: ch:hacluster\n  mysql:\n", result)
+        self.assertIn("    charm: ch:mysql-innodb-cluster\n", result)
+        self.assertNotIn("8.0/edge", result)
+
+    def test_unchanged_bundle_is_not_written(self):
+        self._modify(['stable/2024.1'])
+        mtime = self.bundle.stat().st_mtime_ns
+        with contextlib.redirect_stdout(io.StringIO()):
+            changed = _mod.modify_channel(
+                list(LP_CONFIG.keys()), LP_CONFIG, self.bundle, None,
+                ['stable/2024.1'], True, [], None, False, False)
+        self.assertFalse(changed)
+        self.assertEqual(self.bundle.stat().st_mtime_ns, mtime)
+
+    def test_channel_table_is_used(self):
+        table = lp_builder.build_channel_table(
+            LP_CONFIG, ['stable/2024.1'], enforce_edge=True)
+        result = self._modify(['stable/2024.1'], channel_table=table)
+        self.assertIn("    channel: 2024.1/edge\n", result)
+
+
+class TestFleet(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        for charm in ('charm-a', 'charm-b', 'charm-c'):
+            bundles = self.tmpdir / charm / 'tests' / 'bundles'
+            bundles.mkdir(parents=True)
+            (bundles / 'jammy-caracal.yaml').write_text(BUNDLE)
+        # charm-c's bundle is already up to date.
+        (self.tmpdir / 'charm-c' / 'tests' / 'bundles' /
+         'jammy-caracal.yaml').write_text(
+            BUNDLE.replace('latest/edge', '2024.1/candidate'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_args(self):
+        args = _mod.parse_args(['--remove-channel', '--branch', 'master',
+                                '--charms-dir', 'charms', '-j', '4'])
+        self.assertTrue(args.remove_channel)
+        self.assertEqual(args.branches, ['master'])
+        self.assertEqual(args.charms_dir, Path('charms'))
+        self.assertEqual(args.workers, 4)
+        with contextlib.redirect_stderr(io.StringIO()):
+            for argv in ([],
+                         ['--channel', 'x', '--remove-channel'],
+                         ['--channel', 'x', '--branch', 'master'],
+                         ['--remove-channel', '--charms-dir', 'c', 'dir']):
+                with self.assertRaises(SystemExit):
+                    _mod.parse_args(argv)
+
+    def test_update_fleet(self):
+        charm_dirs = _mod.find_charm_dirs(self.tmpdir)
+        update = _mod.BundleUpdate(
+            charms=list(LP_CONFIG.keys()),
+            lp_config=LP_CONFIG,
+            channel=None,
+            branches=['stable/2024.1'],
+            ensure_charmhub_prefix=False,
+            ignore_tracks=[],
+            disable_local_overlay=False,
+            set_local_charm=False,
+            enforce_edge=False,
+            channel_table=lp_builder.build_channel_table(
+                LP_CONFIG, ['stable/2024.1']),
+            remove_unresolved=False)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            failed = _mod.update_fleet(charm_dirs, update, workers=2)
+        self.assertEqual(failed, 0)
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            ['charm-a: 1 file(s) changed',
+             '    tests/bundles/jammy-caracal.yaml',
+             'charm-b: 1 file(s) changed',
+             '    tests/bundles/jammy-caracal.yaml',
+             'charm-c: no changes',
+             '2 of 3 charm(s) changed, 0 failed.'])
+        for charm_dir in charm_dirs:
+            self.assertIn(
+                "channel: 2024.1/candidate",
+                (charm_dir / 'tests' / 'bundles' /
+                 'jammy-caracal.yaml').read_text())
+
+    def _update(self, **kwargs):
+        fields = dict(charms=list(LP_CONFIG.keys()),
+                      lp_config=LP_CONFIG,
+                      channel=None,
+                      branches=['stable/2024.1'],
+                      ensure_charmhub_prefix=False,
+                      ignore_tracks=[],
+                      disable_local_overlay=False,
+                      set_local_charm=False,
+                      enforce_edge=False,
+                      channel_table=lp_builder.build_channel_table(
+                          LP_CONFIG, ['stable/2024.1']),
+                      remove_unresolved=False)
+        fields.update(kwargs)
+        return _mod.BundleUpdate(**fields)
+
+    def test_target_charms(self):
+        self.assertEqual(_mod.target_charms(self._update()), ['keystone'])
+        self.assertEqual(
+            _mod.target_charms(self._update(charms=['mysql-innodb-cluster'],
+                                            remove_unresolved=True)),
+            ['keystone', 'mysql-innodb-cluster'])
+        self.assertEqual(
+            _mod.target_charms(self._update(charms=['vault'], branches=[],
+                                            channel='1.8/stable')),
+            ['vault'])
+
+    def test_targeted_update(self):
+        bundles = self.tmpdir / 'charm-d' / 'tests' / 'bundles'
+        bundles.mkdir(parents=True)
+        (bundles / 'jammy-caracal.yaml').write_text(
+            BUNDLE.replace('ch:keystone', 'ch:vault'))
+        with mock.patch.dict(os.environ, {
+                'XDG_CACHE_HOME': str(self.tmpdir / 'cache')}):
+            targeted = _mod.find_targeted_bundles(
+                self.tmpdir, ['keystone'], workers=1)
+        self.assertEqual(sorted(targeted), ['charm-a', 'charm-b', 'charm-c'])
+        update = self._update(bundles=targeted)
+        mtime = (bundles / 'jammy-caracal.yaml').stat().st_mtime_ns
+        charm_dirs = [d for d in _mod.find_charm_dirs(self.tmpdir)
+                      if d.name in targeted]
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            failed = _mod.update_fleet(charm_dirs, update, workers=2)
+        self.assertEqual(failed, 0)
+        self.assertEqual(out.getvalue().splitlines()[-1],
+                         '2 of 3 charm(s) changed, 0 failed.')
+        self.assertEqual((bundles / 'jammy-caracal.yaml').stat().st_mtime_ns,
+                         mtime)
+
+    def test_use_inventory_args(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            for argv in (['--channel', 'x', '--use-inventory'],
+                         ['--channel', 'x', '--use-inventory',
+                          '--charms-dir', 'c', '--ensure-charmhub']):
+                with self.assertRaises(SystemExit):
+                    _mod.parse_args(argv)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Tests for the multi-file mode of _update-charmcraft.py."""
+
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# _update-charmcraft.py has a hyphen in its name so it can't be imported with a
+# normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "_update_charmcraft",
+    _REPO_ROOT / "_update-charmcraft.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+FIXTURE = _REPO_ROOT / 'tests' / 'charm_tools' / 'reactive_charm.yaml'
+EXPECTED = (_REPO_ROOT / 'tests' / 'charm_tools' /
+            'reactive_charm_expected.yaml')
+
+
+class TestMultiFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        for charm in ('charm-a', 'charm-b'):
+            (self.tmpdir / charm).mkdir()
+            shutil.copy(FIXTURE, self.tmpdir / charm / 'charmcraft.yaml')
+        (self.tmpdir / 'charm-c').mkdir()
+        (self.tmpdir / 'charm-c' / 'charmcraft.yaml').write_text(
+            "type: charm\n")
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _main(self, *argv):
+        out = io.StringIO()
+        with mock.patch('sys.argv', ['_update-charmcraft.py', *argv]), \
+                contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(io.StringIO()):
+            try:
+                _mod.main()
+                code = 0
+            except SystemExit as e:
+                code = e.code
+        return code, out.getvalue().splitlines()
+
+    def test_parse_args(self):
+        args = _mod.parse_args(['-j', '2', 'a.yaml', 'b.yaml', 'cc3ify'])
+        self.assertEqual(args.filenames, ['a.yaml', 'b.yaml'])
+        self.assertEqual(args.workers, 2)
+        self.assertEqual(args.cmd, 'cc3ify')
+
+    def test_expand_filenames(self):
+        pattern = str(self.tmpdir / '*' / 'charmcraft.yaml')
+        missing = str(self.tmpdir / 'missing.yaml')
+        self.assertEqual(
+            _mod.expand_filenames([pattern, missing, pattern]),
+            [str(self.tmpdir / c / 'charmcraft.yaml')
+             for c in ('charm-a', 'charm-b', 'charm-c')] + [missing])
+
+    def test_report_and_exit_status(self):
+        pattern = str(self.tmpdir / 'charm-[ab]' / 'charmcraft.yaml')
+        missing = str(self.tmpdir / 'missing.yaml')
+        code, lines = self._main('-j', '1', pattern, missing,
+                                 'charm-tools', '--channel', '3.x/stable')
+        self.assertEqual(code, 0)
+        self.assertEqual(lines, [
+            f"{self.tmpdir}/charm-a/charmcraft.yaml: changed",
+            f"{self.tmpdir}/charm-b/charmcraft.yaml: changed",
+            f"{missing}: missing",
+            "3 file(s): 2 changed, 0 unchanged, 1 missing, 0 failed"])
+        for charm in ('charm-a', 'charm-b'):
+            self.assertEqual(
+                (self.tmpdir / charm / 'charmcraft.yaml').read_text(),
+                EXPECTED.read_text())
+        # a second run changes nothing.
+        code, lines = self._main('-j', '1', pattern,
+                                 'charm-tools', '--channel', '3.x/stable')
+        self.assertEqual(lines[-1],
+                         "2 file(s): 0 changed, 2 unchanged, 0 missing, "
+                         "0 failed")
+
+    def test_only_failed_files_fail(self):
+        broken = self.tmpdir / 'charm-c' / 'charmcraft.yaml'
+        broken.write_text("parts: [\n")
+        pattern = str(self.tmpdir / '*' / 'charmcraft.yaml')
+        code, lines = self._main('-j', '1', pattern,
+                                 'charm-tools', '--channel', '3.x/stable')
+        self.assertEqual(code, 1)
+        self.assertTrue(lines[2].startswith(f"{broken}: FAILED: "))
+        self.assertEqual(lines[-1],
+                         "3 file(s): 2 changed, 0 unchanged, 0 missing, "
+                         "1 failed")
+        self.assertEqual(broken.read_text(), "parts: [\n")
+
+    def test_yaml_instance_is_reused(self):
+        self.assertIs(_mod.get_yaml(), _mod.get_yaml())
+
+
+if __name__ == "__main__":
+    unittest.main()
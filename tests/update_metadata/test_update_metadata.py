@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Tests for _update-metadata.py."""
+
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import readonly
+
+# _update-metadata.py has a hyphen in its name so it can't be imported with a
+# normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "update_metadata",
+    _REPO_ROOT / "_update-metadata.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+METADATA = """\
+name: {name}
+# the series
+series:
+- jammy
+- noble
+tags: [openstack]
+"""
+
+
+class TestUpdateMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charms_dir = self.tmpdir / 'charms'
+        for name in ('aodh', 'barbican'):
+            (self.charms_dir / name).mkdir(parents=True)
+            (self.charms_dir / name / 'metadata.yaml').write_text(
+                METADATA.format(name=name))
+        # a reactive charm, with the metadata in src/
+        src = self.charms_dir / 'cinder' / 'src'
+        src.mkdir(parents=True)
+        (src / 'metadata.yaml').write_text(
+            "name: cinder\nseries:\n- focal\n- jammy\n")
+        (self.charms_dir / 'cinder' / 'metadata.yaml').symlink_to(
+            'src/metadata.yaml')
+        readonly.cache_clear()
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _main(self, *argv):
+        out = io.StringIO()
+        with mock.patch('sys.argv', ['_update-metadata.py', *argv,
+                                     '--charms-dir', str(self.charms_dir),
+                                     '-j', '1']), \
+                contextlib.redirect_stdout(out):
+            try:
+                _mod.run()
+                code = 0
+            except SystemExit as e:
+                code = e.code
+        return code, out.getvalue().splitlines()
+
+    def _read(self, name):
+        return (self.charms_dir / name / 'metadata.yaml').read_text()
+
+    def test_single_charm(self):
+        code, lines = self._main('aodh', 'add', 'Focal')
+        self.assertEqual(code, 0)
+        self.assertEqual(lines, ["Adding series 'focal' to metadata"])
+        self.assertEqual(self._read('aodh'),
+                         METADATA.format(name='aodh').replace(
+                             "- noble\n", "- noble\n- focal\n"))
+        code, lines = self._main('aodh', 'list')
+        self.assertEqual(lines, ["Series are: jammy, noble, focal"])
+
+    def test_add_several(self):
+        code, lines = self._main('all', 'add', 'noble', 'oracular')
+        self.assertEqual(code, 0)
+        self.assertEqual(lines, [
+            "aodh: changed",
+            "    Series 'noble' already present; continuing",
+            "    Adding series 'oracular' to metadata",
+            "barbican: changed",
+            "    Series 'noble' already present; continuing",
+            "    Adding series 'oracular' to metadata",
+            "cinder: changed",
+            "    Adding series 'noble' to metadata",
+            "    Adding series 'oracular' to metadata",
+            "3 charm(s): 3 changed, 0 unchanged, 0 failed"])
+        # the symlink is kept and src/metadata.yaml is updated.
+        self.assertTrue(
+            (self.charms_dir / 'cinder' / 'metadata.yaml').is_symlink())
+        self.assertEqual(self._read('cinder'),
+                         "name: cinder\nseries:\n- focal\n- jammy\n- noble\n"
+                         "- oracular\n")
+
+    def test_remove_unchanged_not_written(self):
+        path = self.charms_dir / 'aodh' / 'metadata.yaml'
+        path.write_text(path.read_text().replace("- noble", "-   noble"))
+        before = path.stat().st_mtime_ns
+        code, lines = self._main('all', 'remove', 'focal')
+        self.assertEqual(lines[0], "aodh: unchanged")
+        self.assertEqual(lines[-1],
+                         "3 charm(s): 1 changed, 2 unchanged, 0 failed")
+        self.assertEqual(path.stat().st_mtime_ns, before)
+
+    def test_ensure(self):
+        code, lines = self._main('all', 'ensure', 'noble', 'jammy')
+        self.assertEqual(code, 0)
+        self.assertIn("aodh: unchanged", lines)
+        self.assertEqual(self._read('cinder'),
+                         "name: cinder\nseries:\n- jammy\n- noble\n")
+
+    def test_check(self):
+        code, lines = self._main('all', 'check', 'jammy', 'noble')
+        self.assertEqual(code, 1)
+        self.assertEqual(lines, [
+            "jammy OK  aodh", "noble OK  aodh",
+            "jammy OK  barbican", "noble OK  barbican",
+            "jammy OK  cinder", "noble NOT FOUND  cinder"])
+        code, _ = self._main('all', 'check', 'jammy')
+        self.assertEqual(code, 0)
+
+    def test_failures(self):
+        (self.charms_dir / 'barbican' / 'metadata.yaml').write_text(
+            "name: barbican\n")
+        (self.charms_dir / 'designate').mkdir()
+        code, lines = self._main('all', 'add', 'oracular')
+        self.assertEqual(code, 1)
+        self.assertIn("designate: FAILED: Can't find metadata!", lines)
+        self.assertEqual(lines[-1],
+                         "4 charm(s): 2 changed, 0 unchanged, 2 failed")
+
+    def test_bad_args(self):
+        self.assertEqual(self._main('aodh', 'frob')[0], 1)
+        self.assertEqual(self._main('aodh', 'add')[0], 1)
+        code, lines = self._main('keystone', 'list')
+        self.assertEqual(code, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Tests for the section index, several versions and several files in
+update-tox.py."""
+
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+from unittest import mock
+
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "update_tox",
+    _REPO_ROOT / "update-tox.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+TOX_PY310_ONLY = Path(__file__).parent / "tox_py310_only.ini"
+
+
+class TestIndexSections(unittest.TestCase):
+
+    def test_spans(self):
+        content = textwrap.dedent("""\
+            [tox]
+            envlist = py3
+
+            [testenv:py310]
+            deps = {[testenv]deps}
+                foo[extra]
+            # a comment
+            [testenv:pep8]
+            commands = flake8""")
+        sections = _mod.index_sections(content)
+        self.assertEqual(list(sections), ['tox', 'testenv:py310',
+                                          'testenv:pep8'])
+        py310 = sections['testenv:py310']
+        # '[' in the body doesn't end the section.
+        self.assertEqual(content[py310.start:py310.end],
+                         "[testenv:py310]\ndeps = {[testenv]deps}\n"
+                         "    foo[extra]\n# a comment\n")
+        self.assertEqual(sections['testenv:pep8'].end, len(content))
+
+    def test_clone_several_versions(self):
+        content = TOX_PY310_ONLY.read_text()
+        new = _mod.clone_py3_sections(content, ['3.12', '3.13', '3.12'],
+                                      '3.10')
+        sections = _mod.index_sections(new)
+        names = list(sections)
+        self.assertEqual(
+            names[names.index('testenv:py310'):][:4],
+            ['testenv:py310', 'testenv:py312', 'testenv:py313',
+             'testenv:pep8'])
+        py313 = sections['testenv:py313']
+        self.assertIn("basepython = python3.13\n",
+                      new[py313.start:py313.end])
+        # and again is a no-op.
+        self.assertEqual(
+            _mod.clone_py3_sections(new, ['3.12', '3.13'], '3.10'), new)
+
+    def test_template_at_end_without_newline(self):
+        content = "[testenv:py310]\nbasepython = python3.10"
+        self.assertEqual(
+            _mod.clone_py3_section(content, '3.12', '3.10'),
+            "[testenv:py310]\nbasepython = python3.10\n"
+            "[testenv:py312]\nbasepython = python3.12")
+
+
+class TestSeveralFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charms_dir = self.tmpdir / 'charms'
+        for charm in ('aodh', 'barbican', 'cinder'):
+            (self.charms_dir / charm).mkdir(parents=True)
+            shutil.copy(TOX_PY310_ONLY, self.charms_dir / charm / 'tox.ini')
+        # cinder has no py310 section to clone.
+        tox_ini = self.charms_dir / 'cinder' / 'tox.ini'
+        tox_ini.write_text(tox_ini.read_text().replace('py310', 'py38'))
+        (self.charms_dir / 'designate').mkdir()
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _main(self, *argv):
+        out = io.StringIO()
+        err = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            rc = _mod.main(['add-py3', '-j', '1', *argv])
+        return rc, out.getvalue().splitlines(), err.getvalue().splitlines()
+
+    def test_charms_dir(self):
+        rc, out, err = self._main('--version', '3.12,3.13', '--template',
+                                  '3.10', '--charms-dir',
+                                  str(self.charms_dir))
+        self.assertEqual(rc, 1)
+        aodh = self.charms_dir / 'aodh' / 'tox.ini'
+        self.assertEqual(out[:2], [f"Added [testenv:py312] to {aodh}",
+                                   f"Added [testenv:py313] to {aodh}"])
+        self.assertEqual(out[-1],
+                         "3 file(s): 2 changed, 0 unchanged, 1 failed")
+        self.assertEqual(err, [
+            f"error: section [testenv:py310] not found in "
+            f"{self.charms_dir / 'cinder' / 'tox.ini'}"])
+        self.assertIn('[testenv:py313]', aodh.read_text())
+
+    def test_repeated_tox_ini(self):
+        aodh = self.charms_dir / 'aodh' / 'tox.ini'
+        barbican = self.charms_dir / 'barbican' / 'tox.ini'
+        self._main('--version', '3.12', '--template', '3.10',
+                   '--tox-ini', str(aodh))
+        rc, out, err = self._main('--version', '3.12', '--template', '3.10',
+                                  '--tox-ini', str(aodh),
+                                  '--tox-ini', str(barbican))
+        self.assertEqual(rc, 0)
+        self.assertEqual(out, [f"Added [testenv:py312] to {barbican}",
+                               "2 file(s): 1 changed, 1 unchanged, 0 failed"])
+        self.assertEqual(len(err), 1)
+        self.assertIn("already exists", err[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Tests for update-zuul-jobs.py."""
+
+import contextlib
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from lib import readonly
+from tests.fixtures import write
+
+# update-zuul-jobs.py has hyphens in its name so it can't be imported with a
+# normal import statement.  Load it explicitly via importlib.
+_REPO_ROOT = Path(__file__).parents[2]
+_spec = importlib.util.spec_from_file_location(
+    "update_zuul_jobs",
+    _REPO_ROOT / "update-zuul-jobs.py",
+)
+_mod = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_mod)
+
+
+ZUUL_YAML = """\
+    - project:
+        templates:
+          - openstack-python3-charm-jobs
+          - openstack-cover-jobs
+        check:
+          jobs:
+            - osci-lint
+    """
+
+
+def make_charm(charms_dir: Path, name: str) -> Path:
+    charm_dir = charms_dir / name
+    write(charm_dir / '.zuul.yaml', ZUUL_YAML)
+    write(charm_dir / 'metadata.yaml', f"name: {name}\n")
+    write(charm_dir / 'osci.yaml', """\
+        - project:
+            vars:
+              charmcraft_channel: 3.x/stable
+        """)
+    return charm_dir
+
+
+class TestUpdateZuulYaml(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charm_dir = make_charm(self.tmpdir, 'aodh')
+        readonly.cache_clear()
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _update(self, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return _mod.update_zuul_yaml(self.charm_dir, **kwargs)
+
+    def test_combined(self):
+        with mock.patch.object(_mod, 'write_if_changed',
+                               wraps=_mod.write_if_changed) as write:
+            self.assertTrue(self._update(
+                replacements=[('openstack-python3-*', 'py3-jobs'),
+                              ('*-cover-*', 'cover-jobs')],
+                add_charmbuild=True))
+        write.assert_called_once()
+        data = readonly.load(self.charm_dir / '.zuul.yaml')
+        project = data[0]['project']
+        self.assertEqual(project['templates'], ['py3-jobs', 'cover-jobs'])
+        self.assertEqual(project['check']['jobs'], ['osci-lint', 'charmbuild'])
+        self.assertEqual(project['vars'],
+                         {'charmbuild_charmcraft_channel': '3.x/stable',
+                          'charm_build_name': 'aodh'})
+        # nothing more to do.
+        self.assertFalse(self._update(
+            replacements=[('openstack-python3-*', 'py3-jobs')],
+            add_charmbuild=True))
+
+    def test_ambiguous_pattern(self):
+        before = (self.charm_dir / '.zuul.yaml').read_text()
+        with self.assertRaises(ValueError):
+            self._update(replacements=[('py3-*', 'x'), ('openstack-*', 'y')])
+        self.assertEqual((self.charm_dir / '.zuul.yaml').read_text(), before)
+
+    def test_missing_channel(self):
+        (self.charm_dir / 'osci.yaml').write_text("[]\n")
+        with self.assertRaisesRegex(ValueError, "'charmcraft_channel' not"):
+            self._update(add_charmbuild=True)
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.charm_dirs = [make_charm(self.tmpdir, name)
+                           for name in ('aodh', 'barbican', 'cinder')]
+        (self.charm_dirs[1] / 'metadata.yaml').unlink()
+        readonly.cache_clear()
+        patcher = mock.patch.dict(os.environ, {
+            'XDG_CACHE_HOME': str(self.tmpdir / 'cache')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _main(self, *argv):
+        out = io.StringIO()
+        err = io.StringIO()
+        with mock.patch('sys.argv', ['update-zuul-jobs.py', *argv]), \
+                contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(err):
+            try:
+                _mod.main()
+                code = 0
+            except SystemExit as e:
+                code = e.code
+        return code, out.getvalue().splitlines()
+
+    def test_fleet(self):
+        code, lines = self._main(
+            '-j', '1', '--add-charmbuild',
+            '--replace', 'openstack-python3-*', '--with', 'py3-jobs',
+            *map(str, self.charm_dirs))
+        self.assertEqual(code, 1)
+        self.assertIn("aodh: changed", lines)
+        self.assertIn("cinder: changed", lines)
+        self.assertTrue(any(line.startswith("barbican: FAILED: ")
+                            for line in lines))
+        self.assertEqual(lines[-1],
+                         "3 charm(s): 2 changed, 0 unchanged, 1 failed")
+
+    def test_single_charm_error(self):
+        code, _ = self._main('--add-charmbuild', str(self.charm_dirs[1]))
+        self.assertIn('metadata.yaml not found', code)
+
+    def test_unpaired_replace(self):
+        code, _ = self._main('--replace', 'a*', '--replace', 'b*',
+                             '--with', 'c', str(self.charm_dirs[0]))
+        self.assertEqual(code, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
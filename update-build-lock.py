@@ -7,15 +7,30 @@
 # For add the type/(item|package) must be specified plus ALL the keys to set.
 # the build.lock file needs to be specified.  Note that it gets re-written
 # completely.
+#
+# --file may be repeated (or be a quoted glob) to make the same change to many
+# build.lock files in one go.  Several changes can be made at once with the
+# 'apply' command and a file of operations, one JSON object per line, e.g.:
+#
+#   {"op": "delete", "type": "python_module", "package": "Tempita"}
+#   {"op": "modify", "type": "python_module", "package": "charmhelpers",
+#    "spec": {"branch": "stable/xena"}}
+#
+# Each build.lock is then loaded once, the operations are applied in order and
+# it is written once (and not at all if an operation fails).
 
 import argparse
-import copy
+import functools
 import json
 import logging
-import os
 from pathlib import Path
 import sys
-from typing import List, Dict
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from lib.fleet import Result, charm_name_for, expand_filenames, run_pool
+from lib.output import write_if_changed
+from lib.timing import timed
+from lib.profiling import run_profiled
 
 
 logger = logging.getLogger(__name__)
@@ -32,7 +47,17 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
         epilog=("Note; this script doesn't look up any of the keys. Pass it "
                 "the correct data in the keys."))
     parser.add_argument('--file',
-                        help="Required filename to change.")
+                        dest='files',
+                        action='append',
+                        metavar='FILE',
+                        help=("Required filename to change.  May be repeated, "
+                              "or be a quoted glob such as "
+                              "'charms/*/src/build.lock', to change many "
+                              "files; a result is then printed for each."))
+    parser.add_argument('--workers', '-j',
+                        dest='workers',
+                        type=int,
+                        help="With many files, how many to change at once.")
     parser.add_argument('--log', dest='loglevel',
                         type=str.upper,
                         default='INFO',
@@ -43,10 +68,9 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
     parser.add_argument('--type', '-t',
                         dest='type',
                         type=str.lower,
-                        required=True,
                         choices=('layer', 'python_module'),
-                        help='The type of lock')
-    group = parser.add_mutually_exclusive_group(required=True)
+                        help='The type of lock; required except for apply.')
+    group = parser.add_mutually_exclusive_group()
     group.add_argument('--item', '-i',
                        dest='item',
                        metavar='ITEM',
@@ -86,16 +110,112 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
         help=("modify the layer so that the branch is locked to the commit "
               "sha."))
     lock_layer_command.set_defaults(func=lock_layer)
+    apply_command = subparser.add_parser(
+        'apply',
+        help=("Apply the operations in a file (one JSON object per line) to "
+              "the build.lock file(s)."))
+    apply_command.add_argument(
+        '--ops',
+        dest='ops',
+        required=True,
+        type=Path,
+        metavar='OPS',
+        help="The file of operations.")
+
+    args = parser.parse_args(argv)
+    if not args.files:
+        parser.error("the following arguments are required: --file")
+    if args.cmd == 'apply':
+        if args.type or args.item or args.package:
+            parser.error("--type, --item and --package are given in the "
+                         "operations file for apply")
+    else:
+        if not args.type:
+            parser.error("the following arguments are required: --type/-t")
+        if args.cmd != 'lock-layer' and not (args.item or args.package):
+            parser.error("one of the arguments --item/-i --package/-p is "
+                         "required")
+    return args
 
-    return parser.parse_args(argv)
 
+# (type, item) for a layer, (type, package) for a python_module.
+LockKey = Tuple[str, Optional[str]]
 
-def add_lock(args: argparse.Namespace, locks: Dict) -> Dict:
-    locks = copy.deepcopy(locks)
+OPS_KEYS = ('op', 'type', 'item', 'package', 'spec')
+
+
+class LockOp(NamedTuple):
+    """One operation on a build.lock; the attributes match the arguments."""
+    cmd: str
+    type: str
+    item: Optional[str] = None
+    package: Optional[str] = None
+    spec: Optional[str] = None
+
+
+def _key(type_: Optional[str],
+         item: Optional[str],
+         package: Optional[str],
+         ) -> LockKey:
+    if type_ == 'layer':
+        return (type_, item)
+    if type_ == 'python_module':
+        return (type_, package)
+    return (type_, None)  # type: ignore
+
+
+class LockIndex:
+    """The locks of a loaded build.lock, indexed by (type, item or package).
+
+    The edits are made in place to the loaded document.
+
+    :param locks: the loaded build.lock.
+    """
+
+    def __init__(self, locks: Dict) -> None:
+        self.locks = locks
+        self._index: Dict[LockKey, List[Dict]] = {}
+        for s in locks['locks']:
+            self._index.setdefault(
+                _key(s.get('type'), s.get('item'), s.get('package')),
+                []).append(s)
+
+    def find(self, key: LockKey) -> Optional[Dict]:
+        """The first lock with the key, or None."""
+        found = self._index.get(key)
+        return found[0] if found else None
+
+    def append(self, spec: Dict) -> None:
+        self.locks['locks'].append(spec)
+        self._index.setdefault(
+            _key(spec['type'], spec.get('item'), spec.get('package')),
+            []).append(spec)
+
+    def remove(self, key: LockKey) -> bool:
+        """Remove all the locks with the key; False if there were none."""
+        found = self._index.pop(key, None)
+        if not found:
+            return False
+        ids = {id(s) for s in found}
+        self.locks['locks'] = [s for s in self.locks['locks']
+                               if id(s) not in ids]
+        return True
+
+    def of_type(self, type_: str) -> Iterator[Dict]:
+        return (s for s in self.locks['locks'] if s['type'] == type_)
+
+
+def _decode_spec(args: Any) -> Dict:
+    if isinstance(args.spec, dict):
+        return dict(args.spec)
     try:
-        spec = json.loads(args.spec)
-    except json.JSONDecodeError as e:
+        return json.loads(args.spec)
+    except (TypeError, json.JSONDecodeError):
         raise RuntimeError(f"Couldn't decode '{args.spec}'")
+
+
+def add_to(index: LockIndex, args: Any) -> None:
+    spec = _decode_spec(args)
     # Construct the full spec including args.type and args.item or args.package
     spec['type'] = args.type
     if args.type == 'layer':
@@ -104,28 +224,15 @@ def add_lock(args: argparse.Namespace, locks: Dict) -> Dict:
         spec['package'] = args.package
     else:
         raise RuntimeError(f"Don't know how to add a {args.type} type of lock")
-    try:
-        for s in locks['locks']:
-            if s['type'] == args.type:
-                if ((args.type == 'layer' and args.item == s['item']) or
-                        (args.type == 'python_module' and
-                         args.package == s['package'])):
-                    raise RuntimeError(
-                        f"Expecting to add '{json.dumps(spec)}' but it "
-                        f"already exists?")
-    except Exception:
-        raise
+    if index.find(_key(args.type, args.item, args.package)) is not None:
+        raise RuntimeError(
+            f"Expecting to add '{json.dumps(spec)}' but it already exists?")
     # add the spec to the locks
-    locks['locks'].append(spec)
-    return locks
+    index.append(spec)
 
 
-def modify_lock(args: argparse.Namespace, locks: Dict) -> Dict:
-    locks = copy.deepcopy(locks)
-    try:
-        spec = json.loads(args.spec)
-    except json.JSONDecodeError as e:
-        raise RuntimeError(f"Couldn't decode '{args.spec}'")
+def modify_in(index: LockIndex, args: Any) -> None:
+    spec = _decode_spec(args)
     spec['type'] = args.type
     if args.type == 'layer':
         spec['item'] = args.item
@@ -134,98 +241,191 @@ def modify_lock(args: argparse.Namespace, locks: Dict) -> Dict:
     else:
         raise RuntimeError(
             f"Don't know how to modify a {args.type} type of lock")
-    try:
-        for s in locks['locks']:
-            if s['type'] == args.type:
-                if ((args.type == 'layer' and args.item == s['item']) or
-                        (args.type == 'python_module' and
-                         args.package == s['package'])):
-                    s.update(spec)
-                    break
-        else:
-            raise RuntimeError(f"Couldn't find a lock spec to modify?")
-    except Exception:
-        raise
-    return locks
+    found = index.find(_key(args.type, args.item, args.package))
+    if found is None:
+        raise RuntimeError(f"Couldn't find a lock spec to modify?")
+    found.update(spec)
 
 
-def delete_lock(args: argparse.Namespace, locks: Dict) -> Dict:
-    locks = copy.deepcopy(locks)
+def delete_from(index: LockIndex, args: Any) -> None:
     if args.type not in ('layer', 'python_module'):
         raise RuntimeError(
             f"Don't know how to modify a {args.type} type of lock")
-
-    new_locks = []
-    found = False
-    try:
-        for s in locks['locks']:
-            if s['type'] == args.type:
-                if ((args.type == 'layer' and args.item == s['item']) or
-                        (args.type == 'python_module' and
-                         args.package == s['package'])):
-                    found = True
-                    continue
-            new_locks.append(s)
-    except Exception:
-        raise
-    if not(found):
+    if not index.remove(_key(args.type, args.item, args.package)):
         raise RuntimeError("Couldn't find the item to remove!")
-    locks['locks'] = new_locks
-    return locks
 
 
-def lock_layer(args: argparse.Namespace, locks: Dict) -> Dict:
+def lock_layers_in(index: LockIndex, args: Any) -> None:
     """Lock the layers so that the branch is locked to the commit SHA."""
-    locks = copy.deepcopy(locks)
     if args.type != 'layer':
         raise RuntimeError(
             f"Won't lock branches to commits for {args.type} type of lock")
-    try:
-        for s in locks['locks']:
-            if s['type'] == 'layer':
-                s['branch'] = s['commit']
-    except Exception:
-        raise
+    for s in index.of_type('layer'):
+        s['branch'] = s['commit']
+
+
+OPERATIONS = {
+    'add': add_to,
+    'modify': modify_in,
+    'delete': delete_from,
+    'lock-layer': lock_layers_in,
+}
+
+
+# The single operation functions: each edits locks in place and returns it.
+def add_lock(args: argparse.Namespace, locks: Dict) -> Dict:
+    add_to(LockIndex(locks), args)
     return locks
 
 
-# update the charmcraft.yaml file (passed on the line as arg1) and ensure that
-# it has the bases added.
-def main() -> None:
-    args = parse_args(sys.argv[1:])
-    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+def modify_lock(args: argparse.Namespace, locks: Dict) -> Dict:
+    modify_in(LockIndex(locks), args)
+    return locks
+
+
+def delete_lock(args: argparse.Namespace, locks: Dict) -> Dict:
+    delete_from(LockIndex(locks), args)
+    return locks
+
+
+def lock_layer(args: argparse.Namespace, locks: Dict) -> Dict:
+    """Lock the layers so that the branch is locked to the commit SHA."""
+    lock_layers_in(LockIndex(locks), args)
+    return locks
+
+
+def load_ops(path: Path) -> List[LockOp]:
+    """Load a file of operations: one JSON object per line.
+
+    Blank lines and lines starting with '#' are ignored.
+
+    :param path: the file of operations.
+    :returns: the operations, in order.
+    :raises: RuntimeError if an operation is invalid.
+    """
+    ops: List[LockOp] = []
+    with path.open() as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            where = f"{path}:{lineno}"
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise RuntimeError(f"{where}: Couldn't decode: {e}")
+            if not isinstance(data, dict):
+                raise RuntimeError(f"{where}: expecting a JSON object")
+            unknown = sorted(set(data) - set(OPS_KEYS))
+            if unknown:
+                raise RuntimeError(f"{where}: unknown key(s): "
+                                   f"{', '.join(unknown)}")
+            op = LockOp(cmd=data.get('op'),
+                        type=data.get('type'),
+                        item=data.get('item'),
+                        package=data.get('package'),
+                        spec=data.get('spec'))
+            if op.cmd not in OPERATIONS:
+                raise RuntimeError(f"{where}: unknown op: {op.cmd}")
+            if op.type not in ('layer', 'python_module'):
+                raise RuntimeError(f"{where}: unknown type: {op.type}")
+            if op.cmd != 'lock-layer' and \
+                    _key(op.type, op.item, op.package)[1] is None:
+                raise RuntimeError(
+                    f"{where}: {'item' if op.type == 'layer' else 'package'} "
+                    f"is required")
+            if op.cmd in ('add', 'modify') and op.spec is None:
+                raise RuntimeError(f"{where}: spec is required")
+            ops.append(op)
+    return ops
 
-    # find the build.lock file.
+
+def update_lock_file(filename: str, ops: List[LockOp]) -> bool:
+    """Apply the operations to a build.lock and write it if it changed.
+
+    :param filename: the build.lock file.
+    :param ops: the operations, applied in order.
+    :returns: True if the file was written.
+    :raises: RuntimeError if the file can't be read or an operation fails;
+        the file isn't written.
+    """
     try:
-        with Path(args.file).open() as f:
+        with Path(filename).open() as f:
             locks = json.load(f)
     except json.JSONDecodeError as e:
-        raise RuntimeError(f"Couldn't decode the lock file: {args.file}: {e}")
+        raise RuntimeError(f"Couldn't decode the lock file: {filename}: {e}")
     except IOError as e:
-        raise RuntimeError(f"Problem reading the lock file: {args.file}: {e}")
+        raise RuntimeError(f"Problem reading the lock file: {filename}: {e}")
     except Exception as e:
         raise RuntimeError(
-            f"Some other problem reading the lock file: {args.file}: {e}")
+            f"Some other problem reading the lock file: {filename}: {e}")
 
+    stage = ops[0].cmd if len(ops) == 1 else 'apply'
+    with timed(stage, charm=charm_name_for(Path(filename))):
+        index = LockIndex(locks)
+        for op in ops:
+            OPERATIONS[op.cmd](index, op)
+        return write_if_changed(filename,
+                                json.dumps(index.locks, indent=2))
 
-    # Call the function associated with the sub-command.
-    modified_locks = args.func(args, locks)
 
-    # write the modified_locks back IFF it was updated.
-    if modified_locks is not None:
-        new_file = Path(args.file).resolve().parent / "build.lock.new"
-        with new_file.open("w") as f:
-            json.dump(modified_locks, f, indent=2)
-        # now overwrite the file
-        os.rename(new_file, args.file)
-        logger.info("Finished.")
+def report(results: List[Result]) -> int:
+    """Print the result for each file and a summary.
+
+    :param results: the result for each file.
+    :returns: the number of files that failed.
+    """
+    changed = failed = 0
+    for result in results:
+        if not result.ok:
+            failed += 1
+            print(f"{result.item}: FAILED: {result.error}")
+        elif result.value:
+            changed += 1
+            print(f"{result.item}: changed")
+        else:
+            print(f"{result.item}: unchanged")
+    print(f"{len(results)} file(s): {changed} changed, "
+          f"{len(results) - changed - failed} unchanged, {failed} failed")
+    return failed
+
+
+def main() -> None:
+    args = parse_args(sys.argv[1:])
+    logger.setLevel(getattr(logging, args.loglevel, 'INFO'))
+
+    if args.cmd == 'apply':
+        ops = load_ops(args.ops)
+        if not ops:
+            logger.info("Nothing done; %s has no operations.", args.ops)
+            return
     else:
-        logger.info("Nothing done.")
+        ops = [LockOp(cmd=args.cmd,
+                      type=args.type,
+                      item=args.item,
+                      package=args.package,
+                      spec=getattr(args, 'spec', None))]
+
+    filenames = expand_filenames(args.files)
+    if not filenames:
+        raise RuntimeError(f"No files match {' '.join(args.files)}")
+    if len(filenames) == 1:
+        if update_lock_file(filenames[0], ops):
+            logger.info("Finished.")
+        else:
+            logger.info("Finished; %s is unchanged.", filenames[0])
+        return
+
+    results = run_pool(functools.partial(update_lock_file, ops=ops),
+                       filenames, workers=args.workers)
+    if report(results):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
     logging.basicConfig()
     try:
-        main()
+        run_profiled(main)
     except RuntimeError as e:
         logger.error("Problem with arguments or file: %s", str(e))
+        sys.exit(1)
@@ -7,18 +7,30 @@
 # candidate channel
 
 import argparse
+import functools
 import itertools
 import logging
 import os
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import List, NamedTuple, Optional, Dict
 import re
 import sys
 
 SCRIPT_DIR = Path(__file__).parent.resolve()
 sys.path.append(str(SCRIPT_DIR.parent))
 
-from lib.lp_builder import get_lp_builder_config, get_lp_builder_config_for
+from lib.bundles import ANY_CHARM_MATCH, CHANNEL_MATCH, CHARM_MATCH
+from lib.fleet import find_charm_dirs, run_pool
+from lib.lp_builder import (
+    ChannelTable,
+    build_channel_table,
+    get_lp_builder_config,
+    get_lp_builder_config_for,
+)
+from lib.output import write_lines_if_changed
+from lib import readonly
+from lib.timing import timed
+from lib.profiling import run_profiled
 
 
 logger = logging.getLogger(__name__)
@@ -27,26 +39,6 @@ logger = logging.getLogger(__name__)
 # type Alias for LpConfig struture.
 LpConfig = Dict[str, Dict[str, List[str]]]
 
-# This matches against a charm: <spec> where spec is either quoted or unquoted
-# version of cs:~openstack-charmers/<name> or
-# cs:~openstack-charmers-next/<name>
-# or ch:<name>
-# Includes 3 capture groups:
-# 1. the whitespace at the beginning of the line
-# 2. the prefix (cs: or ch:)
-# 3. the charm name
-CHARM_MATCH = re.compile(
-    r'^(\s*)charm:\s+(?:|' + r"'" + r'|")'
-    r'(ch:|cs:(?:~openstack-charmers/|~openstack-charmers-next/))'
-    r'([a-zA-Z0-9-]+)(?:|' + r"'" + r'|")\s*(?:|#.*)$')
-CHANNEL_MATCH = re.compile(r'^(\s*)channel:\s+(\S+)\s*(?:|#.*)$')
-# Match any charm; used after the specific CHARM_MATCH to re-write charms using
-# as cs: prefix to a ch: prefix if needed.
-ANY_CHARM_MATCH = re.compile(
-    r'^(\s*)charm:\s+(?:|' + r"'" + r'|")'
-    r'(cs:.*/)'
-    r'([a-zA-Z0-9-]+)(?:|' + r"'" + r'|")\s*(?:|#.*)$')
-
 
 def find_bundles_dirs(charm_dir: Path) -> List[Path]:
     """Find the directory with bundles.
@@ -104,7 +96,9 @@ def modify_channel(charms: List[str],
                    set_local_charm: Optional[str],
                    disable_local_overlay: bool,
                    enforce_edge: bool,
-                   ) -> None:
+                   channel_table: Optional[ChannelTable] = None,
+                   remove_unresolved: bool = False,
+                   ) -> bool:
     """Modify the candidate channel to the bundle as needed.
 
     If the :param:`branches` is populated, then they are the github branches
@@ -139,58 +133,49 @@ def modify_channel(charms: List[str],
         "starts with" so that 'latest' can match against any channel, for
         example.
     :param enforce_edge: If set to True, enforce the track as <track>/edge
+    :param channel_table: the channels resolved from :param:`lp_config` for
+        the branches, ignore_tracks and enforce_edge; built if not passed.
+    :param remove_unresolved: with branches, remove the channel of the charms
+        in :param:`charms` that the branches don't give a channel for.  This
+        is the same as running with --remove-channel and then with the
+        branches, except that a channel is replaced where it is rather than
+        being moved to the end of the charm's block.
+    :returns: True if the bundle was changed.
     """
     logger.debug("Looking at file: %s", bundle_filename)
-    new_file_name = bundle_filename.with_suffix(
-        f"{bundle_filename.suffix}.new")
     with open(bundle_filename) as f:
         file_lines = f.readlines()
 
     new_lines = []
 
     # get the list of charms to match against
+    remove_charms = set(charms) if remove_unresolved else set()
     if branches:
-        valid_charms = list(lp_config.keys())
+        valid_charms = set(lp_config.keys()) | remove_charms
+        if channel_table is None:
+            channel_table = build_channel_table(
+                lp_config, branches, ignore_tracks, enforce_edge)
     else:
-        valid_charms = charms[:]
+        valid_charms = set(charms)
 
     def _get_channel(_charm: Optional[str]) -> Optional[str]:
         """Get the channel based on branches and channel contents.
 
-        If the branches are set, then use the LpConfig to find the channel
-        based on any of the branches supplied.  If none are found then don't
-        update this charm (returns None).
-
-        If the track/channel found matches an ignore_tracks (from the parent
-        closure) then None is returned.
+        If the branches are set, then the channel is looked up in the channel
+        table, which has the first channel of the first of the branches
+        supplied that isn't in ignore_tracks (made <track>/edge if
+        enforce_edge is set).  If there isn't one then don't update this charm
+        (returns None).
 
         Otherwise just return the current channel in the `channel` var.
 
-        if the outer-scoped variable enforce_edge is set, then ensure that the
-        track/channel returned is <track>/edge
-
         :param _charm: the charm to check against.
         """
         if _charm is None:
             return None
         if not branches:
             return channel
-        for branch in branches:
-            try:
-                for track in lp_config[_charm][branch]:
-                    for ignore in ignore_tracks:
-                        if track.startswith(ignore):
-                            # ignore this track
-                            break
-                    else:
-                        if enforce_edge:
-                            if '/' in track:
-                                track = "{}/edge".format(track.split('/')[0])
-                        return track
-            except (KeyError, IndexError):
-                pass
-        # The charm/branch didn't match so return None
-        return None
+        return channel_table.channel_for(_charm)  # type: ignore
 
     ###
     # The following for-loop code implements an algorithm that searches for a
@@ -227,11 +212,10 @@ def modify_channel(charms: List[str],
     #
     ###
 
-    print(f"set_local_charm is {set_local_charm}")
+    logger.debug("set_local_charm is %s", set_local_charm)
     if set_local_charm:
         LOCAL_CHARM_MATCH = re.compile(
             r'^(\s*)charm:\s+[./]*' + set_local_charm + r'\s*(?:|#.*)$')
-        print(f"set local regex for {set_local_charm}")
     indent = None
     current_charm: Optional[str] = None
     for line in file_lines:
@@ -249,7 +233,7 @@ def modify_channel(charms: List[str],
                             if _channel is not None:
                                 new_lines.append(
                                     "{}channel: {}\n".format(indent, _channel))
-                            else:
+                            elif current_charm not in remove_charms:
                                 new_lines.append(line)
                         indent = None
                         current_charm =None
@@ -288,7 +272,7 @@ def modify_channel(charms: List[str],
         elif set_local_charm is not None:
             local_match = LOCAL_CHARM_MATCH.match(line)  # type: ignore
             if local_match:
-                print("matched!")
+                logger.debug("Matched local charm %s", set_local_charm)
                 prefix = \
                     '../../../' \
                     if bundle_filename.parent.parent.parent.stem == 'src' \
@@ -312,10 +296,9 @@ def modify_channel(charms: List[str],
             bundle_filename.parent.name != 'overlays'):
         new_lines = ensure_local_overlay_disabled(new_lines)
 
-    with open(new_file_name, "wt") as f:
-        f.writelines(new_lines)
-    # now overwrite the file
-    os.rename(new_file_name, bundle_filename)
+    if new_lines == file_lines:
+        return False
+    return write_lines_if_changed(bundle_filename, new_lines)
 
 
 def ensure_local_overlay_disabled(lines: List[str]) -> List[str]:
@@ -355,13 +338,140 @@ def update_bundles(charms: List[str],
                    disable_local_overlay: bool,
                    set_local_charm: Optional[str],
                    enforce_edge: bool,
-                   ) -> None:
+                   channel_table: Optional[ChannelTable] = None,
+                   remove_unresolved: bool = False,
+                   ) -> List[Path]:
+    """Update the bundles; see `modify_channel` for the arguments.
+
+    :returns: the bundles that were changed.
+    """
+    # resolve the channels once for all the bundles.
+    if branches and channel_table is None:
+        channel_table = build_channel_table(
+            lp_config, branches, ignore_tracks, enforce_edge)
+    changed: List[Path] = []
     for path in bundle_paths:
         logger.debug("Doing path: %s", path)
-        modify_channel(
-            charms, lp_config, path, channel, branches, ensure_charmhub_prefix,
-            ignore_tracks, set_local_charm, disable_local_overlay,
-            enforce_edge)
+        if modify_channel(
+                charms, lp_config, path, channel, branches,
+                ensure_charmhub_prefix, ignore_tracks, set_local_charm,
+                disable_local_overlay, enforce_edge, channel_table,
+                remove_unresolved):
+            changed.append(path)
+    return changed
+
+
+class BundleUpdate(NamedTuple):
+    """The update to make to each charm's bundles in fleet mode.
+
+    The fields are the arguments of `update_bundles`; set_local_charm says
+    whether to work the local charm out for each charm.  If bundles is set,
+    it is the bundles to update for each charm (by directory name), rather
+    than all of them.
+    """
+    charms: List[str]
+    lp_config: LpConfig
+    channel: Optional[str]
+    branches: List[str]
+    ensure_charmhub_prefix: bool
+    ignore_tracks: List[str]
+    disable_local_overlay: bool
+    set_local_charm: bool
+    enforce_edge: bool
+    channel_table: Optional[ChannelTable]
+    remove_unresolved: bool
+    bundles: Optional[Dict[str, List[Path]]] = None
+
+
+def update_charm_bundles(charm_dir: Path, update: BundleUpdate) -> List[Path]:
+    """Update the bundles of one charm in the fleet.
+
+    :param charm_dir: the charm's directory.
+    :param update: the update to make.
+    :returns: the bundles that were changed.
+    """
+    with timed('update-bundles', charm=charm_dir.name):
+        if update.bundles is not None:
+            bundles = update.bundles.get(charm_dir.name, [])
+        else:
+            bundles = find_bundles_in_dirs(find_bundles_dirs(charm_dir))
+        local_charm = determine_charm(charm_dir) if update.set_local_charm \
+            else None
+        return update_bundles(
+            update.charms, update.lp_config, sorted(bundles), update.channel,
+            update.branches, update.ensure_charmhub_prefix,
+            update.ignore_tracks, update.disable_local_overlay, local_charm,
+            update.enforce_edge, update.channel_table,
+            update.remove_unresolved)
+
+
+def update_fleet(charm_dirs: List[Path],
+                 update: BundleUpdate,
+                 workers: Optional[int] = None,
+                 ) -> int:
+    """Update the bundles of the charms in a pool and print a summary.
+
+    :param charm_dirs: the charms' directories.
+    :param update: the update to make.
+    :param workers: the size of the pool; default is `default_workers()`.
+    :returns: the number of charms that failed.
+    """
+    results = run_pool(functools.partial(update_charm_bundles, update=update),
+                       charm_dirs, workers=workers)
+    failed = 0
+    changed = 0
+    for result in results:
+        charm_dir: Path = result.item
+        if not result.ok:
+            failed += 1
+            print(f"{charm_dir.name}: FAILED: {result.error}")
+            continue
+        if not result.value:
+            print(f"{charm_dir.name}: no changes")
+            continue
+        changed += 1
+        print(f"{charm_dir.name}: {len(result.value)} file(s) changed")
+        for path in result.value:
+            print(f"    {path.relative_to(charm_dir)}")
+    print(f"{changed} of {len(results)} charm(s) changed, {failed} failed.")
+    return failed
+
+
+def target_charms(update: BundleUpdate) -> List[str]:
+    """The charms whose channel the update may set or remove."""
+    if not update.branches:
+        return list(update.charms)
+    targets = {charm for charm in update.lp_config
+               if update.channel_table.channel_for(charm)}  # type: ignore
+    if update.remove_unresolved:
+        targets.update(update.charms)
+    return sorted(targets)
+
+
+def find_targeted_bundles(charms_dir: Path,
+                          charms: List[str],
+                          names: Optional[List[str]] = None,
+                          workers: Optional[int] = None,
+                          ) -> Dict[str, List[Path]]:
+    """Find the bundles that reference the charms from the inventory.
+
+    The inventory (see charm-inventory.py) is refreshed first; only the repos
+    whose files have changed are re-scanned.
+
+    :param charms_dir: the directory with the charm repos.
+    :param charms: the charms to find the bundles of.
+    :param names: optionally, only look in these charm repos.
+    :param workers: the size of the pool for the refresh.
+    :returns: {charm directory name: [bundle paths]}
+    """
+    # only needed with --use-inventory.
+    from lib.inventory import Inventory
+
+    with Inventory(charms_dir) as inventory:
+        summary = inventory.update(names=names, workers=workers)
+        logger.info("Inventory: %d repo(s) re-scanned, %d unchanged.",
+                    len(summary.scanned), len(summary.unchanged))
+        return inventory.bundles_referencing(charms)
 
 
 def check_charm_dir_exists(charm_dir: Path) -> None:
@@ -375,13 +485,8 @@ def check_charm_dir_exists(charm_dir: Path) -> None:
 
 def determine_charm(charm_dir: Path) -> Optional[str]:
     """Workout what the charm is from the osci.yaml in the charm_dir."""
-    osci_file = charm_dir / 'osci.yaml'
-    if osci_file.is_file():
-        with osci_file.open() as f:
-            for line in f.readlines():
-                if "charm_build_name" in line:
-                    return line.split()[-1]
-    return None
+    name = readonly.osci_var(charm_dir, 'charm_build_name')
+    return str(name) if name is not None else None
 
 
 def parse_args(argv: List[str]) -> argparse.Namespace:
@@ -394,9 +499,40 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
         description=('Change or add the juju channel to the bundles '
                      'for the charm.'),
         epilog=("Either pass the directory of the charm, or be in that "
-                "directory when the script is called."))
+                "directory when the script is called.  Or, to update the "
+                "bundles of all the charms in one go, pass --charms-dir."))
     parser.add_argument('dir', nargs='?',
                         help="Optional directory argument")
+    parser.add_argument('--charms-dir',
+                        dest='charms_dir',
+                        type=Path,
+                        metavar='DIR',
+                        help=('Fleet mode: update the bundles of every charm '
+                              'in DIR (e.g. ./charms), loading the config '
+                              'once and printing a summary of the changed '
+                              'files for each charm.'))
+    parser.add_argument('--only',
+                        dest='only_charms',
+                        action='append',
+                        metavar='NAME',
+                        help=('In fleet mode, only update the charm '
+                              'directory NAME.  May be repeated.'))
+    parser.add_argument('--workers', '-j',
+                        dest='workers',
+                        type=int,
+                        help=('In fleet mode, the number of charms to update '
+                              'at once.'))
+    parser.add_argument('--use-inventory',
+                        dest='use_inventory',
+                        action='store_true',
+                        default=False,
+                        help=('In fleet mode, use the charm inventory (see '
+                              'charm-inventory.py) to find the bundles that '
+                              'reference the charms, and only open those.  '
+                              "Can't be used with --ensure-charmhub, "
+                              '--disable-local-overlay or --set-local-charm, '
+                              'which change bundles regardless of the '
+                              'charms.'))
     parser.add_argument('--bundle',
                         dest='bundles',
                         action='append',
@@ -405,7 +541,7 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
                         help=('Path to a bundle file to update. '
                               'May be repeated for multiple files to update'))
 
-    channel_group = parser.add_mutually_exclusive_group(required=True)
+    channel_group = parser.add_mutually_exclusive_group(required=False)
     channel_group.add_argument(
         '--channel', '-c',
         dest='channel',
@@ -413,10 +549,15 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
         metavar='CHANNEL',
         help=('If present, adds channel spec to openstack charms. Must use '
               '--remove-channel if this is not supplied.'))
-    channel_group.add_argument(
+    parser.add_argument(
         '--remove-channel',
         dest="remove_channel",
-        help="Remove the channel specifier.  Don't use with --channel.",
+        help=("Remove the channel specifier.  Don't use with --channel.  "
+              "With --branch, the channels are set from the branches and "
+              "removed from the charms that the branches don't give a "
+              "channel for, in one pass.  Unlike removing and then "
+              "re-adding the channels, a channel that is kept stays where "
+              "it is in the charm's block."),
         action='store_true')
     channel_group.add_argument(
         '--branch', '-b',
@@ -496,7 +637,25 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
     parser.set_defaults(channel=None,
                         remove_channel=False,
                         loglevel='INFO')
-    return parser.parse_args(argv)
+    args = parser.parse_args(argv)
+    if not (args.channel or args.remove_channel or args.branches):
+        parser.error("one of the arguments --channel/-c --remove-channel "
+                     "--branch/-b is required")
+    if args.channel and args.remove_channel:
+        parser.error("argument --remove-channel: not allowed with argument "
+                     "--channel/-c")
+    if args.charms_dir and args.dir:
+        parser.error("argument --charms-dir: not allowed with a charm "
+                     "directory")
+    if args.use_inventory:
+        if not args.charms_dir:
+            parser.error("argument --use-inventory: requires --charms-dir")
+        for option in ('ensure_charmhub', 'disable_local_overlay',
+                       'set_local_charm'):
+            if getattr(args, option):
+                parser.error("argument --use-inventory: not allowed with "
+                             f"argument --{option.replace('_', '-')}")
+    return args
 
 
 def main() -> None:
@@ -511,7 +670,9 @@ def main() -> None:
         logger.error("Something went drastically wrong!")
         sys.exit(1)
 
-    if args.dir:
+    if args.charms_dir:
+        charm_dir = args.charms_dir.resolve()
+    elif args.dir:
         charm_dir = Path(os.fspath(args.dir)).resolve()
     else:
         charm_dir = Path(os.getcwd())
@@ -527,15 +688,11 @@ def main() -> None:
                     charm_dir, channel)
     elif args.branches:
         logger.info("Charm dir: %s, adding/changing channel via lp_config"
-                    " git brances: %s", charm_dir, ", ".join(args.branches))
+                    " git brances: %s%s", charm_dir, ", ".join(args.branches),
+                    " and removing the others" if args.remove_channel else "")
     else:
         logger.info("Charm dir: %s, removing the channel spec.", charm_dir)
 
-    dirs = find_bundles_dirs(charm_dir)
-    if args.bundles:
-        bundles = args.bundles
-    else:
-        bundles = find_bundles_in_dirs(dirs)
     config = get_lp_builder_config()
     # start off with all the known charms from the config.
     charms = list(config.keys())
@@ -561,19 +718,67 @@ def main() -> None:
                 ", ".join(unknowns))
         charms = args.charms
 
+    branches = args.branches or []
+    ignore_tracks = args.ignore_tracks or []
+    # with branches, --remove-channel removes the channels that the branches
+    # don't set.
+    remove_unresolved = bool(args.remove_channel and branches)
+    channel_table = build_channel_table(
+        config, branches, ignore_tracks, args.enforce_edge) \
+        if branches else None
+
+    if args.charms_dir:
+        if args.bundles:
+            logger.error("--bundle can't be used with --charms-dir")
+            sys.exit(1)
+        charm_dirs = find_charm_dirs(charm_dir, args.only_charms)
+        update = BundleUpdate(
+            charms=charms,
+            lp_config=config,
+            channel=channel,
+            branches=branches,
+            ensure_charmhub_prefix=args.ensure_charmhub,
+            ignore_tracks=ignore_tracks,
+            disable_local_overlay=args.disable_local_overlay,
+            set_local_charm=args.set_local_charm,
+            enforce_edge=args.enforce_edge,
+            channel_table=channel_table,
+            remove_unresolved=remove_unresolved)
+        if args.use_inventory:
+            bundles = find_targeted_bundles(
+                charm_dir, target_charms(update), args.only_charms,
+                args.workers)
+            logger.info("%d bundle(s) in %d charm(s) reference the charms.",
+                        sum(len(b) for b in bundles.values()), len(bundles))
+            charm_dirs = [d for d in charm_dirs if d.name in bundles]
+            update = update._replace(bundles=bundles)
+        if update_fleet(charm_dirs, update, args.workers):
+            sys.exit(1)
+        return
+
+    dirs = find_bundles_dirs(charm_dir)
+    if args.bundles:
+        bundles = args.bundles
+    else:
+        bundles = find_bundles_in_dirs(dirs)
+
     print(dirs, bundles, charms)
     local_charm = determine_charm(charm_dir) if args.set_local_charm \
         else None
-    update_bundles(
-        charms, config, bundles, channel, args.branches, args.ensure_charmhub,
-        args.ignore_tracks or [],
-        args.disable_local_overlay,
-        local_charm,
-        args.enforce_edge,
-    )
+    with timed('update-bundles', charm=charm_dir.name):
+        update_bundles(
+            charms, config, bundles, channel, branches,
+            args.ensure_charmhub,
+            ignore_tracks,
+            args.disable_local_overlay,
+            local_charm,
+            args.enforce_edge,
+            channel_table,
+            remove_unresolved,
+        )
     logging.info("done.")
 
 
 if __name__ == '__main__':
     logging.basicConfig()
-    main()
+    run_profiled(main)
@@ -2,9 +2,51 @@
 """Tools for updating tox.ini files in OpenStack charms."""
 
 import argparse
+import functools
 import re
 import sys
 from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from lib.fleet import Result, charm_name_for, find_charm_dirs, run_pool
+from lib.output import write_if_changed
+from lib.timing import timed
+from lib.profiling import run_profiled
+
+
+# an ini section header; it must start a line.
+SECTION_MATCH = re.compile(r"^\[([^\]\n]+)\][ \t]*$", re.MULTILINE)
+
+
+class Section(NamedTuple):
+    """A section of an ini file and its span in the text.
+
+    The span runs from the header to the next header (or the end of the
+    text), so it includes any blank lines and comments after the section.
+    """
+    name: str
+    start: int
+    end: int
+
+
+class AddPy3Result(NamedTuple):
+    """The sections that add-py3 added and those that already existed."""
+    added: List[str]
+    existing: List[str]
+
+
+def index_sections(content: str) -> Dict[str, Section]:
+    """Index the sections of ini content by name, in order.
+
+    If a section is repeated, the first one is indexed.
+    """
+    headers = list(SECTION_MATCH.finditer(content))
+    sections: Dict[str, Section] = {}
+    for i, header in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(content)
+        sections.setdefault(
+            header.group(1), Section(header.group(1), header.start(), end))
+    return sections
 
 
 def _version_to_section(version: str) -> str:
@@ -12,74 +54,171 @@ def _version_to_section(version: str) -> str:
     return "py" + version.replace(".", "")
 
 
-def add_py3(args) -> int:
-    """Add a new [testenv:pyXYZ] section to a tox.ini by cloning a template section.
+def split_versions(versions: str) -> List[str]:
+    """Split a comma separated list of versions, e.g. '3.12,3.13'."""
+    return [v.strip() for v in versions.split(",") if v.strip()]
 
-    Reads the tox.ini at *args.tox_ini*, finds the section for *args.template*,
-    clones it with all occurrences of the template version replaced by
-    *args.version*, and inserts the new section immediately after the template.
 
-    Returns 0 on success, non-zero on error.
-    """
-    tox_ini: Path = args.tox_ini
-    version: str = args.version
-    template: str = args.template
+def clone_py3_sections(content: str,
+                       versions: Sequence[str],
+                       template: str,
+                       ) -> str:
+    """Add [testenv:pyXYZ] sections to tox.ini content by cloning a template.
 
-    if not tox_ini.exists():
-        print(f"error: {tox_ini} does not exist", file=sys.stderr)
-        return 1
+    The content is indexed once.  The section for *template* is cloned for
+    each version, with all occurrences of the template version replaced, and
+    the clones are inserted, in order, immediately after the template section.
+    Versions whose section already exists are skipped.
 
+    Raises ValueError if the template section isn't in the content.
+    """
+    sections = index_sections(content)
     template_section = _version_to_section(template)
-    new_section = _version_to_section(version)
+    try:
+        span = sections[f"testenv:{template_section}"]
+    except KeyError:
+        raise ValueError(f"section [testenv:{template_section}] not found")
 
-    content = tox_ini.read_text()
-
-    # Find the template section using a regex that captures the header and body
-    # up to (but not including) the next section header or end of file.
-    pattern = re.compile(
-        r"(\[testenv:" + re.escape(template_section) + r"\][^\[]*)",
-        re.DOTALL,
-    )
-    match = pattern.search(content)
-    if match is None:
-        print(
-            f"error: section [testenv:{template_section}] not found in {tox_ini}",
-            file=sys.stderr,
+    template_block = content[span.start:span.end]
+    new_blocks = []
+    for version in dict.fromkeys(versions):
+        new_section = _version_to_section(version)
+        if f"testenv:{new_section}" in sections:
+            continue
+        # Replace every occurrence of the template version string and section
+        # name within the cloned block.  We replace the longer/more-specific
+        # strings first to avoid partial substitutions.
+        new_block = template_block.replace(
+            f"[testenv:{template_section}]",
+            f"[testenv:{new_section}]",
         )
-        return 1
+        # Replace dotted form: "3.10" → "3.12"  (matches basepython,
+        # constraints…)
+        new_block = new_block.replace(template, version)
+        # Replace compact form: "py310" → "py312"  (matches filenames like
+        # test-requirements-py310.txt that don't contain the dotted version)
+        new_block = new_block.replace(template_section, new_section)
+        new_blocks.append(new_block)
+    if not new_blocks:
+        return content
+
+    # Insert the new blocks right after the template block, making sure that
+    # each starts on a new line.
+    insert = ""
+    for new_block in new_blocks:
+        if not (content[:span.end] + insert).endswith("\n"):
+            insert += "\n"
+        insert += new_block
+    return content[:span.end] + insert + content[span.end:]
+
 
-    # Check whether the target section already exists.
-    if re.search(r"\[testenv:" + re.escape(new_section) + r"\]", content):
+def clone_py3_section(content: str, version: str, template: str) -> str:
+    """Add a [testenv:pyXYZ] section to tox.ini content by cloning a template.
+
+    As `clone_py3_sections` for a single version: if the section for *version*
+    already exists, the content is returned unchanged.
+
+    Raises ValueError if the template section isn't in the content.
+    """
+    return clone_py3_sections(content, [version], template)
+
+
+def add_py3_to_file(tox_ini: Path,
+                    versions: Sequence[str],
+                    template: str,
+                    ) -> AddPy3Result:
+    """Add the py3 sections to a tox.ini and write it if it changed.
+
+    Raises FileNotFoundError if there isn't a tox.ini and ValueError if the
+    template section isn't in it.
+    """
+    with timed("add-py3", charm=charm_name_for(tox_ini)):
+        if not tox_ini.exists():
+            raise FileNotFoundError(f"{tox_ini} does not exist")
+        content = tox_ini.read_text()
+        try:
+            new_content = clone_py3_sections(content, versions, template)
+        except ValueError as e:
+            raise ValueError(f"{e} in {tox_ini}")
+        sections = index_sections(content)
+        result = AddPy3Result([], [])
+        for section in dict.fromkeys(map(_version_to_section, versions)):
+            if f"testenv:{section}" in sections:
+                result.existing.append(section)
+            else:
+                result.added.append(section)
+        write_if_changed(tox_ini, new_content)
+        return result
+
+
+def _print_result(tox_ini: Path, result: AddPy3Result) -> None:
+    for section in result.existing:
         print(
-            f"warning: section [testenv:{new_section}] already exists in {tox_ini}, skipping",
+            f"warning: section [testenv:{section}] already exists in "
+            f"{tox_ini}, skipping",
             file=sys.stderr,
         )
-        return 0
+    for section in result.added:
+        print(f"Added [testenv:{section}] to {tox_ini}")
 
-    template_block = match.group(1)
 
-    # Replace every occurrence of the template version string and section name
-    # within the cloned block.  We replace the longer/more-specific strings
-    # first to avoid partial substitutions.
-    new_block = template_block.replace(
-        f"[testenv:{template_section}]",
-        f"[testenv:{new_section}]",
-    )
-    # Replace dotted form: "3.10" → "3.12"  (matches basepython, constraints…)
-    new_block = new_block.replace(template, version)
-    # Replace compact form: "py310" → "py312"  (matches filenames like
-    # test-requirements-py310.txt that don't contain the dotted version)
-    new_block = new_block.replace(template_section, new_section)
+def tox_ini_paths(args) -> List[Path]:
+    """The tox.ini files to update: --tox-ini (which may be repeated) and/or
+    the tox.ini of each charm in --charms-dir."""
+    paths: List[Path] = []
+    tox_ini = getattr(args, "tox_ini", None)
+    if isinstance(tox_ini, list):
+        paths.extend(tox_ini)
+    elif tox_ini is not None:
+        paths.append(tox_ini)
+    charms_dir: Optional[Path] = getattr(args, "charms_dir", None)
+    if charms_dir is not None:
+        paths.extend(d / "tox.ini" for d in find_charm_dirs(charms_dir)
+                     if (d / "tox.ini").exists())
+    elif not paths:
+        paths.append(Path("tox.ini"))
+    return list(dict.fromkeys(paths))
+
 
-    # Ensure the new block ends with exactly one newline before insertion.
-    template_end = match.end()
+def add_py3(args) -> int:
+    """Add [testenv:pyXYZ] sections to tox.ini files by cloning a template.
+
+    Reads the tox.ini at *args.tox_ini* (or each of them), finds the section
+    for *args.template*, clones it for each version in *args.version* (a
+    comma separated list) with all occurrences of the template version
+    replaced, and inserts the new sections immediately after the template.
+    Several files are updated in a process pool.
+
+    Returns 0 on success, non-zero on error.
+    """
+    versions = split_versions(args.version)
+    template: str = args.template
+    paths = tox_ini_paths(args)
 
-    # Insert the new block right after the template block.
-    new_content = content[:template_end] + new_block + content[template_end:]
+    if len(paths) == 1:
+        try:
+            result = add_py3_to_file(paths[0], versions, template)
+        except (OSError, ValueError) as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+        _print_result(paths[0], result)
+        return 0
 
-    tox_ini.write_text(new_content)
-    print(f"Added [testenv:{new_section}] to {tox_ini}")
-    return 0
+    results: List[Result] = run_pool(
+        functools.partial(add_py3_to_file, versions=versions,
+                          template=template),
+        paths, workers=getattr(args, "workers", None), processes=True)
+    changed = failed = 0
+    for r in results:
+        if r.ok:
+            changed += bool(r.value.added)
+            _print_result(r.item, r.value)
+        else:
+            failed += 1
+            print(f"error: {r.error}", file=sys.stderr)
+    print(f"{len(results)} file(s): {changed} changed, "
+          f"{len(results) - changed - failed} unchanged, {failed} failed")
+    return 1 if failed else 0
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -91,12 +230,13 @@ def build_parser() -> argparse.ArgumentParser:
     # add-py3 subcommand
     add_py3_parser = subparsers.add_parser(
         "add-py3",
-        help="Add a new pyXYZ testenv section to a tox.ini file.",
+        help="Add new pyXYZ testenv sections to tox.ini files.",
     )
     add_py3_parser.add_argument(
         "--version",
         required=True,
-        help="Python version to add (e.g. '3.12').",
+        help=("Python version to add (e.g. '3.12'); several may be given, "
+              "comma separated (e.g. '3.12,3.13')."),
     )
     add_py3_parser.add_argument(
         "--template",
@@ -106,8 +246,20 @@ def build_parser() -> argparse.ArgumentParser:
     add_py3_parser.add_argument(
         "--tox-ini",
         type=Path,
-        default=Path("tox.ini"),
-        help="Path to the tox.ini file to modify (default: tox.ini).",
+        action="append",
+        help=("Path to the tox.ini file to modify (default: tox.ini).  May "
+              "be repeated; several files are updated in a process pool."),
+    )
+    add_py3_parser.add_argument(
+        "--charms-dir",
+        type=Path,
+        metavar="DIR",
+        help="Update the tox.ini of every charm in DIR (e.g. ./charms).",
+    )
+    add_py3_parser.add_argument(
+        "--workers", "-j",
+        type=int,
+        help="With several files, how many to update at once.",
     )
     add_py3_parser.set_defaults(func=add_py3)
 
@@ -121,4 +273,4 @@ def main(argv=None):
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    sys.exit(run_profiled(main))
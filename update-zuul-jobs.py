@@ -2,54 +2,74 @@
 """Update .zuul.yaml jobs for a charm repository.
 
 Usage:
-    update-zuul-jobs.py [options] CHARM_DIR
+    update-zuul-jobs.py [options] CHARM_DIR [CHARM_DIR ...]
 
 The script reads <charm-directory>/.zuul.yaml, <charm-directory>/osci.yaml and
 <charm-directory>/metadata.yaml and ensures that .zuul.yaml contains a check
-job entry for ``charmbuild`` with the correct vars block.
+job entry for ``charmbuild`` with the correct vars block, and/or replaces
+templates.  With several charm directories, the charms are updated in a
+process pool and a result is printed for each one.
 """
 
 import argparse
 import fnmatch
+import functools
 import sys
 from pathlib import Path
+from typing import TYPE_CHECKING, List, Sequence, Tuple
 
-from ruamel.yaml import YAML
+from lib.fleet import Result, run_pool
+from lib.output import dumps, write_if_changed
+from lib import readonly
+from lib.timing import timed
+from lib.profiling import run_profiled
 
+if TYPE_CHECKING:
+    from ruamel.yaml import YAML
 
-def _make_yaml() -> YAML:
+
+def _make_yaml() -> 'YAML':
     """Return a ruamel.yaml instance configured for round-trip use."""
+    # imported here so that e.g. --help doesn't pay for importing ruamel.
+    from ruamel.yaml import YAML
     yml = YAML()
     yml.preserve_quotes = True
     yml.width = 4096  # avoid unwanted line wrapping
     return yml
 
 
+@functools.lru_cache(maxsize=None)
+def get_yaml() -> 'YAML':
+    """The round-trip YAML instance, made once per process."""
+    return _make_yaml()
+
+
 def load_yaml_file(path: Path):
-    """Load a YAML file and return its parsed content."""
-    yml = _make_yaml()
+    """Load a YAML file, to modify it, and return its parsed content.
+
+    Files that are only read use lib/readonly.py instead.
+    """
     with path.open() as fh:
-        return yml.load(fh)
+        return get_yaml().load(fh)
 
 
 def get_charm_name(charm_dir: Path) -> str:
-    """Return the charm name from metadata.yaml."""
+    """Return the charm name from metadata.yaml.
+
+    Raises ValueError if there isn't a metadata.yaml or it has no name.
+    """
     metadata_path = charm_dir / "metadata.yaml"
     if not metadata_path.exists():
-        sys.exit(f"ERROR: {metadata_path} not found")
-    data = load_yaml_file(metadata_path)
+        raise ValueError(f"{metadata_path} not found")
+    data = readonly.load(metadata_path)
     name = data.get("name")
     if not name:
-        sys.exit(f"ERROR: 'name' key not found in {metadata_path}")
+        raise ValueError(f"'name' key not found in {metadata_path}")
     return name
 
 
-def get_charmcraft_channel(charm_dir: Path) -> str:
-    """Return the charmcraft_channel value from osci.yaml."""
-    osci_path = charm_dir / "osci.yaml"
-    if not osci_path.exists():
-        sys.exit(f"ERROR: {osci_path} not found")
-    data = load_yaml_file(osci_path)
+def find_charmcraft_channel(data):
+    """Return the charmcraft_channel var from parsed osci.yaml data, or None."""
     # osci.yaml is a list of project dicts
     if isinstance(data, list):
         for item in data:
@@ -57,25 +77,32 @@ def get_charmcraft_channel(charm_dir: Path) -> str:
             channel = project.get("vars", {}).get("charmcraft_channel")
             if channel:
                 return channel
-    sys.exit(f"ERROR: 'charmcraft_channel' not found in {osci_path}")
+    return None
 
 
-def process_zuul_yaml(charm_dir: Path, charm_name: str, charmcraft_channel: str):
-    """Ensure .zuul.yaml has the charmbuild check job.
+def get_charmcraft_channel(charm_dir: Path) -> str:
+    """Return the charmcraft_channel value from osci.yaml.
 
-    Modifies the file in-place if the job is missing.  Returns True if a
-    change was made, False otherwise.
+    Raises ValueError if there isn't an osci.yaml or it has no channel.
     """
-    zuul_path = charm_dir / ".zuul.yaml"
-    if not zuul_path.exists():
-        sys.exit(f"ERROR: {zuul_path} not found")
+    osci_path = charm_dir / "osci.yaml"
+    if not osci_path.exists():
+        raise ValueError(f"{osci_path} not found")
+    channel = find_charmcraft_channel(readonly.load(osci_path))
+    if not channel:
+        raise ValueError(f"'charmcraft_channel' not found in {osci_path}")
+    return channel
 
-    yml = _make_yaml()
-    with zuul_path.open() as fh:
-        data = yml.load(fh)
 
+def add_charmbuild_job(data, zuul_path: Path, charm_name: str,
+                       charmcraft_channel: str) -> bool:
+    """Add the charmbuild check job to parsed .zuul.yaml data if missing.
+
+    The data is modified in place.  Returns True if a change was made, False
+    otherwise.  Raises ValueError if the data isn't a list of stanzas.
+    """
     if not isinstance(data, list):
-        sys.exit(f"ERROR: Unexpected structure in {zuul_path}")
+        raise ValueError(f"Unexpected structure in {zuul_path}")
 
     changed = False
     for item in data:
@@ -117,31 +144,20 @@ def process_zuul_yaml(charm_dir: Path, charm_name: str, charmcraft_channel: str)
         print(f"No project stanza found in {zuul_path}, nothing to do.")
         return False
 
-    # Dump back preserving order and style
-    with zuul_path.open("w") as fh:
-        yml.dump(data, fh)
-
     print(f"Updated {zuul_path}: added charmbuild job for charm '{charm_name}'.")
     return True
 
 
-def replace_template_in_zuul_yaml(charm_dir: Path, pattern: str, replacement: str):
-    """Replace a template entry in .zuul.yaml whose name matches *pattern*.
+def replace_template(data, zuul_path: Path, pattern: str,
+                     replacement: str) -> bool:
+    """Replace a template whose name matches *pattern* in parsed .zuul.yaml data.
 
-    Uses shell-style glob matching (fnmatch).  Exits with an error if more
-    than one template matches.  Prints a message and exits successfully if no
-    match is found.
+    The data is modified in place.  Returns True if a change was made.
+    Raises ValueError if the data isn't a list of stanzas or if more than one
+    template matches.
     """
-    zuul_path = charm_dir / ".zuul.yaml"
-    if not zuul_path.exists():
-        sys.exit(f"ERROR: {zuul_path} not found")
-
-    yml = _make_yaml()
-    with zuul_path.open() as fh:
-        data = yml.load(fh)
-
     if not isinstance(data, list):
-        sys.exit(f"ERROR: Unexpected structure in {zuul_path}")
+        raise ValueError(f"Unexpected structure in {zuul_path}")
 
     changed = False
     for item in data:
@@ -153,7 +169,7 @@ def replace_template_in_zuul_yaml(charm_dir: Path, pattern: str, replacement: st
         if not templates:
             continue
 
-        matches = [t for t in templates if fnmatch.fnmatch(t, pattern)]
+        matches = [t for t in templates if fnmatch.fnmatchcase(t, pattern)]
 
         if not matches:
             print(
@@ -162,8 +178,8 @@ def replace_template_in_zuul_yaml(charm_dir: Path, pattern: str, replacement: st
             return False
 
         if len(matches) > 1:
-            sys.exit(
-                f"ERROR: pattern '{pattern}' matched more than one template in "
+            raise ValueError(
+                f"pattern '{pattern}' matched more than one template in "
                 f"{zuul_path}: {', '.join(matches)}"
             )
 
@@ -179,21 +195,82 @@ def replace_template_in_zuul_yaml(charm_dir: Path, pattern: str, replacement: st
     if not changed and not any("project" in item for item in data):
         print(f"No project stanza found in {zuul_path}, nothing to do.")
 
-    if changed:
-        with zuul_path.open("w") as fh:
-            yml.dump(data, fh)
-
     return changed
 
 
-def main():
+def update_zuul_yaml(charm_dir: Path,
+                     replacements: Sequence[Tuple[str, str]] = (),
+                     add_charmbuild: bool = False) -> bool:
+    """Apply the template replacements and/or add the charmbuild job.
+
+    .zuul.yaml is parsed once, the replacements are applied in order, then the
+    charmbuild job is added, and the file is written once if it changed.
+
+    :param charm_dir: the root of the charm repo.
+    :param replacements: (pattern, replacement) pairs for `replace_template`.
+    :param add_charmbuild: whether to add the charmbuild check job.
+    :returns: True if .zuul.yaml was written.
+    :raises: ValueError if a file is missing or can't be updated.
+    """
+    with timed("update-zuul-jobs", charm=charm_dir.name):
+        zuul_path = charm_dir / ".zuul.yaml"
+        if not zuul_path.exists():
+            raise ValueError(f"{zuul_path} not found")
+        if add_charmbuild:
+            charm_name = get_charm_name(charm_dir)
+            charmcraft_channel = get_charmcraft_channel(charm_dir)
+
+        yml = get_yaml()
+        with zuul_path.open() as fh:
+            data = yml.load(fh)
+
+        changed = False
+        for pattern, replacement in replacements:
+            changed |= replace_template(data, zuul_path, pattern, replacement)
+        if add_charmbuild:
+            changed |= add_charmbuild_job(data, zuul_path, charm_name,
+                                          charmcraft_channel)
+        return changed and write_if_changed(zuul_path, dumps(yml, data))
+
+
+def report(results: List[Result]) -> int:
+    """Print the result for each charm and a summary.
+
+    :param results: the result for each charm directory.
+    :returns: the number of charms that failed.
+    """
+    changed = failed = 0
+    for result in results:
+        if not result.ok:
+            failed += 1
+            print(f"{result.item.name}: FAILED: {result.error}")
+        elif result.value:
+            changed += 1
+            print(f"{result.item.name}: changed")
+        else:
+            print(f"{result.item.name}: unchanged")
+    print(f"{len(results)} charm(s): {changed} changed, "
+          f"{len(results) - changed - failed} unchanged, {failed} failed")
+    return failed
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments.
+
+    :param argv: List of configure functions functions
+    :returns: Parsed arguments
+    """
     parser = argparse.ArgumentParser(
         description="Add charmbuild check job to .zuul.yaml if missing."
     )
     parser.add_argument(
-        "charm_dir",
+        "charm_dirs",
         metavar="CHARM_DIR",
-        help="Path to the charm git repository directory.",
+        nargs="+",
+        help=(
+            "Path to the charm git repository directory.  More than one may "
+            "be given; the charms are then updated in a process pool."
+        ),
     )
     parser.add_argument(
         "--add-charmbuild",
@@ -204,43 +281,69 @@ def main():
     parser.add_argument(
         "--replace",
         metavar="PATTERN",
-        default=None,
+        action="append",
+        default=[],
         help=(
             "Glob pattern to match a template name in .zuul.yaml "
-            "(e.g. 'openstack-python3-charm-jobs-*'). Must be used with --with."
+            "(e.g. 'openstack-python3-charm-jobs-*'). Must be used with "
+            "--with. May be repeated; each --replace is paired with a "
+            "--with, in order."
         ),
     )
     parser.add_argument(
         "--with",
         metavar="REPLACEMENT",
         dest="replace_with",
-        default=None,
+        action="append",
+        default=[],
         help="Replacement template name to use when --replace finds a match.",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--workers", "-j",
+        dest="workers",
+        type=int,
+        help="With several charm directories, how many to update at once.",
+    )
+    args = parser.parse_args(argv)
+    if len(args.replace) < len(args.replace_with):
+        parser.error("--with requires --replace.")
+    if len(args.replace) > len(args.replace_with):
+        parser.error("--replace requires --with.")
+    return args
 
-    charm_dir = Path(args.charm_dir).resolve()
-    if not charm_dir.is_dir():
-        sys.exit(f"ERROR: {charm_dir} is not a directory")
 
-    if args.replace is not None or args.replace_with is not None:
-        if args.replace is None:
-            sys.exit("ERROR: --with requires --replace.")
-        if args.replace_with is None:
-            sys.exit("ERROR: --replace requires --with.")
-        replace_template_in_zuul_yaml(charm_dir, args.replace, args.replace_with)
+def main():
+    args = parse_args(sys.argv[1:])
 
-    if args.add_charmbuild:
-        charm_name = get_charm_name(charm_dir)
-        charmcraft_channel = get_charmcraft_channel(charm_dir)
-        process_zuul_yaml(charm_dir, charm_name, charmcraft_channel)
+    charm_dirs = [Path(d).resolve() for d in args.charm_dirs]
+    for charm_dir in charm_dirs:
+        if not charm_dir.is_dir():
+            sys.exit(f"ERROR: {charm_dir} is not a directory")
 
-    if not args.add_charmbuild and args.replace is None:
+    if not args.add_charmbuild and not args.replace:
         print(
             "Nothing to do. Use --add-charmbuild to add the charmbuild job, "
             "or --replace PATTERN --with REPLACEMENT to replace a template."
         )
+        return
+
+    update = functools.partial(
+        update_zuul_yaml,
+        replacements=list(zip(args.replace, args.replace_with)),
+        add_charmbuild=args.add_charmbuild)
+
+    if len(charm_dirs) == 1:
+        try:
+            update(charm_dirs[0])
+        except ValueError as e:
+            sys.exit(f"ERROR: {e}")
+        return
+
+    results = run_pool(update, charm_dirs, workers=args.workers,
+                       processes=True)
+    if report(results):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    run_profiled(main)